@@ -15,6 +15,13 @@ from ._utils import ParseFailure, SerialisationFailure, build_header, build_stri
 
 unicode = type("")
 
+# PUBLISH fixed header QoS bits -> QoS level ((True, True) is invalid)
+_QOS_FLAGS = {
+    (False, False): 0,
+    (False, True): 1,
+    (True, False): 2,
+}
+
 
 @attr.s
 class Failure(object):
@@ -36,6 +43,8 @@ class Disconnect(object):
 
         return cls()
 
+    deserialise_bytes = deserialise
+
 
 @attr.s
 class PingRESP(object):
@@ -52,6 +61,8 @@ class PingRESP(object):
 
         return cls()
 
+    deserialise_bytes = deserialise
+
 
 @attr.s
 class PingREQ(object):
@@ -68,6 +79,8 @@ class PingREQ(object):
 
         return cls()
 
+    deserialise_bytes = deserialise
+
 
 @attr.s
 class UnsubACK(object):
@@ -101,6 +114,13 @@ class UnsubACK(object):
         packet_identifier = data.read("uint:16")
         return cls(packet_identifier=packet_identifier)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        return cls(packet_identifier=data.uint16())
+
 
 @attr.s
 class Unsubscribe(object):
@@ -149,6 +169,22 @@ class Unsubscribe(object):
 
         return cls(packet_identifier=packet_identifier, topics=topics)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        if flags != (False, False, True, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        topics = []
+        packet_identifier = data.uint16()
+
+        while not data.at_end:
+            topics.append(data.string())
+
+        if len(topics) == 0:
+            raise ParseFailure(cls, "Must contain a payload.")
+
+        return cls(packet_identifier=packet_identifier, topics=topics)
+
 
 @attr.s
 class PubCOMP(object):
@@ -182,6 +218,16 @@ class PubCOMP(object):
 
         return cls(packet_identifier)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Disassemble from the body of an on-wire message held by a :class:`ByteReader`.
+        """
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        return cls(data.uint16())
+
 
 @attr.s
 class PubREL(object):
@@ -215,6 +261,16 @@ class PubREL(object):
 
         return cls(packet_identifier)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Disassemble from the body of an on-wire message held by a :class:`ByteReader`.
+        """
+        if flags != (False, False, True, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        return cls(data.uint16())
+
 
 @attr.s
 class PubREC(object):
@@ -248,6 +304,16 @@ class PubREC(object):
 
         return cls(packet_identifier)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Disassemble from the body of an on-wire message held by a :class:`ByteReader`.
+        """
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        return cls(data.uint16())
+
 
 @attr.s
 class PubACK(object):
@@ -281,6 +347,16 @@ class PubACK(object):
 
         return cls(packet_identifier)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Disassemble from the body of an on-wire message held by a :class:`ByteReader`.
+        """
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        return cls(data.uint16())
+
 
 @attr.s
 class Publish(object):
@@ -288,7 +364,7 @@ class Publish(object):
     qos_level = attr.ib(validator=instance_of(int))
     retain = attr.ib(validator=instance_of(bool))
     topic_name = attr.ib(validator=instance_of(unicode))
-    payload = attr.ib(validator=instance_of(bytes))
+    payload = attr.ib(validator=instance_of((bytes, memoryview)))
     packet_identifier = attr.ib(validator=optional(instance_of(int)), default=None)
 
     def serialise(self):
@@ -370,6 +446,32 @@ class Publish(object):
             payload=payload,
         )
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        qos_level = _QOS_FLAGS.get(flags[1:3])
+
+        if qos_level is None:
+            raise ParseFailure(cls, "Invalid QoS value")
+
+        topic_name = data.string()
+
+        if qos_level in [1, 2]:
+            packet_identifier = data.uint16()
+        else:
+            packet_identifier = None
+
+        # a memoryview slice of the packet when the reader is in zero-copy mode
+        payload = data.payload()
+
+        return cls(
+            duplicate=flags[0],
+            qos_level=qos_level,
+            retain=flags[3],
+            topic_name=topic_name,
+            packet_identifier=packet_identifier,
+            payload=payload,
+        )
+
 
 @attr.s
 class SubACK(object):
@@ -413,6 +515,16 @@ class SubACK(object):
 
         return cls(packet_identifier=packet_identifier, return_codes=return_codes)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        packet_identifier = data.uint16()
+        return_codes = list(data.read(len(data) - data.pos))
+
+        return cls(packet_identifier=packet_identifier, return_codes=return_codes)
+
 
 @attr.s
 class SubscriptionTopicRequest(object):
@@ -490,6 +602,32 @@ class Subscribe(object):
 
         return cls(packet_identifier=packet_identifier, topic_requests=pairs)
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        if flags != (False, False, True, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        pairs = []
+        packet_identifier = data.uint16()
+
+        while True:
+            topic_filter = data.string()
+            options = data.uint8()
+
+            # upper 6 bits are reserved, lower 2 bits are the max QoS
+            if options & 0xFC:
+                raise ParseFailure(cls, "Data in QoS Reserved area")
+
+            if options == 3:
+                raise ParseFailure(cls, "Invalid QoS")
+
+            pairs.append(SubscriptionTopicRequest(topic_filter=topic_filter, max_qos=options))
+
+            if data.at_end:
+                break
+
+        return cls(packet_identifier=packet_identifier, topic_requests=pairs)
+
 
 @attr.s
 class ConnACK(object):
@@ -546,6 +684,30 @@ class ConnACK(object):
 
         return built
 
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Take the body of an on-wire message held by a :class:`ByteReader` and
+        turn it into an instance of this class.
+        """
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        ack_flags = data.uint8()
+
+        if ack_flags & 0xFE:
+            raise ParseFailure(cls, "Reserved flag used.")
+
+        built = cls(session_present=bool(ack_flags & 0x01), return_code=data.uint8())
+
+        if not data.at_end:
+            warnings.warn(
+                ("Quirky server CONNACK -- packet length was %d bytes but only had %d bytes of useful data")
+                % (len(data), data.pos)
+            )
+
+        return built
+
 
 @attr.s
 class ConnectFlags(object):
@@ -593,6 +755,27 @@ class ConnectFlags(object):
 
         return built
 
+    @classmethod
+    def from_byte(cls, value):
+        """
+        Build from the CONNECT flags byte (as opposed to a bitstring).
+        """
+        built = cls(
+            username=bool(value & 0x80),
+            password=bool(value & 0x40),
+            will_retain=bool(value & 0x20),
+            will_qos=(value >> 3) & 0x03,
+            will=bool(value & 0x04),
+            clean_session=bool(value & 0x02),
+            reserved=bool(value & 0x01),
+        )
+
+        if built.reserved:
+            # MQTT-3.1.2-3, reserved flag must not be used
+            raise ParseFailure(cls, "Reserved flag in CONNECT used")
+
+        return built
+
 
 @attr.s
 class Connect(object):
@@ -715,3 +898,52 @@ class Connect(object):
             username=username,
             password=password,
         )
+
+    @classmethod
+    def deserialise_bytes(cls, flags, data):
+        """
+        Disassemble from the body of an on-wire message held by a :class:`ByteReader`.
+        """
+        if flags != (False, False, False, False):
+            raise ParseFailure(cls, "Bad flags")
+
+        if data.string() != "MQTT":
+            raise ParseFailure(cls, "Bad protocol name")
+
+        if data.uint8() != 4:
+            raise ParseFailure(cls, "Bad protocol level")
+
+        flags = ConnectFlags.from_byte(data.uint8())
+
+        # Keep alive, in seconds
+        keep_alive = data.uint16()
+
+        # The client ID
+        client_id = data.string()
+
+        if flags.will:
+            # MQTT-3.1.3-10, topic must be UTF-8
+            will_topic = data.string()
+            will_message = data.prefixed_data()
+        else:
+            will_topic = None
+            will_message = None
+
+        username = data.string() if flags.username else None
+        password = data.string() if flags.password else None
+
+        if not data.at_end:
+            warnings.warn(
+                ("Quirky client CONNECT -- packet length was %d bytes but only had %d bytes of useful data")
+                % (len(data), data.pos)
+            )
+
+        return cls(
+            flags=flags,
+            keep_alive=keep_alive,
+            client_id=client_id,
+            will_topic=will_topic,
+            will_message=will_message,
+            username=username,
+            password=password,
+        )
@@ -5,6 +5,8 @@
 #
 #####################################################################################
 
+import struct
+
 from autobahn.websocket.utf8validator import Utf8Validator
 from bitstring import pack
 
@@ -19,6 +21,12 @@ class SerialisationFailure(Exception):
     pass
 
 
+class ReadError(Exception):
+    """
+    A read ran off the end of the packet body held by a :class:`ByteReader`.
+    """
+
+
 def read_prefixed_data(data):
     """
     Reads the next 16-bit-uint prefixed data block from `data`.
@@ -31,7 +39,10 @@ def read_string(data):
     """
     Reads the next MQTT pascal-style string from `data`.
     """
-    byte_data = read_prefixed_data(data)
+    return _decode_string(read_prefixed_data(data))
+
+
+def _decode_string(byte_data):
     _validator.reset()
 
     if _validator.validate(byte_data)[0]:
@@ -69,3 +80,85 @@ def build_header(packet_id, flags, payload_length):
 def iterbytes(b):
     for i in range(len(b)):
         yield b[i : i + 1]
+
+
+_UINT16 = struct.Struct("!H")
+
+
+class ByteReader(object):
+    """
+    Sequential reader over the body of a single MQTT packet.
+
+    This is the ``bytes``/``memoryview`` counterpart of reading from a
+    ``bitstring.BitStream``: all reads are byte aligned, and blocks of data are
+    returned as slices of the underlying buffer without copying.
+
+    :param data: The packet body.
+    :type data: bytes or memoryview
+    :param zero_copy: If set, :meth:`payload` returns a ``memoryview`` slice
+        of the packet body rather than a ``bytes`` copy.
+    :type zero_copy: bool
+    """
+
+    __slots__ = ("_data", "_pos", "zero_copy")
+
+    def __init__(self, data, zero_copy=False):
+        self._data = memoryview(data)
+        self._pos = 0
+        self.zero_copy = zero_copy
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def pos(self):
+        """
+        Number of bytes consumed so far.
+        """
+        return self._pos
+
+    @property
+    def at_end(self):
+        return self._pos == len(self._data)
+
+    def read(self, length):
+        """
+        Read the next ``length`` bytes as a ``memoryview`` slice.
+        """
+        end = self._pos + length
+        if end > len(self._data):
+            raise ReadError("Cannot read {} bytes, only {} available.".format(length, len(self._data) - self._pos))
+        view = self._data[self._pos : end]
+        self._pos = end
+        return view
+
+    def uint8(self):
+        if self._pos >= len(self._data):
+            raise ReadError("Cannot read 1 bytes, only 0 available.")
+        value = self._data[self._pos]
+        self._pos += 1
+        return value
+
+    def uint16(self):
+        return _UINT16.unpack(self.read(2))[0]
+
+    def prefixed_data(self):
+        """
+        Read the next 16-bit-uint prefixed data block as ``bytes``.
+        """
+        return self.read(self.uint16()).tobytes()
+
+    def string(self):
+        """
+        Read the next MQTT pascal-style string.
+        """
+        return _decode_string(self.read(self.uint16()).tobytes())
+
+    def payload(self):
+        """
+        Read everything that is left in the packet body.
+        """
+        view = self.read(len(self._data) - self._pos)
+        if self.zero_copy:
+            return view
+        return view.tobytes()
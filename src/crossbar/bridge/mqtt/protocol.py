@@ -25,9 +25,12 @@ from ._events import (
     UnsubACK,
     Unsubscribe,
 )
+from ._utils import ByteReader, ReadError
 
 __all__ = [
     "MQTTParser",
+    "MQTTBytesParser",
+    "PARSERS",
 ]
 
 
@@ -206,3 +209,189 @@ class MQTTParser(object):
 class MQTTClientParser(MQTTParser):
     _first_pkt = P_CONNACK
     _packet_handlers = client_packet_handlers
+
+
+# fixed header flag nibble -> flags tuple, as produced by _parse_header()
+_FLAGS = [(bool(i & 8), bool(i & 4), bool(i & 2), bool(i & 1)) for i in range(16)]
+
+# the packet type/flags byte plus at most 4 bytes of remaining length
+_MAX_HEADER_LENGTH = 5
+
+
+class MQTTBytesParser(object):
+    """
+    MQTT packet parser working on ``bytes``/``memoryview`` rather than bit
+    streams.
+
+    The fixed header remaining length is decoded incrementally as bytes arrive.
+    Once the length of the packet under way is known, further chunks are only
+    appended to the receive buffer until the packet is complete, so a large
+    packet arriving in many small chunks is not re-scanned each time. Packet
+    bodies are handed to the event deserialisers as ``memoryview`` slices of
+    the received data.
+
+    :param zero_copy: If set, the payload of :class:`Publish` events is a
+        read-only ``memoryview`` slice of the received data rather than a
+        ``bytes`` copy.
+    :type zero_copy: bool
+    """
+
+    _packet_handlers = server_packet_handlers
+    _first_pkt = P_CONNECT
+
+    def __init__(self, zero_copy=False):
+        self._zero_copy = zero_copy
+        self._buffer = bytearray()
+        self._bytes_expected = 0
+        self._state = WAITING_FOR_NEW_PACKET
+        self._packet_count = 0
+
+        # fixed header of the packet under way, as far as decoded
+        self._packet_type = None
+        self._flags = None
+        self._length = 0
+        self._multiplier = 1
+        self._header_length = 0
+        self._header_complete = False
+
+    def _reset_header(self):
+        self._packet_type = None
+        self._flags = None
+        self._length = 0
+        self._multiplier = 1
+        self._header_length = 0
+        self._header_complete = False
+
+    def _decode_header(self, data, offset):
+        """
+        Continue decoding the fixed header at ``offset``, resuming from where
+        the previous call stopped.
+
+        :returns: ``True`` once the header is complete, ``False`` when more
+            data is needed.
+        """
+        if self._header_complete:
+            return True
+
+        available = len(data) - offset
+        if self._header_length == 0:
+            if available < 1:
+                return False
+            first = data[offset]
+            self._packet_type = first >> 4
+            self._flags = _FLAGS[first & 0x0F]
+            self._header_length = 1
+
+        while True:
+            if self._header_length >= available:
+                return False
+            encoded_byte = data[offset + self._header_length]
+            self._header_length += 1
+            self._length += (encoded_byte & 127) * self._multiplier
+            if not encoded_byte & 128:
+                self._header_complete = True
+                return True
+            self._multiplier *= 128
+            if self._header_length >= _MAX_HEADER_LENGTH:
+                raise ParseFailure("Too big packet size")
+
+    def data_received(self, data):
+        if self._state is PROTOCOL_VIOLATION:
+            # Conformance statement MQTT-4.8.0-1: Must close the connection on
+            # a protocol violation. For us, if we keep getting data somehow
+            # (e.g. flushed input buffers), just drop the data.
+            return []
+
+        if self._buffer:
+            self._buffer += data
+            if len(self._buffer) < self._bytes_expected:
+                # still collecting the rest of a packet with known length
+                return []
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        elif not isinstance(data, bytes):
+            # packet bodies are sliced from this, so make sure it can't change
+            data = bytes(data)
+
+        events = []
+        view = memoryview(data)
+        offset = 0
+        end = len(data)
+
+        while offset < end:
+            try:
+                complete = self._decode_header(view, offset)
+            except ParseFailure as e:
+                events.append(Failure(e.args[0]))
+                self._state = PROTOCOL_VIOLATION
+                return events
+
+            if not complete:
+                self._state = WAITING_FOR_NEW_PACKET
+                self._bytes_expected = 0
+                break
+
+            body_start = offset + self._header_length
+            body_end = body_start + self._length
+
+            if body_end > end:
+                self._state = COLLECTING_REST_OF_PACKET
+                self._bytes_expected = body_end - offset
+                break
+
+            packet_type = self._packet_type
+            flags = self._flags
+            self._reset_header()
+            self._state = WAITING_FOR_NEW_PACKET
+
+            if self._packet_count == 0 and packet_type != self._first_pkt:
+                self._state = PROTOCOL_VIOLATION
+                return [Failure("Connect packet was not first")]
+
+            if self._packet_count > 0 and packet_type == self._first_pkt:
+                events.append(Failure("Multiple Connect packets"))
+                self._state = PROTOCOL_VIOLATION
+                return events
+
+            if packet_type not in self._packet_handlers:
+                self._state = PROTOCOL_VIOLATION
+                events.append(Failure("Unimplemented packet type %d" % (packet_type,)))
+                return events
+
+            try:
+                packet_handler = self._packet_handlers[packet_type]
+                body = ByteReader(view[body_start:body_end], zero_copy=self._zero_copy)
+                events.append(packet_handler.deserialise_bytes(flags, body))
+            except ParseFailure as e:
+                if len(e.args) == 1:
+                    events.append(Failure(e.args[0]))
+                else:
+                    events.append(Failure(e.args[1] + " in " + e.args[0].__name__))
+                self._state = PROTOCOL_VIOLATION
+                return events
+            except ReadError as e:
+                # whoops the parsing fell off the amount of data
+                events.append(Failure("Corrupt data, fell off the end: {}".format(e)))
+                self._state = PROTOCOL_VIOLATION
+                return events
+
+            offset = body_end
+            self._packet_count += 1
+
+        if offset < end:
+            # keep the incomplete packet (including its partially decoded header)
+            self._buffer += view[offset:]
+
+        return events
+
+
+class MQTTBytesClientParser(MQTTBytesParser):
+    _first_pkt = P_CONNACK
+    _packet_handlers = client_packet_handlers
+
+
+# parser implementations selectable by name ("parser" MQTT transport option)
+PARSERS = {
+    "bitstring": MQTTParser,
+    "bytes": MQTTBytesParser,
+}
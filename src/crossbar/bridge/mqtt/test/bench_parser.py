@@ -0,0 +1,157 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+"""
+Benchmark the MQTT packet parsers over recorded client-to-broker packet streams.
+
+A stream is replayed into each parser in chunks of a fixed size, mimicking how
+the bytes arrive from the transport. By default, a set of synthetic streams is
+recorded by serialising typical client sessions; a raw capture of a client's
+side of an MQTT connection (e.g. written by ``tcpflow``) can be given instead:
+
+    python -m crossbar.bridge.mqtt.test.bench_parser
+    python -m crossbar.bridge.mqtt.test.bench_parser --stream client.raw --chunk 1460
+"""
+
+import argparse
+import time
+
+from crossbar.bridge.mqtt._events import (
+    Connect,
+    ConnectFlags,
+    Disconnect,
+    PingREQ,
+    PubACK,
+    Publish,
+    Subscribe,
+    SubscriptionTopicRequest,
+)
+from crossbar.bridge.mqtt.protocol import PARSERS
+
+
+def _record(packets):
+    return b"".join(packet.serialise() for packet in packets)
+
+
+def _session(publishes):
+    return (
+        [
+            Connect(client_id="bench", flags=ConnectFlags(clean_session=True), keep_alive=60),
+            Subscribe(
+                packet_identifier=1,
+                topic_requests=[SubscriptionTopicRequest(topic_filter="sensors/#", max_qos=1)],
+            ),
+        ]
+        + publishes
+        + [PingREQ(), Disconnect()]
+    )
+
+
+def record_streams(count):
+    """
+    Record the synthetic packet streams to benchmark with.
+
+    :param count: Number of publishes per stream.
+    :type count: int
+
+    :returns: Map of stream name to recorded stream.
+    :rtype: dict
+    """
+    small = [
+        Publish(
+            duplicate=False,
+            qos_level=0,
+            retain=False,
+            topic_name="sensors/{}/temperature".format(i % 100),
+            payload=b'{"value": 21.5}',
+        )
+        for i in range(count)
+    ]
+
+    acked = []
+    for i in range(count):
+        packet_id = i % 65535 + 1
+        acked.append(
+            Publish(
+                duplicate=False,
+                qos_level=1,
+                retain=False,
+                topic_name="sensors/{}/image".format(i % 100),
+                payload=b"\x00" * 1024,
+                packet_identifier=packet_id,
+            )
+        )
+        acked.append(PubACK(packet_identifier=packet_id))
+
+    large = [
+        Publish(duplicate=False, qos_level=0, retain=True, topic_name="firmware/blob", payload=b"\xff" * 262144)
+        for i in range(max(1, count // 100))
+    ]
+
+    return {
+        "small-qos0": _record(_session(small)),
+        "1k-qos1": _record(_session(acked)),
+        "256k-qos0": _record(_session(large)),
+    }
+
+
+def run(parser_factory, stream, chunk_size, rounds):
+    """
+    Replay a stream into fresh parsers and time it.
+
+    :returns: Tuple of (events parsed per round, best time per round in seconds).
+    :rtype: tuple
+    """
+    chunks = [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    best = None
+    events = 0
+
+    for _ in range(rounds):
+        parser = parser_factory()
+        events = 0
+        started = time.perf_counter()
+        for chunk in chunks:
+            events += len(parser.data_received(chunk))
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return events, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MQTT packet parsers.")
+    parser.add_argument("--stream", help="Raw client-to-broker stream to replay (default: synthetic streams)")
+    parser.add_argument("--chunk", type=int, default=1460, help="Size of the chunks fed to the parser")
+    parser.add_argument("--count", type=int, default=10000, help="Publishes per synthetic stream")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per measurement (best is reported)")
+    parser.add_argument("--parser", choices=sorted(PARSERS), action="append", help="Parser(s) to benchmark")
+    args = parser.parse_args()
+
+    if args.stream:
+        with open(args.stream, "rb") as f:
+            streams = {args.stream: f.read()}
+    else:
+        streams = record_streams(args.count)
+
+    for name, stream in sorted(streams.items()):
+        for parser_name in args.parser or sorted(PARSERS):
+            events, elapsed = run(PARSERS[parser_name], stream, args.chunk, args.rounds)
+            print(
+                "{:<16} {:<10} {:>9} bytes {:>7} events {:>9.2f} ms {:>10.0f} events/s {:>8.1f} MB/s".format(
+                    name,
+                    parser_name,
+                    len(stream),
+                    events,
+                    elapsed * 1000.0,
+                    events / elapsed,
+                    len(stream) / elapsed / 1000000.0,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
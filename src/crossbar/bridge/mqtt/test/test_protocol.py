@@ -10,11 +10,28 @@ from binascii import unhexlify
 import attr
 from twisted.trial.unittest import TestCase
 
+from crossbar.bridge.mqtt._events import (
+    ConnACK,
+    ConnectFlags,
+    Disconnect,
+    PingRESP,
+    PubACK,
+    PubCOMP,
+    Publish,
+    PubREC,
+    PubREL,
+    SubACK,
+    SubscriptionTopicRequest,
+    UnsubACK,
+)
 from crossbar.bridge.mqtt._utils import iterbytes
 from crossbar.bridge.mqtt.protocol import (
+    COLLECTING_REST_OF_PACKET,
     PROTOCOL_VIOLATION,
     Connect,
     Failure,
+    MQTTBytesClientParser,
+    MQTTBytesParser,
     MQTTParser,
     PingREQ,
     Subscribe,
@@ -496,3 +513,231 @@ class MQTTConformanceTests(TestCase, MQTTEventTestBase):
         # We want to have consumed all the events
         self.assertEqual(len(events), 0)
         self.assertEqual(p._state, PROTOCOL_VIOLATION)
+
+
+class BytesParserTests(TestCase, MQTTEventTestBase):
+    """
+    Tests for the bytes/memoryview based MQTT parser.
+    """
+
+    connect = unhexlify(b"101300044d51545404020002000774657374313233")
+
+    def _feed(self, parser, data, chunk_size=None):
+        events = []
+        if chunk_size is None:
+            events.extend(parser.data_received(data))
+        else:
+            for i in range(0, len(data), chunk_size):
+                events.extend(parser.data_received(data[i : i + chunk_size]))
+        return events
+
+    def test_connect_subscribe_unsubscribe_ping(self):
+        """
+        A stream of packets parses to the same events, no matter how it is
+        split into chunks.
+        """
+        data = (
+            self.connect
+            + unhexlify(b"820d00010008746573742f31323300")
+            + unhexlify(b"a20c00030008746573742f313233")
+            + unhexlify(b"c000")
+        )
+
+        for chunk_size in [None, 1, 2, 3, 7]:
+            events = self._feed(MQTTBytesParser(), data, chunk_size)
+
+            self.assertEqual(len(events), 4)
+            self.assertIsInstance(events[0], Connect)
+            self.assertEqual(events[0].client_id, "test123")
+            self.assertEqual(events[0].keep_alive, 2)
+            self.assertTrue(events[0].flags.clean_session)
+            self._assert_event(
+                events[1],
+                Subscribe,
+                {"packet_identifier": 1, "topic_requests": [{"topic_filter": "test/123", "max_qos": 0}]},
+            )
+            self._assert_event(events[2], Unsubscribe, {"packet_identifier": 3, "topics": ["test/123"]})
+            self._assert_event(events[3], PingREQ, {})
+
+    def test_roundtrip(self):
+        """
+        Serialised events parse back to equal events.
+        """
+        packets = [
+            Connect(
+                client_id="test123",
+                flags=ConnectFlags(username=True, password=True, will=True, will_qos=1, clean_session=True),
+                keep_alive=60,
+                will_topic="will/topic",
+                will_message=b"gone",
+                username="user",
+                password="secret",
+            ),
+            Subscribe(
+                packet_identifier=2,
+                topic_requests=[
+                    SubscriptionTopicRequest(topic_filter="a/#", max_qos=1),
+                    SubscriptionTopicRequest(topic_filter="b/+/c", max_qos=2),
+                ],
+            ),
+            Publish(
+                duplicate=False, qos_level=1, retain=True, topic_name="a/b", payload=b"hello", packet_identifier=3
+            ),
+            Publish(duplicate=False, qos_level=0, retain=False, topic_name="a/b", payload=b""),
+            PubACK(packet_identifier=4),
+            PubREC(packet_identifier=5),
+            PubREL(packet_identifier=5),
+            PubCOMP(packet_identifier=5),
+            Unsubscribe(packet_identifier=6, topics=["a/#"]),
+            PingREQ(),
+            Disconnect(),
+        ]
+        data = b"".join(p.serialise() for p in packets)
+
+        self.assertEqual(self._feed(MQTTBytesParser(), data), packets)
+        self.assertEqual(self._feed(MQTTBytesParser(), data, 5), packets)
+
+    def test_client_roundtrip(self):
+        """
+        The client parser accepts server packets, starting with a CONNACK.
+        """
+        packets = [
+            ConnACK(session_present=True, return_code=0),
+            SubACK(packet_identifier=1, return_codes=[0, 1, 128]),
+            UnsubACK(packet_identifier=2),
+            PingRESP(),
+        ]
+        data = b"".join(p.serialise() for p in packets)
+
+        self.assertEqual(self._feed(MQTTBytesClientParser(), data, 3), packets)
+
+    def test_large_publish(self):
+        """
+        A publish with a multi-byte remaining length, arriving in small chunks,
+        is only parsed once complete.
+        """
+        payload = b"x" * 200000
+        publish = Publish(duplicate=False, qos_level=0, retain=False, topic_name="big", payload=payload)
+        p = MQTTBytesParser()
+        self._feed(p, self.connect)
+
+        data = publish.serialise()
+        events = []
+        for i in range(0, len(data) - 1, 1000):
+            events.extend(p.data_received(data[i : min(i + 1000, len(data) - 1)]))
+        self.assertEqual(events, [])
+        self.assertEqual(p._state, COLLECTING_REST_OF_PACKET)
+
+        events = p.data_received(data[-1:])
+        self.assertEqual(events, [publish])
+
+    def test_zero_copy_payload(self):
+        """
+        In zero-copy mode, publish payloads are memoryview slices of the
+        received data.
+        """
+        publish = Publish(duplicate=False, qos_level=0, retain=False, topic_name="a/b", payload=b"hello")
+        p = MQTTBytesParser(zero_copy=True)
+
+        events = p.data_received(self.connect + publish.serialise())
+
+        self.assertEqual(len(events), 2)
+        self.assertIsInstance(events[1].payload, memoryview)
+        self.assertEqual(events[1].payload.tobytes(), b"hello")
+        self.assertTrue(events[1].payload.readonly)
+
+    def test_malformed_packet(self):
+        """
+        Reading off the end of a packet body is a protocol violation.
+        """
+        p = MQTTBytesParser()
+
+        events = self._feed(p, b"\x10\x13\x00\x04MQTT\x04\x02\x00x\x00\x09test123", 1)
+
+        self.assertEqual(events, [Failure("Corrupt data, fell off the end: Cannot read 9 bytes, only 7 available.")])
+        self.assertEqual(p._state, PROTOCOL_VIOLATION)
+        self.assertEqual(p.data_received(self.connect), [])
+
+    def test_too_large_header(self):
+        """
+        A remaining length of more than 4 bytes is a protocol violation.
+        """
+        p = MQTTBytesParser()
+
+        events = self._feed(p, unhexlify(b"10ffffffff000000000000000000"), 1)
+
+        self.assertEqual(events, [Failure("Too big packet size")])
+        self.assertEqual(p._state, PROTOCOL_VIOLATION)
+
+    def test_connect_not_first(self):
+        """
+        Conformance Statement MQTT-3.1.0-1
+        """
+        p = MQTTBytesParser()
+
+        events = self._feed(p, unhexlify(b"820d00010008746573742f31323300"))
+
+        self.assertEqual(events, [Failure("Connect packet was not first")])
+        self.assertEqual(p._state, PROTOCOL_VIOLATION)
+
+    def test_multiple_connects(self):
+        """
+        Conformance Statement MQTT-3.1.0-2
+        """
+        p = MQTTBytesParser()
+
+        events = self._feed(p, self.connect + self.connect)
+
+        self.assertEqual(len(events), 2)
+        self.assertIsInstance(events[0], Connect)
+        self.assertEqual(events[1], Failure("Multiple Connect packets"))
+        self.assertEqual(p._state, PROTOCOL_VIOLATION)
+
+    def test_connect_reserved_area(self):
+        """
+        Conformance Statement MQTT-3.1.2-3
+        """
+        events = self._feed(MQTTBytesParser(), unhexlify(b"111300044d51545404020002000774657374313233"))
+
+        self.assertEqual(events, [Failure("Bad flags in Connect")])
+
+    def test_invalid_utf8(self):
+        """
+        Conformance statements MQTT-1.5.3-1 and MQTT-1.5.3-2
+        """
+        surrogates = b"\x10\x13\x00\x04\xed\xbf\xbfT\x04\x02\x00x\x00\x07test123"
+        nulls = b"\x10\x13\x00\x04\x00QTT\x04\x02\x00x\x00\x07test123"
+
+        self.assertEqual(
+            self._feed(MQTTBytesParser(), surrogates), [Failure("Invalid UTF-8 string (contains surrogates)")]
+        )
+        self.assertEqual(self._feed(MQTTBytesParser(), nulls), [Failure("Invalid UTF-8 string (contains nulls)")])
+
+    def test_quirks_mode_connect(self):
+        """
+        Trailing bytes in a CONNECT are tolerated with a warning.
+        """
+        events = self._feed(MQTTBytesParser(), b"\x10\x15\x00\x04MQTT\x04\x02\x00x\x00\x07test123\x00\x00")
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].client_id, "test123")
+        warnings = self.flushWarnings()
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(
+            warnings[0]["message"],
+            ("Quirky client CONNECT -- packet length was 21 bytes but only had 19 bytes of useful data"),
+        )
+
+    def test_quirks_mode_connack(self):
+        """
+        Trailing bytes in a CONNACK are tolerated with a warning.
+        """
+        events = self._feed(MQTTBytesClientParser(), b"\x20\x03\x01\x00\x00")
+
+        self.assertEqual(events, [ConnACK(session_present=True, return_code=0)])
+        warnings = self.flushWarnings()
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(
+            warnings[0]["message"],
+            ("Quirky server CONNACK -- packet length was 3 bytes but only had 2 bytes of useful data"),
+        )
@@ -26,7 +26,7 @@ from crossbar.bridge.mqtt._events import (
     Unsubscribe,
 )
 from crossbar.bridge.mqtt._utils import iterbytes
-from crossbar.bridge.mqtt.protocol import MQTTClientParser
+from crossbar.bridge.mqtt.protocol import MQTTBytesClientParser
 from crossbar.bridge.mqtt.tx import MQTTServerTwistedProtocol, Session
 
 try:
@@ -41,10 +41,11 @@ from twisted.trial.unittest import TestCase
 @attr.s
 class BasicHandler(object):
     _connect_code = attr.ib(default=0)
+    _session_present = attr.ib(default=False)
 
     def process_connect(self, event):
         d = Deferred()
-        d.callback((self._connect_code, False))
+        d.callback((self._connect_code, self._session_present))
         return d
 
     def new_wamp_session(self, event):
@@ -66,14 +67,18 @@ class BasicHandler(object):
         return
 
 
-def make_test_items(handler):
+def make_test_items(handler, session=None):
     r = Clock()
     t = StringTransport()
     p = MQTTServerTwistedProtocol(handler, r)
-    cp = MQTTClientParser()
+    cp = MQTTBytesClientParser()
 
     p.makeConnection(t)
 
+    if session is not None:
+        # the WAMP layer takes over the session state stored when the client disconnected
+        p.session = session
+
     return r, t, p, cp
 
 
@@ -1103,7 +1108,10 @@ class SendPublishTests(TestCase):
         t.loseConnection()
         p.connectionLost(None)
 
-        r2, t2, p2, cp2 = make_test_items(h)
+        # the WAMP layer stores the session state when the client disconnects, and
+        # resumes the session when it connects again
+        state = p.session.marshal()
+        r2, t2, p2, cp2 = make_test_items(BasicHandler(session_present=True), Session.parse("test123", state))
 
         # We must NOT have a clean session
         data = Connect(client_id="test123", flags=ConnectFlags(clean_session=False)).serialise()
@@ -1175,7 +1183,10 @@ class SendPublishTests(TestCase):
         t.loseConnection()
         p.connectionLost(None)
 
-        r2, t2, p2, cp2 = make_test_items(h)
+        # the WAMP layer stores the session state when the client disconnects, and
+        # resumes the session when it connects again
+        state = p.session.marshal()
+        r2, t2, p2, cp2 = make_test_items(BasicHandler(session_present=True), Session.parse("test123", state))
 
         # We must NOT have a clean session
         data = Connect(client_id="test123", flags=ConnectFlags(clean_session=False)).serialise()
@@ -1272,7 +1283,10 @@ class SendPublishTests(TestCase):
         t.loseConnection()
         p.connectionLost(None)
 
-        r2, t2, p2, cp2 = make_test_items(h)
+        # the WAMP layer stores the session state when the client disconnects, and
+        # resumes the session when it connects again
+        state = p.session.marshal()
+        r2, t2, p2, cp2 = make_test_items(BasicHandler(session_present=True), Session.parse("test123", state))
 
         # We must NOT have a clean session
         data = Connect(client_id="test123", flags=ConnectFlags(clean_session=False)).serialise()
@@ -1336,9 +1350,131 @@ class SendPublishTests(TestCase):
         # Still nothing
         self.assertEqual(t.value(), b"")
 
-    for x in [
-        test_qos_1_resent_on_disconnect,
-        test_qos_2_resent_on_disconnect_pubcomp,
-        test_qos_2_resent_on_disconnect_pubrel,
-    ]:
-        x.todo = "Needs WAMP-level implementation first, and the WAMP router to resend ACKs/messages"
+
+class InFlightWindowTests(TestCase):
+    """
+    Tests for outgoing QoS 1/2 messages in flight, and resuming sessions.
+    """
+
+    def _connect(self, session=None, max_inflight=2):
+        h = BasicHandler()
+        if session is not None:
+            h.process_connect = lambda event: succeed((0, True))
+        r = Clock()
+        t = StringTransport()
+        p = MQTTServerTwistedProtocol(h, r, max_inflight=max_inflight)
+        cp = MQTTBytesClientParser()
+        p.makeConnection(t)
+        if session is not None:
+            p.session = session
+
+        p.dataReceived(Connect(client_id="test123", flags=ConnectFlags(clean_session=session is None)).serialise())
+        r.advance(0.1)
+        events = cp.data_received(t.value())
+        t.clear()
+        self.assertEqual(events[0], ConnACK(session_present=session is not None, return_code=0))
+        return r, t, p, cp, events[1:]
+
+    def _publish(self, packet_id, qos=1, duplicate=False):
+        return Publish(
+            duplicate=duplicate,
+            qos_level=qos,
+            retain=False,
+            packet_identifier=packet_id,
+            topic_name="hello",
+            payload=b"some bytes",
+        )
+
+    def test_window(self):
+        """
+        No more than max_inflight QoS 1 messages are sent before they are
+        acknowledged, QoS 0 messages queue up behind them.
+        """
+        r, t, p, cp, _ = self._connect(max_inflight=2)
+
+        for qos in [1, 1, 1, 0]:
+            p.send_publish("hello", qos, b"some bytes", False)
+        r.advance(0.1)
+
+        self.assertEqual(cp.data_received(t.value()), [self._publish(1), self._publish(2)])
+        t.clear()
+        self.assertEqual(len(p.session.queued_messages), 2)
+
+        p.dataReceived(PubACK(packet_identifier=1).serialise())
+        r.advance(0.1)
+
+        self.assertEqual(cp.data_received(t.value()), [self._publish(3)])
+        t.clear()
+        self.assertEqual(list(p.session.in_flight), [2, 3])
+
+        p.dataReceived(PubACK(packet_identifier=2).serialise())
+        r.advance(0.1)
+
+        self.assertEqual(cp.data_received(t.value()), [self._publish(None, qos=0)])
+        self.assertEqual(list(p.session.in_flight), [3])
+        self.assertEqual(len(p.session.queued_messages), 0)
+
+    def test_qos_2_flow(self):
+        """
+        A QoS 2 message stays in flight until the PubCOMP.
+        """
+        r, t, p, cp, _ = self._connect(max_inflight=1)
+
+        p.send_publish("hello", 2, b"some bytes", False)
+        p.send_publish("hello", 2, b"some bytes", False)
+        r.advance(0.1)
+        self.assertEqual(cp.data_received(t.value()), [self._publish(1, qos=2)])
+        t.clear()
+
+        p.dataReceived(PubREC(packet_identifier=1).serialise())
+        r.advance(0.1)
+        self.assertEqual(cp.data_received(t.value()), [PubREL(packet_identifier=1)])
+        t.clear()
+
+        p.dataReceived(PubCOMP(packet_identifier=1).serialise())
+        r.advance(0.1)
+        self.assertEqual(cp.data_received(t.value()), [self._publish(2, qos=2)])
+
+    def test_byte_budget(self):
+        """
+        Queued messages over the per-client byte budget are dropped, oldest
+        first.
+        """
+        r, t, p, cp, _ = self._connect(max_inflight=1)
+        p.session.max_bytes = 3 * len("hello" + "some bytes")
+
+        for i in range(5):
+            p.send_publish("hello", 1, b"some bytes", False)
+
+        self.assertEqual(len(p.session.queued_messages), 3)
+        self.assertEqual(p.session.dropped, 2)
+
+    def test_resume_session(self):
+        """
+        When a session is resumed, messages in flight are sent again (with DUP
+        set, or as PubREL after a PubREC), followed by the queued messages.
+
+        Compliance statements: MQTT-4.4.0-1, MQTT-3.3.1-1
+        """
+        r, t, p, cp, _ = self._connect(max_inflight=2)
+
+        for qos in [1, 2, 2]:
+            p.send_publish("hello", qos, b"some bytes", False)
+        r.advance(0.1)
+        p.dataReceived(PubREC(packet_identifier=2).serialise())
+        p.session.subscriptions["hello"] = 2
+        p.session.authid = "test123"
+
+        state = p.session.marshal()
+        self.assertEqual(len(state["messages"]), 3)
+        self.assertEqual(state["subscriptions"], {"hello": 2})
+
+        session = Session.parse("test123", state)
+        self.assertEqual(session.authid, "test123")
+        r, t, p, cp, events = self._connect(session=session, max_inflight=2)
+
+        self.assertEqual(events, [self._publish(1, duplicate=True), PubREL(packet_identifier=2)])
+
+        p.dataReceived(PubACK(packet_identifier=1).serialise())
+        r.advance(0.1)
+        self.assertEqual(cp.data_received(t.value()), [self._publish(3, qos=2)])
@@ -16,8 +16,10 @@ try:
 except ImportError:
     from twisted.internet.task import Clock
 from autobahn.twisted.wamp import ApplicationSession
+from autobahn.wamp import message
 from autobahn.wamp.exception import ApplicationError
 from autobahn.wamp.types import ComponentConfig
+from mock import Mock
 from twisted.internet import selectreactor
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.protocol import Factory, Protocol
@@ -35,11 +37,13 @@ from crossbar.bridge.mqtt._events import (
     Disconnect,
     PubACK,
     Publish,
+    PubREL,
     SubACK,
     Subscribe,
     SubscriptionTopicRequest,
 )
-from crossbar.bridge.mqtt.wamp import WampMQTTServerFactory
+from crossbar.bridge.mqtt.tx import AWAITING_ACK
+from crossbar.bridge.mqtt.wamp import WampMQTTServerFactory, WampMQTTServerProtocol
 from crossbar.common.twisted.endpoint import (
     create_connecting_endpoint_from_config,
     create_listening_endpoint_from_config,
@@ -589,3 +593,207 @@ class MQTTAdapterTests(TestCase):
         # This needs to be replaced with the real deal, see https://github.com/crossbario/crossbar/issues/885
         self.assertEqual(len(session.events), 1)
         self.assertEqual(session.events, [{"args": ["foobar"]}])
+
+
+class WampMQTTZeroCopyTests(TestCase):
+    """
+    PUBLISH payloads as views of the received data (``zero_copy`` MQTT transport option).
+    """
+
+    def _factory(self, **options):
+        config = {"options": dict(realm="realm1", **options)}
+        return WampMQTTServerFactory(Mock(), config, Clock())
+
+    def test_build_protocol(self):
+        protocol = self._factory(zero_copy=True).buildProtocol(None)
+        self.assertTrue(protocol._mqtt._mqtt._zero_copy)
+        self.assertFalse(self._factory().buildProtocol(None)._mqtt._mqtt._zero_copy)
+
+    def test_transform_payload(self):
+        factory = self._factory(
+            zero_copy=True,
+            payload_mapping={
+                "a": {"type": "passthrough"},
+                "b": {"type": "native", "serializer": "json"},
+                "c": {"type": "native", "serializer": "cbor"},
+            },
+        )
+
+        # a payload kept in the event is copied, ..
+        _, _, options = self.successResultOf(factory.transform_mqtt("a", memoryview(b"hello")))
+        self.assertEqual(options["payload"], b"hello")
+        self.assertIsInstance(options["payload"], bytes)
+
+        # .. while native payloads are decoded from the view
+        payload = memoryview(factory.serializers["json"].serialize({"args": [1]}))
+        _, _, options = self.successResultOf(factory.transform_mqtt("b", payload))
+        self.assertEqual(options["args"], [1])
+        payload = memoryview(factory.serializers["cbor"].serialize({"args": [2]}))
+        _, _, options = self.successResultOf(factory.transform_mqtt("c", payload))
+        self.assertEqual(options["args"], [2])
+
+
+class WampMQTTSessionTests(TestCase):
+    """
+    Session state, granted QoS and QoS 2 handling of the MQTT protocol, towards a mocked
+    forwarding WAMP session and realm store.
+    """
+
+    def setUp(self):
+        self.protocol = WampMQTTServerProtocol(Clock())
+        self.protocol.factory = Mock()
+        self.protocol.factory._options = {}
+        self.protocol._wamp_session = Mock()
+        self.protocol._wamp_session._authid = "alice"
+        self.protocol._mqtt.send_suback = Mock()
+        self.store = Mock()
+        self.store.pop_mqtt_session = Mock(return_value=None)
+
+        self.state = {
+            "authid": "alice",
+            "subscriptions": {"a/b": 1},
+            "messages": [
+                {
+                    "topic": "a/b",
+                    "body": b"hello",
+                    "qos": 1,
+                    "retained": False,
+                    "packet_id": 7,
+                    "state": AWAITING_ACK,
+                },
+                {"topic": "a/b", "body": b"world", "qos": 1, "retained": False, "packet_id": None, "state": None},
+            ],
+            "bytes": 16,
+        }
+
+    def _connect(self, clean_session=False):
+        packet = Connect(client_id="client1", flags=ConnectFlags(clean_session=clean_session))
+        return self.protocol._resume_session((0, False), packet, self.store)
+
+    def _sent(self, klass):
+        return [c[0][0] for c in self.protocol._wamp_session.onMessage.call_args_list if isinstance(c[0][0], klass)]
+
+    def test_resume_session(self):
+        self.store.pop_mqtt_session.return_value = self.state
+
+        self.assertEqual(self._connect(), (0, True))
+        self.store.pop_mqtt_session.assert_called_once_with("client1")
+
+        session = self.protocol._mqtt.session
+        self.assertEqual(session.client_id, "client1")
+        self.assertEqual(dict(session.subscriptions), {"a/b": 1})
+        self.assertEqual(list(session.in_flight), [7])
+        self.assertEqual([m.body for m in session.queued_messages], [b"world"])
+
+        # the subscriptions of the session are made again
+        subscribes = self._sent(message.Subscribe)
+        self.assertEqual([(m.topic, m.match) for m in subscribes], [("a.b", "exact")])
+
+    def test_resume_session_other_authid(self):
+        self.state["authid"] = "bob"
+        self.store.pop_mqtt_session.return_value = self.state
+
+        self.assertEqual(self._connect(), (0, False))
+        self.assertEqual(self.protocol._mqtt.session.authid, "alice")
+        self.assertEqual(dict(self.protocol._mqtt.session.subscriptions), {})
+        self.assertEqual(self._sent(message.Subscribe), [])
+
+    def test_clean_session(self):
+        self.store.pop_mqtt_session.return_value = self.state
+
+        # the stored state is discarded, and the session is not stored when the client goes away
+        self.assertEqual(self._connect(clean_session=True), (0, False))
+        self.store.pop_mqtt_session.assert_called_once_with("client1")
+        self.protocol.connectionLost(None)
+        self.assertFalse(self.store.store_mqtt_session.called)
+
+    def test_connection_lost_stores_session(self):
+        self.store.pop_mqtt_session.return_value = self.state
+        self._connect()
+        wamp_session = self.protocol._wamp_session
+
+        self.protocol.connectionLost(None)
+
+        self.store.store_mqtt_session.assert_called_once_with("client1", self.protocol._mqtt.session.marshal())
+        client_id, state = self.store.store_mqtt_session.call_args[0]
+        self.assertEqual(state["subscriptions"], {"a/b": 1})
+        self.assertEqual([m["packet_id"] for m in state["messages"]], [7, None])
+        self.assertEqual(state["bytes"], 16)
+        self.assertIsInstance(wamp_session.onMessage.call_args[0][0], message.Goodbye)
+
+        # the session is stored once only
+        self.protocol._wamp_session = None
+        self.protocol.connectionLost(None)
+        self.assertEqual(self.store.store_mqtt_session.call_count, 1)
+
+    def test_suback_granted_qos(self):
+        self.protocol.factory._options["max_qos"] = 1
+        self.protocol.process_subscribe(
+            Subscribe(
+                packet_identifier=1,
+                topic_requests=[
+                    SubscriptionTopicRequest(topic_filter="a/b", max_qos=2),
+                    SubscriptionTopicRequest(topic_filter="c/+", max_qos=0),
+                    SubscriptionTopicRequest(topic_filter="d", max_qos=1),
+                ],
+            )
+        )
+        subscribes = self._sent(message.Subscribe)
+        self.assertEqual(len(subscribes), 3)
+
+        self.protocol.on_message(message.Subscribed(subscribes[0].request, 100))
+        self.protocol.on_message(message.Subscribed(subscribes[1].request, 101))
+        self.assertFalse(self.protocol._mqtt.send_suback.called)
+        self.protocol.on_message(
+            message.Error(message.Subscribe.MESSAGE_TYPE, subscribes[2].request, "wamp.error.not_authorized")
+        )
+
+        # the QoS granted is capped by the configured maximum QoS, and a failed subscription is 128
+        self.protocol._mqtt.send_suback.assert_called_once_with(1, [1, 0, 128])
+        self.assertEqual(self.protocol._subscription_qos, {100: 1, 101: 0})
+        self.assertEqual(dict(self.protocol._mqtt.session.subscriptions), {"a/b": 1, "c/+": 0})
+
+    def test_publish_qos_2_dedup(self):
+        self.protocol._publish = Mock()
+        publish = Publish(
+            duplicate=False, qos_level=2, retain=False, topic_name="a/b", payload=b"hello", packet_identifier=5
+        )
+
+        self.protocol.process_publish_qos_2(publish)
+        self.protocol.process_publish_qos_2(
+            Publish(duplicate=True, qos_level=2, retain=False, topic_name="a/b", payload=b"hello", packet_identifier=5)
+        )
+        # a retransmission before the message was released is not published again
+        self.assertEqual(self.protocol._publish.call_count, 1)
+        self.protocol._publish.assert_called_with(publish, acknowledge=True)
+
+        # after the release, the packet ID can be reused for a new message
+        self.protocol.process_pubrel(PubREL(packet_identifier=5))
+        self.protocol.process_publish_qos_2(publish)
+        self.assertEqual(self.protocol._publish.call_count, 2)
+
+    def test_publish_qos_2_dedup_resumed(self):
+        self.store.pop_mqtt_session.return_value = self.state
+        self._connect()
+        self.protocol._publish = Mock()
+        publish = Publish(
+            duplicate=False, qos_level=2, retain=False, topic_name="a/b", payload=b"hello", packet_identifier=5
+        )
+        self.protocol.process_publish_qos_2(publish)
+
+        # the packet IDs not yet released are stored with the session ..
+        self.protocol.connectionLost(None)
+        client_id, state = self.store.store_mqtt_session.call_args[0]
+        self.assertEqual(state["qos2_received"], [5])
+
+        # .. so a retransmission after reconnecting (on a new connection) is not published again
+        self.setUp()
+        self.protocol._publish = Mock()
+        self.store.pop_mqtt_session.return_value = state
+        self.assertEqual(self._connect(), (0, True))
+        self.protocol.process_publish_qos_2(
+            Publish(duplicate=True, qos_level=2, retain=False, topic_name="a/b", payload=b"hello", packet_identifier=5)
+        )
+        self.assertEqual(self.protocol._publish.call_count, 0)
+        self.protocol.process_pubrel(PubREL(packet_identifier=5))
+        self.assertEqual(self.protocol._mqtt.session.qos2_received, set())
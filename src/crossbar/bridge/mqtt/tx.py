@@ -34,26 +34,19 @@ from ._events import (
     Unsubscribe,
 )
 from .protocol import (
+    PARSERS,
     Failure,
-    MQTTParser,
 )
 
 _ids = count()
 _SIXTEEN_BIT_MAX = 65535
 
+# default number of outgoing QoS 1/2 messages awaiting acknowledgement per client
+DEFAULT_MAX_INFLIGHT = 20
 
-@attr.s
-class Session(object):
-    client_id = attr.ib()
-    queued_messages = attr.ib(default=attr.Factory(collections.deque))
-    _count = attr.ib(default=attr.Factory(count))
-
-    def get_packet_id(self):
-        x = next(self._count)
-        if x == _SIXTEEN_BIT_MAX or x == 0:
-            self._count = count(start=1)
-            x = next(self._count)
-        return x
+# states of outgoing QoS 1/2 messages in flight
+AWAITING_ACK = "publish"  # PUBLISH sent, waiting for PUBACK (QoS 1) or PUBREC (QoS 2)
+AWAITING_COMP = "pubrel"  # PUBREL sent, waiting for PUBCOMP (QoS 2)
 
 
 @attr.s
@@ -62,14 +55,146 @@ class Message(object):
     body = attr.ib()
     qos = attr.ib()
     retained = attr.ib()
+    packet_id = attr.ib(default=None)
+    state = attr.ib(default=None)
+
+    @property
+    def nbytes(self):
+        return len(self.topic) + len(self.body)
+
+    def marshal(self):
+        return {
+            "topic": self.topic,
+            "body": bytes(self.body),
+            "qos": self.qos,
+            "retained": self.retained,
+            "packet_id": self.packet_id,
+            "state": self.state,
+        }
+
+
+@attr.s
+class Session(object):
+    client_id = attr.ib()
+    queued_messages = attr.ib(default=attr.Factory(collections.deque))
+    _count = attr.ib(default=attr.Factory(count))
+
+    # authid of the client owning a persistent session
+    authid = attr.ib(default=None)
+
+    # map: topic filter -> granted QoS
+    subscriptions = attr.ib(default=attr.Factory(collections.OrderedDict))
+
+    # map: packet ID -> outgoing QoS 1/2 message awaiting acknowledgement, oldest first
+    in_flight = attr.ib(default=attr.Factory(collections.OrderedDict))
+
+    # packet IDs of incoming QoS 2 messages published, but not yet released (PUBREL)
+    qos2_received = attr.ib(default=attr.Factory(set))
+
+    # per-client byte budget of queued and in-flight messages (None: unlimited)
+    max_bytes = attr.ib(default=None)
+    nbytes = attr.ib(default=0)
+    dropped = attr.ib(default=0)
+
+    def get_packet_id(self):
+        while True:
+            x = next(self._count)
+            if x == _SIXTEEN_BIT_MAX or x == 0:
+                self._count = count(start=1)
+                x = next(self._count)
+            # MQTT-2.3.1-2: don't reuse the ID of a message still in flight
+            if x not in self.in_flight:
+                return x
+
+    def queue(self, message):
+        """
+        Queue an outgoing message, dropping the oldest queued messages when over budget.
+        """
+        self.queued_messages.append(message)
+        self.nbytes += message.nbytes
+
+        if self.max_bytes is not None:
+            while self.nbytes > self.max_bytes and self.queued_messages:
+                self.nbytes -= self.queued_messages.popleft().nbytes
+                self.dropped += 1
+
+    def next_message(self):
+        message = self.queued_messages.popleft()
+        self.nbytes -= message.nbytes
+        return message
+
+    def send(self, message):
+        """
+        Track an outgoing QoS 1/2 message as in flight.
+        """
+        message.packet_id = self.get_packet_id()
+        message.state = AWAITING_ACK
+        self.in_flight[message.packet_id] = message
+        self.nbytes += message.nbytes
+
+    def complete(self, packet_id):
+        """
+        An outgoing QoS 1/2 message was acknowledged.
+        """
+        message = self.in_flight.pop(packet_id)
+        self.nbytes -= message.nbytes
+        return message
+
+    def marshal(self):
+        """
+        Marshal the state to persist for a clean-session=false session.
+
+        QoS 0 messages still queued are not persisted. The packet IDs of incoming QoS 2
+        messages not yet released are, so that a retransmission after reconnecting is not
+        published again.
+        """
+        messages = [m.marshal() for m in self.in_flight.values()]
+        messages.extend(m.marshal() for m in self.queued_messages if m.qos > 0)
+        return {
+            "authid": self.authid,
+            "subscriptions": dict(self.subscriptions),
+            "messages": messages,
+            "qos2_received": sorted(self.qos2_received),
+            "bytes": sum(len(m["topic"]) + len(m["body"]) for m in messages),
+        }
+
+    @classmethod
+    def parse(cls, client_id, state, max_bytes=None):
+        """
+        Restore a session from persisted state.
+        """
+        session = cls(client_id=client_id, authid=state.get("authid", None), max_bytes=max_bytes)
+        session.subscriptions.update(state.get("subscriptions", {}))
+        session.qos2_received.update(state.get("qos2_received", []))
+        for m in state.get("messages", []):
+            message = Message(
+                topic=m["topic"],
+                body=m["body"],
+                qos=m["qos"],
+                retained=m["retained"],
+                packet_id=m.get("packet_id", None),
+                state=m.get("state", None),
+            )
+            if message.packet_id is not None:
+                session.in_flight[message.packet_id] = message
+                session.nbytes += message.nbytes
+            else:
+                session.queue(message)
+        if session.in_flight:
+            session._count = count(start=max(session.in_flight) + 1)
+        return session
 
 
 class MQTTServerTwistedProtocol(Protocol):
     log = make_logger()
 
-    def __init__(self, handler, reactor, _id_maker=_ids):
+    def __init__(
+        self, handler, reactor, _id_maker=_ids, parser="bytes", max_inflight=DEFAULT_MAX_INFLIGHT, zero_copy=False
+    ):
         self._reactor = reactor
-        self._mqtt = MQTTParser()
+        # (only the bytes parser hands out payloads as memoryview slices of the received data)
+        self._mqtt = PARSERS[parser](zero_copy=True) if zero_copy else PARSERS[parser]()
+        self._max_inflight = max_inflight
         self._handler = handler
         self._timeout = None
         self._timeout_time = 0
@@ -134,45 +259,46 @@ class MQTTServerTwistedProtocol(Protocol):
         if qos not in [0, 1, 2]:
             raise ValueError("QoS must be [0, 1, 2]")
 
-        self.session.queued_messages.append(Message(topic=topic, qos=qos, body=body, retained=retained))
+        self.session.queue(Message(topic=topic, qos=qos, body=body, retained=retained))
+        self._schedule_flush()
 
-        if not self._flush_publishes and self._connected:
+    def _schedule_flush(self):
+        if not self._flush_publishes and self._connected and self.session.queued_messages:
             self._flush_publishes = self._reactor.callLater(0, self._flush_saved_messages)
 
-    def _send_publish(self, topic, qos, body, retained):
-        if qos == 0:
-            publish = Publish(
-                duplicate=False, qos_level=qos, retain=retained, packet_identifier=None, topic_name=topic, payload=body
-            )
+    def _send_publish(self, message, duplicate=False):
+        if message.qos == 0:
+            packet_id = None
 
-        elif qos == 1:
-            packet_id = self.session.get_packet_id()
-            publish = Publish(
-                duplicate=False,
-                qos_level=qos,
-                retain=retained,
-                packet_identifier=packet_id,
-                topic_name=topic,
-                payload=body,
-            )
-
-        elif qos == 2:
-            packet_id = self.session.get_packet_id()
-            publish = Publish(
-                duplicate=False,
-                qos_level=qos,
-                retain=retained,
-                packet_identifier=packet_id,
-                topic_name=topic,
-                payload=body,
-            )
+        elif message.qos in [1, 2]:
+            if not duplicate:
+                self.session.send(message)
+            packet_id = message.packet_id
 
         else:
             self.log.warn(log_category="MQ303")
             return
 
+        publish = Publish(
+            duplicate=duplicate,
+            qos_level=message.qos,
+            retain=message.retained,
+            packet_identifier=packet_id,
+            topic_name=message.topic,
+            payload=message.body,
+        )
         self._send_packet(publish)
 
+    def _resend_in_flight(self):
+        """
+        Retransmit the messages in flight of a resumed session (MQTT-4.4.0-1).
+        """
+        for message in self.session.in_flight.values():
+            if message.state == AWAITING_COMP:
+                self._send_packet(PubREL(packet_identifier=message.packet_id))
+            else:
+                self._send_publish(message, duplicate=True)
+
     def _lose_connection(self):
         self.log.debug(
             log_category="MQ400",
@@ -199,10 +325,24 @@ class MQTTServerTwistedProtocol(Protocol):
         if not self._connected:
             return None
 
-        # New, queued messages
-        while self.session.queued_messages:
-            message = self.session.queued_messages.popleft()
-            self._send_publish(message.topic, message.qos, message.body, message.retained)
+        # New, queued messages -- as long as the window of QoS 1/2 messages in
+        # flight is not full
+        while self.session.queued_messages and len(self.session.in_flight) < self._max_inflight:
+            self._send_publish(self.session.next_message())
+
+    def _acknowledged(self, event, qos, state):
+        message = self.session.in_flight.get(event.packet_identifier, None)
+
+        if message is None or message.qos != qos or message.state != state:
+            self.log.debug(
+                "unexpected {packet} for packet ID {packet_id} from client {client_id}",
+                packet=event.__class__.__name__,
+                packet_id=event.packet_identifier,
+                client_id=self.session.client_id,
+            )
+            return None
+
+        return message
 
     @inlineCallbacks
     def _handle(self, data):
@@ -270,6 +410,13 @@ class MQTTServerTwistedProtocol(Protocol):
                     self.transport.loseConnection()
                     returnValue(None)
 
+                # MQTT-4.4.0-1 - on reconnecting with a session present, resend
+                # unacknowledged PUBLISH (and PUBREL) packets, then the
+                # messages queued while disconnected
+                if session_present:
+                    self._resend_in_flight()
+                self._schedule_flush()
+
                 self.log.debug(log_category="MQ200", client_id=event.client_id)
                 continue
 
@@ -374,6 +521,11 @@ class MQTTServerTwistedProtocol(Protocol):
                 continue
 
             elif isinstance(event, PubACK):
+                # QoS 1 delivery complete
+                if self._acknowledged(event, 1, AWAITING_ACK):
+                    self.session.complete(event.packet_identifier)
+                    self._schedule_flush()
+
                 try:
                     self._handler.process_puback(event)
                 except:
@@ -383,6 +535,11 @@ class MQTTServerTwistedProtocol(Protocol):
                     returnValue(None)
 
             elif isinstance(event, PubREC):
+                # QoS 2 message received, it stays in flight until PUBCOMP
+                message = self._acknowledged(event, 2, AWAITING_ACK)
+                if message:
+                    message.state = AWAITING_COMP
+
                 try:
                     self._handler.process_pubrec(event)
                 except:
@@ -411,6 +568,11 @@ class MQTTServerTwistedProtocol(Protocol):
                 continue
 
             elif isinstance(event, PubCOMP):
+                # QoS 2 delivery complete
+                if self._acknowledged(event, 2, AWAITING_COMP):
+                    self.session.complete(event.packet_identifier)
+                    self._schedule_flush()
+
                 try:
                     self._handler.process_pubcomp(event)
                 except:
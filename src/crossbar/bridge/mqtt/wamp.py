@@ -30,11 +30,19 @@ from twisted.internet.protocol import Factory, Protocol
 from txaio import make_logger
 from zope.interface import implementer
 
-from crossbar.bridge.mqtt.tx import MQTTServerTwistedProtocol
+from crossbar.bridge.mqtt._events import SubscriptionTopicRequest
+from crossbar.bridge.mqtt.tx import DEFAULT_MAX_INFLIGHT, MQTTServerTwistedProtocol, Session
 from crossbar.router.session import RouterSession
 
 _validator = Utf8Validator()
 
+# default per-client byte budget of queued and unacknowledged messages
+DEFAULT_SESSION_MAX_BYTES = 1048576
+
+# MQTT subscription request ID used when restoring the subscriptions of a resumed
+# session (0 is never used as a packet identifier by clients, MQTT-2.3.1-1)
+_RESTORE_SUBSCRIPTIONS = 0
+
 
 def _mqtt_topicfilter_to_wamp(topic):
     """
@@ -159,8 +167,10 @@ class WampTransport(object):
 class WampMQTTServerProtocol(Protocol):
     log = make_logger()
 
-    def __init__(self, reactor):
-        self._mqtt = MQTTServerTwistedProtocol(self, reactor)
+    def __init__(self, reactor, parser="bytes", max_inflight=DEFAULT_MAX_INFLIGHT, zero_copy=False):
+        self._mqtt = MQTTServerTwistedProtocol(
+            self, reactor, parser=parser, max_inflight=max_inflight, zero_copy=zero_copy
+        )
         self._request_to_packetid = {}
         self._waiting_for_connect = None
         self._inflight_subscriptions = {}
@@ -169,6 +179,12 @@ class WampMQTTServerProtocol(Protocol):
         self._topic_lookup = {}
         self._wamp_session = None
 
+        # map: WAMP subscription ID -> QoS granted to the MQTT subscription(s)
+        self._subscription_qos = {}
+
+        # realm store holding the state of the session, when clean-session=false
+        self._session_store = None
+
     def on_message(self, inc_msg):
         try:
             self._on_message(inc_msg)
@@ -196,8 +212,11 @@ class WampMQTTServerProtocol(Protocol):
         elif isinstance(inc_msg, message.Subscribed):
             # Successful subscription!
             mqtt_id = self._subrequest_to_mqtt_subrequest[inc_msg.request]
-            self._inflight_subscriptions[mqtt_id][inc_msg.request]["response"] = 0
-            self._topic_lookup[inc_msg.subscription] = self._inflight_subscriptions[mqtt_id][inc_msg.request]["topic"]
+            request = self._inflight_subscriptions[mqtt_id][inc_msg.request]
+            request["response"] = request["qos"]
+            self._topic_lookup[inc_msg.subscription] = request["topic"]
+            self._subscription_qos[inc_msg.subscription] = request["qos"]
+            self._mqtt.session.subscriptions[request["topic"]] = request["qos"]
 
             if -1 not in [x["response"] for x in self._inflight_subscriptions[mqtt_id].values()]:
                 self._subrequest_callbacks[mqtt_id].callback(None)
@@ -218,7 +237,8 @@ class WampMQTTServerProtocol(Protocol):
             except:
                 self.log.failure()
             else:
-                self._mqtt.send_publish(mapped_topic, 0, payload, retained=inc_msg.retained or False)
+                qos = self._subscription_qos.get(inc_msg.subscription, 0)
+                self._mqtt.send_publish(mapped_topic, qos, payload, retained=inc_msg.retained or False)
 
         elif isinstance(inc_msg, message.Goodbye):
             if self._mqtt.transport:
@@ -233,6 +253,14 @@ class WampMQTTServerProtocol(Protocol):
             self._when_ready()
 
     def connectionLost(self, reason):
+        self._mqtt.connectionLost(reason)
+
+        if self._session_store:
+            # persist subscriptions and unacknowledged messages of the session
+            session = self._mqtt.session
+            self._session_store.store_mqtt_session(session.client_id, session.marshal())
+            self._session_store = None
+
         if self._wamp_session:
             msg = message.Goodbye()
             self._wamp_session.onMessage(msg)
@@ -278,10 +306,15 @@ class WampMQTTServerProtocol(Protocol):
         #         password=None)
         self.log.info("WampMQTTServerProtocol.process_connect(packet={packet})", packet=packet)
 
-        # we don't support session resumption: https://github.com/crossbario/crossbar/issues/892
-        if not packet.flags.clean_session:
+        # per-client byte budget of queued and unacknowledged messages
+        self._mqtt.session.max_bytes = self.factory._options.get("session_max_bytes", DEFAULT_SESSION_MAX_BYTES)
+
+        # session resumption needs a realm store to keep the session state in
+        store = self._get_store()
+        if not packet.flags.clean_session and store is None:
             self.log.warn(
-                "denying MQTT connect from {peer}, as the clients wants to resume a session (which we do not support)",
+                "denying MQTT connect from {peer}, as the clients wants to resume a session "
+                "(which needs a realm store)",
                 peer=peer2str(self.transport.getPeer()),
             )
             return succeed((1, False))
@@ -328,6 +361,9 @@ class WampMQTTServerProtocol(Protocol):
 
         self._wamp_session.onMessage(msg)
 
+        if store is not None:
+            self._waiting_for_connect.addCallback(self._resume_session, packet, store)
+
         if packet.flags.will:
             # it's unclear from the MQTT spec whether a) the publication of the last will
             # is to happen in-band during "connect", and if it fails, deny the connection,
@@ -368,6 +404,60 @@ class WampMQTTServerProtocol(Protocol):
 
         return self._waiting_for_connect
 
+    def _get_store(self):
+        router = self.factory._router_factory.get(self.factory._options.get("realm", None))
+        if router is None:
+            return None
+        return router._store
+
+    def _resume_session(self, res, packet, store):
+        """
+        Once the MQTT client is connected (authenticated), take over the session state
+        stored for the client from the realm store.
+        """
+        accept_conn, _ = res
+        if accept_conn != 0:
+            return res
+
+        # with clean-session=true, any state stored before is discarded (MQTT-3.1.2-6)
+        state = store.pop_mqtt_session(packet.client_id)
+
+        if packet.flags.clean_session:
+            return res
+
+        authid = self._wamp_session._authid
+        if state is not None and state.get("authid", None) != authid:
+            self.log.warn(
+                "not resuming MQTT session of client {client_id}, as it was stored for another authid",
+                client_id=packet.client_id,
+            )
+            state = None
+
+        max_bytes = self._mqtt.session.max_bytes
+        if state is not None:
+            self._mqtt.session = Session.parse(packet.client_id, state, max_bytes=max_bytes)
+        else:
+            self._mqtt.session = Session(client_id=packet.client_id, authid=authid, max_bytes=max_bytes)
+        self._session_store = store
+
+        self.log.info(
+            "MQTT session of client {client_id} {action} ({subscriptions} subscriptions, {messages} messages)",
+            client_id=packet.client_id,
+            action="resumed" if state is not None else "created",
+            subscriptions=len(self._mqtt.session.subscriptions),
+            messages=len(self._mqtt.session.in_flight) + len(self._mqtt.session.queued_messages),
+        )
+
+        if self._mqtt.session.subscriptions:
+            # subscribe again (without sending a SUBACK) to the topics of the session
+            topic_requests = [
+                SubscriptionTopicRequest(topic_filter=topic_filter, max_qos=qos)
+                for topic_filter, qos in self._mqtt.session.subscriptions.items()
+            ]
+            self._subscribe(_RESTORE_SUBSCRIPTIONS, topic_requests)
+
+        return (0, state is not None)
+
     @inlineCallbacks
     def _publish(self, event, acknowledge=None):
         """
@@ -410,6 +500,18 @@ class WampMQTTServerProtocol(Protocol):
         except:
             self.log.failure()
 
+    def process_publish_qos_2(self, event):
+        # a retransmission of a message not yet released must not be published again
+        # (also after reconnecting, as the packet IDs are kept with the session state)
+        qos2_received = self._mqtt.session.qos2_received
+        if event.packet_identifier in qos2_received:
+            return
+        qos2_received.add(event.packet_identifier)
+        try:
+            return self._publish(event, acknowledge=True)
+        except:
+            self.log.failure()
+
     def process_puback(self, event):
         return
 
@@ -417,25 +519,39 @@ class WampMQTTServerProtocol(Protocol):
         return
 
     def process_pubrel(self, event):
-        return
+        self._mqtt.session.qos2_received.discard(event.packet_identifier)
 
     def process_pubcomp(self, event):
         return
 
     def process_subscribe(self, packet):
+        d = self._subscribe(packet.packet_identifier, packet.topic_requests)
+
+        @d.addCallback
+        def _(return_codes):
+            self._mqtt.send_suback(packet.packet_identifier, return_codes)
+
+    def _subscribe(self, mqtt_id, topic_requests):
+        """
+        Subscribe to the WAMP topics mapped from MQTT topic filters.
+
+        :returns: A deferred firing with the MQTT return codes (the QoS granted, or 128
+            for a failed subscription) of the topic requests.
+        """
         packet_watch = OrderedDict()
         d = Deferred()
+        max_qos = self.factory._options.get("max_qos", 2)
 
         @d.addCallback
         def _(ign):
-            self._mqtt.send_suback(packet.packet_identifier, [x["response"] for x in packet_watch.values()])
-            del self._inflight_subscriptions[packet.packet_identifier]
-            del self._subrequest_callbacks[packet.packet_identifier]
+            del self._inflight_subscriptions[mqtt_id]
+            del self._subrequest_callbacks[mqtt_id]
+            return [x["response"] for x in packet_watch.values()]
 
-        self._subrequest_callbacks[packet.packet_identifier] = d
-        self._inflight_subscriptions[packet.packet_identifier] = packet_watch
+        self._subrequest_callbacks[mqtt_id] = d
+        self._inflight_subscriptions[mqtt_id] = packet_watch
 
-        for n, x in enumerate(packet.topic_requests):
+        for n, x in enumerate(topic_requests):
             topic, match = _mqtt_topicfilter_to_wamp(x.topic_filter)
 
             self.log.info("process_subscribe -> topic={topic}, match={match}", topic=topic, match=match)
@@ -450,15 +566,20 @@ class WampMQTTServerProtocol(Protocol):
             )
 
             try:
-                packet_watch[request_id] = {"response": -1, "topic": x.topic_filter}
-                self._subrequest_to_mqtt_subrequest[request_id] = packet.packet_identifier
+                packet_watch[request_id] = {"response": -1, "topic": x.topic_filter, "qos": min(x.max_qos, max_qos)}
+                self._subrequest_to_mqtt_subrequest[request_id] = mqtt_id
                 self._wamp_session.onMessage(msg)
             except:
                 self.log.failure()
                 packet_watch[request_id] = {"response": 128}
 
+        return d
+
     @inlineCallbacks
     def process_unsubscribe(self, packet):
+        for topic in packet.topics:
+            self._mqtt.session.subscriptions.pop(topic, None)
+
         for topic in packet.topics:
             if topic in self._subscriptions:
                 yield self._subscriptions.pop(topic).unsubscribe()
@@ -492,7 +613,12 @@ class WampMQTTServerFactory(Factory):
             self._set_payload_format(topic, pmap)
 
     def buildProtocol(self, addr):
-        protocol = self.protocol(self._reactor)
+        protocol = self.protocol(
+            self._reactor,
+            parser=self._options.get("parser", "bytes"),
+            max_inflight=self._options.get("max_inflight", DEFAULT_MAX_INFLIGHT),
+            zero_copy=self._options.get("zero_copy", False),
+        )
         protocol.factory = self
         return protocol
 
@@ -604,6 +730,13 @@ class WampMQTTServerFactory(Factory):
         payload_format = self._get_payload_format(mapped_topic)
         payload_format_type = payload_format["type"]
 
+        # with zero_copy, the payload is a memoryview of the data received: binary serializers
+        # decode it as is, while a payload kept in the event (or decoded as text) is copied once here
+        if isinstance(payload, memoryview) and (
+            payload_format_type != "native" or payload_format.get("serializer", None) == "json"
+        ):
+            payload = payload.tobytes()
+
         if payload_format_type == "passthrough":
             options = {"payload": payload, "enc_algo": "mqtt"}
 
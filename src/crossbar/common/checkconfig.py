@@ -378,6 +378,33 @@ def check_or_raise_uri(value, message):
     return value
 
 
+def check_transport_auth_cache(config, name):
+    """
+    Check the (optional) authentication cache attributes of a dynamic authentication method
+    configuration item.
+
+    :param config: The authentication method configuration item.
+    :type config: dict
+
+    :param name: The name of the authentication method for error messages, eg ``"WAMP-Ticket"``.
+    :type name: str
+    """
+    for attr in ["authenticator-cache-ttl", "authenticator-cache-size"]:
+        if attr in config:
+            value = config[attr]
+            valid_types = (int, float) if attr == "authenticator-cache-ttl" else (int,)
+            if type(value) not in valid_types or value <= 0:
+                raise InvalidConfigException(
+                    "invalid value {} for attribute '{}' in {} configuration - expected a positive {}".format(
+                        value, attr, name, "number" if attr == "authenticator-cache-ttl" else "integer"
+                    )
+                )
+    if "authenticator-cache-size" in config and "authenticator-cache-ttl" not in config:
+        raise InvalidConfigException(
+            "attribute 'authenticator-cache-size' requires 'authenticator-cache-ttl' in {} configuration".format(name)
+        )
+
+
 def check_transport_auth_ticket(config):
     """
     Check a Ticket-based authentication configuration item.
@@ -433,6 +460,7 @@ def check_transport_auth_ticket(config):
             config["authenticator"],
             "invalid authenticator URI '{}' in dynamic WAMP-Ticket configuration".format(config["authenticator"]),
         )
+        check_transport_auth_cache(config, "WAMP-Ticket")
 
     elif config["type"] == "function":
         if "create" not in config:
@@ -495,6 +523,7 @@ def check_transport_auth_wampcra(config):
             config["authenticator"],
             "invalid authenticator URI '{}' in dynamic WAMP-CRA configuration".format(config["authenticator"]),
         )
+        check_transport_auth_cache(config, "WAMP-CRA")
 
     elif config["type"] == "function":
         if "create" not in config:
@@ -649,6 +678,7 @@ def check_transport_auth_cryptosign(config):
             config["authenticator"],
             "invalid authenticator URI '{}' in dynamic WAMP-Cryptosign configuration".format(config["authenticator"]),
         )
+        check_transport_auth_cache(config, "WAMP-Cryptosign")
 
     elif config["type"] == "function":
         if "create" not in config:
@@ -715,6 +745,7 @@ def check_transport_auth_scram(config):
             config["authenticator"],
             "invalid authenticator URI '{}' in dynamic WAMP-SCRAM configuration".format(config["authenticator"]),
         )
+        check_transport_auth_cache(config, "WAMP-SCRAM")
 
     elif config["type"] == "function":
         if "create" not in config:
@@ -2388,6 +2419,11 @@ def check_listening_transport_mqtt(personality, transport, with_endpoint=True):
             "role": (False, [str]),
             "payload_mapping": (False, [Mapping]),
             "auth": (False, [Mapping]),
+            "parser": (False, [str]),
+            "zero_copy": (False, [bool]),
+            "max_qos": (False, [int]),
+            "max_inflight": (False, [int]),
+            "session_max_bytes": (False, [int]),
         },
         options,
         "invalid MQTT options",
@@ -2395,6 +2431,21 @@ def check_listening_transport_mqtt(personality, transport, with_endpoint=True):
 
     check_realm_name(options["realm"])
 
+    if "parser" in options and options["parser"] not in ["bytes", "bitstring"]:
+        raise InvalidConfigException(
+            'invalid MQTT parser "{}" (must be "bytes" or "bitstring")'.format(options["parser"])
+        )
+
+    if options.get("zero_copy", False) and options.get("parser", "bytes") != "bytes":
+        raise InvalidConfigException('invalid MQTT option zero_copy (only valid with the "bytes" parser)')
+
+    if "max_qos" in options and options["max_qos"] not in [0, 1, 2]:
+        raise InvalidConfigException("invalid MQTT max_qos {} (must be 0, 1 or 2)".format(options["max_qos"]))
+
+    for k in ["max_inflight", "session_max_bytes"]:
+        if k in options and options[k] < 1:
+            raise InvalidConfigException("invalid MQTT {} {} (must be positive)".format(k, options[k]))
+
     if "payload_mapping" in options:
         for k, v in options["payload_mapping"].items():
             if not isinstance(k, str):
@@ -2732,6 +2783,8 @@ def check_listening_transport_rawsocket(personality, transport, with_endpoint=Tr
             "debug",
             "options",
             "auth",
+            "multiplex",
+            "max_channels",
         ]:
             raise InvalidConfigException(
                 "encountered unknown attribute '{}' in RawSocket transport configuration".format(k)
@@ -2780,6 +2833,27 @@ def check_listening_transport_rawsocket(personality, transport, with_endpoint=Tr
                 "'debug' in RawSocket transport configuration must be boolean ({} encountered)".format(type(debug))
             )
 
+    if "multiplex" in transport:
+        multiplex = transport["multiplex"]
+        if not isinstance(multiplex, bool):
+            raise InvalidConfigException(
+                "'multiplex' in RawSocket transport configuration must be boolean ({} encountered)".format(
+                    type(multiplex)
+                )
+            )
+
+    if "max_channels" in transport:
+        if not transport.get("multiplex", False):
+            raise InvalidConfigException(
+                "'max_channels' in RawSocket transport configuration is only valid with 'multiplex'"
+            )
+        max_channels = transport["max_channels"]
+        if type(max_channels) != int or max_channels < 1:
+            raise InvalidConfigException(
+                "'max_channels' in RawSocket transport configuration must be a positive integer ({} "
+                "encountered)".format(max_channels)
+            )
+
     if "auth" in transport:
         personality.check_transport_auth(personality, transport["auth"])
 
@@ -3181,7 +3255,19 @@ def check_router_realm(personality, realm, ignore=[]):
     if not isinstance(options, Mapping):
         raise InvalidConfigException("Realm 'options' must be a dict")
     for arg, val in options.items():
-        if arg not in ["event_dispatching_chunk_size", "uri_check", "enable_meta_api", "bridge_meta_api"] + ignore:
+        if (
+            arg
+            not in [
+                "event_dispatching_chunk_size",
+                "event_dispatching_serialize_once",
+                "invoke_policies",
+                "authorization_cache_size",
+                "uri_check",
+                "enable_meta_api",
+                "bridge_meta_api",
+            ]
+            + ignore
+        ):
             raise InvalidConfigException("Unknown realm option '{}'".format(arg))
     if "event_dispatching_chunk_size" in options:
         try:
@@ -3191,6 +3277,45 @@ def check_router_realm(personality, realm, ignore=[]):
         except ValueError:
             raise InvalidConfigException("Realm option 'event_dispatching_chunk_size' must be a positive int")
 
+    if "authorization_cache_size" in options:
+        acs = options["authorization_cache_size"]
+        if type(acs) != int or acs <= 0:
+            raise InvalidConfigException("Realm option 'authorization_cache_size' must be a positive int")
+
+    if "event_dispatching_serialize_once" in options:
+        if not isinstance(options["event_dispatching_serialize_once"], bool):
+            raise InvalidConfigException(
+                "Invalid type {} for event_dispatching_serialize_once in realm options".format(
+                    type(options["event_dispatching_serialize_once"])
+                )
+            )
+
+    if "invoke_policies" in options:
+        if not isinstance(options["invoke_policies"], Sequence) or isinstance(options["invoke_policies"], str):
+            raise InvalidConfigException(
+                "Invalid type {} for invoke_policies in realm options".format(type(options["invoke_policies"]))
+            )
+        for policy in options["invoke_policies"]:
+            check_dict_args(
+                {
+                    "uri": (True, [str]),
+                    "match": (False, [str]),
+                    "invoke": (True, [str]),
+                },
+                policy,
+                "invalid item in realm option 'invoke_policies'",
+            )
+            if policy.get("match", "exact") not in ["exact", "prefix"]:
+                raise InvalidConfigException(
+                    "invalid value '{}' for 'match' in realm option 'invoke_policies' "
+                    "(must be one of: exact, prefix)".format(policy["match"])
+                )
+            if policy["invoke"] not in ["least_loaded", "fastest"]:
+                raise InvalidConfigException(
+                    "invalid value '{}' for 'invoke' in realm option 'invoke_policies' "
+                    "(must be one of: least_loaded, fastest)".format(policy["invoke"])
+                )
+
     if "enable_meta_api" in options:
         if not isinstance(options["enable_meta_api"], bool):
             raise InvalidConfigException(
@@ -3219,6 +3344,34 @@ def check_router_realm_role(personality, role):
             "invalid dynamic authorizer URI '{}' in role permissions".format(auth_uri),
         )
 
+        if "authorizer-batch" in role and not isinstance(role["authorizer-batch"], bool):
+            raise InvalidConfigException(
+                "invalid type {} for 'authorizer-batch' in role (must be a bool)".format(
+                    type(role["authorizer-batch"])
+                )
+            )
+
+        if "authorizer-batch-size" in role:
+            batch_size = role["authorizer-batch-size"]
+            if type(batch_size) != int or batch_size <= 0:
+                raise InvalidConfigException("'authorizer-batch-size' in role must be a positive int")
+
+        if "authorizer-coalesce" in role and role["authorizer-coalesce"] not in ["session", "authid"]:
+            raise InvalidConfigException(
+                "invalid value '{}' for 'authorizer-coalesce' in role (must be one of: session, authid)".format(
+                    role["authorizer-coalesce"]
+                )
+            )
+
+        if "authorizer-cache-ttl" in role:
+            cache_ttl = role["authorizer-cache-ttl"]
+            if type(cache_ttl) not in [int, float] or cache_ttl <= 0:
+                raise InvalidConfigException("'authorizer-cache-ttl' in role must be a positive number")
+    else:
+        for key in ["authorizer-batch", "authorizer-batch-size", "authorizer-coalesce", "authorizer-cache-ttl"]:
+            if key in role:
+                raise InvalidConfigException("'{}' in role is only valid with a dynamic 'authorizer'".format(key))
+
     # 'static' permissions
     if "permissions" in role:
         permissions = role["permissions"]
@@ -5,6 +5,9 @@
 #
 #####################################################################################
 
+import struct
+import threading
+import time
 import uuid
 from collections import deque
 from typing import Any, Dict, List, Optional, Tuple
@@ -12,14 +15,14 @@ from typing import Any, Dict, List, Optional, Tuple
 import cfxdb
 import numpy as np
 import zlmdb
-from autobahn.twisted.util import sleep
 from autobahn.util import hltype, hlval
 from autobahn.wamp import message
 from autobahn.wamp.interfaces import ISession
 from autobahn.wamp.message import Publish
 from autobahn.wamp.types import CloseDetails, SessionDetails, TransportDetails
 from cfxdb.realmstore import Publication, RealmStore
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThreadPool
 from txaio import (
     make_logger,
     time_ns,
@@ -28,9 +31,227 @@ from txaio import (
 
 from crossbar.interfaces import IRealmStore
 from crossbar.router.observation import UriObservationMap
-from crossbar.router.realmstore import QueuedCall
+from crossbar.router.realmstore import CallQueues, MQTTSessions
 
-__all__ = ("RealmStoreDatabase",)
+__all__ = (
+    "EventHistory",
+    "MQTTSessionStates",
+    "RealmStoreDatabase",
+    "WriteQueue",
+)
+
+
+def _identity(obj):
+    return obj
+
+
+@zlmdb.table("0b2cd2b4-0c2d-4b55-a6cb-4ba41c7a3e57", build=Publication.build, cast=Publication.cast)
+class EventHistory(zlmdb.MapOidTimestampFlatBuffers):
+    """
+    Event history index, denormalized from the publications archive: map from
+    ``(subscription, timestamp)`` to (a copy of) the :class:`cfxdb.realmstore.Publication`
+    dispatched on the subscription, where ``timestamp`` is the publication timestamp (epoch time in ns).
+
+    Both key parts are serialized big-endian, so that the records of a subscription are
+    clustered in chronological order, and a page of history is read with one sequential range scan.
+    """
+
+    def _serialize_key(self, keys):
+        subscription_id, timestamp = keys
+        return struct.pack(">QQ", subscription_id, timestamp)
+
+    def _deserialize_key(self, data):
+        return struct.unpack(">QQ", data)
+
+
+@zlmdb.table("3d6f0a2e-9c47-4e1b-8f5d-6a2b1c0e7d94", marshal=_identity, parse=_identity)
+class MQTTSessionStates(zlmdb.MapStringCbor):
+    """
+    Persisted state of MQTT sessions with clean-session=false: map from MQTT client ID to a dict
+    with the session ``state`` (see :class:`crossbar.router.realmstore.MQTTSessions`) and the
+    time it was ``stored`` (epoch time in ns).
+    """
+
+
+class WriteQueue(object):
+    """
+    Bounded, thread-safe queue of database writes with group commit.
+
+    Writes are queued from the reactor thread as functions to be called with a
+    write transaction (and the arguments queued with the function). A writer running
+    on a background thread takes batches of queued writes and applies each batch in
+    a single write transaction, as soon as either ``batch_size`` writes are queued or
+    ``flush_ms`` milliseconds have passed.
+
+    When ``maxsize`` writes are queued, further writes are rejected, which the
+    caller is expected to push back on.
+    """
+
+    log = make_logger()
+
+    def __init__(self, db, maxsize=10000, batch_size=1000, flush_ms=200):
+        """
+
+        :param db: The database to write to.
+        :type db: :class:`zlmdb.Database`
+
+        :param maxsize: Maximum number of queued writes.
+        :type maxsize: int
+
+        :param batch_size: Maximum number of writes committed in one write transaction
+            (a batch is committed as soon as it is full).
+        :type batch_size: int
+
+        :param flush_ms: Maximum time in milliseconds writes are queued before being committed.
+        :type flush_ms: int
+        """
+        assert type(maxsize) == int and maxsize > 0
+        assert type(batch_size) == int and batch_size > 0
+        assert type(flush_ms) == int and flush_ms >= 0
+
+        self._db = db
+        self._maxsize = maxsize
+        self._batch_size = batch_size
+        self._flush = float(flush_ms) / 1000.0
+
+        # queued writes: (func, args) and the condition (and lock) protecting it
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+        self._running = False
+        self._congested = False
+
+        # statistics (updated by the writer under the lock)
+        self._enqueued = 0
+        self._rejected = 0
+        self._written = 0
+        self._errors = 0
+        self._commits = 0
+        self._batch_last = 0
+        self._batch_max = 0
+        self._commit_ms_last = 0.0
+        self._commit_ms_max = 0.0
+        self._commit_ms_total = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, func, *args):
+        """
+        Queue a write. Called from the reactor thread.
+
+        :param func: Function to be called with a write transaction and ``args``.
+
+        :returns: ``True`` if the write was queued, ``False`` if the queue is full.
+        :rtype: bool
+        """
+        with self._cond:
+            if len(self._queue) >= self._maxsize:
+                self._rejected += 1
+                if not self._congested:
+                    self._congested = True
+                    self.log.warn(
+                        "{func} write queue full ({maxsize} writes queued) - rejecting writes",
+                        func=hltype(self.put),
+                        maxsize=self._maxsize,
+                    )
+                return False
+            self._congested = False
+            self._queue.append((func, args))
+            self._enqueued += 1
+            if len(self._queue) >= self._batch_size:
+                self._cond.notify()
+        return True
+
+    def start(self, reactor):
+        """
+        Start the writer on a thread from the reactor thread pool.
+
+        :returns: A deferred firing when the writer has stopped (and all queued writes are committed).
+        """
+        with self._cond:
+            self._running = True
+        return deferToThreadPool(reactor, reactor.getThreadPool(), self.run)
+
+    def stop(self):
+        """
+        Signal the writer to commit all queued writes and stop.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def run(self):
+        """
+        Writer loop, run on a background thread. When the queue is stopped, all queued writes
+        are committed before returning.
+        """
+        self.log.debug("{func} write queue writer starting", func=hltype(self.run))
+        while True:
+            with self._cond:
+                if self._running and len(self._queue) < self._batch_size:
+                    self._cond.wait(self._flush)
+                if not self._queue:
+                    if self._running:
+                        continue
+                    break
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self._batch_size))]
+            self._commit(batch)
+        self.log.debug("{func} write queue writer ended", func=hltype(self.run))
+
+    def _commit(self, batch):
+        errors = 0
+        started = time.perf_counter()
+        try:
+            with self._db.begin(write=True) as txn:
+                for func, args in batch:
+                    try:
+                        func(txn, *args)
+                    except Exception:
+                        self.log.failure()
+                        errors += 1
+        except Exception:
+            # the write transaction itself failed, and none of the writes were committed
+            self.log.failure()
+            errors = len(batch)
+        commit_ms = (time.perf_counter() - started) * 1000.0
+
+        with self._cond:
+            self._written += len(batch) - errors
+            self._errors += errors
+            self._commits += 1
+            self._batch_last = len(batch)
+            self._batch_max = max(self._batch_max, len(batch))
+            self._commit_ms_last = commit_ms
+            self._commit_ms_max = max(self._commit_ms_max, commit_ms)
+            self._commit_ms_total += commit_ms
+
+    def stats(self):
+        """
+        Get write queue statistics.
+
+        :returns: Dict with the current and maximum queue depth, the number of writes queued,
+            rejected, written and failed, and the number of commits with (last, maximum and
+            average) batch sizes and commit latencies in milliseconds.
+        :rtype: dict
+        """
+        with self._cond:
+            commits = self._commits
+            return {
+                "depth": len(self._queue),
+                "maxsize": self._maxsize,
+                "enqueued": self._enqueued,
+                "rejected": self._rejected,
+                "written": self._written,
+                "errors": self._errors,
+                "commits": commits,
+                "batch_last": self._batch_last,
+                "batch_max": self._batch_max,
+                "batch_avg": float(self._written + self._errors) / commits if commits else 0.0,
+                "commit_ms_last": self._commit_ms_last,
+                "commit_ms_max": self._commit_ms_max,
+                "commit_ms_avg": self._commit_ms_total / commits if commits else 0.0,
+            }
 
 
 class RealmStoreDatabase(object):
@@ -83,17 +304,37 @@ class RealmStoreDatabase(object):
         self._db = zlmdb.Database.open(dbpath=dbpath, maxsize=maxsize, readonly=readonly, sync=sync, context=self)
         self._db.__enter__()
         self._schema = RealmStore.attach(self._db)
+        self._history = self._db.attach_table(EventHistory)
+        self._mqtt_session_states = self._db.attach_table(MQTTSessionStates)
+
+        # IDs of subscriptions with event history (attached in attach_subscription_map)
+        self._history_subscriptions = set()
+
+        # timestamp of the last publication stored (only accessed by the writer): publication
+        # timestamps are kept strictly increasing, as they are part of event history keys
+        self._last_timestamp = 0
 
         self._running = False
-        self._process_buffers_thread = None
 
+        # writes to the database are queued and committed in batches from a background thread
         self._max_buffer = config.get("max-buffer", 10000)
         self._buffer_flush = config.get("buffer-flush", 200)
-        self._buffer = []
-        self._log_counter = 0
+        self._batch_size = config.get("batch-size", 1000)
+        self._writes = WriteQueue(
+            self._db, maxsize=self._max_buffer, batch_size=self._batch_size, flush_ms=self._buffer_flush
+        )
+        self._writer_done = None
+
+        # number of session joins/leaves not stored because the write queue was full
+        self._sessions_dropped = 0
 
-        # map: registration.id -> deque( (session, call, registration, authorization) )
-        self._queued_calls = {}
+        # bounded per-registration call queues
+        self._call_queues = CallQueues(config, now=lambda: self._reactor.seconds())
+
+        # persistent MQTT session state: the sessions stored in the database are kept in
+        # memory too, and changes are written through to the database
+        self._mqtt_sessions = MQTTSessions(config)
+        self._load_mqtt_sessions()
 
         self.log.info(
             '{func} realm store initialized (type="{stype}", dbpath="{dbpath}", maxsize={maxsize}, '
@@ -118,7 +359,6 @@ class RealmStoreDatabase(object):
         """
         return self._running
 
-    @inlineCallbacks
     def start(self):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.start`
@@ -132,10 +372,8 @@ class RealmStoreDatabase(object):
                 stype=hlval(self._type),
             )
 
-        self._buffer = []
-        self._log_counter = 0
         self._running = True
-        self._process_buffers_thread = yield self._reactor.callInThread(self._process_buffers)
+        self._writer_done = self._writes.start(self._reactor)
         self.log.info("{func} realm store ready!", func=hltype(self.start))
 
     def stop(self):
@@ -149,52 +387,22 @@ class RealmStoreDatabase(object):
 
         self._running = False
 
-        # FIXME: wait for _process_buffers_thread
-
-        self._buffer = []
-        self._log_counter = 0
-
-    @inlineCallbacks
-    def _process_buffers(self):
-        self.log.debug("ZLMDB buffer background writer starting")
-        while self._running:
-            cnt, errs, duration_ms = self._process_buffer()
-            if cnt > 0:
-                self.log.debug(
-                    "ZLMDB buffer background writer processed {cnt} records in {duration_ms} ms",
-                    cnt=cnt,
-                    duration_ms=duration_ms,
-                )
-            if errs > 0:
-                self.log.warn("ZLMDB buffer background writer encountered {errs} errors", errs=errs)
-            if duration_ms < self._buffer_flush:
-                sleep_ms = int(self._buffer_flush - duration_ms)
-            else:
-                sleep_ms = self._buffer_flush
-            self.log.debug("Throttling buffer background writer (sleeping {sleep_ms} ms)", sleep_ms=sleep_ms)
-            yield sleep(float(sleep_ms) / 1000.0)
-        self.log.debug("ZLMDB buffer background writer ended")
-
-    def _process_buffer(self):
-        buffer = self._buffer
-        self._buffer = []
-        self.log.debug("Processing {cnt} buffered records", cnt=len(buffer))
-        cnt = 0
-        errs = 0
-        started = time_ns()
-        with self._db.begin(write=True) as txn:
-            for rec in buffer:
-                func = rec[0]
-                args = rec[1:]
-                try:
-                    func(txn, *args)
-                    cnt += 1
-                except:
-                    self.log.failure()
-                    errs += 1
-            ended = time_ns()
-        duration_ms = int((ended - started) / 1000000)
-        return cnt, errs, duration_ms
+        # the writer commits all writes still queued before it stops
+        self._writes.stop()
+        done, self._writer_done = self._writer_done, None
+        return done or succeed(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.stats`
+        """
+        return {
+            "type": self._type,
+            "writes": self._writes.stats(),
+            "sessions_dropped": self._sessions_dropped,
+            "calls": self._call_queues.stats(),
+            "mqtt_sessions": self._mqtt_sessions.stats(),
+        }
 
     def store_session_joined(self, session: ISession, details: SessionDetails):
         """
@@ -235,7 +443,14 @@ class RealmStoreDatabase(object):
         ses.proxy_worker_name = None
         ses.proxy_worker_pid = None
 
-        self._buffer.append([self._store_session_joined, ses])
+        if not self._writes.put(self._store_session_joined, ses):
+            self._sessions_dropped += 1
+            self.log.warn(
+                "{func} write queue full - join of session {session} is not stored [dropped={dropped}]",
+                func=hltype(self.store_session_joined),
+                session=details.session,
+                dropped=self._sessions_dropped,
+            )
 
     def _store_session_joined(self, txn: zlmdb.Transaction, ses: cfxdb.realmstore.Session):
         # FIXME: use idx_sessions_by_session_id to check there is no session with (session_id, joined_at) yet
@@ -261,7 +476,14 @@ class RealmStoreDatabase(object):
             details=details,
         )
 
-        self._buffer.append([self._store_session_left, session, details])
+        if not self._writes.put(self._store_session_left, session, details):
+            self._sessions_dropped += 1
+            self.log.warn(
+                "{func} write queue full - leave of session {session} is not stored [dropped={dropped}]",
+                func=hltype(self.store_session_left),
+                session=session._session_id,
+                dropped=self._sessions_dropped,
+            )
 
     def _store_session_left(self, txn: zlmdb.Transaction, session: ISession, details: CloseDetails):
         # FIXME: apparently, session ID is already erased at this point:(
@@ -367,11 +589,10 @@ class RealmStoreDatabase(object):
         for sub in self._config.get("event-history", []):
             uri = sub["uri"]
             match = sub.get("match", "exact")
-            # observation, was_already_observed, was_first_observer
-            subscription_map.add_observer(self, uri=uri, match=match)
-            # subscription_id = observation.id
+            observation, _, _ = subscription_map.add_observer(self, uri=uri, match=match)
+            self._history_subscriptions.add(observation.id)
 
-    def store_event(self, session: ISession, publication_id: int, publish: Publish):
+    def store_event(self, session: ISession, publication_id: int, publish: Publish) -> bool:
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.store_event`
         """
@@ -380,7 +601,7 @@ class RealmStoreDatabase(object):
         assert isinstance(publication_id, int), 'invalid type {} for "publication_id"'.format(type(publication_id))
         assert isinstance(publish, message.Publish), 'invalid type {} for "publish"'.format(type(publish))
 
-        self._buffer.append([self._store_event, session, publication_id, publish])
+        return self._writes.put(self._store_event, session, publication_id, publish)
 
     def _store_event(self, txn, session, publication_id, publish):
         pub = self._schema.publications[txn, publication_id]
@@ -401,7 +622,8 @@ class RealmStoreDatabase(object):
 
         pub = cfxdb.realmstore.Publication()
 
-        pub.timestamp = time_ns()
+        self._last_timestamp = max(time_ns(), self._last_timestamp + 1)
+        pub.timestamp = self._last_timestamp
         pub.publication = publication_id
         pub.publisher = session._session_id
 
@@ -437,7 +659,7 @@ class RealmStoreDatabase(object):
         # FIXME: unexpected type <class 'backend.BackendSession'> for receiver
         # assert isinstance(receiver, RouterSession), 'unexpected type {} for receiver'.format(type(receiver))
 
-        self._buffer.append([self._store_event_history, publication_id, subscription_id, receiver])
+        self._writes.put(self._store_event_history, publication_id, subscription_id, receiver)
 
     def _store_event_history(self, txn, publication_id, subscription_id, receiver):
         # FIXME
@@ -473,14 +695,29 @@ class RealmStoreDatabase(object):
 
         self._schema.events[txn, evt_key] = evt
 
-    def get_events(self, subscription_id: int, limit: Optional[int] = None):
+        # index the publication in the event history of the subscription (once, for the first receiver)
+        history_key = (subscription_id, pub.timestamp)
+        if self._history[txn, history_key] is None:
+            self._history[txn, history_key] = pub
+
+    def get_events(self, subscription_id: int, limit: Optional[int] = None, before: Optional[int] = None):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.get_events`
         """
         assert isinstance(subscription_id, int)
         assert limit is None or isinstance(limit, int)
+        assert before is None or isinstance(before, int)
+
+        until_ts = time_ns() + 1
+        if before is not None:
+            # the cursor is the publication ID of the oldest event of the previous page
+            with self._db.begin() as txn:
+                pub = self._schema.publications[txn, before]
+            if pub is None:
+                return []
+            until_ts = pub.timestamp
 
-        return self.get_event_history(subscription_id, from_ts=0, until_ts=time_ns(), reverse=True, limit=limit)
+        return self.get_event_history(subscription_id, from_ts=0, until_ts=until_ts, reverse=True, limit=limit)
 
     def get_event_history(
         self,
@@ -496,56 +733,102 @@ class RealmStoreDatabase(object):
         assert isinstance(subscription_id, int)
         assert isinstance(from_ts, int)
         assert isinstance(until_ts, int)
-        assert isinstance(reverse, bool)
+        assert reverse is None or isinstance(reverse, bool)
         assert limit is None or isinstance(limit, int)
 
-        # FIXME
-        # from_key = (subscription_id, np.datetime64(from_ts, 'ns'))
+        if subscription_id not in self._history_subscriptions:
+            return None
+
+        if until_ts <= from_ts or limit == 0:
+            return []
+
         from_key = (subscription_id, from_ts)
-        # to_key = (subscription_id, np.datetime64(until_ts, 'ns'))
         to_key = (subscription_id, until_ts)
 
         with self._db.begin() as txn:
-            res = []
-            i = 0
-
-            for evt in self._schema.events.select(
-                txn, from_key=from_key, to_key=to_key, return_keys=False, reverse=True, limit=limit
-            ):
-                pub: Publication = self._schema.publications.select(txn, evt.publication)
-                if pub:
-                    res.append(pub.marshal())
-                    i += 1
-                    if limit is not None and i >= limit:
-                        break
-
-        return res
+            return [
+                pub.marshal()
+                for pub in self._history.select(
+                    txn, from_key=from_key, to_key=to_key, return_keys=False, reverse=bool(reverse), limit=limit
+                )
+            ]
 
     def maybe_queue_call(self, session, call, registration, authorization):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.maybe_queue_call`
         """
-        # FIXME: match this against the config, not just plain accept queueing!
-        if registration.id not in self._queued_calls:
-            self._queued_calls[registration.id] = deque()
-
-        self._queued_calls[registration.id].append(QueuedCall(session, call, registration, authorization))
-
-        return True
+        return self._call_queues.put(session, call, registration, authorization)
 
     def get_queued_call(self, registration):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.get_queued_call`
         """
-        if registration.id in self._queued_calls and self._queued_calls[registration.id]:
-            return self._queued_calls[registration.id][0]
+        return self._call_queues.head(registration)
 
     def pop_queued_call(self, registration):
         """
-        Implements :meth:`crossbar._interfaces.IRealmStore.get_event_history`
+        Implements :meth:`crossbar._interfaces.IRealmStore.pop_queued_call`
         """
-        if registration.id in self._queued_calls and self._queued_calls[registration.id]:
-            return self._queued_calls[registration.id].popleft()
+        return self._call_queues.pop(registration)
+
+    def expire_queued_calls(self, registration):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.expire_queued_calls`
+        """
+        return self._call_queues.expire(registration)
+
+    def drop_queued_calls(self, registration):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.drop_queued_calls`
+        """
+        return self._call_queues.drop(registration)
+
+    def _load_mqtt_sessions(self):
+        with self._db.begin() as txn:
+            records = list(self._mqtt_session_states.select(txn))
+
+        # restore the sessions least recently stored first, as these are discarded first
+        records.sort(key=lambda record: record[1]["stored"])
+        for client_id, record in records:
+            for evicted in self._mqtt_sessions.put(client_id, record["state"], restored=True):
+                self._writes.put(self._delete_mqtt_session, evicted)
+
+        if records:
+            self.log.info(
+                "{func} restored {cnt} MQTT sessions from database",
+                func=hltype(self._load_mqtt_sessions),
+                cnt=hlval(len(self._mqtt_sessions)),
+            )
+
+    def store_mqtt_session(self, client_id, state):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.store_mqtt_session`
+        """
+        evicted = self._mqtt_sessions.put(client_id, state)
+        record = {"stored": time_ns(), "state": state}
+        if not self._writes.put(self._store_mqtt_session, client_id, record):
+            self.log.warn(
+                "{func} write queue full - state of MQTT session of client {client_id} is not persisted",
+                func=hltype(self.store_mqtt_session),
+                client_id=client_id,
+            )
+        for client_id in evicted:
+            self._writes.put(self._delete_mqtt_session, client_id)
+
+    def _store_mqtt_session(self, txn, client_id, record):
+        self._mqtt_session_states[txn, client_id] = record
+
+    def pop_mqtt_session(self, client_id):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.pop_mqtt_session`
+        """
+        state = self._mqtt_sessions.pop(client_id)
+        if state is not None:
+            self._writes.put(self._delete_mqtt_session, client_id)
+        return state
+
+    def _delete_mqtt_session(self, txn, client_id):
+        del self._mqtt_session_states[txn, client_id]
 
 
 IRealmStore.register(RealmStoreDatabase)
@@ -5,6 +5,8 @@
 #
 ##############################################################################
 
+import os
+
 import six
 from autobahn import wamp
 from autobahn.wamp.exception import ApplicationError
@@ -13,7 +15,7 @@ from twisted.internet import reactor
 from txaio import make_logger
 
 from crossbar._util import hl, hltype
-from crossbar.edge.worker.tracing import FabricRouterTrace
+from crossbar.edge.worker.tracing import FabricRouterTrace, TraceFilter, TraceSampler
 from crossbar.router.router import Router, RouterFactory
 from crossbar.worker.router import RouterController
 from crossbar.worker.types import RouterRealm
@@ -262,6 +264,26 @@ class ExtRouterController(RouterController):
             self.log.error(emsg)
             raise ApplicationError("crossbar.error.invalid_configuration", emsg)
 
+        # filter selecting the messages traced
+        trace_filter = trace_options.get("filter", None)
+        if trace_filter is not None:
+            try:
+                trace_filter = TraceFilter.parse(trace_filter)
+            except ValueError as e:
+                emsg = "invalid tracing options: {}".format(e)
+                self.log.error(emsg)
+                raise ApplicationError("crossbar.error.invalid_configuration", emsg)
+
+        # sampling of the messages (or actions) traced, eg {"every": 100} or {"per_second": 1000}
+        trace_sampler = trace_options.get("sampling", None)
+        if trace_sampler is not None:
+            try:
+                trace_sampler = TraceSampler.parse(trace_sampler)
+            except ValueError as e:
+                emsg = "invalid tracing options: {}".format(e)
+                self.log.error(emsg)
+                raise ApplicationError("crossbar.error.invalid_configuration", emsg)
+
         # check user provided trace_id
         if trace_id in self._traces:
             emsg = 'could not start trace: a trace with ID "{}" is already running (or starting)'.format(trace_id)
@@ -270,7 +292,7 @@ class ExtRouterController(RouterController):
 
         def on_trace_period_finished(trace_id, period, trace_batch):
             if trace_level == "message":
-                trace_data = [trace_record.marshal(self._trace_app_payload) for trace_record in trace_batch]
+                trace_data = [trace_record.marshal(trace_app_payload) for trace_record in trace_batch]
             elif trace_level == "action":
                 trace_data = [traced_action.marshal() for traced_action in trace_batch]
             else:
@@ -287,6 +309,9 @@ class ExtRouterController(RouterController):
             batching_period=batching_period,
             persist=persist,
             duration=duration,
+            trace_filter=trace_filter,
+            trace_sampler=trace_sampler,
+            persist_dir=os.path.join(self.config.extra.cbdir, ".traces") if persist else None,
         )
         trace.start()
         self._traces[trace_id] = trace
@@ -0,0 +1,6 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
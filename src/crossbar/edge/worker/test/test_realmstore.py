@@ -0,0 +1,227 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import shutil
+import tempfile
+import threading
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.wamp import message
+from mock import Mock
+from twisted.trial import unittest
+
+from crossbar.edge.worker.realmstore import RealmStoreDatabase, WriteQueue
+from crossbar.router.observation import UriObservationMap
+
+
+class _FakeTransaction(object):
+    def __init__(self, db):
+        self._db = db
+        self.writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._db.commits.append(self.writes)
+            self._db.committed.set()
+
+
+class _FakeDatabase(object):
+    def __init__(self):
+        self.commits = []
+        self.committed = threading.Event()
+
+    def begin(self, write=False):
+        assert write
+        return _FakeTransaction(self)
+
+
+def _write(txn, value):
+    if value is None:
+        raise ValueError("invalid value")
+    txn.writes.append(value)
+
+
+class TestWriteQueue(unittest.TestCase):
+    def setUp(self):
+        self.db = _FakeDatabase()
+
+    def test_bounded(self):
+        queue = WriteQueue(self.db, maxsize=10, batch_size=4, flush_ms=0)
+        for i in range(10):
+            self.assertTrue(queue.put(_write, i))
+        self.assertFalse(queue.put(_write, 10))
+        self.assertEqual(len(queue), 10)
+
+        stats = queue.stats()
+        self.assertEqual(stats["depth"], 10)
+        self.assertEqual(stats["enqueued"], 10)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_group_commit(self):
+        queue = WriteQueue(self.db, maxsize=100, batch_size=4, flush_ms=0)
+        for i in range(10):
+            queue.put(_write, i)
+
+        # the queue is not running, so the writer commits all queued writes and returns
+        queue.run()
+
+        self.assertEqual(self.db.commits, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        stats = queue.stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["written"], 10)
+        self.assertEqual(stats["commits"], 3)
+        self.assertEqual(stats["batch_last"], 2)
+        self.assertEqual(stats["batch_max"], 4)
+        self.assertTrue(stats["commit_ms_max"] >= stats["commit_ms_avg"] >= 0)
+
+    def test_failed_write(self):
+        queue = WriteQueue(self.db, maxsize=100, batch_size=10, flush_ms=0)
+        queue.put(_write, 1)
+        queue.put(_write, None)
+        queue.put(_write, 2)
+        queue.run()
+
+        # a failing write does not abort the other writes in the batch
+        self.assertEqual(self.db.commits, [[1, 2]])
+        self.assertEqual(queue.stats()["written"], 2)
+        self.assertEqual(queue.stats()["errors"], 1)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+    def test_writer_thread(self):
+        queue = WriteQueue(self.db, maxsize=100, batch_size=5, flush_ms=10000)
+        queue._running = True
+        writer = threading.Thread(target=queue.run)
+        writer.start()
+        try:
+            # a full batch is committed without waiting for the flush interval
+            for i in range(5):
+                queue.put(_write, i)
+            self.assertTrue(self.db.committed.wait(5))
+            self.assertEqual(self.db.commits, [[0, 1, 2, 3, 4]])
+
+            # the remaining writes are committed when stopping
+            queue.put(_write, 5)
+        finally:
+            queue.stop()
+            writer.join(5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(self.db.commits, [[0, 1, 2, 3, 4], [5]])
+
+
+class TestRealmStoreDatabase(unittest.TestCase):
+    def setUp(self):
+        dbpath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dbpath)
+        self.config = {
+            "type": "cfxdb",
+            "path": dbpath,
+            "max-buffer": 100,
+            "event-history": [{"uri": "com.example.history"}],
+        }
+        self.store = RealmStoreDatabase(None, None, self.config)
+        self.session = Mock()
+        self.session._session_id = 1
+
+    def tearDown(self):
+        self.store._db.__exit__(None, None, None)
+
+    def test_store_event_overloaded(self):
+        self.store._writes._maxsize = 2
+        for publication_id in [1, 2]:
+            publish = message.Publish(publication_id, "com.example.topic", args=[publication_id])
+            self.assertTrue(self.store.store_event(self.session, publication_id, publish))
+
+        publish = message.Publish(3, "com.example.topic", args=[3])
+        self.assertFalse(self.store.store_event(self.session, 3, publish))
+
+        self.store._writes.run()
+        self.assertEqual(self.store.stats()["writes"]["written"], 2)
+        with self.store._db.begin() as txn:
+            self.assertEqual(self.store._schema.publications[txn, 2].args, [2])
+            self.assertEqual(self.store._schema.publications[txn, 3], None)
+
+    def test_store_session_overloaded(self):
+        self.store._writes._maxsize = 1
+        self.store.store_session_left(self.session, None)
+        self.assertEqual(self.store.stats()["sessions_dropped"], 0)
+
+        self.store.store_session_left(self.session, None)
+        self.assertEqual(self.store.stats()["sessions_dropped"], 1)
+        self.assertEqual(self.store.stats()["writes"]["rejected"], 1)
+
+    def test_event_history(self):
+        subscription_map = UriObservationMap()
+        self.store.attach_subscription_map(subscription_map)
+        subscription_id = subscription_map.get_observation("com.example.history").id
+
+        for publication_id in range(1, 8):
+            publish = message.Publish(publication_id, "com.example.history", args=[publication_id])
+            self.store.store_event(self.session, publication_id, publish)
+            for receiver_session_id in [2, 3]:
+                receiver = Mock()
+                receiver._session_id = receiver_session_id
+                self.store.store_event_history(publication_id, subscription_id, receiver)
+        self.store._writes.run()
+
+        # events are returned once (regardless of the number of receivers), newest first
+        events = self.store.get_events(subscription_id, 3)
+        self.assertEqual([event["publication"] for event in events], [7, 6, 5])
+        self.assertEqual(events[0]["args"], [7])
+
+        # paging through the history using the publication ID of the last event as cursor
+        events = self.store.get_events(subscription_id, 3, before=5)
+        self.assertEqual([event["publication"] for event in events], [4, 3, 2])
+        events = self.store.get_events(subscription_id, 3, before=2)
+        self.assertEqual([event["publication"] for event in events], [1])
+        self.assertEqual(self.store.get_events(subscription_id, 3, before=1), [])
+
+        events = self.store.get_event_history(subscription_id, 0, events[0]["timestamp"] + 1, reverse=False)
+        self.assertEqual([event["publication"] for event in events], [1])
+
+        # no history is maintained for other subscriptions
+        self.assertEqual(self.store.get_events(subscription_id + 1), None)
+
+    def test_mqtt_sessions_persisted(self):
+        states = {
+            "client1": {
+                "authid": None,
+                "subscriptions": {"a/#": 1},
+                "messages": [
+                    {"topic": "a/b", "body": b"\x00\x01", "qos": 1, "retained": False, "packet_id": 1, "state": None}
+                ],
+                "bytes": 5,
+            },
+            "client2": {"authid": "bob", "subscriptions": {"c": 2}, "messages": [], "bytes": 0},
+            "client3": {"authid": None, "subscriptions": {}, "messages": [], "bytes": 0},
+        }
+        for client_id in sorted(states):
+            self.store.store_mqtt_session(client_id, states[client_id])
+        self.assertEqual(self.store.pop_mqtt_session("client3"), states["client3"])
+        self.store._writes.run()
+        self.store._db.__exit__(None, None, None)
+
+        # the sessions are restored from the database, least recently stored first
+        self.config["mqtt-session-limit"] = 1
+        self.store = RealmStoreDatabase(None, None, self.config)
+        self.assertEqual(self.store.stats()["mqtt_sessions"]["sessions"], 1)
+        self.assertEqual(self.store.pop_mqtt_session("client1"), None)
+        self.assertEqual(self.store.pop_mqtt_session("client2"), states["client2"])
+        self.store._writes.run()
+        with self.store._db.begin() as txn:
+            self.assertEqual(self.store._mqtt_session_states.count(txn), 0)
+
+        self.store.store_mqtt_session("client1", states["client1"])
+        self.store._writes.run()
+        self.store._db.__exit__(None, None, None)
+        self.store = RealmStoreDatabase(None, None, self.config)
+        self.assertEqual(self.store.pop_mqtt_session("client1"), states["client1"])
@@ -0,0 +1,186 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import shutil
+import tempfile
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+import zlmdb
+from autobahn.wamp import message
+from mock import Mock
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from crossbar.edge.worker.realmstore import WriteQueue
+from crossbar.edge.worker.tracing import FabricRouterTrace, TraceFilter, TraceRecords, TraceSampler
+
+
+def _session(session_id, realm="realm1", authrole="backend"):
+    session = Mock()
+    session._session_id = session_id
+    session._realm = realm
+    session._authid = "authid{}".format(session_id)
+    session._authrole = authrole
+    return session
+
+
+class TestTraceFilter(unittest.TestCase):
+    def test_parse(self):
+        trace_filter = TraceFilter.parse({"uri_prefix": ["com.example."], "msg_type": ["Call"]})
+        self.assertEqual(trace_filter.marshal(), {"uri_prefix": ["com.example."], "msg_type": ["Call"]})
+
+        for config in [[], {"foo": ["bar"]}, {"realm": "realm1"}, {"msg_type": ["NoSuchMessage"]}]:
+            self.assertRaises(ValueError, TraceFilter.parse, config)
+
+    def test_matches(self):
+        trace_filter = TraceFilter.parse(
+            {"realm": ["realm1"], "uri_prefix": ["com.example."], "authrole": ["backend"], "msg_type": ["Call"]}
+        )
+        call = message.Call(1, "com.example.proc")
+        self.assertTrue(trace_filter.matches(_session(1), call))
+        self.assertFalse(trace_filter.matches(_session(1, realm="realm2"), call))
+        self.assertFalse(trace_filter.matches(_session(1, authrole="frontend"), call))
+        self.assertFalse(trace_filter.matches(_session(1), message.Call(2, "com.other.proc")))
+        self.assertFalse(trace_filter.matches(_session(1), message.Publish(3, "com.example.topic")))
+
+
+class TestFabricRouterTrace(unittest.TestCase):
+    def _trace(self, count, procedure="com.example.proc"):
+        for i in range(count):
+            self.trace.maybe_trace_rx_msg(self.session, message.Call(i + 1, procedure))
+
+    def _seqs(self, records):
+        return [record["seq"] for record in records]
+
+    def setUp(self):
+        self.session = _session(1)
+        self.trace = FabricRouterTrace(
+            Mock(),
+            "trace1",
+            trace_filter=TraceFilter.parse({"uri_prefix": ["com.example."]}),
+            batching_period=1000,
+            limit=2,
+        )
+        self.trace._status = "running"
+
+    def test_filter(self):
+        self._trace(3)
+        self._trace(3, procedure="com.other.proc")
+        self.assertEqual(self._seqs(self.trace.get_data(0)), [0, 1, 2])
+
+    def test_get_data(self):
+        for _ in range(3):
+            self._trace(10)
+            self.trace._batch_loop()
+
+        self.assertEqual(self._seqs(self.trace.get_data(12, 14)), [12, 13, 14])
+        self.assertEqual(self._seqs(self.trace.get_data(25, limit=10)), [25, 26, 27, 28, 29])
+        self.assertEqual(self.trace.get_data(30), [])
+
+        # only the last 2 periods are kept in memory
+        self.assertEqual(self._seqs(self.trace.get_data(0, 11)), [10, 11])
+
+
+class TestPersistedTrace(unittest.TestCase):
+    def setUp(self):
+        self.persist_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.persist_dir)
+
+        # the writer is run synchronously from the test (rather than on a background thread)
+        self.patch(WriteQueue, "start", lambda queue, reactor: defer.succeed(None))
+
+        self.session = _session(1)
+        self.trace = FabricRouterTrace(
+            Mock(), "trace1", batching_period=1000, limit=1, persist=True, persist_dir=self.persist_dir
+        )
+
+    @defer.inlineCallbacks
+    def test_persist(self):
+        self.trace.start()
+        self.addCleanup(self.trace.stop)
+        for _ in range(3):
+            for i in range(10):
+                self.trace.maybe_trace_rx_msg(self.session, message.Call(i + 1, "com.example.proc"))
+            self.trace._batch_loop()
+        self.trace._writes.run()
+
+        # records no longer kept in memory are read from the database
+        records = self.trace.get_data(5, 24)
+        self.assertEqual([record["seq"] for record in records], list(range(5, 25)))
+
+        yield self.trace.stop()
+
+        db = zlmdb.Database.open(dbpath=self.trace._persist_path, maxsize=2**20)
+        records_table = db.attach_table(TraceRecords)
+        with db.begin() as txn:
+            self.assertEqual(records_table.count(txn), 30)
+            self.assertEqual(records_table[txn, 29]["msg_type"], "Call")
+
+
+class TestTraceSampler(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def _action(self, correlation_id):
+        call = message.Call(1, "com.example.proc")
+        call.correlation_id = correlation_id
+        call.correlation_is_anchor = True
+        result = message.Result(1)
+        result.correlation_id = correlation_id
+        result.correlation_is_last = True
+        return call, result
+
+    def test_parse(self):
+        self.assertEqual(TraceSampler.parse({"every": 10}).every, 10)
+        for config in [{}, {"every": 0}, {"per_second": -1}, {"foo": 1}, 10]:
+            self.assertRaises(ValueError, TraceSampler.parse, config)
+
+    def test_every(self):
+        sampler = TraceSampler(every=10)
+        kept = [sampler.sample(message.Publish(i, "com.example.topic")) for i in range(100)]
+        self.assertEqual(kept.count(True), 10)
+
+    def test_every_correlated(self):
+        sampler = TraceSampler(every=4)
+        for i in range(100):
+            call, result = self._action("correlation{}".format(i))
+            self.assertEqual(sampler.sample(call), sampler.sample(result))
+        self.assertTrue(0 < sampler.sampled < 200)
+
+    def test_per_second_correlated(self):
+        sampler = TraceSampler(per_second=2, now=lambda: self.now)
+        actions = [self._action("correlation{}".format(i)) for i in range(5)]
+
+        # at most 2 actions are sampled per second, and their results are kept too
+        kept = [sampler.sample(call) for call, _ in actions]
+        self.assertEqual(kept, [True, True, False, False, False])
+        self.now += 1.0
+        self.assertEqual([sampler.sample(result) for _, result in actions], kept)
+        self.assertEqual(len(sampler._decisions), 0)
+
+        self.assertTrue(sampler.sample(message.Publish(1, "com.example.topic")))
+
+    def test_per_second_actions(self):
+        sampler = TraceSampler(per_second=2, now=lambda: self.now)
+        trace = FabricRouterTrace(Mock(), "trace1", trace_level="action", trace_sampler=sampler)
+        trace._status = "running"
+        session = _session(1)
+
+        # the open actions are tracked by the trace, not the sampler
+        actions = [self._action("correlation{}".format(i)) for i in range(5)]
+        for call, _ in actions:
+            trace.maybe_trace_rx_msg(session, call)
+        self.assertEqual(len(trace._open_actions), 2)
+        self.assertEqual(len(sampler._decisions), 0)
+
+        for _, result in actions:
+            trace.maybe_trace_tx_msg(session, result)
+        self.assertEqual(trace._open_actions, {})
+        self.assertEqual((sampler.sampled, sampler.dropped), (2, 3))
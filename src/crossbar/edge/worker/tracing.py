@@ -6,17 +6,29 @@
 ##############################################################################
 
 import math
+import os
+import time
 import uuid
-from collections import deque
+import zlib
+from collections import OrderedDict, deque
 from datetime import datetime
 
 import six
+import zlmdb
 from autobahn import util
 from autobahn.wamp import message
+from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
 from txaio import make_logger, perf_counter_ns, time_ns
 
-__all__ = ("FabricRouterTrace",)
+from crossbar.edge.worker.realmstore import WriteQueue
+
+__all__ = (
+    "FabricRouterTrace",
+    "TraceFilter",
+    "TraceRecords",
+    "TraceSampler",
+)
 
 # import pyarrow as pa
 # import pyarrow.parquet as pq
@@ -34,7 +46,293 @@ __all__ = ("FabricRouterTrace",)
 # https://arrow.apache.org/docs/python/generated/pyarrow.Array.html#pyarrow.Array
 
 
+def _identity(obj):
+    return obj
+
+
+@zlmdb.table("7f3d1c1e-5b8a-4b0e-a0a5-0c7e2f6d9b41", marshal=_identity, parse=_identity)
+class TraceRecords(zlmdb.MapOidCbor):
+    """
+    Persisted trace records: map from sequence number to the marshaled trace record.
+    """
+
+
+class TraceFilter(object):
+    """
+    Filter selecting the messages traced. The filter is evaluated before a trace
+    record is created for a message, so messages filtered out cost (almost) nothing.
+
+    All conditions given must match for a message to be traced.
+    """
+
+    __slots__ = ("realms", "uri_prefixes", "authroles", "msg_types")
+
+    def __init__(self, realms=None, uri_prefixes=None, authroles=None, msg_types=None):
+        """
+
+        :param realms: Trace messages of sessions joined to any of these realms.
+        :type realms: set or None
+
+        :param uri_prefixes: Trace messages with a procedure, topic or correlation URI
+            starting with any of these prefixes.
+        :type uri_prefixes: tuple or None
+
+        :param authroles: Trace messages of sessions joined with any of these authroles.
+        :type authroles: set or None
+
+        :param msg_types: Trace messages of any of these WAMP message classes.
+        :type msg_types: set or None
+        """
+        self.realms = realms
+        self.uri_prefixes = uri_prefixes
+        self.authroles = authroles
+        self.msg_types = msg_types
+
+    @staticmethod
+    def parse(config):
+        """
+        Parse a trace filter from trace options, eg
+
+        .. code-block:: json
+
+            {
+                "realm": ["realm1"],
+                "uri_prefix": ["com.example."],
+                "authrole": ["backend"],
+                "msg_type": ["Call", "Yield", "Error"]
+            }
+
+        :param config: The filter configuration.
+        :type config: dict
+
+        :returns: The trace filter.
+        :rtype: :class:`TraceFilter`
+
+        :raises ValueError: When the configuration is invalid.
+        """
+        if not isinstance(config, dict):
+            raise ValueError("filter must be a dict, was {}".format(type(config)))
+
+        def _strings(key):
+            values = config.get(key, None)
+            if values is None:
+                return None
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise ValueError("filter attribute '{}' must be a list of strings".format(key))
+            return values
+
+        for key in config:
+            if key not in ["realm", "uri_prefix", "authrole", "msg_type"]:
+                raise ValueError("invalid filter attribute '{}'".format(key))
+
+        realms = _strings("realm")
+        uri_prefixes = _strings("uri_prefix")
+        authroles = _strings("authrole")
+
+        msg_types = _strings("msg_type")
+        if msg_types is not None:
+            classes = set()
+            for msg_type in msg_types:
+                klass = getattr(message, msg_type, None)
+                if not (isinstance(klass, type) and issubclass(klass, message.Message)):
+                    raise ValueError("invalid WAMP message type '{}' in filter".format(msg_type))
+                classes.add(klass)
+            msg_types = classes
+
+        return TraceFilter(
+            realms=set(realms) if realms is not None else None,
+            uri_prefixes=tuple(uri_prefixes) if uri_prefixes is not None else None,
+            authroles=set(authroles) if authroles is not None else None,
+            msg_types=msg_types,
+        )
+
+    def matches(self, session, msg):
+        """
+        Check if a message received from or sent to a session is to be traced.
+
+        :returns: ``True`` if the message is to be traced.
+        :rtype: bool
+        """
+        if self.msg_types is not None and msg.__class__ not in self.msg_types:
+            return False
+        if self.realms is not None and session._realm not in self.realms:
+            return False
+        if self.authroles is not None and session._authrole not in self.authroles:
+            return False
+        if self.uri_prefixes is not None:
+            uri = getattr(msg, "procedure", None) or getattr(msg, "topic", None) or msg.correlation_uri
+            if not uri or not uri.startswith(self.uri_prefixes):
+                return False
+        return True
+
+    def marshal(self):
+        obj = {}
+        if self.realms is not None:
+            obj["realm"] = sorted(self.realms)
+        if self.uri_prefixes is not None:
+            obj["uri_prefix"] = list(self.uri_prefixes)
+        if self.authroles is not None:
+            obj["authrole"] = sorted(self.authroles)
+        if self.msg_types is not None:
+            obj["msg_type"] = sorted(klass.__name__ for klass in self.msg_types)
+        return obj
+
+
+class TraceSampler(object):
+    """
+    Sampler selecting the messages recorded in a trace, for tracing under production load:
+    either one in every ``every`` messages, or at most ``per_second`` records per second
+    (or both).
+
+    Sampling is correlated: all messages with the same correlation ID (that is, all messages
+    of one action, eg a call with its invocation, yield and result) are either recorded or
+    dropped together. For 1-in-N sampling, the decision is derived from the correlation ID
+    itself (and hence is also consistent across router workers); for rate-limited sampling,
+    the decision is taken on the first message of an action and remembered until the last.
+    """
+
+    __slots__ = ("every", "per_second", "_now", "_count", "_tokens", "_last", "_decisions", "sampled", "dropped")
+
+    MAX_DECISIONS = 10000
+    """
+    Maximum number of open actions the (rate-limited) sampling decision is remembered for.
+    """
+
+    def __init__(self, every=None, per_second=None, now=None):
+        """
+
+        :param every: Record one in every this many messages (or actions).
+        :type every: int or None
+
+        :param per_second: Record at most this many messages (or actions) per second.
+        :type per_second: int or float or None
+
+        :param now: Function returning the current time in seconds. Defaults to ``time.monotonic``.
+        :type now: callable
+        """
+        self.every = every
+        self.per_second = per_second
+        self._now = now or time.monotonic
+
+        # message counter for 1-in-N sampling of messages without correlation ID
+        self._count = 0
+
+        # token bucket for rate-limited sampling
+        self._tokens = float(per_second or 0)
+        self._last = self._now()
+
+        # map: correlation ID -> sampling decision, for open actions
+        self._decisions = OrderedDict()
+
+        self.sampled = 0
+        self.dropped = 0
+
+    @staticmethod
+    def parse(config):
+        """
+        Parse a sampler from trace options, eg ``{"every": 100}`` or ``{"per_second": 1000}``.
+
+        :param config: The sampling configuration.
+        :type config: dict
+
+        :returns: The trace sampler.
+        :rtype: :class:`TraceSampler`
+
+        :raises ValueError: When the configuration is invalid.
+        """
+        if not isinstance(config, dict):
+            raise ValueError("sampling must be a dict, was {}".format(type(config)))
+        for key in config:
+            if key not in ["every", "per_second"]:
+                raise ValueError("invalid sampling attribute '{}'".format(key))
+
+        every = config.get("every", None)
+        if every is not None and (type(every) != int or every < 1):
+            raise ValueError("sampling attribute 'every' must be a positive integer, was {}".format(every))
+
+        per_second = config.get("per_second", None)
+        if per_second is not None and (type(per_second) not in (int, float) or per_second <= 0):
+            raise ValueError("sampling attribute 'per_second' must be a positive number, was {}".format(per_second))
+
+        if every is None and per_second is None:
+            raise ValueError("sampling requires 'every' or 'per_second'")
+
+        return TraceSampler(every=every, per_second=per_second)
+
+    def _take_token(self):
+        now = self._now()
+        self._tokens = min(float(self.per_second), self._tokens + (now - self._last) * self.per_second)
+        self._last = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def sample(self, msg, remember=True):
+        """
+        Decide if a message is to be recorded.
+
+        :param msg: The message to decide on.
+        :type msg: :class:`autobahn.wamp.message.Message`
+
+        :param remember: Remember the decision on the first message of an action for the
+            following messages of the action. Callers which keep track of the sampled actions
+            themselves (and only ask for the first message of an action) pass ``False``.
+        :type remember: bool
+
+        :returns: ``True`` if the message is to be recorded.
+        :rtype: bool
+        """
+        correlation_id = msg.correlation_id
+
+        if correlation_id is None:
+            keep = True
+            if self.every:
+                self._count += 1
+                keep = self._count % self.every == 0
+            if keep and self.per_second:
+                keep = self._take_token()
+
+        elif self.every and zlib.crc32(correlation_id.encode()) % self.every:
+            keep = False
+
+        elif self.per_second and not remember:
+            keep = self._take_token()
+
+        elif self.per_second:
+            keep = self._decisions.get(correlation_id, None)
+            if keep is None:
+                keep = self._take_token()
+                if not msg.correlation_is_last:
+                    self._decisions[correlation_id] = keep
+                    if len(self._decisions) > self.MAX_DECISIONS:
+                        self._decisions.popitem(last=False)
+            elif msg.correlation_is_last:
+                del self._decisions[correlation_id]
+
+        else:
+            keep = True
+
+        if keep:
+            self.sampled += 1
+        else:
+            self.dropped += 1
+        return keep
+
+    def marshal(self):
+        return {
+            "every": self.every,
+            "per_second": self.per_second,
+            "sampled": self.sampled,
+            "dropped": self.dropped,
+        }
+
+
 class TracedMessage(object):
+    """
+    Trace record of a WAMP message. Only the fields traced are kept (rather than the message itself).
+    """
+
     __slots__ = (
         "ts",
         "pc",
@@ -44,10 +342,19 @@ class TracedMessage(object):
         "session_id",
         "authid",
         "authrole",
+        "msg_type",
+        "correlation",
+        "correlation_uri",
+        "correlation_is_anchor",
+        "correlation_is_last",
+        "enc_algo",
+        "enc_key",
+        "enc_serializer",
+        "serializations",
         "msg",
     )
 
-    def __init__(self, seq, realm, direction, session_id, authid, authrole, msg):
+    def __init__(self, seq, realm, direction, session_id, authid, authrole, msg, include_message=False):
         self.ts = time_ns()
         self.pc = perf_counter_ns()
         self.seq = seq
@@ -56,7 +363,20 @@ class TracedMessage(object):
         self.session_id = session_id
         self.authid = authid
         self.authrole = authrole
-        self.msg = msg
+        self.msg_type = msg.__class__.__name__
+        self.correlation = msg.correlation_id
+        self.correlation_uri = msg.correlation_uri
+        self.correlation_is_anchor = msg.correlation_is_anchor
+        self.correlation_is_last = msg.correlation_is_last
+        self.enc_algo = getattr(msg, "enc_algo", None)
+        self.enc_key = getattr(msg, "enc_key", None)
+        self.enc_serializer = getattr(msg, "enc_serializer", None)
+
+        # msg serialization sizes
+        self.serializations = tuple((ser.NAME, len(val)) for ser, val in msg._serialized.items())
+
+        # the raw WAMP message, only when tracing app payload
+        self.msg = msg.marshal() if include_message else None
 
     def marshal(self, include_message=False):
         obj = {
@@ -68,25 +388,20 @@ class TracedMessage(object):
             "session_id": self.session_id,
             "authid": self.authid,
             "authrole": self.authrole,
-            "msg_type": six.text_type(self.msg.__class__.__name__),
-            "correlation": self.msg.correlation_id,
-            "correlation_uri": self.msg.correlation_uri,
-            "correlation_is_anchor": self.msg.correlation_is_anchor,
-            "correlation_is_last": self.msg.correlation_is_last,
-            "enc_algo": self.msg.enc_algo if hasattr(self.msg, "enc_algo") else None,
-            "enc_key": self.msg.enc_key if hasattr(self.msg, "enc_key") else None,
-            "enc_serializer": self.msg.enc_serializer if hasattr(self.msg, "enc_serializer") else None,
+            "msg_type": self.msg_type,
+            "correlation": self.correlation,
+            "correlation_uri": self.correlation_uri,
+            "correlation_is_anchor": self.correlation_is_anchor,
+            "correlation_is_last": self.correlation_is_last,
+            "enc_algo": self.enc_algo,
+            "enc_key": self.enc_key,
+            "enc_serializer": self.enc_serializer,
+            "serializations": dict(self.serializations),
         }
 
-        # track msg serialization sizes
-        serializations = {}
-        for ser, val in self.msg._serialized.items():
-            serializations[ser.NAME] = len(val)
-        obj["serializations"] = serializations
-
-        if include_message:
+        if include_message and self.msg is not None:
             # forward raw WAMP message
-            obj["msg"] = self.msg.marshal()
+            obj["msg"] = self.msg
 
         return obj
 
@@ -144,10 +459,15 @@ class FabricRouterTrace(object):
     A trace is always run from a router worker process. The router code calls
     into maybe_trace_rx_msg/maybe_trace_tx_msg to trace messages as they are received
     and sent to/from the router. These 2 functions check if the message is to be traced
-    in the first place, and if so, create a trace record and append that to a in-memory
-    list in the same (main) thread. Every 10-100ms, a looping call will trigger that
-    will then take the buffered messages in the list and forward that to a background
+    in the first place (the trace is running, and the message passes the trace filter),
+    and if so, create a trace record and append that to a in-memory list in the same
+    (main) thread. Every 10-100ms, a looping call will trigger that will then take the
+    buffered messages in the list and - for persisted traces - forward that to a background
     thread where it is written to a LMDB database file specific to this trace.
+
+    Trace records are numbered by a sequence number without gaps, and the records kept in
+    memory are indexed by sequence number, so that retrieving a window of a (long) trace
+    only touches the records in the window.
     """
 
     log = make_logger()
@@ -163,6 +483,10 @@ class FabricRouterTrace(object):
         persist=False,
         duration=None,
         limit=60,
+        trace_filter=None,
+        persist_dir=None,
+        persist_maxsize=2**30,
+        trace_sampler=None,
     ):
         """
 
@@ -183,8 +507,20 @@ class FabricRouterTrace(object):
             stopped after this time. Otherwise a trace needs to be stopped explicitly.
         :type duration: int
 
-        :param limit: Limit in secs of the history kept for the trace.
+        :param limit: Limit in secs of the history kept (in memory) for the trace.
         :type limit: int
+
+        :param trace_filter: Filter selecting the messages traced (all messages are traced when not given).
+        :type trace_filter: :class:`TraceFilter` or None
+
+        :param persist_dir: Directory in which the database of a persisted trace is created.
+        :type persist_dir: str or None
+
+        :param persist_maxsize: Maximum size of the database of a persisted trace in bytes.
+        :type persist_maxsize: int
+
+        :param trace_sampler: Sampler selecting the messages (or actions) recorded (all are recorded when not given).
+        :type trace_sampler: :class:`TraceSampler` or None
         """
         self._session = session
         self._trace_id = trace_id
@@ -195,12 +531,24 @@ class FabricRouterTrace(object):
         self._persist = persist
         self._duration = duration
         self._limit = limit
+        self._filter = trace_filter
+        self._sampler = trace_sampler
         self._status = "created"
 
         if persist:
+            assert persist_dir is not None
             self._persistent_id = str(uuid.uuid4())
+            self._persist_path = os.path.join(persist_dir, self._persistent_id)
         else:
             self._persistent_id = None
+            self._persist_path = None
+        self._persist_maxsize = persist_maxsize
+
+        # database, table and background writer of a persisted trace (while running)
+        self._db = None
+        self._records_table = None
+        self._writes = None
+        self._writer_done = None
 
         self._started = None
         self._ended = None
@@ -220,9 +568,47 @@ class FabricRouterTrace(object):
         max_periods = int(math.ceil(float(limit) * 1000.0 / float(batching_period)))
         self._trace = deque(maxlen=max_periods)
 
+        # index of the trace records kept in memory, in sequence order: the record with
+        # sequence number seq is self._records[self._head + seq - self._head_seq]
+        self._records = []
+        self._head = 0
+        self._head_seq = 0
+
         # the looping call the accumulates the current batch
         self._batch_looper = None
 
+    def _record(self, trace_record):
+        trace_record.seq = self._seq
+        self._seq += 1
+        self._current_batch.append(trace_record)
+        self._records.append(trace_record)
+
+    def _marshal(self, trace_record):
+        if self._trace_level == "message":
+            return trace_record.marshal(self._trace_app_payload)
+        elif self._trace_level == "action":
+            return trace_record.marshal()
+        else:
+            raise Exception("logic error")
+
+    def _drop_period(self, batch):
+        # the records of a period dropped from the history are dropped from the index
+        if batch:
+            self._head += len(batch)
+            self._head_seq += len(batch)
+            if self._head > 1024 and self._head * 2 > len(self._records):
+                del self._records[: self._head]
+                self._head = 0
+
+    def _write_records(self, txn, records):
+        for seq, record in records:
+            self._records_table[txn, seq] = record
+
+    def _persist_batch(self, batch):
+        if self._writes is not None and batch:
+            records = [(trace_record.seq, self._marshal(trace_record)) for trace_record in batch]
+            self._writes.put(self._write_records, records)
+
     def _batch_loop(self):
         period = {
             "finished_ts": time_ns(),
@@ -244,17 +630,31 @@ class FabricRouterTrace(object):
         if self._on_trace_period_finished:
             self._on_trace_period_finished(self._trace_id, period, current_batch)
 
+        # hand the current batch to the background writer of a persisted trace
+        self._persist_batch(current_batch)
+
         # append current batch to history
+        if len(self._trace) == self._trace.maxlen:
+            self._drop_period(self._trace[0][1])
         self._trace.append((period, current_batch))
 
         # next period
         self._period += 1
         self._period_ts = datetime.utcnow()
-        if current_batch:
-            self._current_batch = []
+        self._current_batch = []
 
     def start(self):
         if self._status == "created":
+            if self._persist:
+                os.makedirs(os.path.dirname(self._persist_path), exist_ok=True)
+                self._db = zlmdb.Database.open(dbpath=self._persist_path, maxsize=self._persist_maxsize, context=self)
+                self._db.__enter__()
+                self._records_table = self._db.attach_table(TraceRecords)
+                self._writes = WriteQueue(self._db, flush_ms=self._batching_period)
+                self._writer_done = self._writes.start(reactor)
+                self.log.info(
+                    'persisting trace "{trace_id}" to {dbpath}', trace_id=self._trace_id, dbpath=self._persist_path
+                )
             self._status = "running"
             self._started = datetime.utcnow()
             self._period_ts = self._started
@@ -264,6 +664,13 @@ class FabricRouterTrace(object):
             self.log.warn('skip starting of Trace not in status "created", but "{status}"', status=self._status)
 
     def stop(self):
+        """
+        Stop the trace. For a persisted trace, the records of the current period are
+        persisted, and the database is closed once all records are written.
+
+        :returns: A deferred firing when all records of a persisted trace are written, or ``None``.
+        """
+        done = None
         if self._status == "running":
             if self._batch_looper:
                 if self._batch_looper.running:
@@ -271,8 +678,21 @@ class FabricRouterTrace(object):
                 self._batch_looper = None
             self._status = "stopped"
             self._ended = datetime.utcnow()
+            if self._writes is not None:
+                self._persist_batch(self._current_batch)
+                self._writes.stop()
+                done, self._writer_done = self._writer_done, None
+                db, self._db = self._db, None
+                self._writes = None
+
+                def close(res):
+                    db.__exit__(None, None, None)
+                    return res
+
+                done.addBoth(close)
         else:
             self.log.warn('skip stopping of Trace not in status "running", but "{status}"', status=self._status)
+        return done
 
     def marshal(self):
         if self._started:
@@ -299,26 +719,58 @@ class FabricRouterTrace(object):
                 "persist": self._persist,
                 "duration": self._duration,
                 "limit": self._limit,
+                "filter": self._filter.marshal() if self._filter else None,
+                "sampling": self._sampler.marshal() if self._sampler else None,
             },
             "next_period": self._period,
             "next_seq": self._seq,
         }
         return data
 
-    def get_data(self, from_seq, to_seq, limit):
-        # FIXME: implement selection for sequence range / limit
+    def get_data(self, from_seq, to_seq=None, limit=None):
+        """
+        Get trace records in a sequence number range.
+
+        :param from_seq: Sequence number of the first record to return.
+        :type from_seq: int
+
+        :param to_seq: Sequence number of the last record to return (up to the last record when ``None``).
+        :type to_seq: int or None
+
+        :param limit: Return at most this many records.
+        :type limit: int or None
+
+        :returns: List of marshaled trace records, in sequence order.
+        :rtype: list
+        """
+        from_seq = max(from_seq or 0, 0)
+        last_seq = self._seq - 1 if to_seq is None else min(to_seq, self._seq - 1)
+        if limit is not None:
+            last_seq = min(last_seq, from_seq + limit - 1)
+
         res = []
-        for period, batch in self._trace:
-            if batch:
-                if self._trace_level == "message":
-                    res.extend([trace_record.marshal(self._trace_app_payload) for trace_record in batch])
-                elif self._trace_level == "action":
-                    res.extend([traced_action.marshal() for traced_action in batch])
-                else:
-                    raise Exception("logic error")
-            if len(res) > limit:
-                res = res[:limit]
-                break
+        if last_seq < from_seq:
+            return res
+
+        # records no longer kept in memory are read from the database of a persisted trace
+        if from_seq < self._head_seq:
+            if self._db:
+                with self._db.begin() as txn:
+                    res.extend(
+                        self._records_table.select(
+                            txn,
+                            from_key=from_seq,
+                            to_key=min(last_seq, self._head_seq - 1) + 1,
+                            return_keys=False,
+                        )
+                    )
+            from_seq = self._head_seq
+
+        start = self._head + from_seq - self._head_seq
+        stop = self._head + last_seq - self._head_seq + 1
+        for trace_record in self._records[start:stop]:
+            res.append(self._marshal(trace_record))
+
         return res
 
     def maybe_trace_rx_msg(self, session, msg):
@@ -328,22 +780,36 @@ class FabricRouterTrace(object):
         self._maybe_trace_msg(session, msg, "tx")
 
     def _maybe_trace_msg(self, session, msg, direction):
-        # FIXME: implement tracing filters
         is_traced = self._status == "running"
 
         if is_traced:
-            self.log.debug("{direction}: {msg}", direction=direction.upper(), msg=msg)
-
             if self._trace_level == "message":
+                if self._filter and not self._filter.matches(session, msg):
+                    return
+                if self._sampler and not self._sampler.sample(msg):
+                    return
+
+                self.log.debug("{direction}: {msg}", direction=direction.upper(), msg=msg)
+
                 trace_record = TracedMessage(
-                    self._seq, session._realm, direction, session._session_id, session._authid, session._authrole, msg
+                    self._seq,
+                    session._realm,
+                    direction,
+                    session._session_id,
+                    session._authid,
+                    session._authrole,
+                    msg,
+                    include_message=self._trace_app_payload,
                 )
-
-                self._current_batch.append(trace_record)
-                self._seq += 1
+                self._record(trace_record)
 
             elif self._trace_level == "action":
-                if msg.correlation_is_anchor:
+                # actions are filtered by the anchor message (the responses to a traced action are always traced)
+                if (
+                    msg.correlation_is_anchor
+                    and (not self._filter or self._filter.matches(session, msg))
+                    and (not self._sampler or self._sampler.sample(msg, remember=False))
+                ):
                     # RPC/PubSub related actions
                     if (
                         isinstance(msg, message.Call)
@@ -358,10 +824,11 @@ class FabricRouterTrace(object):
                         _action = None
 
                     if _action:
+                        # the sequence number is assigned when the action is finished (and recorded)
                         traced_action = TracedAction(
                             msg.correlation_id,
                             msg.correlation_uri,
-                            self._seq,
+                            None,
                             session._realm,
                             _action,
                             session._session_id,
@@ -369,7 +836,6 @@ class FabricRouterTrace(object):
                         )
 
                         self._open_actions[msg.correlation_id] = traced_action
-                        self._seq += 1
                         self.log.debug("New TRACE ACTION: {traced_action}", traced_action=traced_action)
 
                 if isinstance(msg, message.Invocation) or isinstance(msg, message.Event):
@@ -377,7 +843,7 @@ class FabricRouterTrace(object):
                         response = {
                             "session_id": session._session_id,
                             "authid": session._authid,
-                            "authrole": session._authid,
+                            "authrole": session._authrole,
                             "enc_algo": msg.enc_algo,
                             "enc_key": msg.enc_key,
                             "enc_serializer": msg.enc_serializer,
@@ -389,7 +855,7 @@ class FabricRouterTrace(object):
                         traced_action = self._open_actions[msg.correlation_id]
                         traced_action.success = not isinstance(msg, message.Error)
                         del self._open_actions[msg.correlation_id]
-                        self._current_batch.append(traced_action)
+                        self._record(traced_action)
                         self.log.debug("TRACE ACTION finished: {traced_action}", traced_action=traced_action)
 
             else:
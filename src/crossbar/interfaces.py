@@ -215,13 +215,24 @@ class IRealmStore(abc.ABC):
         """
 
     @abc.abstractmethod
-    def store_event(self, session: ISession, publication_id: int, publish: Publish):
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get realm store statistics.
+
+        :return: Dict with statistics depending on the store type, e.g. the write queue
+            of a database-backed store.
+        """
+
+    @abc.abstractmethod
+    def store_event(self, session: ISession, publication_id: int, publish: Publish) -> bool:
         """
         Store event to event history.
 
         :param session: The publishing session.
         :param publication_id: The WAMP publication ID under which the publish-action happens.
         :param publish: The WAMP publish message.
+        :return: ``False`` if the store is overloaded and the event was not stored (the
+            broker then pushes back on the publisher), otherwise ``True``.
         """
 
     @abc.abstractmethod
@@ -236,7 +247,7 @@ class IRealmStore(abc.ABC):
         """
 
     @abc.abstractmethod
-    def get_events(self, subscription_id: int, limit: Optional[int] = None):
+    def get_events(self, subscription_id: int, limit: Optional[int] = None, before: Optional[int] = None):
         """
         Retrieve given number of last events for a given subscription.
 
@@ -248,6 +259,8 @@ class IRealmStore(abc.ABC):
 
         :param subscription_id: The ID of the subscription to retrieve events for.
         :param limit: Limit number of events returned.
+        :param before: Cursor for paging through the history: only return events published
+            before the event with this publication ID (the oldest event of the previous page).
         :return: List of events: at most ``limit`` events in reverse chronological order.
         """
 
@@ -275,28 +288,72 @@ class IRealmStore(abc.ABC):
     @abc.abstractmethod
     def maybe_queue_call(self, session: ISession, call, registration, authorization):
         """
+        Queue a call which cannot be forwarded because the maximum concurrency of all
+        callees of the registration is reached.
 
-        :param session:
-        :param call:
-        :param registration:
-        :param authorization:
-        :return:
+        :param session: The caller session.
+        :param call: The WAMP CALL message.
+        :param registration: The registration called.
+        :param authorization: The authorization of the call.
+        :return: The queued call (:class:`crossbar.router.realmstore.QueuedCall`), or ``None``
+            when calls on the registration are not queued or the call queue is full.
         """
 
     @abc.abstractmethod
     def get_queued_call(self, registration):
         """
+        Get the call queued on a registration which is to be forwarded next, without dequeueing it.
 
-        :param registration:
-        :return:
+        :param registration: The registration.
+        :return: The queued call or ``None``.
         """
 
     @abc.abstractmethod
     def pop_queued_call(self, registration):
         """
+        Dequeue the call queued on a registration which is to be forwarded next.
 
-        :param registration:
-        :return:
+        :param registration: The registration.
+        :return: The queued call or ``None``.
+        """
+
+    @abc.abstractmethod
+    def expire_queued_calls(self, registration) -> List[Any]:
+        """
+        Dequeue all calls queued on a registration for longer than the max-age configured.
+
+        :param registration: The registration.
+        :return: The expired calls.
+        """
+
+    @abc.abstractmethod
+    def drop_queued_calls(self, registration) -> List[Any]:
+        """
+        Dequeue all calls queued on a registration, eg when the registration was deleted.
+
+        :param registration: The registration.
+        :return: The dropped calls.
+        """
+
+    @abc.abstractmethod
+    def store_mqtt_session(self, client_id: str, state: Dict[str, Any]):
+        """
+        Store the state of a persistent (clean-session=false) MQTT session when the client
+        disconnects, replacing any state stored for the client before.
+
+        :param client_id: The MQTT client ID.
+        :param state: The session state (subscriptions, unacknowledged messages and the packet
+            IDs of incoming QoS 2 messages not yet released).
+        """
+
+    @abc.abstractmethod
+    def pop_mqtt_session(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Take over (remove) the state stored for a persistent MQTT session, when the client
+        reconnects (or discard it, when the client reconnects with clean-session=true).
+
+        :param client_id: The MQTT client ID.
+        :return: The session state or ``None``.
         """
 
 
@@ -33,6 +33,7 @@ class RemoteProxyApi(RemoteApi):
             "get_proxy_connection",
             "start_proxy_connection",
             "stop_proxy_connection",
+            "get_proxy_join_timings",
         ],
     }
 
@@ -890,6 +890,13 @@ class Node(object):
         for i, realm_name in enumerate(worker.get("routes", {})):
             roles = worker["routes"][realm_name]
             for role_id, connections in roles.items():
+                # a single connection ID, a list of connection IDs, or a dict with a list of
+                # connection IDs and the strategy to select from these
+                options = None
+                if isinstance(connections, dict):
+                    if "strategy" in connections:
+                        options = {"strategy": connections["strategy"]}
+                    connections = connections.get("connections", [])
                 if not isinstance(connections, list):
                     connections = [connections]  # used to be a single string, now a list of strings
                 for connection_id in connections:
@@ -903,6 +910,7 @@ class Node(object):
                         "crossbar.worker.{}.start_proxy_realm_route".format(worker_id),
                         realm_name,
                         {role_id: connection_id},
+                        options,
                     )
 
         # start transports on proxy
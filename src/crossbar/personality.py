@@ -107,7 +107,9 @@ def create_realm_store(personality, factory, config) -> IRealmStore:
                 {
                     "uri": "com.example.compute",
                     "match": "exact",
-                    "limit": 1000   // procedure specific call queue limit
+                    "limit": 1000,              // procedure specific call queue limit
+                    "max-age": 60,              // seconds a call may stay queued
+                    "priority": {"admin": 1}    // queueing priority by caller authrole
                 }
             ],
             "event-history": [
@@ -14,19 +14,51 @@ class RouterOptions(object):
     URI_CHECK_LOOSE = "loose"
     URI_CHECK_STRICT = "strict"
 
-    def __init__(self, uri_check=None, event_dispatching_chunk_size=None):
+    def __init__(
+        self,
+        uri_check=None,
+        event_dispatching_chunk_size=None,
+        event_dispatching_serialize_once=None,
+        invoke_policies=None,
+        authorization_cache_size=None,
+    ):
         """
 
         :param uri_check: Method which should be applied to check WAMP URIs.
         :type uri_check: str
+
+        :param event_dispatching_chunk_size: Dispatch this many events before reentering the event loop.
+        :type event_dispatching_chunk_size: int
+
+        :param event_dispatching_serialize_once: If ``True``, serialize and frame each event once per
+            serializer and transport framing, and write the same pre-framed bytes to all receivers.
+        :type event_dispatching_serialize_once: bool
+
+        :param invoke_policies: Router-side invocation policies (``least_loaded`` or ``fastest``)
+            applied to shared registrations of procedures, as a list of dicts with ``uri``,
+            ``match`` (``exact`` or ``prefix``) and ``invoke``.
+        :type invoke_policies: list
+
+        :param authorization_cache_size: Maximum number of authorizations cached (least recently
+            used authorizations are evicted).
+        :type authorization_cache_size: int
         """
         self.uri_check = uri_check or RouterOptions.URI_CHECK_STRICT
         self.event_dispatching_chunk_size = event_dispatching_chunk_size or 100
+        self.event_dispatching_serialize_once = bool(event_dispatching_serialize_once)
+        self.invoke_policies = invoke_policies or []
+        self.authorization_cache_size = authorization_cache_size or 10000
 
     def __str__(self):
-        return "RouterOptions(uri_check = {0}, event_dispatching_chunk_size = {1})".format(
+        return (
+            "RouterOptions(uri_check = {0}, event_dispatching_chunk_size = {1}, "
+            "event_dispatching_serialize_once = {2}, invoke_policies = {3}, authorization_cache_size = {4})"
+        ).format(
             self.uri_check,
             self.event_dispatching_chunk_size,
+            self.event_dispatching_serialize_once,
+            self.invoke_policies,
+            self.authorization_cache_size,
         )
 
 
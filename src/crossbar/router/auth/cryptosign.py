@@ -65,6 +65,9 @@ class PendingAuthCryptosign(PendingAuth):
         self._challenge: Optional[bytes] = None
         self._expected_signed_message: Optional[bytes] = None
 
+        # The principal returned by the dynamic authenticator (cached when the authentication succeeds).
+        self._principal: Optional[Dict[str, Any]] = None
+
         # map `pubkey -> authid` from `config['principals']`, this is to allow clients to
         # authenticate without specifying an authid
         self._pubkey_to_authid = None
@@ -334,6 +337,25 @@ class PendingAuthCryptosign(PendingAuth):
         elif self._config["type"] == "dynamic":
             self._authprovider = "dynamic"
 
+            def challenge_principal(principal):
+                _error = self._assign_principal(principal)
+                if _error:
+                    return _error
+                self._principal = principal
+
+                self._verify_key = VerifyKey(principal["pubkey"], encoder=nacl.encoding.HexEncoder)
+
+                extra = self._compute_challenge(requested_channel_binding)
+                return Challenge(self._authmethod, extra)
+
+            # skip calling the authenticator when the client was authenticated before: the signature
+            # over the (fresh) challenge is still verified in authenticate(), and a client challenge
+            # is not part of the key
+            authextra = {k: v for k, v in (details.authextra or {}).items() if k != "challenge"}
+            principal = self._get_cached_principal(realm, details.authid, [details.authrole, authextra])
+            if principal is not None:
+                return challenge_principal(principal)
+
             d = Deferred()
 
             d1 = txaio.as_future(self._init_dynamic_authenticator)
@@ -369,16 +391,7 @@ class PendingAuthCryptosign(PendingAuth):
                         details=details,
                         principal=principal,
                     )
-                    _error = self._assign_principal(principal)
-                    if _error:
-                        d.callback(_error)
-                        return
-
-                    self._verify_key = VerifyKey(principal["pubkey"], encoder=nacl.encoding.HexEncoder)
-
-                    extra = self._compute_challenge(requested_channel_binding)
-                    challenge = Challenge(self._authmethod, extra)
-                    d.callback(challenge)
+                    d.callback(challenge_principal(principal))
 
                 def on_authenticate_error(_error):
                     self.log.debug(
@@ -508,6 +521,7 @@ class PendingAuthCryptosign(PendingAuth):
 
             # signature was valid _and_ the message that was signed is equal to
             # what we expected => accept the client
+            self._set_cached_principal(self._principal)
             return self._accept()
 
         # should not arrive here, but who knows
@@ -5,8 +5,10 @@
 #
 #####################################################################################
 
+import hashlib
 import importlib
-from typing import Any, Dict, Optional, Union
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import txaio
 from autobahn.wamp.exception import ApplicationError
@@ -17,12 +19,159 @@ from txaio import make_logger
 
 from crossbar._util import hlid, hltype
 from crossbar.interfaces import IRealmContainer
+from crossbar.router.cache import LRUCache
 
-__all__ = ("PendingAuth",)
+__all__ = ("PendingAuth", "AuthenticationCache", "authentication_cache_stats")
 
 _authenticators: Dict[str, object] = dict()
 
 
+class AuthenticationCache(object):
+    """
+    Cache of the principals returned by a dynamic authenticator for successful
+    authentications, so that repeated authentications of a client presenting the same
+    credentials do not need to call the authenticator (via WAMP) again.
+
+    Entries are keyed by authentication method, realm, authid and a digest of
+    the credentials presented by the client, and expire after a time-to-live.
+    """
+
+    __slots__ = ("_authmethod", "_authenticator", "_ttl", "_cache")
+
+    def __init__(self, authmethod, authenticator, ttl, maxsize=1000, now=None):
+        """
+
+        :param authmethod: The authentication method the cache is used for.
+        :type authmethod: str
+
+        :param authenticator: The URI of the dynamic authenticator the cache is used for.
+        :type authenticator: str
+
+        :param ttl: Time-to-live of cached principals in seconds.
+        :type ttl: int or float
+
+        :param maxsize: Maximum number of cached principals.
+        :type maxsize: int
+
+        :param now: Function returning the current time in seconds.
+        :type now: callable
+        """
+        self._authmethod = authmethod
+        self._authenticator = authenticator
+        self._ttl = ttl
+        self._cache = LRUCache(maxsize=maxsize, now=now)
+
+    @staticmethod
+    def key(authmethod, realm, authid, credential):
+        """
+        Compute the cache key for an authentication.
+
+        :param credential: The (JSON serializable) credentials presented by the client,
+            eg the ticket for WAMP-Ticket. Only a digest of the credentials is kept in the key.
+
+        :rtype: tuple
+        """
+        data = json.dumps(credential, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return authmethod, realm, authid, hashlib.sha256(data.encode("utf8")).hexdigest()
+
+    def get(self, key):
+        """
+        Get the principal cached for an authentication.
+
+        :returns: The principal or ``None`` if no (unexpired) principal is cached.
+        """
+        return self._cache.get(key)
+
+    def put(self, key, principal):
+        """
+        Cache the principal returned by the authenticator for a successful authentication.
+        """
+        self._cache.put(key, principal, ttl=self._ttl)
+
+    def clear(self):
+        """
+        Remove all cached principals.
+        """
+        self._cache.clear()
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        :returns: Dict with the authentication method and authenticator, the time-to-live,
+            and the statistics of the underlying LRU cache (size, hits, misses, ..).
+        :rtype: dict
+        """
+        stats = {
+            "authmethod": self._authmethod,
+            "authenticator": self._authenticator,
+            "ttl": self._ttl,
+        }
+        stats.update(self._cache.stats())
+        return stats
+
+
+# map: id(authentication method configuration) -> (configuration, cache). the authentication
+# method configuration item of a transport is shared by all pending authentications on the
+# transport, and the reference to the configuration kept here keeps its ID unique until the
+# transport is stopped and the cache is released (see release_authentication_caches)
+_authentication_caches: Dict[int, Tuple[Dict[str, Any], AuthenticationCache]] = dict()
+
+
+def _authentication_cache(authmethod: str, config: Dict[str, Any]) -> Optional[AuthenticationCache]:
+    """
+    Get the authentication cache for the authentication method configuration of a transport.
+
+    :returns: The cache or ``None`` if caching is not enabled in the configuration.
+    """
+    if config.get("type", None) != "dynamic" or "authenticator-cache-ttl" not in config:
+        return None
+    entry = _authentication_caches.get(id(config), None)
+    if entry is None or entry[0] is not config:
+        cache = AuthenticationCache(
+            authmethod,
+            config["authenticator"],
+            config["authenticator-cache-ttl"],
+            maxsize=config.get("authenticator-cache-size", 1000),
+        )
+        _authentication_caches[id(config)] = (config, cache)
+        return cache
+    return entry[1]
+
+
+def release_authentication_caches(config: Any) -> int:
+    """
+    Release the authentication caches of a (stopped) transport.
+
+    :param config: The transport configuration. The authentication method configurations
+        are looked up anywhere within, eg also in the paths of a Web transport.
+
+    :returns: The number of caches released.
+    """
+    released = 0
+    todo = [config]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, dict):
+            entry = _authentication_caches.get(id(item), None)
+            if entry is not None and entry[0] is item:
+                del _authentication_caches[id(item)]
+                released += 1
+            todo.extend(item.values())
+        elif isinstance(item, list):
+            todo.extend(item)
+    return released
+
+
+def authentication_cache_stats() -> List[Dict[str, Any]]:
+    """
+    Get the statistics of all authentication caches in this worker.
+
+    :returns: List of cache statistics, one per transport authentication method with caching enabled.
+    """
+    return [cache.stats() for _, cache in _authentication_caches.values()]
+
+
 class PendingAuth:
     """
     Base class for pending WAMP authentications.
@@ -91,6 +240,40 @@ class PendingAuth:
         # The session over which to issue the call to the authenticator (filled only in dynamic mode).
         self._authenticator_session: Optional[ISession] = None
 
+        # The key under which to cache the principal returned by the dynamic authenticator
+        # when the authentication succeeds (filled only when the authentication cache is enabled).
+        self._cache_key: Optional[Tuple[str, Optional[str], Optional[str], str]] = None
+
+    def _get_cached_principal(self, realm: Optional[str], authid: Optional[str], credential: Any):
+        """
+        Lookup the principal returned by the dynamic authenticator for a previous
+        successful authentication with the same realm, authid and credentials.
+
+        When no principal is cached, the principal returned by the authenticator
+        should be cached using :meth:`_set_cached_principal` once the authentication succeeds.
+
+        :param credential: The (JSON serializable) credentials presented by the client.
+
+        :returns: The cached principal or ``None``.
+        """
+        cache = _authentication_cache(self._authmethod, self._config)
+        if cache is None:
+            return None
+        key = AuthenticationCache.key(self._authmethod, realm, authid, credential)
+        principal = cache.get(key)
+        self._cache_key = key if principal is None else None
+        return principal
+
+    def _set_cached_principal(self, principal):
+        """
+        Cache the principal returned by the dynamic authenticator after the authentication succeeded.
+        """
+        if self._cache_key is not None and principal is not None:
+            cache = _authentication_cache(self._authmethod, self._config)
+            if cache is not None:
+                cache.put(self._cache_key, principal)
+            self._cache_key = None
+
     def _assign_principal(self, principal):
         if isinstance(principal, str):
             # FIXME: more strict authrole checking
@@ -53,6 +53,9 @@ class PendingAuthScram(PendingAuth):
             transport_details.channel_id.get("tls-unique", None) if transport_details.channel_id else None
         )
 
+        # The principal returned by the dynamic authenticator (cached when the authentication succeeds).
+        self._principal = None
+
     def hello(self, realm: str, details: HelloDetails) -> Union[Accept, Deny, Challenge]:
         # the channel binding requested by the client authenticating
         # client must send "nonce" in details, and MAY send "gs2_cbind_flag"
@@ -90,6 +93,7 @@ class PendingAuthScram(PendingAuth):
             error = self._assign_principal(principal)
             if error:
                 return error
+            self._principal = principal
 
             # XXX TODO this needs to include (optional) channel-binding
             extra = self._compute_challenge()
@@ -112,6 +116,13 @@ class PendingAuthScram(PendingAuth):
         elif self._config["type"] == "dynamic":
             self._authprovider = "dynamic"
 
+            # skip calling the authenticator when the client was authenticated before (the
+            # client nonce is fresh for every authentication, and hence not part of the key)
+            credential = [details.authrole, {k: v for k, v in details.authextra.items() if k != "nonce"}]
+            principal = self._get_cached_principal(realm, details.authid, credential)
+            if principal is not None:
+                return on_authenticate_ok(principal)
+
             init_d = as_future(self._init_dynamic_authenticator)
 
             def init(error):
@@ -191,11 +202,12 @@ class PendingAuthScram(PendingAuth):
         # if we adjust self._authextra before _accept() it gets sent
         # back to the client
         server_signature = hmac.new(self._server_key, auth_message.encode("ascii"), hashlib.sha256).digest()
-        if self._authextra is None:
-            self._authextra = {}
+        # copy, as the authextra from the principal may be shared (eg with a cached principal)
+        self._authextra = dict(self._authextra) if self._authextra else {}
         self._authextra["scram_server_signature"] = base64.b64encode(server_signature).decode("ascii")
 
         if hmac.compare_digest(recovered_stored_key, self._stored_key):
+            self._set_cached_principal(self._principal)
             return self._accept()
 
         self.log.error("SCRAM authentication failed for '{authid}'", authid=self._authid)
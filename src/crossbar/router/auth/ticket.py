@@ -42,6 +42,10 @@ class PendingAuthTicket(PendingAuth):
         # The secret/ticket the authenticating principal will need to provide (filled only in static mode).
         self._signature = None
 
+        # The authrole and authextra requested by the client in HELLO, which are part of the
+        # authentication cache key (filled only in dynamic mode).
+        self._requested = None
+
     def hello(self, realm: str, details: HelloDetails) -> Union[Accept, Deny, Challenge]:
         # remember the realm the client requested to join (if any)
         self._realm = realm
@@ -71,6 +75,7 @@ class PendingAuthTicket(PendingAuth):
         # use configured procedure to dynamically get a ticket for the principal
         elif self._config["type"] == "dynamic":
             self._authprovider = "dynamic"
+            self._requested = [details.authrole, details.authextra]
 
             init_d = as_future(self._init_dynamic_authenticator)
 
@@ -118,6 +123,7 @@ class PendingAuthTicket(PendingAuth):
             if error:
                 return error
 
+            self._set_cached_principal(principal)
             return self._accept()
 
         def on_authenticate_error(err):
@@ -144,6 +150,11 @@ class PendingAuthTicket(PendingAuth):
 
         # WAMP-Ticket "dynamic"
         elif self._authprovider == "dynamic":
+            # skip calling the authenticator when the same ticket was accepted before
+            principal = self._get_cached_principal(self._realm, self._authid, [signature] + self._requested)
+            if principal is not None:
+                return on_authenticate_ok(principal)
+
             self._session_details["ticket"] = signature
 
             assert self._authenticator_session
@@ -51,6 +51,9 @@ class PendingAuthWampCra(PendingAuth):
         # The signature we expect the client to send in AUTHENTICATE.
         self._signature = None
 
+        # The principal returned by the dynamic authenticator (cached when the authentication succeeds).
+        self._principal = None
+
     def _compute_challenge(self, user):
         """
         Returns: challenge, signature
@@ -96,6 +99,7 @@ class PendingAuthWampCra(PendingAuth):
                 _error = self._assign_principal(_principal)
                 if _error:
                     return _error
+                self._principal = _principal
 
                 # now compute CHALLENGE.Extra and signature expected
                 _extra, self._signature = self._compute_challenge(_principal)
@@ -127,6 +131,12 @@ class PendingAuthWampCra(PendingAuth):
         elif self._config["type"] == "dynamic":
             self._authprovider = "dynamic"
 
+            # skip calling the authenticator when the client was authenticated before: the principal
+            # carries the secret, and the signature is still verified in authenticate()
+            principal = self._get_cached_principal(realm, details.authid, [details.authrole, details.authextra])
+            if principal is not None:
+                return on_authenticate_ok(principal)
+
             init_d = txaio.as_future(self._init_dynamic_authenticator)
 
             def init(result):
@@ -179,6 +189,7 @@ class PendingAuthWampCra(PendingAuth):
     def authenticate(self, signature: str) -> Union[Accept, Deny]:
         if signature == self._signature:
             # signature was valid: accept the client
+            self._set_cached_principal(self._principal)
             return self._accept()
         else:
             # signature was invalid: deny the client
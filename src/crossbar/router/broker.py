@@ -24,7 +24,9 @@ from txaio import make_logger
 
 from crossbar._util import hlflag, hlid, hltype
 from crossbar.router import NotAttached, RouterOptions
+from crossbar.router.fanout import EventFanout
 from crossbar.router.observation import UriObservationMap
+from crossbar.router.receivers import ReceiverIndex
 
 __all__ = ("Broker",)
 
@@ -74,8 +76,11 @@ class Broker(object):
         # generator for WAMP request IDs
         self._request_id_gen = util.IdGenerator()
 
+        # index of attached sessions used for subscriber black- and whitelisting
+        self._receiver_index = ReceiverIndex()
+
         # subscription map managed by this broker
-        self._subscription_map = UriObservationMap()
+        self._subscription_map = UriObservationMap(index=self._receiver_index)
 
         # map: session -> set of subscriptions (needed for detach)
         self._session_to_subscriptions = {}
@@ -83,6 +88,10 @@ class Broker(object):
         # check all topic URIs with strict rules
         self._option_uri_strict = self._options.uri_check == RouterOptions.URI_CHECK_STRICT
 
+        # serialize and frame events once per serializer/framing when dispatching to many receivers
+        self._option_serialize_once = self._options.event_dispatching_serialize_once
+        self.reset_fanout_stats()
+
         # supported features from "WAMP Advanced Profile"
         self._role_features = role.RoleBrokerFeatures(
             publisher_identification=True,
@@ -114,6 +123,7 @@ class Broker(object):
         """
         if session not in self._session_to_subscriptions:
             self._session_to_subscriptions[session] = set()
+            self._receiver_index.add(session)
         else:
             raise Exception("session with ID {} already attached".format(session._session_id))
 
@@ -167,66 +177,53 @@ class Broker(object):
 
             del self._session_to_subscriptions[session]
 
+            # release the session's slot only after it has been dropped from all subscriptions
+            self._receiver_index.remove(session)
+
         else:
             raise NotAttached("session with ID {} not attached".format(session._session_id))
 
-    def _filter_publish_receivers(self, receivers, publish):
+    def fanout_stats(self):
         """
-        Internal helper.
+        Get serialize-once event fan-out statistics.
 
-        Does all filtering on a candidate set of Publish receivers,
-        based on all the white/blacklist options in 'publish'.
+        :return: Dict with number of events dispatched in serialize-once mode, and the total
+            number of sends served from pre-framed bytes (hits), sends which needed to serialize
+            and frame the event (misses) and sends done via the regular transport path (fallbacks).
         """
-        # filter by "eligible" receivers
-        #
-        if publish.eligible:
-            # map eligible session IDs to eligible sessions
-            eligible = set()
-            for session_id in publish.eligible:
-                if session_id in self._router._session_id_to_session:
-                    eligible.add(self._router._session_id_to_session[session_id])
-
-            # filter receivers for eligible sessions
-            receivers = eligible & receivers
-
-        # if "eligible_authid" we only accept receivers that have the correct authid
-        if publish.eligible_authid:
-            eligible = set()
-            for aid in publish.eligible_authid:
-                eligible.update(self._router._authid_to_sessions.get(aid, set()))
-            receivers = receivers & eligible
-
-        # if "eligible_authrole" we only accept receivers that have the correct authrole
-        if publish.eligible_authrole:
-            eligible = set()
-            for ar in publish.eligible_authrole:
-                eligible.update(self._router._authrole_to_sessions.get(ar, set()))
-            receivers = receivers & eligible
-
-        # remove "excluded" receivers
-        #
-        if publish.exclude:
-            # map excluded session IDs to excluded sessions
-            exclude = set()
-            for s in publish.exclude:
-                if s in self._router._session_id_to_session:
-                    exclude.add(self._router._session_id_to_session[s])
+        return self._fanout_stats
 
-            # filter receivers for excluded sessions
-            if exclude:
-                receivers = receivers - exclude
-
-        # remove auth-id based receivers
-        if publish.exclude_authid:
-            for aid in publish.exclude_authid:
-                receivers = receivers - self._router._authid_to_sessions.get(aid, set())
+    def reset_fanout_stats(self):
+        """
+        Reset serialize-once event fan-out statistics.
+        """
+        self._fanout_stats = {
+            "enabled": self._option_serialize_once,
+            "events": 0,
+            "hits": 0,
+            "misses": 0,
+            "fallbacks": 0,
+        }
+
+    def _filter_publish_receivers(self, subscription, publish):
+        """
+        Internal helper.
 
-        # remove authrole based receivers
-        if publish.exclude_authrole:
-            for ar in publish.exclude_authrole:
-                receivers = receivers - self._router._authrole_to_sessions.get(ar, set())
+        Does all filtering on the subscribers of a subscription as candidate
+        Publish receivers, based on all the white/blacklist options in 'publish'.
+        The filtering is done on bitmaps of subscribers maintained in the receiver index.
+        """
+        if not (
+            publish.eligible
+            or publish.eligible_authid
+            or publish.eligible_authrole
+            or publish.exclude
+            or publish.exclude_authid
+            or publish.exclude_authrole
+        ):
+            return subscription.observers
 
-        return receivers
+        return self._receiver_index.filter(subscription, publish)
 
     def processPublish(self, session, publish):
         """
@@ -469,8 +466,28 @@ class Broker(object):
                     # persist event (this is done only once, regardless of the number of subscriptions
                     # the event matches on)
                     #
-                    if store_event:
-                        self._event_store.store_event(session, publication, publish)
+                    event_stored = store_event
+                    if store_event and self._event_store.store_event(session, publication, publish) is False:
+                        # the store is overloaded: push back on publishers asking for acknowledgement,
+                        # whereas for other publishers the event is dispatched, but not persisted
+                        event_stored = False
+                        if publish.acknowledge:
+                            if self._router.is_traced:
+                                publish.correlation_is_last = False
+                                self._router._factory._worker._maybe_trace_rx_msg(session, publish)
+
+                            reply = message.Error(
+                                message.Publish.MESSAGE_TYPE,
+                                publish.request,
+                                "crossbar.error.store_overloaded",
+                                ["event store overloaded - could not persist event to '{0}'".format(publish.topic)],
+                            )
+                            reply.correlation_id = publish.correlation_id
+                            reply.correlation_uri = publish.topic
+                            reply.correlation_is_anchor = False
+                            reply.correlation_is_last = True
+                            self._router.send(session, reply)
+                            return
 
                     # retain event on the topic
                     #
@@ -512,8 +529,7 @@ class Broker(object):
                     for subscription in subscriptions:
                         # initial list of receivers are all subscribers on a subscription ..
                         #
-                        receivers = subscription.observers
-                        receivers = self._filter_publish_receivers(receivers, publish)
+                        receivers = self._filter_publish_receivers(subscription, publish)
 
                         # if receivers is non-empty, dispatch event ..
                         #
@@ -554,7 +570,7 @@ class Broker(object):
                         vanished_receivers = []
 
                         for subscription, receivers in subscription_to_receivers.items():
-                            storing_event = store_event and self._event_store in subscription.observers
+                            storing_event = event_stored and self._event_store in subscription.observers
 
                             self.log.debug(
                                 "dispatching for subscription={subscription}, storing_event={storing_event}",
@@ -611,6 +627,13 @@ class Broker(object):
                                 session._authrole,
                             )
 
+                            # serialize-once mode: the event is serialized and framed once per
+                            # serializer/framing, and the pre-framed bytes are written to all receivers
+                            if self._option_serialize_once:
+                                fanout = EventFanout(msg)
+                            else:
+                                fanout = None
+
                             chunk_size = self._options.event_dispatching_chunk_size
 
                             if chunk_size and len(receivers) > chunk_size:
@@ -669,7 +692,7 @@ class Broker(object):
                                     for receiver in receivers_this_chunk:
                                         # send out WAMP msg to peer
                                         try:
-                                            self._router.send(receiver, msg)
+                                            self._router.send(receiver, msg, fanout)
                                         except PayloadExceededError as e:
                                             self.log.warn(
                                                 "could not dispatch event to receiver {receiver} (subscription_id={subscription_id}, publication_id={publication_id}): {err}",
@@ -678,7 +701,7 @@ class Broker(object):
                                                 publication_id=publication,
                                                 err=str(e),
                                             )
-                                        if self._event_store or storing_event:
+                                        if storing_event:
                                             self._event_store.store_event_history(
                                                 publication, subscription.id, receiver
                                             )
@@ -686,7 +709,7 @@ class Broker(object):
                                     # last chunk, so last receiver gets the different message
                                     for receiver in receivers_this_chunk[:-1]:
                                         try:
-                                            self._router.send(receiver, msg)
+                                            self._router.send(receiver, msg, fanout)
                                         except PayloadExceededError as e:
                                             self.log.warn(
                                                 "could not dispatch event to receiver {receiver} (subscription_id={subscription_id}, publication_id={publication_id}): {err}",
@@ -695,7 +718,7 @@ class Broker(object):
                                                 publication_id=publication,
                                                 err=str(e),
                                             )
-                                        if self._event_store or storing_event:
+                                        if storing_event:
                                             self._event_store.store_event_history(
                                                 publication, subscription.id, receiver
                                             )
@@ -713,7 +736,7 @@ class Broker(object):
                                                 publication_id=publication,
                                                 err=str(e),
                                             )
-                                        if self._event_store or storing_event:
+                                        if storing_event:
                                             self._event_store.store_event_history(
                                                 publication, subscription.id, receiver
                                             )
@@ -722,6 +745,20 @@ class Broker(object):
                                     # still more to do ..
                                     return txaio.call_later(0, _notify_some, receivers)
                                 else:
+                                    if fanout:
+                                        self._fanout_stats["events"] += 1
+                                        self._fanout_stats["hits"] += fanout.hits
+                                        self._fanout_stats["misses"] += fanout.misses
+                                        self._fanout_stats["fallbacks"] += fanout.fallbacks
+                                        self.log.debug(
+                                            "serialize-once dispatch for subscription={subscription_id}, publication={publication_id}: hits={hits}, misses={misses}, fallbacks={fallbacks}",
+                                            subscription_id=subscription.id,
+                                            publication_id=publication,
+                                            hits=fanout.hits,
+                                            misses=fanout.misses,
+                                            fallbacks=fanout.fallbacks,
+                                        )
+
                                     # all done! resolve all_d, which represents all receivers
                                     # to a single subscription matching the event
                                     txaio.resolve(all_d, None)
@@ -0,0 +1,154 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import time
+from collections import OrderedDict
+
+__all__ = ("LRUCache",)
+
+
+class LRUCache(object):
+    """
+    Bounded mapping which evicts the least recently used entries, and which
+    tracks hit/miss/eviction statistics, eg for caching authorizations.
+
+    Entries can optionally be given a time-to-live, after which they are
+    treated as missing (and removed when next looked up).
+    """
+
+    __slots__ = ("_maxsize", "_now", "_entries", "_hits", "_misses", "_evictions", "_expirations")
+
+    def __init__(self, maxsize=10000, now=None):
+        """
+
+        :param maxsize: Maximum number of entries in the cache.
+        :type maxsize: int
+
+        :param now: Function returning the current time in seconds (used for entries
+            with a time-to-live), eg ``reactor.seconds``. Defaults to ``time.monotonic``.
+        :type now: callable
+        """
+        assert type(maxsize) == int and maxsize > 0
+
+        self._maxsize = maxsize
+        self._now = now or time.monotonic
+
+        # map: key -> (value, expiration time or None)
+        self._entries = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    def get(self, key, default=None):
+        """
+        Get the value cached under a key, marking the entry as most recently used.
+
+        :param key: The key to lookup.
+        :param default: The value to return when the key is not cached.
+
+        :returns: The cached value or ``default``.
+        """
+        try:
+            value, expires = self._entries[key]
+        except KeyError:
+            self._misses += 1
+            return default
+        if expires is not None and expires <= self._now():
+            del self._entries[key]
+            self._expirations += 1
+            self._misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Cache a value under a key, evicting the least recently used entry when the cache is full.
+
+        :param key: The key to cache the value under.
+        :param value: The value to cache.
+
+        :param ttl: Optional time-to-live of the entry in seconds (the entry never expires when ``None``).
+        :type ttl: int or float or None
+        """
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self._maxsize:
+            entries.popitem(last=False)
+            self._evictions += 1
+        entries[key] = (value, self._now() + ttl if ttl is not None else None)
+
+    def pop(self, key, default=None):
+        """
+        Remove a key from the cache.
+
+        :returns: The value which was cached under the key or ``default``.
+        """
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, predicate):
+        """
+        Remove all entries with keys matching a predicate.
+
+        :param predicate: Function called with a key, returning ``True`` when the entry should be removed.
+
+        :returns: Number of entries removed.
+        :rtype: int
+        """
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        :returns: Dict with the current and maximum number of entries, the number of
+            hits, misses, evictions and expirations, and the hit rate.
+        :rtype: dict
+        """
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self._maxsize,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "hit_rate": float(self._hits) / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        """
+        Reset the hit/miss/eviction/expiration counters.
+        """
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
@@ -25,9 +25,19 @@ from txaio import make_logger
 from crossbar._util import hlflag, hlid, hltype
 from crossbar.router import NotAttached, RouterOptions
 from crossbar.router.observation import UriObservationMap
+from crossbar.router.timerwheel import TimerWheel
 
 __all__ = ("Dealer",)
 
+# router-side invocation policies for shared registrations (in addition to the
+# policies a callee can request in REGISTER). these are enabled per procedure
+# using the realm option "invoke_policies"
+INVOKE_LEAST_LOADED = "least_loaded"
+INVOKE_FASTEST = "fastest"
+
+# smoothing factor of the exponentially weighted moving average of callee call round-trip times
+RTT_EWMA_ALPHA = 0.2
+
 
 class InvocationRequest(object):
     """
@@ -46,6 +56,7 @@ class InvocationRequest(object):
         "canceled",
         "error_msg",
         "timeout_call",
+        "started",
     )
 
     def __init__(self, id, registration, caller, call, callee, forward_for, authorization):
@@ -60,6 +71,7 @@ class InvocationRequest(object):
         self.canceled = False
         self.error_msg = None
         self.timeout_call = None  # if we have a timeout pending, this is it
+        self.started = None  # time the invocation was sent to the callee
 
 
 class RegistrationExtra(object):
@@ -79,17 +91,34 @@ class RegistrationCalleeExtra(object):
     Callee-level extra information held in UriObservationMap.
     """
 
-    __slots__ = ("concurrency", "concurrency_current")
+    __slots__ = ("concurrency", "concurrency_current", "rtt", "rtt_samples")
 
     def __init__(self, concurrency=None):
         self.concurrency = concurrency
         self.concurrency_current = 0
 
+        # exponentially weighted moving average of call round-trip times (in seconds)
+        self.rtt = None
+        self.rtt_samples = 0
+
     def __repr__(self):
-        return "{}(concurrency={}, concurrency_current={})".format(
-            self.__class__.__name__, self.concurrency, self.concurrency_current
+        return "{}(concurrency={}, concurrency_current={}, rtt={})".format(
+            self.__class__.__name__, self.concurrency, self.concurrency_current, self.rtt
         )
 
+    def record_rtt(self, rtt):
+        """
+        Update the moving average of call round-trip times with a new sample.
+
+        :param rtt: Round-trip time of a call (in seconds).
+        :type rtt: float
+        """
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += RTT_EWMA_ALPHA * (rtt - self.rtt)
+        self.rtt_samples += 1
+
 
 def _can_cancel(session, side="callee"):
     """
@@ -118,7 +147,8 @@ class Dealer(object):
         """
         self._router = router
         self._reactor = reactor
-        self._cancel_timers = txaio.make_batched_timer(1)  # timeouts have to be integers anyway
+        # timer wheel for call timeouts (timeouts have to be integers anyway)
+        self._cancel_timers = TimerWheel(reactor, resolution=1)
         self._options = options or RouterOptions()
 
         # generator for WAMP request IDs
@@ -130,13 +160,13 @@ class Dealer(object):
         # map: session -> set of registrations (needed for detach)
         self._session_to_registrations = {}
 
-        # map: session -> in-flight invocations
+        # map: callee session -> (map: invocation request ID -> in-flight invocation)
         self._callee_to_invocations = {}
         # BEWARE: this map must be kept up-to-date along with the
         # _invocations map below! Use the helper methods
         # _add_invoke_request and _remove_invoke_request
 
-        # map: session -> in-flight invocations
+        # map: caller session -> (map: invocation request ID -> in-flight invocation)
         self._caller_to_invocations = {}
 
         # careful here: the 'request' IDs are unique per-session
@@ -150,6 +180,12 @@ class Dealer(object):
         # check all procedure URIs with strict rules
         self._option_uri_strict = self._options.uri_check == RouterOptions.URI_CHECK_STRICT
 
+        # router-side invocation policies for shared registrations: list of (uri, match, invoke)
+        self._option_invoke_policies = [
+            (policy["uri"], policy.get("match", message.Register.MATCH_EXACT), policy["invoke"])
+            for policy in self._options.invoke_policies
+        ]
+
         # supported features from "WAMP Advanced Profile"
         self._role_features = role.RoleDealerFeatures(
             caller_identification=True,
@@ -171,6 +207,15 @@ class Dealer(object):
         else:
             self._call_store = None
 
+    def timer_stats(self):
+        """
+        Get statistics of the call timeout timers.
+
+        :returns: Timer wheel statistics, see :meth:`crossbar.router.timerwheel.TimerWheel.stats`.
+        :rtype: dict
+        """
+        return self._cancel_timers.stats()
+
     def attach(self, session):
         """
         Implements :func:`crossbar.router.interfaces.IDealer.attach`
@@ -187,10 +232,14 @@ class Dealer(object):
         # if the caller on an in-flight invocation goes away
         # INTERRUPT the callee if supported
         is_rlink_session = session._authrole == "rlink"
+
+        # registrations with concurrency freed on callees by cancelled invocations
+        freed = set()
+
         if session in self._caller_to_invocations:
             # this needs to update all four places where we track invocations similar to _remove_invoke_request
-            outstanding = self._caller_to_invocations.get(session, [])
-            for invoke in outstanding:  # type: InvocationRequest
+            outstanding = self._caller_to_invocations.get(session, {})
+            for invoke in outstanding.values():  # type: InvocationRequest
                 if invoke.canceled:
                     continue
                 if invoke.callee is invoke.caller:  # if the calling itself - no need to notify
@@ -202,8 +251,13 @@ class Dealer(object):
                     invoke.timeout_call.cancel()
                     invoke.timeout_call = None
 
+                callee_extra = invoke.registration.observers_extra.get(callee, None)
+                if callee_extra:
+                    callee_extra.concurrency_current -= 1
+                    freed.add(invoke.registration)
+
                 invokes = self._callee_to_invocations[callee]
-                invokes.remove(invoke)
+                del invokes[invoke.id]
                 if not invokes:
                     del self._callee_to_invocations[callee]
 
@@ -241,8 +295,8 @@ class Dealer(object):
 
         if session in self._session_to_registrations:
             # send out Errors for any in-flight calls we have
-            outstanding = self._callee_to_invocations.get(session, [])
-            for invoke in outstanding:
+            outstanding = self._callee_to_invocations.get(session, {})
+            for invoke in outstanding.values():
                 self.log.debug(
                     "Cancelling in-flight INVOKE with id={request} on session {session}",
                     request=invoke.call.request,
@@ -265,7 +319,7 @@ class Dealer(object):
                     invoke.timeout_call = None
 
                 invokes = self._caller_to_invocations[invoke.caller]
-                invokes.remove(invoke)
+                del invokes[invoke.id]
                 if not invokes:
                     del self._caller_to_invocations[invoke.caller]
 
@@ -280,6 +334,7 @@ class Dealer(object):
 
                 if was_registered and was_last_callee:
                     self._registration_map.delete_observation(registration)
+                    self._drop_queued_calls(registration)
 
                 # publish WAMP meta events, if we have a service session, but
                 # not for the meta API itself!
@@ -314,9 +369,40 @@ class Dealer(object):
 
             del self._session_to_registrations[session]
 
+            # forward calls queued on registrations now having concurrency free (once the
+            # session is detached, so that calls it queued itself are skipped)
+            for registration in freed:
+                self._drain_call_queue(registration)
+
         else:
             raise NotAttached("session with ID {} not attached".format(session._session_id))
 
+    def _invoke_policy(self, register):
+        """
+        Determine the effective invocation policy for a registration request.
+
+        Callees requesting a load-balancing policy (``roundrobin`` or ``random``) on a
+        procedure covered by one of the ``invoke_policies`` configured for the realm get
+        the configured (router-side) policy instead, eg ``least_loaded`` or ``fastest``.
+
+        :param register: The WAMP REGISTER message.
+        :type register: :class:`autobahn.wamp.message.Register`
+
+        :returns: The invocation policy to use for the registration.
+        :rtype: str
+        """
+        if self._option_invoke_policies and register.invoke in [
+            message.Register.INVOKE_ROUNDROBIN,
+            message.Register.INVOKE_RANDOM,
+        ]:
+            for uri, match, invoke in self._option_invoke_policies:
+                if match == message.Register.MATCH_PREFIX:
+                    if register.procedure.startswith(uri):
+                        return invoke
+                elif register.procedure == uri:
+                    return invoke
+        return register.invoke
+
     def processRegister(self, session, register):
         """
         Implements :func:`crossbar.router.interfaces.IDealer.processRegister`
@@ -429,6 +515,10 @@ class Dealer(object):
             #
             registration = self._registration_map.get_observation(register.procedure, register.match)
 
+            # the invocation policy actually applied (the realm might override the one requested)
+            #
+            invoke = self._invoke_policy(register)
+
             # if the session disconnected while the authorization was
             # being checked, stop
             if session not in self._session_to_registrations:
@@ -471,7 +561,7 @@ class Dealer(object):
                 # invokation strategy different from the one requested
                 # by the new callee
                 #
-                if registration.extra.invoke != register.invoke:
+                if registration.extra.invoke != invoke:
                     reply = message.Error(
                         message.Register.MESSAGE_TYPE,
                         register.request,
@@ -479,7 +569,7 @@ class Dealer(object):
                         [
                             "register for already registered procedure '{0}' "
                             "with conflicting invocation policy (has {1} and "
-                            "{2} was requested)".format(register.procedure, registration.extra.invoke, register.invoke)
+                            "{2} was requested)".format(register.procedure, registration.extra.invoke, invoke)
                         ],
                     )
                     reply.correlation_id = register.correlation_id
@@ -507,10 +597,11 @@ class Dealer(object):
                         kicked.correlation_is_last = False
                         self._router.send(obs, kicked)
                     self._registration_map.delete_observation(registration)
+                    self._drop_queued_calls(registration)
 
                 # ok, session authorized to register. now get the registration
                 #
-                registration_extra = RegistrationExtra(register.invoke)
+                registration_extra = RegistrationExtra(invoke)
                 registration_callee_extra = RegistrationCalleeExtra(register.concurrency)
                 registration, was_already_registered, is_first_callee = self._registration_map.add_observer(
                     session, register.procedure, register.match, registration_extra, registration_callee_extra
@@ -599,6 +690,10 @@ class Dealer(object):
             #
             self._router.send(session, reply)
 
+            # a new callee on an existing registration has concurrency free for calls queued on the registration
+            if authorization["allow"] and not is_first_callee and not was_already_registered:
+                self._drain_call_queue(registration)
+
         def on_authorize_error(err):
             """
             the call to authorize the action _itself_ failed (note this is
@@ -690,6 +785,7 @@ class Dealer(object):
         if was_registered and was_last_callee:
             self._registration_map.delete_observation(registration)
             was_deleted = True
+            self._drop_queued_calls(registration)
 
         # remove registration from session->registrations map
         #
@@ -973,10 +1069,7 @@ class Dealer(object):
             callee_extra = registration.observers_extra.get(callee, None)
             if callee_extra:
                 if callee_extra.concurrency and callee_extra.concurrency_current >= callee_extra.concurrency:
-                    if is_queued_call or (
-                        self._call_store
-                        and self._call_store.maybe_queue_call(session, call, registration, authorization)
-                    ):
+                    if is_queued_call or self._queue_call(session, call, registration, authorization):
                         return False
                     else:
                         reply = message.Error(
@@ -1020,10 +1113,7 @@ class Dealer(object):
                         ):
                             # we've looked through the whole round-robin list, and didn't find a suitable
                             # callee (one that hasn't it's maximum concurrency already reached).
-                            if is_queued_call or (
-                                self._call_store
-                                and self._call_store.maybe_queue_call(session, call, registration, authorization)
-                            ):
+                            if is_queued_call or self._queue_call(session, call, registration, authorization):
                                 return False
                             else:
                                 reply = message.Error(
@@ -1056,9 +1146,68 @@ class Dealer(object):
             if callee_extra:
                 callee_extra.concurrency_current += 1
 
+        elif registration.extra.invoke in [INVOKE_LEAST_LOADED, INVOKE_FASTEST]:
+            callee, callee_extra = self._select_callee(registration)
+
+            if callee is None:
+                # all callees/endpoints have their maximum concurrency reached
+                if is_queued_call or self._queue_call(session, call, registration, authorization):
+                    return False
+                else:
+                    reply = message.Error(
+                        message.Call.MESSAGE_TYPE,
+                        call.request,
+                        "crossbar.error.max_concurrency_reached",
+                        [
+                            "maximum concurrency of all callee/endpoints reached (on {} registration)".format(
+                                registration.extra.invoke
+                            )
+                        ],
+                    )
+                    reply.correlation_id = call.correlation_id
+                    reply.correlation_uri = call.procedure
+                    reply.correlation_is_anchor = False
+                    reply.correlation_is_last = True
+                    self._router.send(session, reply)
+                    return False
+
+            if callee_extra:
+                callee_extra.concurrency_current += 1
+
         elif registration.extra.invoke == message.Register.INVOKE_RANDOM:
-            # FIXME: implement max. concurrency and call queueing
-            callee = registration.observers[random.randint(0, len(registration.observers) - 1)]
+            # start at a random callee/endpoint, and search on for one which hasn't its
+            # maximum concurrency reached
+            count = len(registration.observers)
+            start = random.randint(0, count - 1)
+            for i in range(count):
+                callee = registration.observers[(start + i) % count]
+                callee_extra = registration.observers_extra.get(callee, None)
+                if not (
+                    callee_extra
+                    and callee_extra.concurrency
+                    and callee_extra.concurrency_current >= callee_extra.concurrency
+                ):
+                    break
+            else:
+                # all callees/endpoints have their maximum concurrency reached
+                if is_queued_call or self._queue_call(session, call, registration, authorization):
+                    return False
+                else:
+                    reply = message.Error(
+                        message.Call.MESSAGE_TYPE,
+                        call.request,
+                        "crossbar.error.max_concurrency_reached",
+                        ["maximum concurrency of all callee/endpoints reached (on random registration)"],
+                    )
+                    reply.correlation_id = call.correlation_id
+                    reply.correlation_uri = call.procedure
+                    reply.correlation_is_anchor = False
+                    reply.correlation_is_last = True
+                    self._router.send(session, reply)
+                    return False
+
+            if callee_extra:
+                callee_extra.concurrency_current += 1
 
         else:
             # should not arrive here
@@ -1173,6 +1322,136 @@ class Dealer(object):
         self._router.send(callee, invocation)
         return True
 
+    def _select_callee(self, registration):
+        """
+        Select the callee for a call on a registration with a ``least_loaded`` or
+        ``fastest`` invocation policy.
+
+        With ``least_loaded``, the callee with the fewest outstanding invocations is selected.
+        With ``fastest``, the callee with the lowest expected latency is selected, that is the
+        moving average of its call round-trip times weighted by its outstanding invocations.
+        Callees without round-trip time samples yet are assumed to be as fast as the mean of
+        the others, so they are ranked by their outstanding invocations too. Callees which have
+        their maximum concurrency reached are skipped, and ties are broken round-robin.
+
+        This scans all callees of the registration, which is O(n) in the number of callees.
+
+        :param registration: The registration to select a callee from.
+        :type registration: :class:`crossbar.router.observation.UriObservation`
+
+        :returns: A pair ``(callee, callee_extra)``, or ``(None, None)`` if all callees
+            have their maximum concurrency reached.
+        :rtype: tuple
+        """
+        observers = registration.observers
+        observers_extra = registration.observers_extra
+        fastest = registration.extra.invoke == INVOKE_FASTEST
+
+        count = len(observers)
+        start = registration.extra.roundrobin_current % count
+        registration.extra.roundrobin_current += 1
+
+        if fastest:
+            rtts = [extra.rtt for extra in observers_extra.values() if extra.rtt is not None]
+            rtt_prior = sum(rtts) / len(rtts) if rtts else 1.0
+
+        best = None
+        best_extra = None
+        best_score = None
+        for i in range(count):
+            callee = observers[(start + i) % count]
+            callee_extra = observers_extra.get(callee, None)
+            if callee_extra is None:
+                score = 0
+            elif callee_extra.concurrency and callee_extra.concurrency_current >= callee_extra.concurrency:
+                continue
+            elif fastest:
+                rtt = rtt_prior if callee_extra.rtt is None else callee_extra.rtt
+                score = rtt * (callee_extra.concurrency_current + 1)
+            else:
+                score = callee_extra.concurrency_current
+            if best_score is None or score < best_score:
+                best, best_extra, best_score = callee, callee_extra, score
+                if not score:
+                    # can't do better than an idle callee
+                    break
+
+        return best, best_extra
+
+    def _queue_call(self, session, call, registration, authorization):
+        """
+        Internal helper. Queue a call which cannot be forwarded because the maximum
+        concurrency of all callees of the registration is reached.
+
+        :returns: ``True`` if the call was queued.
+        """
+        if not self._call_store:
+            return False
+
+        queued_call = self._call_store.maybe_queue_call(session, call, registration, authorization)
+        if not queued_call:
+            return False
+
+        # expire the call when it is still queued after its max-age
+        if queued_call.expires is not None:
+            self._cancel_timers.call_later(
+                queued_call.expires - queued_call.queued, self._expire_queued_calls, registration
+            )
+        return True
+
+    def _reply_queued_call(self, queued_call, reason):
+        """
+        Internal helper. Send an ERROR to the caller of a call dequeued without being forwarded.
+        """
+        if queued_call.session in self._session_to_registrations:
+            call = queued_call.call
+            reply = message.Error(message.Call.MESSAGE_TYPE, call.request, ApplicationError.CANCELED, [reason])
+            reply.correlation_id = call.correlation_id
+            reply.correlation_uri = call.procedure
+            reply.correlation_is_anchor = False
+            reply.correlation_is_last = True
+            self._router.send(queued_call.session, reply)
+
+    def _expire_queued_calls(self, registration):
+        """
+        Internal helper. Dequeue all calls on a registration queued longer than their max-age.
+        """
+        for queued_call in self._call_store.expire_queued_calls(registration):
+            self._reply_queued_call(queued_call, "call expired in call queue")
+
+    def _drop_queued_calls(self, registration):
+        """
+        Internal helper. Dequeue all calls on a registration which was deleted.
+        """
+        if self._call_store:
+            for queued_call in self._call_store.drop_queued_calls(registration):
+                self._reply_queued_call(queued_call, "registration deleted while call was queued")
+
+    def _drain_call_queue(self, registration):
+        """
+        Internal helper. Forward calls queued on a registration for as long as
+        there is concurrency free on callees of the registration.
+        """
+        if not self._call_store:
+            return
+
+        self._expire_queued_calls(registration)
+        while True:
+            queued_call = self._call_store.get_queued_call(registration)
+            if not queued_call:
+                break
+
+            # the caller might have been lost in the meantime ..
+            if queued_call.session in self._session_to_registrations:
+                invocation_sent = self._call(
+                    queued_call.session, queued_call.call, registration, queued_call.authorization, True
+                )
+                if not invocation_sent:
+                    break
+
+            # only actually pop the queued call when we really were able to forward it
+            self._call_store.pop_queued_call(registration)
+
     def _add_invoke_request(
         self, invocation_request_id, registration, session, call, callee, forward_for, authorization, timeout=None
     ):
@@ -1183,21 +1462,24 @@ class Dealer(object):
         invoke_request = InvocationRequest(
             invocation_request_id, registration, session, call, callee, forward_for, authorization
         )
+        invoke_request.started = self._reactor.seconds()
         self._invocations[invocation_request_id] = invoke_request
         self._invocations_by_call[session._session_id, call.request] = invoke_request
-        invokes = self._callee_to_invocations.get(callee, [])
-        invokes.append(invoke_request)
-        self._callee_to_invocations[callee] = invokes
+        invokes = self._callee_to_invocations.get(callee, None)
+        if invokes is None:
+            invokes = self._callee_to_invocations[callee] = {}
+        invokes[invocation_request_id] = invoke_request
 
         # map to keep track of the invocations by each caller
-        invokes = self._caller_to_invocations.get(session, [])
-        invokes.append(invoke_request)
-        self._caller_to_invocations[session] = invokes
+        invokes = self._caller_to_invocations.get(session, None)
+        if invokes is None:
+            invokes = self._caller_to_invocations[session] = {}
+        invokes[invocation_request_id] = invoke_request
 
         # deal with possible timeouts
         # NB: timeouts can only be integers (check spec, but this is
-        # what Autobahn code says) so we can just have a bucket-based
-        # thing (and probably should?) instead of "straight" callLater
+        # what Autobahn code says), so we use a timer wheel with integer-second
+        # buckets (O(1) schedule and cancel, a single pending reactor call)
         if timeout:
 
             def _cancel_both_sides():
@@ -1240,19 +1522,28 @@ class Dealer(object):
 
         # all four places should always be updated together
         if invocation_request.id in self._invocations:
+            # reduce current concurrency on callee. this is done here (rather than only when
+            # the callee answered) so that invocations timed out or canceled are accounted for too
+            callee_extra = invocation_request.registration.observers_extra.get(invocation_request.callee, None)
+            if callee_extra:
+                callee_extra.concurrency_current -= 1
+
             del self._invocations[invocation_request.id]
             invokes = self._callee_to_invocations[invocation_request.callee]
-            invokes.remove(invocation_request)
+            del invokes[invocation_request.id]
             if not invokes:
                 del self._callee_to_invocations[invocation_request.callee]
 
             invokes = self._caller_to_invocations[invocation_request.caller]
-            invokes.remove(invocation_request)
+            del invokes[invocation_request.id]
             if not invokes:
                 del self._caller_to_invocations[invocation_request.caller]
 
             del self._invocations_by_call[invocation_request.caller_session_id, invocation_request.call.request]
 
+            # concurrency on the callee is free again: forward calls queued on the registration
+            self._drain_call_queue(invocation_request.registration)
+
     # noinspection PyUnusedLocal
     def processCancel(self, session, cancel):
         """
@@ -1517,33 +1808,14 @@ class Dealer(object):
                     self._router.send(invocation_request.caller, reply)
 
             if call_complete:
-                # reduce current concurrency on callee
+                # track the call round-trip time of the callee
                 callee_extra = invocation_request.registration.observers_extra.get(session, None)
-                if callee_extra:
-                    callee_extra.concurrency_current -= 1
+                if callee_extra and invocation_request.started is not None:
+                    callee_extra.record_rtt(max(0.0, self._reactor.seconds() - invocation_request.started))
 
-                # cleanup the (individual) invocation
+                # cleanup the (individual) invocation (which also reduces current concurrency on callee)
                 self._remove_invoke_request(invocation_request)
 
-                # check for any calls queued on the registration for which an
-                # invocation just returned, and hence there is likely concurrency
-                # free again to actually forward calls previously queued calls
-                # that were queued because no callee endpoint concurrency was free
-                if self._call_store:
-                    queued_call = self._call_store.get_queued_call(invocation_request.registration)
-                    if queued_call:
-                        invocation_sent = self._call(
-                            queued_call.session,
-                            queued_call.call,
-                            queued_call.registration,
-                            queued_call.authorization,
-                            True,
-                        )
-                        # only actually pop the queued call when we really were
-                        # able to forward the call now
-                        if invocation_sent:
-                            self._call_store.pop_queued_call(invocation_request.registration)
-
         else:
             self.log.debug(
                 "Dealer.onYield(): YIELD received for non-pending request ID {request_id}", request_id=yield_.request
@@ -1567,12 +1839,6 @@ class Dealer(object):
                 error.correlation_is_last = False
                 self._router._factory._worker._maybe_trace_rx_msg(session, error)
 
-            # if concurrency is enabled on this, an error counts as
-            # "an answer" so we decrement.
-            callee_extra = invocation_request.registration.observers_extra.get(session, None)
-            if callee_extra:
-                callee_extra.concurrency_current -= 1
-
             reply = None
 
             # FIXME
@@ -1678,7 +1944,8 @@ class Dealer(object):
                     reply.correlation_is_last = True
                 self._router.send(invocation_request.caller, reply)
 
-            # the call is done
+            # the call is done (if concurrency is enabled on this, an error counts as
+            # "an answer", and current concurrency on the callee is reduced)
             #
             invoke = self._invocations[error.request]
             self._remove_invoke_request(invoke)
@@ -0,0 +1,143 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import struct
+
+from autobahn.exception import PayloadExceededError
+from autobahn.twisted.rawsocket import WampRawSocketProtocol
+from autobahn.wamp.exception import SerializationError, TransportLost
+from autobahn.wamp.serializer import Serializer
+from autobahn.websocket.protocol import PreparedMessage, WebSocketProtocol
+
+__all__ = ("EventFanout",)
+
+
+class EventFanout(object):
+    """
+    Serialize-once, frame-once dispatcher for a single WAMP EVENT message sent
+    to many receivers.
+
+    The event is serialized exactly once per serializer type (eg ``json``,
+    ``msgpack.batched`` or ``cbor``) and framed exactly once per transport framing
+    (a WebSocket frame or a RawSocket length prefix). The resulting pre-framed
+    bytes are then written as-is to every receiving transport of that kind.
+
+    Receivers on transports which cannot take pre-framed bytes (eg long-poll or
+    router-embedded sessions) fall back to the regular ``transport.send(msg)``.
+    """
+
+    __slots__ = (
+        "_msg",
+        "_payloads",
+        "_cache",
+        "hits",
+        "misses",
+        "fallbacks",
+    )
+
+    FRAMING_WEBSOCKET = "websocket"
+    FRAMING_RAWSOCKET = "rawsocket"
+
+    def __init__(self, msg):
+        """
+
+        :param msg: The WAMP event message to dispatch.
+        :type msg: :class:`autobahn.wamp.message.Event`
+        """
+        self._msg = msg
+
+        # map: serializer ID -> serialized message
+        self._payloads = {}
+
+        # map: (framing, serializer ID, framing parameter) -> pre-framed message
+        self._cache = {}
+
+        # number of sends served from the cache, sends that filled the cache,
+        # and sends done via the regular transport send path
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def _serialize(self, serializer):
+        """
+        Serialize the event with the serializer of a receiving transport.
+
+        The bytes serialized for an earlier receiver with the same serializer type are
+        put into the message's own serialization cache, so that
+        :meth:`autobahn.wamp.serializer.Serializer.serialize` returns them as-is while
+        still maintaining the serializer statistics and the serialized sizes recorded
+        on the message (as used by router traces).
+        """
+        payload = self._payloads.get(serializer.SERIALIZER_ID, None)
+        if payload is not None:
+            self._msg._serialized.setdefault(serializer._serializer, payload)
+        try:
+            payload, is_binary = serializer.serialize(self._msg)
+        except Exception as e:
+            raise SerializationError("unable to serialize WAMP application payload ({0})".format(e))
+        self._payloads.setdefault(serializer.SERIALIZER_ID, payload)
+        return payload, is_binary
+
+    def _frame(self, key, make_frame):
+        cached = self._cache.get(key, None)
+        if cached is None:
+            self.misses += 1
+            cached = make_frame()
+            self._cache[key] = cached
+        else:
+            self.hits += 1
+        return cached
+
+    def send(self, transport):
+        """
+        Send the event on the given transport, using pre-framed bytes when possible.
+
+        :param transport: The WAMP transport of the receiving session.
+        """
+        serializer = getattr(transport, "_serializer", None)
+
+        if not isinstance(serializer, Serializer):
+            self.fallbacks += 1
+            transport.send(self._msg)
+
+        elif isinstance(transport, WebSocketProtocol):
+            if not transport.isOpen():
+                raise TransportLost()
+            payload, is_binary = self._serialize(serializer)
+
+            # messages to be fragmented are framed by the transport itself
+            if transport.autoFragmentSize and len(payload) > transport.autoFragmentSize:
+                self.fallbacks += 1
+                transport.sendMessage(payload, is_binary)
+            else:
+                apply_mask = not transport.factory.isServer
+                prepared = self._frame(
+                    (self.FRAMING_WEBSOCKET, serializer.SERIALIZER_ID, apply_mask),
+                    lambda: PreparedMessage(payload, is_binary, apply_mask, False),
+                )
+                transport.sendPreparedMessage(prepared)
+
+        elif isinstance(transport, WampRawSocketProtocol):
+            if not transport.isOpen():
+                raise TransportLost()
+            payload, _ = self._serialize(serializer)
+            if transport._max_len_send and 0 < transport._max_len_send < len(payload):
+                raise PayloadExceededError(
+                    "tried to send RawSocket message with size {} exceeding payload limit of {} octets".format(
+                        len(payload), transport._max_len_send
+                    )
+                )
+            struct_format = transport.structFormat
+            data = self._frame(
+                (self.FRAMING_RAWSOCKET, serializer.SERIALIZER_ID, struct_format),
+                lambda: struct.pack(struct_format, len(payload)) + payload,
+            )
+            transport.transport.write(data)
+
+        else:
+            self.fallbacks += 1
+            transport.send(self._msg)
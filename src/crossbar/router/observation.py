@@ -27,29 +27,154 @@ def is_protected_uri(uri, details=None):
         return uri.startswith("wamp.") or uri.startswith("crossbar.")
 
 
+_REMOVED = object()
+
+
 class OrderedSet(set):
-    __slots__ = ("_list",)
+    """
+    A set which remembers the insertion order of its items, with O(1) add and
+    (amortized) O(1) discard, and positional access by insertion order.
+
+    Discarded items leave a tombstone in the order list, which is compacted once
+    tombstones outnumber live items. While there are no tombstones, positional
+    access is a plain list index. Otherwise, a Fenwick tree counting the live items
+    is (lazily) maintained, so that positional access is O(log n) at worst - instead
+    of the O(n) list removal on every discard.
+    """
+
+    __slots__ = ("_list", "_index", "_removed", "_tree")
 
     def __init__(self):
         super(set, self).__init__()
+
+        # items (or tombstones) in insertion order
         self._list = []
 
+        # map: item -> position in self._list
+        self._index = {}
+
+        # number of tombstones in self._list
+        self._removed = 0
+
+        # Fenwick tree over self._list counting live items (1-based), or None
+        self._tree = None
+
     def add(self, item):
+        if item in self:
+            return
         super(OrderedSet, self).add(item)
+        self._index[item] = len(self._list)
         self._list.append(item)
+        if self._tree is not None:
+            self._tree_append(1)
 
     def discard(self, item):
-        self._list.remove(item)
-        return super(OrderedSet, self).discard(item)
+        if item not in self:
+            return
+        super(OrderedSet, self).discard(item)
+        pos = self._index.pop(item)
+        self._list[pos] = _REMOVED
+        self._removed += 1
+        if self._tree is not None:
+            self._tree_add(pos, -1)
+
+        # trim trailing tombstones
+        lst = self._list
+        while lst and lst[-1] is _REMOVED:
+            lst.pop()
+            self._removed -= 1
+        if self._tree is not None:
+            del self._tree[len(lst) + 1 :]
+
+        # compact the order list once tombstones outnumber live items
+        if self._removed and self._removed > len(self):
+            self._compact()
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.discard(item)
+
+    def clear(self):
+        super(OrderedSet, self).clear()
+        self._list = []
+        self._index = {}
+        self._removed = 0
+        self._tree = None
+
+    def _compact(self):
+        self._list = [item for item in self._list if item is not _REMOVED]
+        self._index = {item: pos for pos, item in enumerate(self._list)}
+        self._removed = 0
+        self._tree = None
+
+    def _tree_build(self):
+        size = len(self._list)
+        tree = [0] * (size + 1)
+        for i, item in enumerate(self._list, 1):
+            if item is not _REMOVED:
+                tree[i] += 1
+            j = i + (i & -i)
+            if j <= size:
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, pos, delta):
+        tree = self._tree
+        size = len(tree) - 1
+        i = pos + 1
+        while i <= size:
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_append(self, value):
+        tree = self._tree
+        i = len(tree)
+        # node i covers the range (i - lowbit(i), i]
+        total = value
+        j = i - 1
+        k = i - (i & -i)
+        while j > k:
+            total += tree[j]
+            j -= j & -j
+        tree.append(total)
+
+    def _tree_select(self, rank):
+        # position (0-based) of the live item with the given rank (0-based)
+        tree = self._tree
+        size = len(tree) - 1
+        pos = 0
+        step = 1 << size.bit_length()
+        remaining = rank + 1
+        while step:
+            nxt = pos + step
+            if nxt <= size and tree[nxt] < remaining:
+                pos = nxt
+                remaining -= tree[nxt]
+            step >>= 1
+        return pos
 
     def __getitem__(self, index):
-        return self._list[index]
+        if not self._removed:
+            return self._list[index]
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("OrderedSet index out of range")
+        if self._tree is None:
+            self._tree_build()
+        return self._list[self._tree_select(index)]
 
     def __iter__(self):
-        return iter(self._list)
+        if not self._removed:
+            return iter(self._list)
+        return (item for item in self._list if item is not _REMOVED)
 
     def __reversed__(self):
-        return reversed(self._list)
+        if not self._removed:
+            return reversed(self._list)
+        return (item for item in reversed(self._list) if item is not _REMOVED)
 
 
 class UriObservation(object):
@@ -57,7 +182,17 @@ class UriObservation(object):
     Represents an URI observation maintained by a broker/dealer.
     """
 
-    __slots__ = ("uri", "ordered", "extra", "id", "created", "observers")
+    __slots__ = (
+        "uri",
+        "ordered",
+        "extra",
+        "id",
+        "created",
+        "observers",
+        "observers_extra",
+        "observers_mask",
+        "observers_unindexed",
+    )
 
     match: Optional[str] = None
 
@@ -92,6 +227,11 @@ class UriObservation(object):
         # arbitrary, opaque extra data attached to the observers of this observation
         self.observers_extra = {}
 
+        # bitmap of the slots of observers indexed in the receiver index of the
+        # observation map (if any), and set of observers not indexed
+        self.observers_mask = 0
+        self.observers_unindexed = set()
+
     def __repr__(self):
         return "{}(id={}, uri={}, match={}, ordered={}, extra={}, created={}, observers={})".format(
             self.__class__.__name__,
@@ -142,13 +282,20 @@ class UriObservationMap(object):
         "_observations_prefix",
         "_observations_wildcard",
         "_observation_id_to_observation",
+        "_index",
+        "_match_cache",
+        "_match_cache_size",
     )
 
-    def __init__(self, ordered=False):
+    def __init__(self, ordered=False, index=None, match_cache_size=10000):
         # flag indicating whether observers should be maintained in a SortedSet
         # or a regular set (unordered)
         self._ordered = ordered
 
+        # optional receiver index (crossbar.router.receivers.ReceiverIndex) used to maintain
+        # per-observation bitmaps of observers
+        self._index = index
+
         # map: URI => ExactUriObservation
         self._observations_exact = {}
 
@@ -166,6 +313,13 @@ class UriObservationMap(object):
         # map: observation ID => UriObservation
         self._observation_id_to_observation = {}
 
+        # map: URI => list of observations matching the URI, as returned from
+        # match_observations(). this is invalidated incrementally when observations
+        # are created or deleted (adding/dropping observers does not change the
+        # set of matching observations), and bounded in size (oldest entries evicted first)
+        self._match_cache = {}
+        self._match_cache_size = match_cache_size
+
     def __repr__(self):
         return "{}(_ordered={}, _observations_exact={}, _observations_prefix={}, _observations_wildcard={}, _observation_id_to_observation={})".format(
             self.__class__.__name__,
@@ -240,6 +394,14 @@ class UriObservationMap(object):
             # add the observer to the set of observers sitting on the observation
             observation.observers.add(observer)
 
+            # maintain the observer bitmap
+            if self._index is not None:
+                slot = self._index.slot(observer)
+                if slot is None:
+                    observation.observers_unindexed.add(observer)
+                else:
+                    observation.observers_mask |= 1 << slot
+
             # if there is observer-specific extra data, store it
             if observer_extra:
                 observation.observers_extra[observer] = observer_extra
@@ -287,13 +449,18 @@ class UriObservationMap(object):
 
         :returns: A list of observations matching the URI. This is a list of instance of
             one of ``ExactUriObservation``, ``PrefixUriObservation`` or ``WildcardUriObservation``.
+            The list is cached and shared between calls, and must not be modified.
         :rtype: list
         """
-        observations = []
-
         if not isinstance(uri, str):
             raise Exception("'uri' should be unicode, not {}".format(type(uri).__name__))
 
+        observations = self._match_cache.get(uri, None)
+        if observations is not None:
+            return observations
+
+        observations = []
+
         if uri in self._observations_exact:
             observations.append(self._observations_exact[uri])
 
@@ -303,8 +470,44 @@ class UriObservationMap(object):
         for observation in self._observations_wildcard.iter_matches(uri):
             observations.append(observation)
 
+        if self._match_cache_size:
+            if len(self._match_cache) >= self._match_cache_size:
+                del self._match_cache[next(iter(self._match_cache))]
+            self._match_cache[uri] = observations
+
         return observations
 
+    def _invalidate_match_cache(self, uri, match):
+        """
+        Drop all cached match results which might be affected by creating or
+        deleting an observation for the given URI (or URI pattern) and match policy.
+        """
+        cache = self._match_cache
+        if not cache:
+            return
+
+        if match == "exact":
+            cache.pop(uri, None)
+
+        elif match == "prefix":
+            for key in [key for key in cache if key.startswith(uri)]:
+                del cache[key]
+
+        elif match == "wildcard":
+            pattern = uri.split(".")
+            pattern_len = len(pattern)
+            stale = []
+            for key in cache:
+                components = key.split(".")
+                if len(components) == pattern_len:
+                    for i in range(pattern_len):
+                        if pattern[i] and pattern[i] != components[i]:
+                            break
+                    else:
+                        stale.append(key)
+            for key in stale:
+                del cache[key]
+
     def best_matching_observation(self, uri):
         """
         Returns the observation that best matches the given URI. This is the core method called
@@ -378,6 +581,10 @@ class UriObservationMap(object):
         #
         self._observation_id_to_observation[observation.id] = observation
 
+        # the new observation might match URIs for which we have cached match results
+        #
+        self._invalidate_match_cache(uri, match)
+
         return observation
 
     def drop_observer(self, observer, observation):
@@ -405,6 +612,16 @@ class UriObservationMap(object):
             #
             observation.observers.discard(observer)
 
+            # maintain the observer bitmap
+            #
+            if self._index is not None:
+                if observer in observation.observers_unindexed:
+                    observation.observers_unindexed.discard(observer)
+                else:
+                    slot = self._index.slot(observer)
+                    if slot is not None:
+                        observation.observers_mask &= ~(1 << slot)
+
             # discard observer-level extra data (if any)
             #
             if observer in observation.observers_extra:
@@ -450,3 +667,5 @@ class UriObservationMap(object):
             raise Exception("logic error")
 
         del self._observation_id_to_observation[observation.id]
+
+        self._invalidate_match_cache(observation.uri, observation.match)
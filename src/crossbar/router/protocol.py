@@ -6,16 +6,23 @@
 #####################################################################################
 
 import binascii
+import copy
 import os
+import struct
 
 # from twisted.protocols.tls import TLSMemoryBIOProtocol
+from autobahn.exception import PayloadExceededError
 from autobahn.twisted import rawsocket, websocket
+from autobahn.twisted.util import transport_channel_id
 from autobahn.util import hlid, hltype, hlval
+from autobahn.wamp.exception import TransportLost
+from autobahn.wamp.interfaces import ITransport
 from autobahn.wamp.types import TransportDetails
 from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
 from autobahn.websocket.types import ConnectionDeny
 from twisted import internet
-from txaio import make_logger
+from twisted.internet.error import ConnectionDone
+from txaio import create_future, is_called, make_logger, reject, resolve
 
 import crossbar
 from crossbar.common.twisted.endpoint import create_connecting_endpoint_from_config
@@ -32,9 +39,94 @@ __all__ = (
     "WampRawSocketClientFactory",
     "WampWebSocketClientProtocol",
     "WampRawSocketClientProtocol",
+    "WampMuxChannel",
+    "WampMuxRawSocketServerProtocol",
+    "WampMuxRawSocketClientProtocol",
+    "WampMuxRawSocketClientFactory",
 )
 
 
+class WampRawMessageMixin(object):
+    """
+    Lets the session running on a transport take over received WAMP messages still serialized, and
+    lets serialized WAMP messages be sent as is. This is used by proxy sessions, which forward messages
+    between transports using the same serializer without deserializing and serializing them again.
+
+    A session takes over received messages by implementing ``onRawMessage(payload, is_binary)``,
+    returning ``True`` for every message it has consumed, and ``False`` for messages which are
+    then deserialized and processed by ``onMessage`` as usual.
+    """
+
+    # the session's onRawMessage (if the session implements it)
+    _on_raw_message = None
+
+    def _attach_raw_message_handler(self):
+        self._on_raw_message = getattr(self._session, "onRawMessage", None)
+
+    def send_raw(self, payload, is_binary):
+        """
+        Send a serialized WAMP message as is.
+
+        This default deserializes the message and sends it via :meth:`send`. The RawSocket and
+        WebSocket mixins below override it to send the serialized message without doing so.
+
+        :param payload: The WAMP message serialized with the serializer of this transport.
+        :type payload: bytes
+        :param is_binary: Whether the serialization is binary.
+        :type is_binary: bool
+        """
+        for msg in self._serializer.unserialize(payload, is_binary):
+            self.send(msg)
+
+
+class WampRawSocketRawMessageMixin(WampRawMessageMixin):
+    """
+    :class:`WampRawMessageMixin` for WAMP-RawSocket protocols.
+    """
+
+    def _on_handshake_complete(self):
+        res = super(WampRawSocketRawMessageMixin, self)._on_handshake_complete()
+        self._attach_raw_message_handler()
+        return res
+
+    def stringReceived(self, payload):
+        if self._on_raw_message is not None and self._on_raw_message(payload, self._serializer._serializer.BINARY):
+            return
+        super(WampRawSocketRawMessageMixin, self).stringReceived(payload)
+
+    def send_raw(self, payload, is_binary):
+        if not self.isOpen():
+            raise TransportLost()
+        if 0 < self._max_len_send < len(payload):
+            raise PayloadExceededError(
+                "tried to send RawSocket message with size {} exceeding payload limit of {} octets".format(
+                    len(payload), self._max_len_send
+                )
+            )
+        self.sendString(payload)
+
+
+class WampWebSocketRawMessageMixin(WampRawMessageMixin):
+    """
+    :class:`WampRawMessageMixin` for WAMP-WebSocket protocols.
+    """
+
+    def onOpen(self):
+        res = super(WampWebSocketRawMessageMixin, self).onOpen()
+        self._attach_raw_message_handler()
+        return res
+
+    def onMessage(self, payload, isBinary):
+        if self._on_raw_message is not None and self._on_raw_message(payload, isBinary):
+            return
+        super(WampWebSocketRawMessageMixin, self).onMessage(payload, isBinary)
+
+    def send_raw(self, payload, is_binary):
+        if not self.isOpen():
+            raise TransportLost()
+        self.sendMessage(payload, is_binary)
+
+
 def set_websocket_options(factory, options):
     """
     Set WebSocket options on a WebSocket or WAMP-WebSocket factory.
@@ -164,7 +256,7 @@ def set_websocket_options(factory, options):
         )
 
 
-class WampWebSocketServerProtocol(websocket.WampWebSocketServerProtocol):
+class WampWebSocketServerProtocol(WampWebSocketRawMessageMixin, websocket.WampWebSocketServerProtocol):
     """
     Crossbar.io WAMP-over-WebSocket server protocol.
     """
@@ -563,7 +655,7 @@ def set_rawsocket_options(factory, options):
     factory.setProtocolOptions(maxMessagePayloadSize=c.get("max_message_size", None))
 
 
-class WampRawSocketServerProtocol(rawsocket.WampRawSocketServerProtocol):
+class WampRawSocketServerProtocol(WampRawSocketRawMessageMixin, rawsocket.WampRawSocketServerProtocol):
     """
     Crossbar.io WAMP-over-RawSocket server protocol.
     """
@@ -591,7 +683,7 @@ class WampRawSocketServerProtocol(rawsocket.WampRawSocketServerProtocol):
             self._serializer.SERIALIZER_ID
         ]
         self._transport_details.websocket_protocol = "wamp.2.{}".format(self._serializer.SERIALIZER_ID)
-        return rawsocket.WampRawSocketServerProtocol._on_handshake_complete(self)
+        return super(WampRawSocketServerProtocol, self)._on_handshake_complete()
 
 
 class WampRawSocketServerFactory(rawsocket.WampRawSocketServerFactory):
@@ -682,6 +774,11 @@ class WampRawSocketServerFactory(rawsocket.WampRawSocketServerFactory):
 
         rawsocket.WampRawSocketServerFactory.__init__(self, factory, serializers)
 
+        # multiplexed transport: many WAMP sessions (e.g. from a proxy worker) share one connection
+        if config.get("multiplex", False):
+            self.protocol = WampMuxRawSocketServerProtocol
+            self._max_channels = config.get("max_channels", 10000)
+
         if "options" in config:
             set_rawsocket_options(self, config["options"])
 
@@ -692,7 +789,7 @@ class WampRawSocketServerFactory(rawsocket.WampRawSocketServerFactory):
         )
 
 
-class WampWebSocketClientProtocol(websocket.WampWebSocketClientProtocol):
+class WampWebSocketClientProtocol(WampWebSocketRawMessageMixin, websocket.WampWebSocketClientProtocol):
     """
     Crossbar.io WAMP-over-WebSocket client protocol.
     """
@@ -710,7 +807,7 @@ class WampWebSocketClientFactory(websocket.WampWebSocketClientFactory):
         return self._proto
 
 
-class WampRawSocketClientProtocol(rawsocket.WampRawSocketClientProtocol):
+class WampRawSocketClientProtocol(WampRawSocketRawMessageMixin, rawsocket.WampRawSocketClientProtocol):
     """
     Crossbar.io WAMP-over-RawSocket client protocol.
     """
@@ -765,6 +862,327 @@ class WampRawSocketClientFactory(rawsocket.WampRawSocketClientFactory):
         rawsocket.WampRawSocketClientFactory.__init__(self, factory, serializer)
 
 
+#: Header of every RawSocket message on a multiplexed WAMP-RawSocket connection: the ID of
+#: the channel (the WAMP session) the message is routed to, and the frame type.
+MUX_FRAME_HEADER = struct.Struct(">QB")
+
+#: Frame carrying serialized WAMP messages of a channel.
+MUX_FRAME_DATA = 0
+
+#: Frame opening a new channel (sent by the client).
+MUX_FRAME_OPEN = 1
+
+#: Frame closing a channel (sent by either side).
+MUX_FRAME_CLOSE = 2
+
+
+class WampMuxChannel(object):
+    """
+    A WAMP transport for one session multiplexed over a shared WAMP-RawSocket connection.
+
+    Channels implement :class:`autobahn.wamp.interfaces.ITransport`, so sessions run on a channel
+    just as they would on a connection of their own.
+    """
+
+    log = make_logger()
+
+    def __init__(self, protocol, channel_id, session):
+        """
+
+        :param protocol: The multiplexed WAMP-RawSocket connection the channel runs on.
+        :type protocol: :class:`WampMuxRawSocketServerProtocol` or :class:`WampMuxRawSocketClientProtocol`
+        :param channel_id: The channel ID, unique on the connection.
+        :type channel_id: int
+        :param session: The WAMP session (transport handler) running on the channel.
+        :type session: object implementing :class:`autobahn.wamp.interfaces.ITransportHandler`
+        """
+        self._protocol = protocol
+        self._channel_id = channel_id
+        self._session = session
+
+        # every channel serializes on its own (so serializer statistics are per session)
+        self._serializer = copy.copy(protocol._serializer)
+
+        self.factory = protocol.factory
+        self.peer = protocol.peer
+        self.is_closed = create_future()
+
+        # the session's onRawMessage (see WampRawMessageMixin)
+        self._on_raw_message = getattr(session, "onRawMessage", None)
+
+        # transport-level authentication and cookie tracking are not available on channels
+        self._authid = None
+        self._authrole = None
+        self._authrealm = None
+        self._authmethod = None
+        self._authprovider = None
+        self._authextra = None
+        self._cbtid = None
+
+    @property
+    def channel_id(self):
+        return self._channel_id
+
+    @property
+    def transport_details(self):
+        return self._protocol.transport_details
+
+    def send(self, msg):
+        """
+        Implements :func:`autobahn.wamp.interfaces.ITransport.send`
+        """
+        if not self.isOpen():
+            raise TransportLost()
+        payload, _ = self._serializer.serialize(msg)
+        self._protocol._send_frame(self._channel_id, MUX_FRAME_DATA, payload)
+
+    def send_raw(self, payload, is_binary):
+        """
+        Send a serialized WAMP message as is (see :meth:`WampRawMessageMixin.send_raw`).
+        """
+        if not self.isOpen():
+            raise TransportLost()
+        self._protocol._send_frame(self._channel_id, MUX_FRAME_DATA, payload)
+
+    def isOpen(self):
+        """
+        Implements :func:`autobahn.wamp.interfaces.ITransport.isOpen`
+        """
+        return self._session is not None
+
+    def close(self):
+        """
+        Implements :func:`autobahn.wamp.interfaces.ITransport.close`
+        """
+        if not self.isOpen():
+            raise TransportLost()
+        self._protocol._close_channel(self._channel_id, True, notify=True)
+
+    def abort(self):
+        """
+        Implements :func:`autobahn.wamp.interfaces.ITransport.abort`
+        """
+        if not self.isOpen():
+            raise TransportLost()
+        self._protocol._close_channel(self._channel_id, False, notify=True)
+
+    def _closed(self, was_clean):
+        session, self._session = self._session, None
+        resolve(self.is_closed, self)
+        try:
+            session.onClose(was_clean)
+        except Exception as e:
+            self.log.warn(
+                "{func} channel {channel_id} session onClose raised ({err})",
+                func=hltype(self._closed),
+                channel_id=hlid(self._channel_id),
+                err=e,
+            )
+
+
+ITransport.register(WampMuxChannel)
+
+
+class WampMuxRawSocketProtocol(object):
+    """
+    Channel routing shared by multiplexed WAMP-RawSocket server and client protocols.
+
+    The RawSocket opening handshake is unchanged. After the handshake, every RawSocket message
+    starts with a :data:`MUX_FRAME_HEADER` which routes the frame to a channel (a WAMP session).
+
+    Server and client protocols handle :data:`MUX_FRAME_OPEN` frames received from the peer
+    in ``_open_remote_channel(channel_id)``.
+    """
+
+    log = make_logger()
+
+    # map: channel_id -> WampMuxChannel (None until the opening handshake has completed)
+    _channels = None
+
+    def isOpen(self):
+        return self._channels is not None
+
+    def _send_frame(self, channel_id, frame_type, payload=b""):
+        frame = MUX_FRAME_HEADER.pack(channel_id, frame_type) + payload
+        if 0 < self._max_len_send < len(frame):
+            raise PayloadExceededError(
+                "tried to send RawSocket message with size {} exceeding payload limit of {} octets".format(
+                    len(frame), self._max_len_send
+                )
+            )
+        self.sendString(frame)
+
+    def _close_channel(self, channel_id, was_clean, notify=False):
+        channel = self._channels.pop(channel_id, None) if self._channels else None
+        if channel is not None:
+            if notify:
+                self._send_frame(channel_id, MUX_FRAME_CLOSE)
+            channel._closed(was_clean)
+
+    def stringReceived(self, payload):
+        if len(payload) < MUX_FRAME_HEADER.size:
+            self.log.warn("{func} frame too short - aborting connection", func=hltype(self.stringReceived))
+            self.abort()
+            return
+
+        channel_id, frame_type = MUX_FRAME_HEADER.unpack_from(payload)
+
+        if frame_type == MUX_FRAME_DATA:
+            channel = self._channels.get(channel_id, None)
+            if channel is None:
+                # frames in flight for a channel we have closed already
+                self.log.debug(
+                    "{func} dropping frame for closed channel {channel_id}",
+                    func=hltype(self.stringReceived),
+                    channel_id=hlid(channel_id),
+                )
+                return
+            data = payload[MUX_FRAME_HEADER.size :]
+            if channel._on_raw_message is not None and channel._on_raw_message(
+                data, channel._serializer._serializer.BINARY
+            ):
+                return
+            try:
+                for msg in channel._serializer.unserialize(data):
+                    if channel._session is None:
+                        break
+                    channel._session.onMessage(msg)
+            except Exception as e:
+                # errors only bring down the channel, not the other sessions sharing the connection
+                self.log.warn(
+                    "{func} closing channel {channel_id} ({err})",
+                    func=hltype(self.stringReceived),
+                    channel_id=hlid(channel_id),
+                    err=e,
+                )
+                self._close_channel(channel_id, False, notify=True)
+
+        elif frame_type == MUX_FRAME_OPEN:
+            self._open_remote_channel(channel_id)
+
+        elif frame_type == MUX_FRAME_CLOSE:
+            self._close_channel(channel_id, True)
+
+        else:
+            self.log.warn(
+                "{func} invalid frame type {frame_type} - aborting connection",
+                func=hltype(self.stringReceived),
+                frame_type=frame_type,
+            )
+            self.abort()
+
+    def connectionLost(self, reason):
+        was_clean = isinstance(reason.value, ConnectionDone)
+        channels, self._channels = self._channels or {}, None
+        for channel in list(channels.values()):
+            channel._closed(was_clean)
+        super(WampMuxRawSocketProtocol, self).connectionLost(reason)
+
+
+class WampMuxRawSocketServerProtocol(WampMuxRawSocketProtocol, WampRawSocketServerProtocol):
+    """
+    Crossbar.io multiplexed WAMP-over-RawSocket server protocol: a new router session
+    is started for every channel the client opens, up to the maximum number of channels
+    per connection configured on the transport (``max_channels``).
+    """
+
+    def _on_handshake_complete(self):
+        self._transport_details.channel_serializer = TransportDetails.CHANNEL_SERIALIZER_FROM_STR[
+            self._serializer.SERIALIZER_ID
+        ]
+        self._transport_details.websocket_protocol = "wamp.2.{}".format(self._serializer.SERIALIZER_ID)
+        if self._transport_details.is_secure:
+            self._transport_details.channel_id = {
+                "tls-unique": transport_channel_id(self.transport, True, "tls-unique"),
+            }
+        self._channels = {}
+
+    def _open_remote_channel(self, channel_id):
+        if channel_id in self._channels:
+            self.log.warn(
+                "{func} channel {channel_id} already open - aborting connection",
+                func=hltype(self._open_remote_channel),
+                channel_id=hlid(channel_id),
+            )
+            self.abort()
+            return
+        if len(self._channels) >= self.factory._max_channels:
+            self.log.warn(
+                "{func} maximum of {max_channels} channels reached - rejecting channel {channel_id}",
+                func=hltype(self._open_remote_channel),
+                max_channels=self.factory._max_channels,
+                channel_id=hlid(channel_id),
+            )
+            self._send_frame(channel_id, MUX_FRAME_CLOSE)
+            return
+        try:
+            session = self.factory._factory()
+            channel = WampMuxChannel(self, channel_id, session)
+            self._channels[channel_id] = channel
+            session.onOpen(channel)
+        except Exception as e:
+            self.log.warn(
+                "{func} session onOpen raised on channel {channel_id} ({err})",
+                func=hltype(self._open_remote_channel),
+                channel_id=hlid(channel_id),
+                err=e,
+            )
+            self._close_channel(channel_id, False, notify=True)
+
+
+class WampMuxRawSocketClientProtocol(WampMuxRawSocketProtocol, WampRawSocketClientProtocol):
+    """
+    Crossbar.io multiplexed WAMP-over-RawSocket client protocol: sessions are started
+    on the connection by opening channels (see :meth:`open_channel`).
+    """
+
+    def connectionMade(self):
+        WampRawSocketClientProtocol.connectionMade(self)
+
+        # fires when the opening handshake has completed and channels can be opened
+        self.is_open = create_future()
+
+    def _on_handshake_complete(self):
+        self._channels = {}
+        resolve(self.is_open, self)
+
+    def _open_remote_channel(self, channel_id):
+        self.log.warn(
+            "{func} server tried to open channel {channel_id} - aborting connection",
+            func=hltype(self._open_remote_channel),
+            channel_id=hlid(channel_id),
+        )
+        self.abort()
+
+    def open_channel(self, channel):
+        """
+        Open a channel on this connection and start the channel's session.
+
+        :param channel: The channel to open (must have been created for this connection).
+        :type channel: :class:`WampMuxChannel`
+        """
+        if not self.isOpen():
+            raise TransportLost()
+        if channel.channel_id in self._channels:
+            raise ValueError("channel {} already open".format(channel.channel_id))
+        self._channels[channel.channel_id] = channel
+        self._send_frame(channel.channel_id, MUX_FRAME_OPEN)
+        channel._session.onOpen(channel)
+
+    def connectionLost(self, reason):
+        if not is_called(self.is_open):
+            reject(self.is_open, TransportLost("connection lost during opening handshake"))
+        WampMuxRawSocketProtocol.connectionLost(self, reason)
+
+
+class WampMuxRawSocketClientFactory(WampRawSocketClientFactory):
+    """
+    Crossbar.io multiplexed WAMP-over-RawSocket client factory.
+    """
+
+    protocol = WampMuxRawSocketClientProtocol
+
+
 class WebSocketReverseProxyClientProtocol(websocket.WebSocketClientProtocol):
     log = make_logger()
 
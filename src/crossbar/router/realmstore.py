@@ -5,9 +5,12 @@
 #
 #####################################################################################
 
-from collections import deque
+import time
+from array import array
+from collections import OrderedDict, deque
 from typing import Any, Dict, List, Optional
 
+import cbor2
 from autobahn.util import hltype, hlval
 from autobahn.wamp.interfaces import ISession
 from autobahn.wamp.message import Publish
@@ -24,18 +27,507 @@ from crossbar.router.observation import UriObservationMap
 __all__ = (
     "RealmStoreMemory",
     "QueuedCall",
+    "CallQueues",
+    "EventRing",
+    "MQTTSessions",
 )
 
 
+class EventRing(object):
+    """
+    Compact ring buffer of the event history of one subscription.
+
+    Publication IDs and timestamps are kept in preallocated arrays, and events as
+    serialized payload bytes (shared between all subscriptions an event is recorded for),
+    so that an event costs little more than its serialized size.
+    """
+
+    __slots__ = ("subscription_id", "uri", "capacity", "_ids", "_timestamps", "_payloads", "_start", "_len", "_bytes")
+
+    # bytes per event kept for publication ID and timestamp, plus the payload reference
+    SLOT_BYTES = 24
+
+    def __init__(self, subscription_id, uri, capacity):
+        """
+
+        :param subscription_id: The ID of the subscription the history is kept for.
+        :type subscription_id: int
+
+        :param uri: The URI of the subscription.
+        :type uri: str
+
+        :param capacity: Maximum number of events kept.
+        :type capacity: int
+        """
+        assert type(capacity) == int and capacity > 0
+
+        self.subscription_id = subscription_id
+        self.uri = uri
+        self.capacity = capacity
+
+        self._ids = array("Q", bytes(8 * capacity))
+        self._timestamps = array("q", bytes(8 * capacity))
+        self._payloads = [None] * capacity
+
+        # index of the oldest event, and number of events kept
+        self._start = 0
+        self._len = 0
+
+        # total size of payloads kept
+        self._bytes = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the events kept (including payloads shared with other subscriptions).
+        """
+        return self.SLOT_BYTES * self._len + self._bytes
+
+    @property
+    def fixed_nbytes(self):
+        """
+        Memory preallocated for the slots of all ``capacity`` events, whether kept or not.
+        """
+        return self.SLOT_BYTES * self.capacity
+
+    def append(self, publication_id, timestamp, payload):
+        """
+        Record an event, dropping the oldest event when the ring is full.
+
+        :returns: The payload of the event dropped, or ``None``.
+        :rtype: bytes or None
+        """
+        if self._len == self.capacity:
+            dropped = self.pop()
+        else:
+            dropped = None
+        i = (self._start + self._len) % self.capacity
+        self._ids[i] = publication_id
+        self._timestamps[i] = timestamp
+        self._payloads[i] = payload
+        self._len += 1
+        self._bytes += len(payload)
+        return dropped
+
+    def pop(self):
+        """
+        Drop the oldest event.
+
+        :returns: The payload of the event dropped, or ``None`` when the history is empty.
+        :rtype: bytes or None
+        """
+        if not self._len:
+            return None
+        i = self._start
+        payload = self._payloads[i]
+        self._payloads[i] = None
+        self._start = (i + 1) % self.capacity
+        self._len -= 1
+        self._bytes -= len(payload)
+        return payload
+
+    def newest_id(self):
+        """
+        :returns: The publication ID of the newest event, or ``None`` when the history is empty.
+        """
+        if self._len:
+            return self._ids[(self._start + self._len - 1) % self.capacity]
+        return None
+
+    def events(self, reverse=False):
+        """
+        Iterate over the events kept, from the oldest (or, when ``reverse``, the newest).
+
+        :returns: Iterator of ``(publication_id, timestamp, payload)`` tuples.
+        """
+        indexes = range(self._len - 1, -1, -1) if reverse else range(self._len)
+        for n in indexes:
+            i = (self._start + n) % self.capacity
+            yield self._ids[i], self._timestamps[i], self._payloads[i]
+
+
 class QueuedCall(object):
-    __slots__ = ("session", "call", "registration", "authorization")
+    """
+    A call queued on a registration until a callee with free concurrency is available.
+    """
+
+    __slots__ = ("session", "call", "registration", "authorization", "priority", "queued", "expires")
 
-    def __init__(self, session, call, registration, authorization):
+    def __init__(self, session, call, registration, authorization, priority=0, queued=None, expires=None):
         self.session = session
         self.call = call
         self.registration = registration
         self.authorization = authorization
 
+        # queueing priority (calls with higher priority are forwarded first)
+        self.priority = priority
+
+        # time the call was queued, and time the call expires (if a max-age applies)
+        self.queued = queued
+        self.expires = expires
+
+
+class _RegistrationCallQueue(object):
+    """
+    Call queue of a single registration, with one FIFO per priority.
+    """
+
+    __slots__ = ("uri", "limit", "max_age", "priorities", "_fifos", "_order", "_len")
+
+    def __init__(self, uri, limit, max_age=None, priorities=None):
+        self.uri = uri
+        self.limit = limit
+        self.max_age = max_age
+
+        # map: authrole -> priority
+        self.priorities = priorities or {}
+
+        # map: priority -> deque(of QueuedCall)
+        self._fifos = {}
+
+        # priorities having a FIFO, highest first
+        self._order = []
+
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, queued_call):
+        fifo = self._fifos.get(queued_call.priority, None)
+        if fifo is None:
+            fifo = self._fifos[queued_call.priority] = deque()
+            self._order.append(queued_call.priority)
+            self._order.sort(reverse=True)
+        fifo.append(queued_call)
+        self._len += 1
+
+    def head(self):
+        for priority in self._order:
+            fifo = self._fifos[priority]
+            if fifo:
+                return fifo[0]
+        return None
+
+    def popleft(self):
+        for priority in self._order:
+            fifo = self._fifos[priority]
+            if fifo:
+                self._len -= 1
+                return fifo.popleft()
+        return None
+
+    def expire(self, now):
+        # all calls share the same max-age, so expired calls are at the front of each FIFO
+        expired = []
+        for fifo in self._fifos.values():
+            while fifo and fifo[0].expires is not None and fifo[0].expires <= now:
+                expired.append(fifo.popleft())
+        self._len -= len(expired)
+        return expired
+
+    def clear(self):
+        dropped = []
+        for priority in self._order:
+            dropped.extend(self._fifos[priority])
+        self._fifos.clear()
+        self._order = []
+        self._len = 0
+        return dropped
+
+
+class CallQueues(object):
+    """
+    Bounded per-registration queues of calls which could not be forwarded because the
+    maximum concurrency of all callees of the registration was reached.
+
+    Which registrations have calls queued is configured by the ``call-queue`` items of the
+    realm store configuration, each matching a registration by URI and match policy, and
+    optionally setting the maximum queue length (``limit``), the maximum time in seconds a
+    call stays queued (``max-age``) and queueing priorities per caller ``authrole``
+    (``priority``). Calls with a higher priority are forwarded first, calls with the same
+    priority in the order they were queued. When no ``call-queue`` is configured, calls on
+    all registrations are queued (up to the global ``limit``).
+    """
+
+    log = make_logger()
+
+    DEFAULT_LIMIT = 1000
+    """
+    The default (per-registration) call queue limit, in case not overridden.
+    """
+
+    def __init__(self, config, now=None):
+        """
+
+        :param config: Realm store configuration.
+        :type config: dict
+
+        :param now: Function returning the current time in seconds (used for calls with
+            a max-age), eg ``reactor.seconds``. Defaults to ``time.monotonic``.
+        :type now: callable
+        """
+        self._now = now or time.monotonic
+        self._limit = config.get("limit", self.DEFAULT_LIMIT)
+
+        # when no call queues are configured, calls on all registrations are queued
+        self._queue_all = "call-queue" not in config
+
+        # map: (uri, match) -> call queue configuration item
+        self._config = {}
+        for item in config.get("call-queue", []):
+            self._config[(item["uri"], item.get("match", "exact"))] = item
+
+        # map: registration ID -> _RegistrationCallQueue (or None when calls are not queued)
+        self._queues = {}
+
+        self._enqueued = 0
+        self._rejected = 0
+        self._expired = 0
+        self._dropped = 0
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values() if queue)
+
+    def _queue(self, registration):
+        try:
+            return self._queues[registration.id]
+        except KeyError:
+            pass
+
+        item = self._config.get((registration.uri, registration.match), None)
+        if item is not None:
+            queue = _RegistrationCallQueue(
+                registration.uri,
+                item.get("limit", self._limit),
+                max_age=item.get("max-age", None),
+                priorities=item.get("priority", None),
+            )
+        elif self._queue_all:
+            queue = _RegistrationCallQueue(registration.uri, self._limit)
+        else:
+            queue = None
+
+        self._queues[registration.id] = queue
+        return queue
+
+    def put(self, session, call, registration, authorization):
+        """
+        Queue a call on a registration.
+
+        :returns: The queued call, or ``None`` when calls on the registration are not
+            queued or the call queue of the registration is full.
+        :rtype: :class:`QueuedCall` or None
+        """
+        queue = self._queue(registration)
+        if queue is None:
+            return None
+
+        if len(queue) >= queue.limit:
+            if not self._rejected % 1000:
+                self.log.warn(
+                    "call queue full ({limit} calls queued) for registration {uri} - rejecting calls",
+                    limit=queue.limit,
+                    uri=queue.uri,
+                )
+            self._rejected += 1
+            return None
+
+        now = self._now()
+        queued_call = QueuedCall(
+            session,
+            call,
+            registration,
+            authorization,
+            priority=queue.priorities.get(session._authrole, 0),
+            queued=now,
+            expires=now + queue.max_age if queue.max_age else None,
+        )
+        queue.append(queued_call)
+        self._enqueued += 1
+        return queued_call
+
+    def head(self, registration):
+        """
+        Get the call to be forwarded next on a registration (without dequeueing it).
+
+        :rtype: :class:`QueuedCall` or None
+        """
+        queue = self._queues.get(registration.id, None)
+        if queue:
+            return queue.head()
+        return None
+
+    def pop(self, registration):
+        """
+        Dequeue the call to be forwarded next on a registration.
+
+        :rtype: :class:`QueuedCall` or None
+        """
+        queue = self._queues.get(registration.id, None)
+        if queue:
+            return queue.popleft()
+        return None
+
+    def expire(self, registration):
+        """
+        Dequeue all calls on a registration which have been queued longer than their max-age.
+
+        :returns: The expired calls.
+        :rtype: list
+        """
+        queue = self._queues.get(registration.id, None)
+        if not queue:
+            return []
+        expired = queue.expire(self._now())
+        self._expired += len(expired)
+        return expired
+
+    def drop(self, registration):
+        """
+        Dequeue all calls on a registration, eg when the registration was deleted.
+
+        :returns: The dropped calls.
+        :rtype: list
+        """
+        queue = self._queues.pop(registration.id, None)
+        if not queue:
+            return []
+        dropped = queue.clear()
+        self._dropped += len(dropped)
+        return dropped
+
+    def stats(self):
+        """
+        Get call queue statistics.
+
+        :returns: Dict with the total number of calls currently queued, the number of calls
+            queued per registration URI (for non-empty queues), and the total number of calls
+            queued, rejected (because the call queue was full), expired and dropped.
+        :rtype: dict
+        """
+        depths = {}
+        for queue in self._queues.values():
+            if queue:
+                depths[queue.uri] = depths.get(queue.uri, 0) + len(queue)
+        return {
+            "depth": sum(depths.values()),
+            "registrations": depths,
+            "enqueued": self._enqueued,
+            "rejected": self._rejected,
+            "expired": self._expired,
+            "dropped": self._dropped,
+        }
+
+
+class MQTTSessions(object):
+    """
+    Persistent session state of MQTT clients connecting with clean-session=false.
+
+    The state of a session is stored when the client disconnects, and taken over again
+    when the client reconnects with the same client ID. It consists of the subscriptions
+    of the client and the QoS 1/2 messages not yet acknowledged by the client, and is
+    kept within the per-client byte budget of the MQTT transport by the transport itself.
+    At most ``mqtt-session-limit`` sessions are stored (configured in the realm store
+    configuration), the least recently stored session is discarded when exceeded.
+    """
+
+    log = make_logger()
+
+    DEFAULT_LIMIT = 10000
+    """
+    The default limit on the number of stored sessions, in case not overridden.
+    """
+
+    def __init__(self, config):
+        """
+
+        :param config: Realm store configuration.
+        :type config: dict
+        """
+        self._limit = config.get("mqtt-session-limit", self.DEFAULT_LIMIT)
+
+        # map: client ID -> session state, least recently stored first
+        self._sessions = OrderedDict()
+
+        self._stored = 0
+        self._resumed = 0
+        self._evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def put(self, client_id, state, restored=False):
+        """
+        Store the state of a session, replacing any state stored for the client before.
+
+        :param client_id: The MQTT client ID.
+        :type client_id: str
+
+        :param state: The session state, a dict with the ``subscriptions`` (map of topic
+            filter to granted QoS) and ``messages`` (list of messages, each a dict) of the
+            session, and the number of bytes taken by the messages (``bytes``).
+        :type state: dict
+
+        :param restored: The state was restored from a database (and is not counted as stored).
+        :type restored: bool
+
+        :returns: The client IDs of the sessions discarded because the session limit was reached.
+        :rtype: list
+        """
+        self._sessions.pop(client_id, None)
+        self._sessions[client_id] = state
+        if not restored:
+            self._stored += 1
+
+        discarded = []
+        while len(self._sessions) > self._limit:
+            evicted, _ = self._sessions.popitem(last=False)
+            discarded.append(evicted)
+            self._evicted += 1
+            self.log.warn(
+                "MQTT session limit ({limit} sessions) reached - discarding session of client {client_id}",
+                limit=self._limit,
+                client_id=evicted,
+            )
+        return discarded
+
+    def pop(self, client_id):
+        """
+        Take over (remove) the state stored for a session.
+
+        :param client_id: The MQTT client ID.
+        :type client_id: str
+
+        :returns: The session state, or ``None`` when no state is stored for the client.
+        :rtype: dict or None
+        """
+        state = self._sessions.pop(client_id, None)
+        if state is not None:
+            self._resumed += 1
+        return state
+
+    def stats(self):
+        """
+        Get MQTT session statistics.
+
+        :returns: Dict with the number of sessions and messages currently stored, the
+            bytes taken by the messages, and the total number of sessions stored, resumed
+            and evicted (because the session limit was reached).
+        :rtype: dict
+        """
+        return {
+            "sessions": len(self._sessions),
+            "messages": sum(len(state["messages"]) for state in self._sessions.values()),
+            "bytes": sum(state["bytes"] for state in self._sessions.values()),
+            "stored": self._stored,
+            "resumed": self._resumed,
+            "evicted": self._evicted,
+        }
+
 
 class RealmStoreMemory(object):
     """
@@ -62,14 +554,18 @@ class RealmStoreMemory(object):
 
             "store": {
                 "type": "memory",
-                "limit": 1000,      // global default for limit on call queues
+                "limit": 1000,      // global default for limit on call queues / event history
+                "history-max-bytes": 10000000,  // memory budget for the event history of all subscriptions
                 "call-queue": [
                     {
                         "uri": "com.example.compute",
                         "match": "exact",
-                        "limit": 10000  // procedure specific call queue limit
+                        "limit": 10000,             // procedure specific call queue limit
+                        "max-age": 60,              // seconds a call may stay queued
+                        "priority": {"admin": 1}    // queueing priority by caller authrole
                     }
-                ]
+                ],
+                "mqtt-session-limit": 10000         // max. number of persistent MQTT sessions stored
             }
         """
         from twisted.internet import reactor
@@ -85,17 +581,32 @@ class RealmStoreMemory(object):
         # limit to event history per subscription
         self._limit = self._config.get("limit", self.GLOBAL_HISTORY_LIMIT)
 
-        # map of publication ID -> event dict
-        self._event_store = {}
+        # memory budget for the event history of all subscriptions (bytes)
+        self._history_max_bytes = self._config.get("history-max-bytes", None)
+
+        # map of subscription ID -> EventRing, least recently used first
+        self._event_history = OrderedDict()
+
+        # memory held by all event histories, and number of events evicted to stay within the budget
+        self._history_bytes = 0
+        self._history_evicted = 0
+
+        # map: id(payload) -> number of events holding the payload. an event is serialized once, and
+        # its payload shared by the histories of all subscriptions it is recorded for, so the size of
+        # a payload is counted (in _history_bytes) once while held by any event
+        self._payload_refs = {}
 
-        # map of publication ID -> set of subscription IDs
-        self._event_subscriptions = {}
+        # the subscription map the store observes subscriptions with event history on
+        self._subscription_map = None
 
-        # map of subscription ID -> (limit, deque(of publication IDs))
-        self._event_history = {}
+        # realm of the sessions publishing events (the realm of the router the store is for)
+        self._realm = None
 
-        # map: registration.id -> deque( (session, call, registration, authorization) )
-        self._queued_calls = {}
+        # bounded per-registration call queues
+        self._call_queues = CallQueues(self._config, now=lambda: self._reactor.seconds())
+
+        # persistent MQTT session state
+        self._mqtt_sessions = MQTTSessions(self._config)
 
         self._running = False
 
@@ -170,6 +681,7 @@ class RealmStoreMemory(object):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.attach_subscription_map`
         """
+        self._subscription_map = subscription_map
         for sub in self._config.get("event-history", []):
             uri = sub["uri"]
             match = sub.get("match", "exact")
@@ -178,141 +690,222 @@ class RealmStoreMemory(object):
             )
             subscription_id = observation.id
 
-            # for in-memory history, we just use a double-ended queue
-            self._event_history[subscription_id] = (sub.get("limit", self._limit), deque())
+            # for in-memory history, we use a ring buffer of serialized events
+            ring = EventRing(subscription_id, uri, sub.get("limit", self._limit))
+            previous = self._event_history.pop(subscription_id, None)
+            if previous:
+                for _, _, payload in previous.events():
+                    self._release_payload(payload)
+            self._event_history[subscription_id] = ring
 
-    def store_event(self, session: ISession, publication_id: int, publish: Publish):
+    def stats(self) -> Dict[str, Any]:
         """
-        Implements :meth:`crossbar._interfaces.IRealmStore.store_event`
+        Implements :meth:`crossbar._interfaces.IRealmStore.stats`
         """
-        assert publication_id not in self._event_store
-        evt = {
-            "time_ns": time_ns(),
-            "realm": session._realm,
-            "session_id": session._session_id,
-            "authid": session._authid,
-            "authrole": session._authrole,
-            "publication": publication_id,
-            "topic": publish.topic,
-            "args": publish.args,
-            "kwargs": publish.kwargs,
+        return {
+            "type": self._type,
+            "events": sum(len(ring) for ring in self._event_history.values()),
+            "history": {
+                "bytes": self._history_bytes,
+                "fixed_bytes": sum(ring.fixed_nbytes for ring in self._event_history.values()),
+                "max_bytes": self._history_max_bytes,
+                "evicted": self._history_evicted,
+                "subscriptions": {
+                    ring.subscription_id: {
+                        "uri": ring.uri,
+                        "events": len(ring),
+                        "bytes": ring.nbytes,
+                        "fixed_bytes": ring.fixed_nbytes,
+                    }
+                    for ring in self._event_history.values()
+                },
+            },
+            "calls": self._call_queues.stats(),
+            "mqtt_sessions": self._mqtt_sessions.stats(),
         }
-        self._event_store[publication_id] = evt
-        self.log.debug(
-            "Event {publication_id} stored in {store_type}-store",
-            store_type=self.STORE_TYPE,
-            publication_id=publication_id,
-        )
 
-    def store_event_history(self, publication_id: int, subscription_id: int, receiver: ISession):
-        """
-        Implements :meth:`crossbar._interfaces.IRealmStore.store_event_history`
+    def store_event(self, session: ISession, publication_id: int, publish: Publish) -> bool:
         """
-        # assert(publication_id in self._event_store)
-        # assert(subscription_id in self._event_history)
+        Implements :meth:`crossbar._interfaces.IRealmStore.store_event`
 
-        if publication_id not in self._event_store:
-            self.log.warn(
-                "INTERNAL WARNING: event for publication {publication_id} not in event store",
-                publication_id=publication_id,
-            )
+        The event is recorded (serialized once) in the history of all subscriptions
+        with event history matching the topic published to.
+        """
+        self._realm = session._realm
+        payload = None
+        timestamp = time_ns()
+
+        for subscription in self._subscription_map.match_observations(publish.topic):
+            ring = self._event_history.get(subscription.id, None)
+            if ring is None:
+                continue
+            if payload is None:
+                payload = cbor2.dumps(
+                    [
+                        session._session_id,
+                        session._authid,
+                        session._authrole,
+                        publish.topic,
+                        publish.args,
+                        publish.kwargs,
+                    ]
+                )
+            self._hold_payload(payload)
+            dropped = ring.append(publication_id, timestamp, payload)
+            if dropped is not None:
+                self._release_payload(dropped)
+            self._event_history.move_to_end(subscription.id)
 
-        if subscription_id not in self._event_history:
-            self.log.warn(
-                "INTERNAL WARNING: subscription {subscription_id} for publication {publication_id} not in event store",
-                subscription_id=subscription_id,
+            self.log.debug(
+                "Event {publication_id} history stored in {store_type}-store for subscription {subscription_id}",
+                store_type=self.STORE_TYPE,
                 publication_id=publication_id,
+                subscription_id=subscription.id,
             )
-            return
-
-        limit, history = self._event_history[subscription_id]
-
-        # append event to history
-        history.append(publication_id)
 
-        if publication_id not in self._event_subscriptions:
-            self._event_subscriptions[publication_id] = set()
+        if self._history_max_bytes is not None and self._history_bytes > self._history_max_bytes:
+            self._evict_history()
 
-        self._event_subscriptions[publication_id].add(subscription_id)
-
-        self.log.debug(
-            "Event {publication_id} history stored in {store_type}-store for subscription {subscription_id}",
-            store_type=self.STORE_TYPE,
-            publication_id=publication_id,
-            subscription_id=subscription_id,
-        )
+        return True
 
-        # purge history if over limit
-        if len(history) > limit:
-            # remove leftmost event from history
-            purged_publication_id = history.popleft()
+    def _hold_payload(self, payload):
+        refs = self._payload_refs.get(id(payload), 0)
+        if not refs:
+            self._history_bytes += len(payload)
+        self._payload_refs[id(payload)] = refs + 1
+        self._history_bytes += EventRing.SLOT_BYTES
+
+    def _release_payload(self, payload):
+        refs = self._payload_refs.pop(id(payload)) - 1
+        if refs:
+            self._payload_refs[id(payload)] = refs
+        else:
+            self._history_bytes -= len(payload)
+        self._history_bytes -= EventRing.SLOT_BYTES
+
+    def _evict_history(self):
+        # drop the oldest events of the least recently used subscriptions until within the memory budget
+        for ring in self._event_history.values():
+            while ring and self._history_bytes > self._history_max_bytes:
+                self._release_payload(ring.pop())
+                self._history_evicted += 1
+            if self._history_bytes <= self._history_max_bytes:
+                break
 
-            # remove the purged publication from event subscriptions
-            self._event_subscriptions[purged_publication_id].remove(subscription_id)
+    def store_event_history(self, publication_id: int, subscription_id: int, receiver: ISession):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.store_event_history`
 
-            self.log.debug(
-                "Event {publication_id} purged from history for subscription {subscription_id}",
-                publication_id=purged_publication_id,
-                subscription_id=subscription_id,
-            )
+        Event history is recorded per subscription when the event is stored, so this does nothing.
+        """
 
-            # if no more event subscriptions exist for publication, remove that too
-            if not self._event_subscriptions[purged_publication_id]:
-                del self._event_subscriptions[purged_publication_id]
-                del self._event_store[purged_publication_id]
-                self.log.debug("Event {publication_id} purged completey", publication_id=purged_publication_id)
+    def _event(self, publication_id, timestamp, payload):
+        session_id, authid, authrole, topic, args, kwargs = cbor2.loads(payload)
+        return {
+            "time_ns": timestamp,
+            "realm": self._realm,
+            "session_id": session_id,
+            "authid": authid,
+            "authrole": authrole,
+            "publication": publication_id,
+            "topic": topic,
+            "args": args,
+            "kwargs": kwargs,
+        }
 
-    def get_events(self, subscription_id: int, limit: Optional[int] = None):
+    def get_events(self, subscription_id: int, limit: Optional[int] = None, before: Optional[int] = None):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.get_events`
         """
-        if subscription_id not in self._event_history:
+        ring = self._event_history.get(subscription_id, None)
+        if ring is None:
             return None
-        else:
-            _, history = self._event_history[subscription_id]
-
-            # at most "limit" events in reverse chronological order
-            res = []
-            i = -1
-            if limit is None or limit > len(history):
-                limit = len(history)
-            for _ in range(limit):
-                publication_id = history[i]
-                res.append(self._event_store[publication_id])
-                i -= 1
-            return res
+        self._event_history.move_to_end(subscription_id)
 
-    def get_event_history(self, subscription_id: int, from_ts: int, until_ts: int) -> Optional[List[Dict[str, Any]]]:
+        # at most "limit" events in reverse chronological order, starting after the cursor
+        res = []
+        if limit == 0:
+            return res
+        events = ring.events(reverse=True)
+        if before is not None:
+            for publication_id, _, _ in events:
+                if publication_id == before:
+                    break
+            else:
+                return res
+        for event in events:
+            res.append(self._event(*event))
+            if limit is not None and len(res) >= limit:
+                break
+        return res
+
+    def get_event_history(
+        self,
+        subscription_id: int,
+        from_ts: int,
+        until_ts: int,
+        reverse: Optional[bool] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.get_event_history`
         """
-        raise Exception("not implemented")
+        ring = self._event_history.get(subscription_id, None)
+        if ring is None:
+            return None
+        self._event_history.move_to_end(subscription_id)
+
+        res = []
+        if limit == 0:
+            return res
+        for publication_id, timestamp, payload in ring.events(reverse=bool(reverse)):
+            if from_ts <= timestamp < until_ts:
+                res.append(self._event(publication_id, timestamp, payload))
+                if limit is not None and len(res) >= limit:
+                    break
+        return res
 
     def maybe_queue_call(self, session, call, registration, authorization):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.maybe_queue_call`
         """
-        # FIXME: match this against the config, not just plain accept queueing!
-        if registration.id not in self._queued_calls:
-            self._queued_calls[registration.id] = deque()
-
-        self._queued_calls[registration.id].append(QueuedCall(session, call, registration, authorization))
-
-        return True
+        return self._call_queues.put(session, call, registration, authorization)
 
     def get_queued_call(self, registration):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.get_queued_call`
         """
-        if registration.id in self._queued_calls and self._queued_calls[registration.id]:
-            return self._queued_calls[registration.id][0]
+        return self._call_queues.head(registration)
 
     def pop_queued_call(self, registration):
         """
         Implements :meth:`crossbar._interfaces.IRealmStore.pop_queued_call`
         """
-        if registration.id in self._queued_calls and self._queued_calls[registration.id]:
-            return self._queued_calls[registration.id].popleft()
+        return self._call_queues.pop(registration)
+
+    def expire_queued_calls(self, registration):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.expire_queued_calls`
+        """
+        return self._call_queues.expire(registration)
+
+    def drop_queued_calls(self, registration):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.drop_queued_calls`
+        """
+        return self._call_queues.drop(registration)
+
+    def store_mqtt_session(self, client_id, state):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.store_mqtt_session`
+        """
+        self._mqtt_sessions.put(client_id, state)
+
+    def pop_mqtt_session(self, client_id):
+        """
+        Implements :meth:`crossbar._interfaces.IRealmStore.pop_mqtt_session`
+        """
+        return self._mqtt_sessions.pop(client_id)
 
 
 IRealmStore.register(RealmStoreMemory)
@@ -0,0 +1,243 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+__all__ = ("ReceiverIndex",)
+
+
+class ReceiverIndex(object):
+    """
+    Indexed receiver-selection engine used by the broker for subscriber
+    black- and whitelisting.
+
+    Every session attached to the broker is assigned a dense integer slot
+    (slots are recycled when sessions detach). Sets of sessions - the subscribers
+    of a subscription, all sessions with a given ``authid`` or ``authrole`` -
+    are then represented as bitmaps (plain Python integers with bit ``slot`` set),
+    so that ``eligible``/``exclude`` filtering of a publication is done using
+    bitset intersections and differences rather than building and combining
+    Python sets.
+    """
+
+    __slots__ = (
+        "_slot_of",
+        "_slot_to_session",
+        "_free_slots",
+        "_session_id_to_slot",
+        "_session_auth",
+        "_authid_masks",
+        "_authrole_masks",
+    )
+
+    def __init__(self):
+        # map: session -> slot
+        self._slot_of = {}
+
+        # map: slot -> session (or None for free slots)
+        self._slot_to_session = []
+
+        # slots freed by detached sessions, reused before growing
+        self._free_slots = []
+
+        # map: session ID -> slot
+        self._session_id_to_slot = {}
+
+        # map: session -> (authid, authrole) the session joined with
+        self._session_auth = {}
+
+        # map: authid -> bitmap of joined sessions with this authid
+        self._authid_masks = {}
+
+        # map: authrole -> bitmap of joined sessions with this authrole
+        self._authrole_masks = {}
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def slot(self, session):
+        """
+        Get the slot of a session.
+
+        :param session: The session to get the slot for.
+
+        :returns: The slot or ``None`` if the session is not indexed.
+        :rtype: int or None
+        """
+        return self._slot_of.get(session, None)
+
+    def add(self, session):
+        """
+        Assign a slot to a session (when the session is attached).
+
+        :param session: The session to index.
+
+        :returns: The slot assigned.
+        :rtype: int
+        """
+        if session in self._slot_of:
+            return self._slot_of[session]
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_to_session[slot] = session
+        else:
+            slot = len(self._slot_to_session)
+            self._slot_to_session.append(session)
+
+        self._slot_of[session] = slot
+        if session._session_id is not None:
+            self._session_id_to_slot[session._session_id] = slot
+        return slot
+
+    def remove(self, session):
+        """
+        Release the slot of a session (when the session is detached).
+
+        :param session: The session to remove from the index.
+        """
+        if session not in self._slot_of:
+            return
+
+        self.set_auth(session, None, None)
+        slot = self._slot_of.pop(session)
+
+        if self._session_id_to_slot.get(session._session_id, None) == slot:
+            del self._session_id_to_slot[session._session_id]
+
+        self._slot_to_session[slot] = None
+        self._free_slots.append(slot)
+
+    def set_auth(self, session, authid, authrole):
+        """
+        Set (or clear, when both are ``None``) the authentication ID and role a session
+        is indexed under for ``eligible_authid``/``exclude_authid`` and
+        ``eligible_authrole``/``exclude_authrole`` filtering.
+
+        :param session: The session, which must have been added before.
+        :param authid: The WAMP authid the session joined with.
+        :param authrole: The WAMP authrole the session joined with.
+        """
+        slot = self._slot_of.get(session, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+
+        previous = self._session_auth.pop(session, None)
+        if previous:
+            prev_authid, prev_authrole = previous
+            for masks, key in ((self._authid_masks, prev_authid), (self._authrole_masks, prev_authrole)):
+                mask = masks.get(key, 0) & ~bit
+                if mask:
+                    masks[key] = mask
+                else:
+                    masks.pop(key, None)
+
+        if authid is not None or authrole is not None:
+            self._session_auth[session] = (authid, authrole)
+            self._authid_masks[authid] = self._authid_masks.get(authid, 0) | bit
+            self._authrole_masks[authrole] = self._authrole_masks.get(authrole, 0) | bit
+
+    def session_ids_mask(self, session_ids):
+        """
+        Get the bitmap of sessions with any of the given session IDs.
+        """
+        mask = 0
+        for session_id in session_ids:
+            slot = self._session_id_to_slot.get(session_id, None)
+            if slot is not None:
+                mask |= 1 << slot
+        return mask
+
+    def authids_mask(self, authids):
+        """
+        Get the bitmap of sessions joined with any of the given authids.
+        """
+        mask = 0
+        for authid in authids:
+            mask |= self._authid_masks.get(authid, 0)
+        return mask
+
+    def authroles_mask(self, authroles):
+        """
+        Get the bitmap of sessions joined with any of the given authroles.
+        """
+        mask = 0
+        for authrole in authroles:
+            mask |= self._authrole_masks.get(authrole, 0)
+        return mask
+
+    def sessions(self, mask):
+        """
+        Get the set of sessions in a bitmap.
+
+        :param mask: Bitmap of session slots.
+        :type mask: int
+
+        :rtype: set
+        """
+        result = set()
+        if mask:
+            slot_to_session = self._slot_to_session
+            # bit string with the least significant bit (slot 0) first
+            bits = bin(mask)[:1:-1]
+            slot = bits.find("1")
+            while slot != -1:
+                result.add(slot_to_session[slot])
+                slot = bits.find("1", slot + 1)
+        return result
+
+    def filter(self, observation, publish):
+        """
+        Filter the observers of a subscription based on all the
+        white/blacklist options of a publication.
+
+        The semantics are identical to filtering the set of observers with Python
+        set operations: observers which are not indexed sessions (eg a realm store
+        tracking the subscription) are only kept when no whitelisting is applied.
+
+        :param observation: The subscription for which to filter receivers.
+        :type observation: :class:`crossbar.router.observation.UriObservation`
+
+        :param publish: The publication with the white/blacklist options.
+        :type publish: :class:`autobahn.wamp.message.Publish`
+
+        :returns: The set of receivers.
+        :rtype: set
+        """
+        mask = observation.observers_mask
+        others = observation.observers_unindexed
+
+        # filter by "eligible" receivers
+        if publish.eligible:
+            mask &= self.session_ids_mask(publish.eligible)
+            others = None
+
+        # if "eligible_authid" we only accept receivers that have the correct authid
+        if publish.eligible_authid:
+            mask &= self.authids_mask(publish.eligible_authid)
+            others = None
+
+        # if "eligible_authrole" we only accept receivers that have the correct authrole
+        if publish.eligible_authrole:
+            mask &= self.authroles_mask(publish.eligible_authrole)
+            others = None
+
+        # remove "excluded" receivers
+        if publish.exclude:
+            mask &= ~self.session_ids_mask(publish.exclude)
+
+        # remove auth-id based receivers
+        if publish.exclude_authid:
+            mask &= ~self.authids_mask(publish.exclude_authid)
+
+        # remove authrole based receivers
+        if publish.exclude_authrole:
+            mask &= ~self.authroles_mask(publish.exclude_authrole)
+
+        receivers = self.sessions(mask)
+        if others:
+            receivers.update(others)
+        return receivers
@@ -5,16 +5,19 @@
 #
 #####################################################################################
 
+import json
 from collections.abc import Mapping
-from pprint import pformat
+from types import MappingProxyType
 
+import txaio
 from autobahn.util import hltype, hlval
 from autobahn.wamp.exception import ApplicationError
 from autobahn.wamp.uri import Pattern, convert_starred_uri
-from pytrie import StringTrie
 from twisted.python.failure import Failure
 from txaio import make_logger
 
+from crossbar.router.wildcard import WildcardTrieMatcher
+
 __all__ = ("RouterRole", "RouterTrustedRole", "RouterRoleStaticAuth", "RouterRoleDynamicAuth", "RouterRoleLMDBAuth")
 
 
@@ -30,6 +33,7 @@ class RouterPermissions(object):
         "disclose_publisher",
         "cache",
         "validate",
+        "_authorizations",
     )
 
     def __init__(
@@ -71,6 +75,9 @@ class RouterPermissions(object):
         self.cache = cache
         self.validate = validate
 
+        # map: action -> authorization (built on first use)
+        self._authorizations = None
+
     def __repr__(self):
         return 'RouterPermissions(uri="{}", match="{}", call={}, register={}, publish={}, subscribe={}, disclose_caller={}, disclose_publisher={}, cache={}, validate={})'.format(
             self.uri,
@@ -85,6 +92,49 @@ class RouterPermissions(object):
             self.validate,
         )
 
+    def authorization(self, action):
+        """
+        Get the authorization these permissions grant for an action.
+
+        The authorizations are built once, and the same (read-only) authorization
+        object is returned for all URIs and sessions these permissions apply to.
+
+        :param action: The action to be performed, one of ``"call"``, ``"register"``,
+            ``"publish"`` or ``"subscribe"``.
+        :type action: str
+
+        :returns: The authorization.
+        :rtype: Mapping
+        """
+        if self._authorizations is None:
+            authorizations = {
+                "publish": {
+                    "allow": self.publish,
+                    "disclose": self.disclose_publisher,
+                    "cache": self.cache,
+                },
+                "subscribe": {"allow": self.subscribe, "cache": self.cache},
+                "call": {
+                    "allow": self.call,
+                    "disclose": self.disclose_caller,
+                    "cache": self.cache,
+                },
+                "register": {"allow": self.register, "cache": self.cache},
+            }
+            for authorization in authorizations.values():
+                # if the action is allowed, add any application payload validation configuration
+                if authorization["allow"]:
+                    authorization["validate"] = self.validate
+            self._authorizations = {
+                action: MappingProxyType(authorization) for action, authorization in authorizations.items()
+            }
+
+        try:
+            return self._authorizations[action]
+        except KeyError:
+            # should not arrive here
+            raise Exception("logic error")
+
     def to_dict(self):
         return {
             "uri": self.uri,
@@ -169,6 +219,115 @@ class RouterPermissions(object):
         )
 
 
+class RouterPermissionsMatcher(object):
+    """
+    Matcher for the permissions of a role, compiled once from the configured permissions.
+
+    Permissions are looked up in order of precedence:
+
+    1. ``exact`` permissions, from a dict keyed by URI
+    2. the longest ``exact`` or ``prefix`` permission URI which is a prefix of the URI,
+       probed from dicts keyed by URI per URI length - when this is an ``exact`` permission
+       for another URI, the default permissions apply (the exact permission shadows
+       shorter prefix permissions)
+    3. ``wildcard`` permissions (with a ``..`` in the URI), from a trie of URI components
+       holding the precompiled patterns - these override the permissions found in 2., and
+       the longest literal prefix wins when more than one pattern matches
+
+    The default permissions apply when no configured permission matches.
+    """
+
+    log = make_logger()
+
+    __slots__ = ("_default", "_exact", "_prefix", "_lengths", "_wildcard")
+
+    def __init__(self, permissions, default):
+        """
+
+        :param permissions: The configured permissions.
+        :type permissions: list of :class:`RouterPermissions`
+
+        :param default: The permissions to apply when no configured permission matches.
+        :type default: :class:`RouterPermissions`
+        """
+        self._default = default
+
+        # map: URI -> permissions
+        self._exact = {}
+
+        # map: prefix -> permissions
+        self._prefix = {}
+
+        # the exact and prefix URI lengths in use (longest first)
+        self._lengths = []
+
+        # trie: wildcard URI pattern -> (literal prefix length, compiled pattern, permissions)
+        self._wildcard = None
+
+        for perms in permissions:
+            if ".." in perms.uri:
+                try:
+                    pattern = Pattern(perms.uri, Pattern.URI_TARGET_ENDPOINT)
+                except Exception as e:
+                    # such a permission never matches
+                    self.log.warn('invalid wildcard URI "{uri}" in role permissions: {error}', uri=perms.uri, error=e)
+                    continue
+                if self._wildcard is None:
+                    self._wildcard = WildcardTrieMatcher()
+                self._wildcard[perms.uri] = (perms.uri.index(".."), pattern, perms)
+            elif perms.match == "prefix":
+                self._prefix[perms.uri] = perms
+            else:
+                self._exact[perms.uri] = perms
+
+        self._lengths = sorted(
+            set(len(uri) for uri in self._prefix) | set(len(uri) for uri in self._exact), reverse=True
+        )
+
+    def match(self, uri):
+        """
+        Get the permissions applying to a URI.
+
+        :param uri: The URI to match.
+        :type uri: str
+
+        :returns: The permissions applying to the URI (the default permissions when no
+            configured permission matches).
+        :rtype: :class:`RouterPermissions`
+        """
+        perms = self._exact.get(uri, None)
+        if perms is not None:
+            return perms
+
+        found = self._default
+        uri_len = len(uri)
+        for length in self._lengths:
+            if length <= uri_len:
+                prefix = uri[:length]
+                perms = self._prefix.get(prefix, None)
+                if perms is not None:
+                    found = perms
+                    break
+                if prefix in self._exact:
+                    # an exact permission shadows shorter prefix permissions
+                    break
+
+        if self._wildcard is not None:
+            best = None
+            for prefix_len, pattern, perms in self._wildcard.iter_matches(uri):
+                if best is None or prefix_len > best[0]:
+                    try:
+                        pattern.match(uri)
+                    except Exception:
+                        # match() raises Exception on no match
+                        continue
+                    best = (prefix_len, perms)
+            if best is not None:
+                return best[1]
+
+        return found
+
+
 class RouterRole(object):
     """
     Base class for router roles.
@@ -187,6 +346,9 @@ class RouterRole(object):
         self.uri = uri
         self.allow_by_default = allow_by_default
 
+        # time-to-live in seconds of authorizations cached by the router (None: no expiry)
+        self.cache_ttl = None
+
     def authorize(self, session, uri, action, options):
         """
         Authorize a session connected under this role to perform the given
@@ -266,20 +428,10 @@ class RouterRoleStaticAuth(RouterRole):
                 cache=True,
             )
 
-        # Trie of explicitly configured permissions
-        self._permissions = StringTrie()
-        self._wild_permissions = StringTrie()
-
-        # for "wildcard" URIs, there will be a ".." in them somewhere,
-        # and so we want to match on the biggest prefix
-        # (i.e. everything to the left of the first "..")
-        for obj in permissions or []:
-            perms = RouterPermissions.from_dict(obj)
-            if ".." in perms.uri:
-                trunc = perms.uri[: perms.uri.index("..")]
-                self._wild_permissions[trunc] = perms
-            else:
-                self._permissions[perms.uri] = perms
+        # permissions explicitly configured, compiled into a single matcher
+        self._matcher = RouterPermissionsMatcher(
+            [RouterPermissions.from_dict(obj) for obj in permissions or []], self._default
+        )
 
     def authorize(self, session, uri, action, options):
         """
@@ -295,107 +447,154 @@ class RouterRoleStaticAuth(RouterRole):
 
         :return: bool -- Flag indicating whether session is authorized or not.
         """
-        try:
-            # longest prefix match of the URI to be authorized against our Trie
-            # of configured URIs for permissions
-            permissions = self._permissions.longest_prefix_value(uri)
-
-            # if there is a _prefix_ matching URI, check that this is actually the
-            # match policy on the permission (otherwise, apply default permissions)!
-            if permissions.match != "prefix" and uri != permissions.uri:
-                permissions = self._default
-
-        except KeyError:
-            # workaround because of https://bitbucket.org/gsakkis/pytrie/issues/4/string-keys-of-zero-length-are-not
-            permissions = self._permissions.get("", self._default)
-
-        # if we found a non-"exact" match, there might be a better one in the wildcards
-        if permissions.match != "exact":
-            try:
-                wildperm = self._wild_permissions.longest_prefix_value(uri)
-                Pattern(wildperm.uri, Pattern.URI_TARGET_ENDPOINT).match(uri)
-            except (KeyError, Exception):
-                # match() raises Exception on no match
-                wildperm = None
-
-            if wildperm is not None:
-                permissions = wildperm
-
-        # we now have some permissions, either from matching something
-        # or via self._default
-
-        if action == "publish":
-            authorization = {
-                "allow": permissions.publish,
-                "disclose": permissions.disclose_publisher,
-                "cache": permissions.cache,
-            }
-
-        elif action == "subscribe":
-            authorization = {"allow": permissions.subscribe, "cache": permissions.cache}
-
-        elif action == "call":
-            authorization = {
-                "allow": permissions.call,
-                "disclose": permissions.disclose_caller,
-                "cache": permissions.cache,
-            }
-
-        elif action == "register":
-            authorization = {"allow": permissions.register, "cache": permissions.cache}
-
-        else:
-            # should not arrive here
-            raise Exception("logic error")
-
-        # if the action is allowed, add any application payload validation configuration
-        if authorization["allow"]:
-            authorization["validate"] = permissions.validate
+        authorization = self._matcher.match(uri).authorization(action)
 
         self.log.debug(
-            '{func} uri="{uri}", action="{action}", options={options} => authorization=\n{authorization}',
+            '{func} uri="{uri}", action="{action}", options={options} => authorization={authorization}',
             func=hltype(self.authorize),
             uri=hlval(uri),
             action=hlval(action),
             options=options,
-            authorization=pformat(authorization),
+            authorization=authorization,
         )
 
         return authorization
 
 
+def _check_authorization(authorization):
+    """
+    Ensure the return-value we got from a user-supplied authorizer makes sense.
+
+    :returns: The authorization, or a :class:`twisted.python.failure.Failure` when the
+        authorization is invalid.
+    """
+    if isinstance(authorization, dict):
+        # check keys
+        for key in authorization.keys():
+            if key not in ["allow", "cache", "disclose", "validate"]:
+                return Failure(
+                    ValueError(
+                        "Authorizer returned unknown key '{key}'".format(
+                            key=key,
+                        )
+                    )
+                )
+        # must have "allow" key
+        if "allow" not in authorization:
+            return Failure(ValueError("Authorizer must have 'allow' in returned dict"))
+        # check bool-valued keys
+        for key in ["allow", "cache", "disclose"]:
+            if key in authorization:
+                value = authorization[key]
+                if not isinstance(value, bool):
+                    return Failure(ValueError("Authorizer must have bool for '{}'".format(key)))
+        # check dict-valued keys
+        for key in ["validate"]:
+            if key in authorization:
+                value = authorization[key]
+                if value is not None and not isinstance(value, Mapping):
+                    return Failure(
+                        ValueError("Authorizer must have dict for '{}' (if present and not null)".format(key))
+                    )
+        return authorization
+
+    elif isinstance(authorization, bool):
+        return authorization
+
+    return Failure(
+        ValueError(
+            "Authorizer returned unknown type '{name}'".format(
+                name=type(authorization).__name__,
+            )
+        )
+    )
+
+
 class RouterRoleDynamicAuth(RouterRole):
     """
     A role on a router realm that is authorized by calling (via WAMP RPC)
     an authorizer function provided by the app.
+
+    Concurrent requests for identical authorizations (same authentication - or same
+    session when coalescing by session - URI, action and options) share a single
+    authorizer call.
+
+    With a batched authorizer, authorization requests are collected during a reactor
+    iteration and sent to the authorizer in one call with a list of
+    ``[session, uri, action, options]`` requests, which must return a list with the
+    authorizations in the same order.
     """
 
-    def __init__(self, router, uri, authorizer):
+    COALESCE_SESSION = "session"
+    COALESCE_AUTHID = "authid"
+
+    def __init__(self, router, uri, authorizer, batch=False, batch_size=100, coalesce=None, cache_ttl=None):
         """
 
         :param router: The router to which to add the role
         :type router: instance of ``crossbar.router.router.Router``
         :param id: The URI of the role.
         :type id: unicode
-        :param authorizer: The dynamic authorizer configuration.
-        :type authorizer: dict
+        :param authorizer: The URI of the dynamic authorizer procedure.
+        :type authorizer: str
+        :param batch: If ``True``, the authorizer takes a list of authorization requests.
+        :type batch: bool
+        :param batch_size: Maximum number of authorization requests per batched authorizer call.
+        :type batch_size: int
+        :param coalesce: Identical concurrent authorization requests share one authorizer call
+            per authentication (``"authid"``, the default: same authid, authrole, authmethod,
+            authprovider and authextra) or per session (``"session"``).
+        :type coalesce: str
+        :param cache_ttl: Time-to-live in seconds of cached authorizations (when the authorizer
+            allows caching), or ``None`` to cache authorizations for the lifetime of the role.
+        :type cache_ttl: int or float
         """
         RouterRole.__init__(self, router, uri)
+        assert coalesce in [None, self.COALESCE_SESSION, self.COALESCE_AUTHID]
+        assert type(batch_size) == int and batch_size > 0
 
         # the URI (identifying name) of the authorizer
         self._uri = uri
 
-        # the dynamic authorizer configuration
-        # {
-        #     "name": "app",
-        #     "authorizer": "com.example.auth"
-        # }
+        # the URI of the authorizer procedure, eg "com.example.auth"
         self._authorizer = authorizer
 
         # the session from which to call the dynamic authorizer: this is
         # the default service session on the realm
         self._session = router._realm.session
 
+        self._batch = batch
+        self._batch_size = batch_size
+        self._coalesce = coalesce or self.COALESCE_AUTHID
+        self.cache_ttl = cache_ttl
+
+        # map: coalescing key -> list of Deferreds waiting for the authorization in-flight
+        self._pending = {}
+
+        # authorization requests waiting to be sent in the next batch: list of (request, Deferred)
+        self._batch_queue = []
+        self._batch_call = None
+
+        # statistics
+        self._requests = 0
+        self._coalesced = 0
+        self._calls = 0
+
+    def stats(self):
+        """
+        Get authorizer statistics.
+
+        :returns: Dict with the number of authorization requests, of requests coalesced with an
+            identical request in-flight, and of calls made to the authorizer procedure.
+        :rtype: dict
+        """
+        return {
+            "requests": self._requests,
+            "coalesced": self._coalesced,
+            "calls": self._calls,
+            "pending": len(self._pending),
+        }
+
     def authorize(self, session, uri, action, options):
         """
         Authorize a session connected under this role to perform the given
@@ -444,6 +643,62 @@ class RouterRoleDynamicAuth(RouterRole):
             "CrossbarRouterRoleDynamicAuth.authorize {uri} {action} {details}", uri=uri, action=action, details=details
         )
 
+        self._requests += 1
+
+        # join an identical authorization request already in-flight
+        key = self._coalesce_key(details, uri, action, options)
+        if key is not None:
+            waiting = self._pending.get(key, None)
+            if waiting is not None:
+                self._coalesced += 1
+                d = txaio.create_future()
+                waiting.append(d)
+                return d
+
+        if self._batch:
+            d = txaio.create_future()
+            self._batch_queue.append(([details, uri, action, options], d))
+            if len(self._batch_queue) >= self._batch_size:
+                self._flush_batch()
+            elif self._batch_call is None:
+                self._batch_call = txaio.call_later(0, self._flush_batch)
+        else:
+            d = self._call_authorizer(session_details, details, uri, action, options)
+
+        if key is not None:
+            self._pending[key] = []
+
+            def resolve_waiting(result):
+                for waiting_d in self._pending.pop(key, []):
+                    if isinstance(result, Failure):
+                        waiting_d.errback(result)
+                    else:
+                        waiting_d.callback(result)
+                return result
+
+            d.addBoth(resolve_waiting)
+
+        return d
+
+    def _coalesce_key(self, details, uri, action, options):
+        try:
+            if self._coalesce == self.COALESCE_AUTHID:
+                who = (
+                    details["authid"],
+                    details["authrole"],
+                    details["authmethod"],
+                    details["authprovider"],
+                    json.dumps(details["authextra"], sort_keys=True) if details["authextra"] else None,
+                )
+            else:
+                who = details["session"]
+            return who, uri, action, json.dumps(options, sort_keys=True) if options else None
+        except (TypeError, ValueError):
+            # options we can't build a key from: don't coalesce
+            return None
+
+    def _call_authorizer(self, session_details, details, uri, action, options):
+        self._calls += 1
         d = self._session.call(self._authorizer, details, uri, action, options)
 
         # we could do backwards-compatibility for clients that didn't
@@ -461,54 +716,42 @@ class RouterRoleDynamicAuth(RouterRole):
             return result
 
         d.addBoth(maybe_call_old_way)
+        d.addCallback(_check_authorization)
+        return d
 
-        def sanity_check(authorization):
-            """
-            Ensure the return-value we got from the user-supplied method makes sense
-            """
-            if isinstance(authorization, dict):
-                # check keys
-                for key in authorization.keys():
-                    if key not in ["allow", "cache", "disclose", "validate"]:
-                        return Failure(
-                            ValueError(
-                                "Authorizer returned unknown key '{key}'".format(
-                                    key=key,
-                                )
-                            )
-                        )
-                # must have "allow" key
-                if "allow" not in authorization:
-                    return Failure(ValueError("Authorizer must have 'allow' in returned dict"))
-                # check bool-valued keys
-                for key in ["allow", "cache", "disclose"]:
-                    if key in authorization:
-                        value = authorization[key]
-                        if not isinstance(value, bool):
-                            return Failure(ValueError("Authorizer must have bool for '{}'".format(key)))
-                # check dict-valued keys
-                for key in ["validate"]:
-                    if key in authorization:
-                        value = authorization[key]
-                        if value is not None and not isinstance(value, Mapping):
-                            return Failure(
-                                ValueError("Authorizer must have dict for '{}' (if present and not null)".format(key))
-                            )
-                return authorization
-
-            elif isinstance(authorization, bool):
-                return authorization
-
-            return Failure(
-                ValueError(
-                    "Authorizer returned unknown type '{name}'".format(
-                        name=type(authorization).__name__,
-                    )
-                )
-            )
+    def _flush_batch(self):
+        if self._batch_call is not None:
+            if self._batch_call.active():
+                self._batch_call.cancel()
+            self._batch_call = None
 
-        d.addCallback(sanity_check)
-        return d
+        while self._batch_queue:
+            batch = self._batch_queue[: self._batch_size]
+            del self._batch_queue[: self._batch_size]
+
+            self._calls += 1
+            d = self._session.call(self._authorizer, [request for request, _ in batch])
+
+            def on_authorizations(authorizations, batch=batch):
+                if not isinstance(authorizations, list) or len(authorizations) != len(batch):
+                    failure = Failure(
+                        ValueError("Batched authorizer must return a list of {} authorizations".format(len(batch)))
+                    )
+                    for _, waiting_d in batch:
+                        waiting_d.errback(failure)
+                    return
+                for authorization, (_, waiting_d) in zip(authorizations, batch):
+                    authorization = _check_authorization(authorization)
+                    if isinstance(authorization, Failure):
+                        waiting_d.errback(authorization)
+                    else:
+                        waiting_d.callback(authorization)
+
+            def on_error(failure, batch=batch):
+                for _, waiting_d in batch:
+                    waiting_d.errback(failure)
+
+            d.addCallbacks(on_authorizations, on_error)
 
 
 class RouterRoleLMDBAuth(RouterRole):
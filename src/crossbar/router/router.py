@@ -7,7 +7,7 @@
 
 import uuid
 from pprint import pformat
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set
 
 import txaio
 from autobahn.util import hlid, hltype, hlval
@@ -20,6 +20,7 @@ from xbr import FbsObject
 from crossbar.interfaces import IInventory, IRealmStore
 from crossbar.router import RouterOptions
 from crossbar.router.broker import Broker
+from crossbar.router.cache import LRUCache
 from crossbar.router.dealer import Dealer
 from crossbar.router.role import RouterRole, RouterRoleDynamicAuth, RouterRoleStaticAuth, RouterTrustedRole
 from crossbar.worker.types import RouterRealm
@@ -96,8 +97,10 @@ class Router(object):
         # map: authrole -> set(session)
         self._authrole_to_sessions: Dict[str, Set[ISession]] = {}
 
-        # map: (realm, authrole, uri, action) -> authorization
-        self._authorization_cache: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+        # LRU cache: (realm, authrole, uri, action) -> authorization
+        self._authorization_cache = LRUCache(
+            maxsize=self._options.authorization_cache_size, now=factory._reactor.seconds
+        )
 
         self._broker = self.broker(self, factory._reactor, self._options)
         self._dealer = self.dealer(self, factory._reactor, self._options)
@@ -128,6 +131,18 @@ class Router(object):
             "sessions": self._attached,
             # WAMP message routing statistics
             "messages": self._message_stats,
+            # serialize-once event fan-out statistics
+            "fanout": self._broker.fanout_stats(),
+            # call timeout timer statistics
+            "timers": self._dealer.timer_stats(),
+            # authorization cache statistics
+            "authorization_cache": self._authorization_cache.stats(),
+            # dynamic authorizer statistics (by role)
+            "authorizers": {
+                uri: role.stats() for uri, role in self._roles.items() if isinstance(role, RouterRoleDynamicAuth)
+            },
+            # realm store statistics (if the realm has a store)
+            "store": self._store.stats() if self._store else None,
         }
         if reset:
             self.reset_stats()
@@ -143,6 +158,8 @@ class Router(object):
             # number of WAMP messages (by type) received in total by the router
             "received": {},
         }
+        self._broker.reset_fanout_stats()
+        self._authorization_cache.reset_stats()
 
     @property
     def is_traced(self):
@@ -199,6 +216,8 @@ class Router(object):
         except KeyError:
             self._authid_to_sessions[session_details.authid] = set([session])
 
+        self._broker._receiver_index.set_auth(session, session_details.authid, session_details.authrole)
+
         if self._store:
             self._store.store_session_joined(session, session_details)
 
@@ -220,6 +239,8 @@ class Router(object):
             del self._authid_to_sessions[session_details.authid]
         self._authrole_to_sessions[session_details.authrole].discard(session)
 
+        self._broker._receiver_index.set_auth(session, None, None)
+
         if self._store:
             self._store.store_session_left(session, close_details)
 
@@ -289,12 +310,24 @@ class Router(object):
             return False
         return True
 
-    def send(self, session, msg):
+    def send(self, session, msg, fanout=None):
+        """
+        Send a WAMP message to a session attached to this router.
+
+        :param session: The receiving session.
+        :param msg: The WAMP message to send.
+        :param fanout: Optional serialize-once dispatcher for ``msg`` (used when the
+            same event is sent to many receivers).
+        :type fanout: :class:`crossbar.router.fanout.EventFanout` or None
+        """
         if self._check_trace(session, msg):
             self.log.info("<<TX<< {msg}", msg=msg)
 
         if session._transport:
-            session._transport.send(msg)
+            if fanout:
+                fanout.send(session._transport)
+            else:
+                session._transport.send(msg)
 
             if self._is_traced:
                 self._factory._worker._maybe_trace_tx_msg(session, msg)
@@ -396,6 +429,10 @@ class Router(object):
 
         self._roles[role.uri] = role
 
+        # authorizations cached from a previous role with the same URI are stale
+        if overwritten:
+            self._authorization_cache.invalidate(lambda key: key[1] == role.uri)
+
         return overwritten
 
     def drop_role(self, role):
@@ -414,6 +451,7 @@ class Router(object):
 
         if role.uri in self._roles:
             del self._roles[role.uri]
+            self._authorization_cache.invalidate(lambda key: key[1] == role.uri)
             return True
         else:
             return False
@@ -441,23 +479,24 @@ class Router(object):
 
         # normally, the role should exist on the router (and hence we should not arrive
         # here), but the role might have been dynamically removed - and anyway, safety first!
-        if authrole in self._roles:
+        role = self._roles.get(authrole, None)
+        if role is not None:
             if cached_authorization:
                 self.log.debug(
-                    "{func} authorization cache entry found key {cache_key}:\n{authorization}",
+                    "{func} authorization cache entry found key {cache_key}: {authorization}",
                     func=hltype(self.authorize),
                     cache_key=hlval(cache_key),
-                    authorization=pformat(cached_authorization),
+                    authorization=cached_authorization,
                 )
                 d = txaio.create_future_success(cached_authorization)
             else:
                 # the authorizer procedure of the role which we will call
-                authorize = self._roles[authrole].authorize
+                authorize = role.authorize
                 d = txaio.as_future(authorize, session, uri, action, options)
         else:
             # remove cache entry
             if cached_authorization:
-                del self._authorization_cache[cache_key]
+                self._authorization_cache.pop(cache_key)
 
             # outright deny, since the role isn't active anymore
             d = txaio.create_future_success(False)
@@ -476,15 +515,16 @@ class Router(object):
 
             auto_disclose_trusted = True
             if auto_disclose_trusted and authrole == "trusted" and action in ["call", "publish"]:
-                authorization["disclose"] = True
+                # authorizations may be shared (read-only) objects, so never modify in place
+                authorization = dict(authorization, disclose=True)
 
-            if not cached_authorization and authorization.get("cache", False):
-                self._authorization_cache[cache_key] = authorization
+            if not cached_authorization and authorization.get("cache", False) and role is not None:
+                self._authorization_cache.put(cache_key, authorization, ttl=role.cache_ttl)
                 self.log.debug(
-                    "{func} add authorization cache entry for key {cache_key}:\n{authorization}",
+                    "{func} add authorization cache entry for key {cache_key}: {authorization}",
                     func=hltype(got_authorization),
                     cache_key=hlval(cache_key),
-                    authorization=pformat(authorization),
+                    authorization=authorization,
                 )
 
             self.log.debug(
@@ -739,8 +779,17 @@ class RouterFactory(object):
         options = RouterOptions(
             uri_check=self._options.uri_check,
             event_dispatching_chunk_size=self._options.event_dispatching_chunk_size,
+            event_dispatching_serialize_once=self._options.event_dispatching_serialize_once,
+            invoke_policies=self._options.invoke_policies,
+            authorization_cache_size=self._options.authorization_cache_size,
         )
-        for arg in ["uri_check", "event_dispatching_chunk_size"]:
+        for arg in [
+            "uri_check",
+            "event_dispatching_chunk_size",
+            "event_dispatching_serialize_once",
+            "invoke_policies",
+            "authorization_cache_size",
+        ]:
             if arg in realm.config.get("options", {}):
                 setattr(options, arg, realm.config["options"][arg])
 
@@ -794,7 +843,15 @@ class RouterFactory(object):
         if "permissions" in config:
             role = RouterRoleStaticAuth(router, uri, config["permissions"])
         elif "authorizer" in config:
-            role = RouterRoleDynamicAuth(router, uri, config["authorizer"])
+            role = RouterRoleDynamicAuth(
+                router,
+                uri,
+                config["authorizer"],
+                batch=config.get("authorizer-batch", False),
+                batch_size=config.get("authorizer-batch-size", 100),
+                coalesce=config.get("authorizer-coalesce", None),
+                cache_ttl=config.get("authorizer-cache-ttl", None),
+            )
         else:
             allow_by_default = config.get("allow-by-default", False)
             role = RouterRole(router, uri, allow_by_default=allow_by_default)
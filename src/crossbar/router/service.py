@@ -25,6 +25,25 @@ from crossbar.router.router import Router
 __all__ = ("RouterServiceAgent",)
 
 
+def _registration_details(registration) -> Dict[str, Any]:
+    return {
+        "id": registration.id,
+        "created": registration.created,
+        "uri": registration.uri,
+        "match": registration.match,
+        "invoke": registration.extra.invoke,
+    }
+
+
+def _subscription_details(subscription) -> Dict[str, Any]:
+    return {
+        "id": subscription.id,
+        "created": subscription.created,
+        "uri": subscription.uri,
+        "match": subscription.match,
+    }
+
+
 def is_restricted_session(session: ISession):
     return session.authrole is None or session.authrole == "trusted"
 
@@ -631,14 +650,7 @@ class RouterServiceAgent(ApplicationSession):
                     message='not authorized to get registration for protected URI "{}"'.format(registration.uri),
                 )
 
-            registration_details = {
-                "id": registration.id,
-                "created": registration.created,
-                "uri": registration.uri,
-                "match": registration.match,
-                "invoke": registration.extra.invoke,
-            }
-            return registration_details
+            return _registration_details(registration)
         else:
             raise ApplicationError(
                 ApplicationError.NO_SUCH_REGISTRATION,
@@ -665,13 +677,7 @@ class RouterServiceAgent(ApplicationSession):
                     message='not authorized to get subscription for protected URI "{}"'.format(subscription.uri),
                 )
 
-            subscription_details = {
-                "id": subscription.id,
-                "created": subscription.created,
-                "uri": subscription.uri,
-                "match": subscription.match,
-            }
-            return subscription_details
+            return _subscription_details(subscription)
         else:
             raise ApplicationError(
                 ApplicationError.NO_SUCH_SUBSCRIPTION,
@@ -679,14 +685,25 @@ class RouterServiceAgent(ApplicationSession):
             )
 
     @wamp.register("wamp.registration.list")
-    def registration_list(self, session_id=None, details=None):
+    def registration_list(self, session_id=None, include_details=False, details=None):
         """
         List current registrations.
 
+        :param include_details: If ``True``, list the registration details (as returned by
+            ``wamp.registration.get``) rather than only the registration IDs.
+        :type include_details: bool
+
         :returns: A dictionary with three entries for the match policies 'exact', 'prefix'
-            and 'wildcard', with a list of registration IDs for each.
+            and 'wildcard', with a list of registration IDs (or details) for each.
         :rtype: dict
         """
+        if include_details:
+            get = _registration_details
+        else:
+
+            def get(registration):
+                return registration.id
+
         if session_id:
             s2r = self._router._dealer._session_to_registrations
             session = None
@@ -705,9 +722,9 @@ class RouterServiceAgent(ApplicationSession):
             _regs = s2r[session]
 
             regs = {
-                "exact": [reg.id for reg in _regs if reg.match == "exact"],
-                "prefix": [reg.id for reg in _regs if reg.match == "prefix"],
-                "wildcard": [reg.id for reg in _regs if reg.match == "wildcard"],
+                "exact": [get(reg) for reg in _regs if reg.match == "exact"],
+                "prefix": [get(reg) for reg in _regs if reg.match == "prefix"],
+                "wildcard": [get(reg) for reg in _regs if reg.match == "wildcard"],
             }
             return regs
 
@@ -717,17 +734,17 @@ class RouterServiceAgent(ApplicationSession):
             registrations_exact = []
             for registration in registration_map._observations_exact.values():
                 if not is_protected_uri(registration.uri, details):
-                    registrations_exact.append(registration.id)
+                    registrations_exact.append(get(registration))
 
             registrations_prefix = []
             for registration in registration_map._observations_prefix.values():
                 if not is_protected_uri(registration.uri, details):
-                    registrations_prefix.append(registration.id)
+                    registrations_prefix.append(get(registration))
 
             registrations_wildcard = []
             for registration in registration_map._observations_wildcard.values():
                 if not is_protected_uri(registration.uri, details):
-                    registrations_wildcard.append(registration.id)
+                    registrations_wildcard.append(get(registration))
 
             regs = {
                 "exact": registrations_exact,
@@ -738,14 +755,25 @@ class RouterServiceAgent(ApplicationSession):
             return regs
 
     @wamp.register("wamp.subscription.list")
-    def subscription_list(self, session_id=None, details=None):
+    def subscription_list(self, session_id=None, include_details=False, details=None):
         """
         List current subscriptions.
 
+        :param include_details: If ``True``, list the subscription details (as returned by
+            ``wamp.subscription.get``) rather than only the subscription IDs.
+        :type include_details: bool
+
         :returns: A dictionary with three entries for the match policies 'exact', 'prefix'
-            and 'wildcard', with a list of subscription IDs for each.
+            and 'wildcard', with a list of subscription IDs (or details) for each.
         :rtype: dict
         """
+        if include_details:
+            get = _subscription_details
+        else:
+
+            def get(subscription):
+                return subscription.id
+
         if session_id:
             s2s = self._router._broker._session_to_subscriptions
             session = None
@@ -764,9 +792,9 @@ class RouterServiceAgent(ApplicationSession):
             _subs = s2s[session]
 
             subs = {
-                "exact": [sub.id for sub in _subs if sub.match == "exact"],
-                "prefix": [sub.id for sub in _subs if sub.match == "prefix"],
-                "wildcard": [sub.id for sub in _subs if sub.match == "wildcard"],
+                "exact": [get(sub) for sub in _subs if sub.match == "exact"],
+                "prefix": [get(sub) for sub in _subs if sub.match == "prefix"],
+                "wildcard": [get(sub) for sub in _subs if sub.match == "wildcard"],
             }
             return subs
 
@@ -776,18 +804,17 @@ class RouterServiceAgent(ApplicationSession):
             subscriptions_exact = []
             for subscription in subscription_map._observations_exact.values():
                 if not is_protected_uri(subscription.uri, details):
-                    subscriptions_exact.append(subscription.id)
+                    subscriptions_exact.append(get(subscription))
 
             subscriptions_prefix = []
             for subscription in subscription_map._observations_prefix.values():
                 if not is_protected_uri(subscription.uri, details):
-                    subscriptions_prefix.append(subscription.id)
+                    subscriptions_prefix.append(get(subscription))
 
             subscriptions_wildcard = []
-            # FIXME
-            # for subscription in subscription_map._observations_wildcard.values():
-            #     if not is_protected_uri(subscription.uri, details):
-            #         subscriptions_wildcard.append(subscription.id)
+            for subscription in subscription_map._observations_wildcard.values():
+                if not is_protected_uri(subscription.uri, details):
+                    subscriptions_wildcard.append(get(subscription))
 
             subs = {
                 "exact": subscriptions_exact,
@@ -895,14 +922,20 @@ class RouterServiceAgent(ApplicationSession):
             return None
 
     @wamp.register("wamp.registration.list_callees")
-    def registration_list_callees(self, registration_id, details=None):
+    def registration_list_callees(self, registration_id, include_stats=False, details=None):
         """
         Retrieve list of callees (WAMP session IDs) registered on (attached to) a registration.
 
         :param registration_id: The ID of the registration to get callees for.
         :type registration_id: int
 
-        :returns: A list of WAMP session IDs of callees currently attached to the registration.
+        :param include_stats: If ``True``, return per-callee load and latency statistics
+            rather than plain session IDs.
+        :type include_stats: bool
+
+        :returns: A list of WAMP session IDs of callees currently attached to the registration
+            (or, with ``include_stats``, a list of dicts with the session ID, maximum and current
+            concurrency, number of calls and moving average of call round-trip times in ms).
         :rtype: list
         """
         registration = self._router._dealer._registration_map.get_observation_by_id(registration_id)
@@ -914,6 +947,23 @@ class RouterServiceAgent(ApplicationSession):
                     message='not authorized to list callees for protected URI "{}"'.format(registration.uri),
                 )
 
+            if include_stats:
+                callees = []
+                for callee in registration.observers:
+                    callee_extra = registration.observers_extra.get(callee, None)
+                    callees.append(
+                        {
+                            "session": callee._session_id,
+                            "concurrency": callee_extra.concurrency if callee_extra else None,
+                            "concurrency_current": callee_extra.concurrency_current if callee_extra else 0,
+                            "calls": callee_extra.rtt_samples if callee_extra else 0,
+                            "rtt_avg": round(callee_extra.rtt * 1000.0, 3)
+                            if callee_extra and callee_extra.rtt is not None
+                            else None,
+                        }
+                    )
+                return callees
+
             session_ids = []
             for callee in registration.observers:
                 session_ids.append(callee._session_id)
@@ -1008,7 +1058,7 @@ class RouterServiceAgent(ApplicationSession):
             )
 
     @wamp.register("wamp.subscription.get_events")
-    def subscription_get_events(self, subscription_id, limit=10, details=None):
+    def subscription_get_events(self, subscription_id, limit=10, before=None, details=None):
         """
         Return history of events for given subscription.
 
@@ -1016,6 +1066,9 @@ class RouterServiceAgent(ApplicationSession):
         :type subscription_id: int
         :param limit: Return at most this many events.
         :type limit: int
+        :param before: Cursor to get the next page of events: the publication ID of the
+            last (oldest) event returned in the previous page.
+        :type before: int or None
 
         :returns: List of events.
         :rtype: list
@@ -1039,7 +1092,7 @@ class RouterServiceAgent(ApplicationSession):
                     message='not authorized to retrieve event history for protected URI "{}"'.format(subscription.uri),
                 )
 
-            events = self._router._broker._event_store.get_events(subscription_id, limit)
+            events = self._router._broker._event_store.get_events(subscription_id, limit, before=before)
             if events is None:
                 # a return value of None in above signals that event history really
                 # is not available/enabled (which is different from an empty history!)
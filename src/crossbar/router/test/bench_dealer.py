@@ -0,0 +1,129 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+"""
+Benchmark the dealer with many concurrent invocations on the callees of a procedure.
+
+All calls are issued before any is answered, and the callees then yield the results
+in an order different from the invocation order. With bookkeeping of invocations that
+is not O(1) per message, the time per call grows with the number of invocations:
+
+    python -m crossbar.router.test.bench_dealer
+    python -m crossbar.router.test.bench_dealer --invocations 1000 10000 100000 --callees 4
+"""
+
+import argparse
+import random
+import time
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.wamp import message, role
+from mock import Mock
+from twisted.internet import defer
+
+from crossbar.router.router import RouterFactory
+from crossbar.worker.types import RouterRealm
+
+
+class _Session(object):
+    """
+    Lightweight session stand-in, recording the messages sent to it.
+    """
+
+    def __init__(self, session_id, roles):
+        self._session_id = session_id
+        self._realm = "realm1"
+        self._authid = "authid{}".format(session_id)
+        self._authrole = "bench"
+        self._session_roles = roles
+        self._transport = Mock()
+        self._transport.send = self.received_message
+        self.received = []
+
+    def received_message(self, msg):
+        self.received.append(msg)
+
+
+def _dealer():
+    router_factory = RouterFactory("node1", "router1", None)
+    router_factory.start_realm(RouterRealm(None, "realm-001", {"name": "realm1"}))
+    router = router_factory.get("realm1")
+    router.authorize = lambda *args, **kwargs: defer.succeed({"allow": True, "disclose": False})
+    return router._dealer
+
+
+def run(invocations, callees, callers, rounds):
+    """
+    Issue calls to a procedure registered by the callees, and yield their results, on a fresh dealer.
+
+    :returns: Tuple of (best time to issue the calls, best time to yield the results) in seconds.
+    :rtype: tuple
+    """
+    best_call = None
+    best_yield = None
+
+    for _ in range(rounds):
+        dealer = _dealer()
+        callee_sessions = [_Session(1 + i, {"callee": role.RoleCalleeFeatures()}) for i in range(callees)]
+        caller_sessions = [_Session(1000 + i, {"caller": role.RoleCallerFeatures()}) for i in range(callers)]
+        for session in callee_sessions + caller_sessions:
+            dealer.attach(session)
+        for callee in callee_sessions:
+            dealer.processRegister(callee, message.Register(1, "com.example.proc", invoke="roundrobin"))
+            callee.received.clear()
+
+        started = time.perf_counter()
+        for i in range(invocations):
+            dealer.processCall(caller_sessions[i % callers], message.Call(1 + i, "com.example.proc", [i]))
+        call_elapsed = time.perf_counter() - started
+
+        answers = [(callee, invocation) for callee in callee_sessions for invocation in callee.received]
+        random.Random(1).shuffle(answers)
+
+        started = time.perf_counter()
+        for callee, invocation in answers:
+            dealer.processYield(callee, message.Yield(invocation.request, args=invocation.args))
+        yield_elapsed = time.perf_counter() - started
+
+        assert sum(len(caller.received) for caller in caller_sessions) == invocations
+
+        if best_call is None or call_elapsed < best_call:
+            best_call = call_elapsed
+        if best_yield is None or yield_elapsed < best_yield:
+            best_yield = yield_elapsed
+
+    return best_call, best_yield
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dealer with many concurrent invocations.")
+    parser.add_argument(
+        "--invocations", type=int, nargs="+", default=[10000], help="Concurrent invocations (one run each)"
+    )
+    parser.add_argument("--callees", type=int, default=1, help="Callees registered on the procedure")
+    parser.add_argument("--callers", type=int, default=10, help="Callers issuing the calls")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per measurement (best is reported)")
+    args = parser.parse_args()
+
+    for invocations in args.invocations:
+        call_elapsed, yield_elapsed = run(invocations, args.callees, args.callers, args.rounds)
+        print(
+            "{:>9} invocations {:>3} callees  call {:>9.2f} ms {:>6.2f} us/call  yield {:>9.2f} ms {:>6.2f} us/yield".format(
+                invocations,
+                args.callees,
+                call_elapsed * 1000.0,
+                call_elapsed / invocations * 1000000.0,
+                yield_elapsed * 1000.0,
+                yield_elapsed / invocations * 1000000.0,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
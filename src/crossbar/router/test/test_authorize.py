@@ -12,10 +12,16 @@ from twisted.trial import unittest
 txaio.use_twisted()  # noqa
 
 from autobahn.wamp import types
+from autobahn.wamp.exception import ApplicationError
 from mock import Mock
 
-from crossbar.router.auth import anonymous, cryptosign, ticket, tls, wampcra
-from crossbar.router.role import RouterRoleStaticAuth
+from crossbar.router.auth import anonymous, cryptosign, pending, ticket, tls, wampcra
+from crossbar.router.role import (
+    RouterPermissions,
+    RouterPermissionsMatcher,
+    RouterRoleDynamicAuth,
+    RouterRoleStaticAuth,
+)
 
 
 class MockRealmContainer(object):
@@ -318,6 +324,137 @@ class TestDynamicAuth(unittest.TestCase):
         self.assertEqual(acc.authid, "alice")
 
 
+class TestAuthenticationCache(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(pending._authentication_caches.clear)
+        self.session = Mock()
+        self.session.call = Mock(side_effect=self._authenticate)
+        self.realm_container = MockRealmContainer("realm", ["some_role", "myauth_role"], self.session)
+        self.config = {
+            "type": "dynamic",
+            "authenticator": "foo.auth_a_doodle",
+            "authenticator-realm": "realm",
+            "authenticator-role": "myauth_role",
+            "authenticator-cache-ttl": 60,
+        }
+
+    def _authenticate(self, method, realm, authid, details):
+        if details["authmethod"] == "ticket" and details["ticket"] != "secret-ticket":
+            return defer.fail(ApplicationError("com.example.invalid_ticket", "invalid ticket"))
+        return defer.succeed({"secret": "secret", "role": "some_role"})
+
+    def _details(self, authid="alice", authrole=None, authextra=None):
+        details = Mock()
+        details.authid = authid
+        details.authrole = authrole
+        details.authextra = authextra
+        return details
+
+    @defer.inlineCallbacks
+    def _ticket(self, signature, authid="alice", config=None, authrole=None, authextra=None):
+        auth = ticket.PendingAuthTicket(1, types.TransportDetails(), self.realm_container, config or self.config)
+        val = yield auth.hello("realm", self._details(authid, authrole, authextra))
+        self.assertTrue(isinstance(val, types.Challenge))
+        val = yield auth.authenticate(signature)
+        return val
+
+    @defer.inlineCallbacks
+    def test_ticket_cached(self):
+        val = yield self._ticket("secret-ticket")
+        self.assertTrue(isinstance(val, types.Accept))
+        self.assertEqual(self.session.call.call_count, 1)
+
+        # the authenticator is not called again for the same ticket
+        val = yield self._ticket("secret-ticket")
+        self.assertTrue(isinstance(val, types.Accept))
+        self.assertEqual(val.authid, "alice")
+        self.assertEqual(val.authrole, "some_role")
+        self.assertEqual(self.session.call.call_count, 1)
+
+        # .. but for a different authid or ticket
+        val = yield self._ticket("secret-ticket", authid="bob")
+        self.assertTrue(isinstance(val, types.Accept))
+        self.assertEqual(self.session.call.call_count, 2)
+
+        for _ in range(2):
+            val = yield self._ticket("wrong-ticket")
+            self.assertTrue(isinstance(val, types.Deny))
+        # failed authentications are never cached
+        self.assertEqual(self.session.call.call_count, 4)
+
+        stats = pending.authentication_cache_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["authmethod"], "ticket")
+        self.assertEqual(stats[0]["authenticator"], "foo.auth_a_doodle")
+        self.assertEqual(stats[0]["size"], 2)
+        self.assertEqual(stats[0]["hits"], 1)
+        self.assertEqual(stats[0]["misses"], 4)
+
+    @defer.inlineCallbacks
+    def test_ticket_requested_role(self):
+        yield self._ticket("secret-ticket")
+        # the authenticator decides on the requested authrole and authextra, so these are part of the key
+        yield self._ticket("secret-ticket", authrole="some_role")
+        yield self._ticket("secret-ticket", authextra={"foo": 23})
+        self.assertEqual(self.session.call.call_count, 3)
+        yield self._ticket("secret-ticket", authrole="some_role")
+        self.assertEqual(self.session.call.call_count, 3)
+
+    @defer.inlineCallbacks
+    def test_released(self):
+        transport_config = {"type": "websocket", "auth": {"ticket": self.config}}
+        yield self._ticket("secret-ticket")
+        self.assertEqual(pending.release_authentication_caches({"auth": {"ticket": dict(self.config)}}), 0)
+        self.assertEqual(pending.release_authentication_caches(transport_config), 1)
+        self.assertEqual(pending.authentication_cache_stats(), [])
+
+    @defer.inlineCallbacks
+    def test_ticket_expired(self):
+        yield self._ticket("secret-ticket")
+        cache = pending._authentication_cache("ticket", self.config)
+        cache._cache._now = lambda: float("inf")
+        val = yield self._ticket("secret-ticket")
+        self.assertTrue(isinstance(val, types.Accept))
+        self.assertEqual(self.session.call.call_count, 2)
+
+    @defer.inlineCallbacks
+    def test_not_enabled(self):
+        del self.config["authenticator-cache-ttl"]
+        for _ in range(2):
+            val = yield self._ticket("secret-ticket")
+            self.assertTrue(isinstance(val, types.Accept))
+        self.assertEqual(self.session.call.call_count, 2)
+        self.assertEqual(pending.authentication_cache_stats(), [])
+
+    @defer.inlineCallbacks
+    def test_per_transport(self):
+        yield self._ticket("secret-ticket")
+        yield self._ticket("secret-ticket", config=dict(self.config))
+        self.assertEqual(self.session.call.call_count, 2)
+        self.assertEqual(len(pending.authentication_cache_stats()), 2)
+
+    @defer.inlineCallbacks
+    def test_wampcra_cached(self):
+        auth = wampcra.PendingAuthWampCra(1, types.TransportDetails(), self.realm_container, self.config)
+        val = yield auth.hello("realm", self._details())
+        self.assertTrue(isinstance(val, types.Challenge))
+
+        # the principal is only cached when the signature is valid
+        self.assertTrue(isinstance(auth.authenticate("bogus"), types.Deny))
+        auth = wampcra.PendingAuthWampCra(1, types.TransportDetails(), self.realm_container, self.config)
+        yield auth.hello("realm", self._details())
+        self.assertTrue(isinstance(auth.authenticate(auth._signature), types.Accept))
+        self.assertEqual(self.session.call.call_count, 2)
+
+        # the cached principal is used to compute a fresh challenge
+        auth = wampcra.PendingAuthWampCra(1, types.TransportDetails(), self.realm_container, self.config)
+        val = yield auth.hello("realm", self._details())
+        self.assertTrue(isinstance(val, types.Challenge))
+        self.assertEqual(self.session.call.call_count, 2)
+        self.assertTrue(isinstance(auth.authenticate("bogus"), types.Deny))
+        self.assertTrue(isinstance(auth.authenticate(auth._signature), types.Accept))
+
+
 class TestRouterRoleStaticAuth(unittest.TestCase):
     def test_ruleset_empty(self):
         permissions = []
@@ -394,3 +531,160 @@ class TestRouterRoleStaticAuthWild(unittest.TestCase):
         self.assertEqual(False, self.role.authorize(None, "com.whatever", "call", {})["allow"])
         self.assertEqual(False, self.role.authorize(None, "com.whatever", "register", {})["allow"])
         self.assertEqual(True, self.role.authorize(None, "com.whatever", "publish", {})["allow"])
+
+
+class TestRouterPermissionsMatcher(unittest.TestCase):
+    def _matcher(self, *rules):
+        permissions = [RouterPermissions.from_dict({"uri": uri, "match": match}) for uri, match in rules]
+        default = RouterPermissions(None, None)
+        return RouterPermissionsMatcher(permissions, default), permissions, default
+
+    def test_longest_prefix(self):
+        matcher, perms, default = self._matcher(
+            ("com.", "prefix"), ("com.example.", "prefix"), ("com.example.foo", "exact"), ("", "prefix")
+        )
+        self.assertIs(matcher.match("com.example.foo"), perms[2])
+        self.assertIs(matcher.match("com.example.bar"), perms[1])
+        # an exact permission shadows (shorter) prefix permissions
+        self.assertIs(matcher.match("com.example.foobar"), default)
+        self.assertIs(matcher.match("com.example.foo.bar"), default)
+        self.assertIs(matcher.match("com.other"), perms[0])
+        self.assertIs(matcher.match("org.other"), perms[3])
+
+        matcher, _, default = self._matcher(("com.", "prefix"))
+        self.assertIs(matcher.match("org.other"), default)
+
+    def test_exact_deny_under_prefix_allow(self):
+        role = RouterRoleStaticAuth(
+            None,
+            "testrole",
+            [
+                {"uri": "com.example.", "match": "prefix", "allow": {"call": True}},
+                {"uri": "com.example.secret", "match": "exact", "allow": {"call": False}},
+            ],
+        )
+        self.assertEqual(True, role.authorize(None, "com.example.proc", "call", {})["allow"])
+        self.assertEqual(False, role.authorize(None, "com.example.secret", "call", {})["allow"])
+        self.assertEqual(False, role.authorize(None, "com.example.secret.proc", "call", {})["allow"])
+
+    def test_wildcards(self):
+        matcher, perms, default = self._matcher(
+            ("com..private", "wildcard"),
+            ("com..public", "wildcard"),
+            ("com.example..private", "wildcard"),
+            ("com.", "prefix"),
+        )
+        self.assertIs(matcher.match("com.foo.private"), perms[0])
+        self.assertIs(matcher.match("com.foo.public"), perms[1])
+        # the longest literal prefix wins
+        self.assertIs(matcher.match("com.example.foo.private"), perms[2])
+        self.assertIs(matcher.match("com.foo.bar.private"), perms[3])
+        self.assertIs(matcher.match("org.foo.private"), default)
+
+    def test_shared_authorizations(self):
+        role = RouterRoleStaticAuth(
+            None, "testrole", [{"uri": "com.example.", "match": "prefix", "allow": {"call": True}}]
+        )
+        authorization = role.authorize(None, "com.example.proc1", "call", {})
+        self.assertIs(role.authorize(None, "com.example.proc2", "call", {}), authorization)
+        self.assertEqual(authorization, {"allow": True, "disclose": False, "cache": False, "validate": None})
+        with self.assertRaises(TypeError):
+            authorization["allow"] = False
+
+
+class _FakeSession(object):
+    _session_details = None
+
+    def __init__(self, session_id, authid):
+        self._session_id = session_id
+        self._authid = authid
+        self._authrole = "user"
+        self._authmethod = "anonymous"
+        self._authprovider = "static"
+        self._authextra = None
+
+
+class TestRouterRoleDynamicAuth(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.service_session = Mock()
+        self.service_session.call = Mock(side_effect=self._call)
+        router = Mock()
+        router._realm.session = self.service_session
+        self.router = router
+
+    def _call(self, procedure, *args):
+        d = defer.Deferred()
+        self.calls.append((procedure, args, d))
+        return d
+
+    def _authorize(self, role, session, uri, action="subscribe"):
+        results = []
+        role.authorize(session, uri, action, {}).addBoth(results.append)
+        return results
+
+    def test_coalesce_session(self):
+        role = RouterRoleDynamicAuth(self.router, "user", "com.example.authorize", coalesce="session")
+        session1, session2 = _FakeSession(1, "alice"), _FakeSession(2, "alice")
+
+        results = [self._authorize(role, session1, "com.example.topic1") for _ in range(3)]
+        other = self._authorize(role, session2, "com.example.topic1")
+        self.assertEqual(len(self.calls), 2)
+
+        authorization = {"allow": True, "cache": True}
+        self.calls[0][2].callback(authorization)
+        self.assertEqual(results, [[authorization]] * 3)
+        self.assertEqual(other, [])
+
+        self.assertEqual(role.stats(), {"requests": 4, "coalesced": 2, "calls": 2, "pending": 1})
+
+        # once answered, a new request calls the authorizer again
+        self._authorize(role, session1, "com.example.topic1")
+        self.assertEqual(len(self.calls), 3)
+
+    def test_coalesce_authid(self):
+        # coalescing by authid is the default
+        role = RouterRoleDynamicAuth(self.router, "user", "com.example.authorize")
+        results = [self._authorize(role, _FakeSession(i, "alice"), "com.example.topic1") for i in range(5)]
+        self._authorize(role, _FakeSession(10, "bob"), "com.example.topic1")
+        self.assertEqual(len(self.calls), 2)
+
+        # sessions with the same authid but different authentication details are not coalesced
+        session = _FakeSession(11, "alice")
+        session._authextra = {"tenant": "other"}
+        self._authorize(role, session, "com.example.topic1")
+        self.assertEqual(len(self.calls), 3)
+
+        self.calls[0][2].errback(RuntimeError("authorizer failed"))
+        for result in results:
+            self.assertIsInstance(result[0].value, RuntimeError)
+
+    def test_invalid_authorization(self):
+        role = RouterRoleDynamicAuth(self.router, "user", "com.example.authorize")
+        results = [self._authorize(role, _FakeSession(1, "alice"), "com.example.topic1") for _ in range(2)]
+        self.calls[0][2].callback({"allow": True, "foo": 1})
+        for result in results:
+            self.assertIsInstance(result[0].value, ValueError)
+
+    def test_batch(self):
+        role = RouterRoleDynamicAuth(self.router, "user", "com.example.authorize_many", batch=True, batch_size=2)
+        sessions = [_FakeSession(i, "user{}".format(i)) for i in range(3)]
+
+        results = [self._authorize(role, session, "com.example.topic1") for session in sessions]
+        # a full batch is sent right away
+        self.assertEqual(len(self.calls), 1)
+        procedure, args, d = self.calls[0]
+        self.assertEqual(procedure, "com.example.authorize_many")
+        self.assertEqual([request[0]["session"] for request in args[0]], [0, 1])
+        self.assertEqual([request[1:] for request in args[0]], [["com.example.topic1", "subscribe", {}]] * 2)
+
+        # .. the rest when the reactor comes around
+        role._flush_batch()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(self.calls[1][1][0]), 1)
+
+        d.callback([True, {"allow": False}])
+        self.assertEqual(results[:2], [[True], [{"allow": False}]])
+
+        self.calls[1][2].callback([True, True])
+        self.assertIsInstance(results[2][0].value, ValueError)
@@ -7,12 +7,16 @@
 
 import mock
 import txaio
+from autobahn.twisted.rawsocket import WampRawSocketServerProtocol
 from autobahn.twisted.wamp import ApplicationSession
 from autobahn.wamp import message, role, types
+from autobahn.wamp.serializer import JsonSerializer
 from autobahn.wamp.types import TransportDetails
 from twisted.internet import defer, reactor
+from twisted.internet.testing import StringTransport
 from twisted.trial import unittest
 
+from crossbar.router import RouterOptions
 from crossbar.router.broker import Broker
 from crossbar.router.role import RouterRoleStaticAuth
 from crossbar.router.router import Router, RouterFactory
@@ -456,6 +460,93 @@ class TestBrokerPublish(unittest.TestCase):
         self.assertFalse(events[0].correlation_is_last)
         self.assertTrue(events[1].correlation_is_last)
 
+    def test_publish_serialize_once(self):
+        """
+        in serialize-once mode, the event is serialized and framed only
+        once for all receivers using the same serializer and framing
+        """
+
+        class TestSession(ApplicationSession):
+            pass
+
+        router = mock.MagicMock()
+        router.is_traced = False
+        router.send = lambda session, msg, fanout=None: fanout.send(session._transport)
+        router.authorize = mock.MagicMock(
+            return_value=txaio.create_future_success(dict(allow=True, cache=False, disclose=False))
+        )
+        broker = Broker(router, reactor, RouterOptions(event_dispatching_serialize_once=True))
+
+        publisher = TestSession()
+        publisher._session_id = 1000
+        publisher._transport = mock.MagicMock()
+
+        receivers = []
+        for i in range(3):
+            session = TestSession()
+            session._session_id = 1001 + i
+            session._transport = WampRawSocketServerProtocol()
+            session._transport._session = session
+            session._transport._serializer = JsonSerializer()
+            session._transport._max_len_send = 2**24
+            session._transport.transport = StringTransport()
+            broker._subscription_map.add_observer(session, "test.topic")
+            receivers.append(session)
+
+        broker.processPublish(publisher, message.Publish(123, "test.topic", args=["hello"]))
+
+        frames = [session._transport.transport.value() for session in receivers]
+        self.assertTrue(frames[0])
+        self.assertEqual(frames, [frames[0]] * 3)
+
+        stats = broker.fanout_stats()
+        self.assertEqual(stats["events"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["fallbacks"], 0)
+
+    def test_publish_store_overloaded(self):
+        """
+        when the event store is overloaded, acknowledged publications are rejected,
+        whereas other publications are dispatched without being persisted
+        """
+
+        class TestSession(ApplicationSession):
+            pass
+
+        router = mock.MagicMock()
+        router.is_traced = False
+        router.authorize = mock.MagicMock(
+            side_effect=lambda *args, **kwargs: txaio.create_future_success(
+                dict(allow=True, cache=False, disclose=False)
+            )
+        )
+        router._store.store_event = mock.Mock(return_value=False)
+        broker = Broker(router, reactor, RouterOptions())
+        broker._subscription_map.add_observer(router._store, "test.topic")
+
+        publisher = TestSession()
+        publisher._session_id = 1000
+        publisher._transport = mock.MagicMock()
+        receiver = TestSession()
+        receiver._session_id = 1001
+        receiver._transport = mock.MagicMock()
+        broker._subscription_map.add_observer(receiver, "test.topic")
+
+        broker.processPublish(publisher, message.Publish(1, "test.topic", args=["hello"], acknowledge=True))
+        self.assertEqual(router.send.call_count, 1)
+        session, reply = router.send.call_args[0][:2]
+        self.assertIs(session, publisher)
+        self.assertIsInstance(reply, message.Error)
+        self.assertEqual(reply.error, "crossbar.error.store_overloaded")
+
+        router.send.reset_mock()
+        broker.processPublish(publisher, message.Publish(2, "test.topic", args=["hello"]))
+        sent = [call[0][:2] for call in router.send.call_args_list]
+        self.assertEqual([session for session, _ in sent], [receiver])
+        self.assertIsInstance(sent[0][1], message.Event)
+        self.assertEqual(router._store.store_event_history.call_count, 0)
+
     def test_publish_traced_events_batched(self):
         """
         with two subscribers and message tracing the last event should
@@ -0,0 +1,71 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from crossbar.router.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=3)
+        for key in "abc":
+            cache.put(key, key.upper())
+
+        # touch "a", so that "b" is the least recently used
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("d", "D")
+
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=10)
+        cache.put(1, "x")
+        cache.get(1)
+        cache.get(1)
+        cache.get(1)
+        self.assertIsNone(cache.get(2))
+
+        stats = cache.stats()
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["maxsize"], 10)
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.75)
+
+        cache.reset_stats()
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(cache.stats()["hit_rate"], 0.0)
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        for i in range(10):
+            cache.put(("role{}".format(i % 2), i), i)
+        self.assertEqual(cache.invalidate(lambda key: key[0] == "role1"), 5)
+        self.assertEqual(len(cache), 5)
+        self.assertEqual(cache.pop(("role0", 0)), 0)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = LRUCache(now=clock.seconds)
+        cache.put("a", 1, ttl=10)
+        cache.put("b", 2)
+
+        clock.advance(9)
+        self.assertEqual(cache.get("a"), 1)
+        clock.advance(1)
+        self.assertIsNone(cache.get("a"))
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.stats()["expirations"], 1)
@@ -5,16 +5,24 @@
 #
 #####################################################################################
 
+import random
+
 import mock
 from autobahn.twisted.wamp import ApplicationSession
 from autobahn.wamp import message, role
 from autobahn.wamp.exception import ProtocolError
+from autobahn.wamp.types import ComponentConfig
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial import unittest
 
+from crossbar.router.dealer import INVOKE_FASTEST, INVOKE_LEAST_LOADED
+from crossbar.router.realmstore import RealmStoreMemory
 from crossbar.router.role import RouterRoleStaticAuth
 from crossbar.router.router import RouterFactory
+from crossbar.router.service import RouterServiceAgent
 from crossbar.router.session import RouterApplicationSession, RouterSessionFactory
+from crossbar.router.timerwheel import TimerWheel
 from crossbar.worker.types import RouterRealm
 
 
@@ -115,8 +123,8 @@ class TestDealer(unittest.TestCase):
         dealer.attach(session)
 
         # All four maps involved in invocation tracking must be updated atomically
-        dealer._caller_to_invocations[outstanding.caller] = [outstanding]
-        dealer._callee_to_invocations[session] = [outstanding]
+        dealer._caller_to_invocations[outstanding.caller] = {outstanding.id: outstanding}
+        dealer._callee_to_invocations[session] = {outstanding.id: outstanding}
         dealer._invocations[outstanding.id] = outstanding
         dealer._invocations_by_call[(outstanding.caller_session_id, outstanding.call.request)] = outstanding
         # pretend we've disconnected already
@@ -711,7 +719,7 @@ class TestDealer(unittest.TestCase):
             "Invocation should be removed from _invocations after caller detach")
         
         # The callee_to_invocations entry should either be removed or empty
-        callee_invocations = dealer._callee_to_invocations.get(callee_session, [])
+        callee_invocations = dealer._callee_to_invocations.get(callee_session, {})
         self.assertEqual(len(callee_invocations), 0,
             "Invocation should be removed from _callee_to_invocations after caller detach")
         
@@ -808,3 +816,430 @@ class TestDealer(unittest.TestCase):
         result_msg = caller_messages[-1]
         self.assertIsInstance(result_msg, message.Result)
         self.assertEqual(result_msg.args, ["a result"])
+
+
+class _BenchSession(object):
+    """
+    Lightweight session stand-in, recording the messages sent to it.
+    """
+
+    def __init__(self, session_id, roles):
+        self._session_id = session_id
+        self._realm = "realm1"
+        self._authid = "authid{}".format(session_id)
+        self._authrole = "test_role"
+        self._session_roles = roles
+        self._transport = mock.Mock()
+        self._transport.send = self._on_message
+        self.received = []
+
+    def _on_message(self, msg):
+        self.received.append(msg)
+
+
+class TestDealerManyInvocations(unittest.TestCase):
+    """
+    Many concurrent invocations on a single callee, answered out of order.
+
+    See ``bench_dealer.py`` for timing the dealer with this workload.
+    """
+
+    INVOCATIONS = 1000
+
+    def setUp(self):
+        self.router_factory = RouterFactory("node1", "router1", None)
+        self.router_factory.start_realm(RouterRealm(None, "realm-001", {"name": "realm1"}))
+        self.router = self.router_factory.get("realm1")
+        self.router.authorize = lambda *args, **kwargs: defer.succeed({"allow": True, "disclose": False})
+
+    def test_concurrent_invocations_one_callee(self):
+        dealer = self.router._dealer
+
+        callee = _BenchSession(1, {"callee": role.RoleCalleeFeatures()})
+        callers = [_BenchSession(100 + i, {"caller": role.RoleCallerFeatures()}) for i in range(10)]
+        for session in [callee] + callers:
+            dealer.attach(session)
+
+        dealer.processRegister(callee, message.Register(1, "com.example.proc"))
+        self.assertIsInstance(callee.received[-1], message.Registered)
+
+        for i in range(self.INVOCATIONS):
+            dealer.processCall(callers[i % len(callers)], message.Call(1000 + i, "com.example.proc", [i]))
+        invocations = callee.received[1:]
+        self.assertEqual(len(invocations), self.INVOCATIONS)
+        self.assertEqual(len(dealer._callee_to_invocations[callee]), self.INVOCATIONS)
+
+        # yield in an order different from the invocation order
+        random.Random(1).shuffle(invocations)
+        for invocation in invocations:
+            dealer.processYield(callee, message.Yield(invocation.request, args=invocation.args))
+
+        # every caller got the results of its calls
+        for n, caller in enumerate(callers):
+            self.assertEqual([result.args[0] % len(callers) for result in caller.received], [n] * len(caller.received))
+        self.assertEqual(sum(len(caller.received) for caller in callers), self.INVOCATIONS)
+        self.assertNotIn(callee, dealer._callee_to_invocations)
+        self.assertEqual(dealer._caller_to_invocations, {})
+        self.assertEqual(dealer._invocations, {})
+        self.assertEqual(dealer._invocations_by_call, {})
+
+
+class TestDealerInvokePolicies(unittest.TestCase):
+    """
+    Router-side ``least_loaded`` and ``fastest`` invocation policies.
+    """
+
+    def setUp(self):
+        self.router_factory = RouterFactory("node1", "router1", None)
+        self.router_factory.start_realm(
+            RouterRealm(
+                None,
+                "realm-001",
+                {
+                    "name": "realm1",
+                    "options": {
+                        "invoke_policies": [
+                            {"uri": "com.example.loaded.", "match": "prefix", "invoke": INVOKE_LEAST_LOADED},
+                            {"uri": "com.example.fast", "invoke": INVOKE_FASTEST},
+                        ]
+                    },
+                },
+            )
+        )
+        self.router = self.router_factory.get("realm1")
+        self.router.authorize = lambda *args, **kwargs: defer.succeed({"allow": True, "disclose": False})
+        self.dealer = self.router._dealer
+        self.clock = Clock()
+        self.dealer._reactor = self.clock
+        self.dealer._cancel_timers = TimerWheel(self.clock)
+
+        self.caller = _BenchSession(100, {"caller": role.RoleCallerFeatures()})
+        self.dealer.attach(self.caller)
+        self.request = 1000
+
+    def _register(self, procedure, count, invoke=message.Register.INVOKE_ROUNDROBIN, concurrency=None):
+        callees = []
+        for i in range(count):
+            callee = _BenchSession(1 + i, {"callee": role.RoleCalleeFeatures()})
+            self.dealer.attach(callee)
+            self.dealer.processRegister(callee, message.Register(1, procedure, invoke=invoke, concurrency=concurrency))
+            self.assertIsInstance(callee.received.pop(), message.Registered)
+            callees.append(callee)
+        return callees
+
+    def _call(self, procedure):
+        self.request += 1
+        self.dealer.processCall(self.caller, message.Call(self.request, procedure, []))
+
+    def _yield(self, callee, invocation):
+        callee.received.remove(invocation)
+        self.dealer.processYield(callee, message.Yield(invocation.request))
+
+    def test_policy_applied(self):
+        self._register("com.example.loaded.proc", 1)
+        self._register("com.example.other", 1)
+        self._register("com.example.single", 1, invoke=message.Register.INVOKE_SINGLE)
+
+        def invoke(uri):
+            return self.dealer._registration_map.get_observation(uri).extra.invoke
+
+        self.assertEqual(invoke("com.example.loaded.proc"), INVOKE_LEAST_LOADED)
+        self.assertEqual(invoke("com.example.other"), message.Register.INVOKE_ROUNDROBIN)
+        self.assertEqual(invoke("com.example.single"), message.Register.INVOKE_SINGLE)
+
+    def test_least_loaded(self):
+        callees = self._register("com.example.loaded.proc", 3)
+
+        for _ in range(3):
+            self._call("com.example.loaded.proc")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1, 1])
+
+        # the callee which answered is the least loaded now
+        self._yield(callees[1], callees[1].received[0])
+        self._call("com.example.loaded.proc")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1, 1])
+        self._call("com.example.loaded.proc")
+        self.assertEqual(sum(len(callee.received) for callee in callees), 4)
+
+        # all invocations answered: load accounting is back to zero
+        for callee in callees:
+            for invocation in list(callee.received):
+                self._yield(callee, invocation)
+        registration = self.dealer._registration_map.get_observation("com.example.loaded.proc")
+        for callee in callees:
+            self.assertEqual(registration.observers_extra[callee].concurrency_current, 0)
+
+    def test_least_loaded_max_concurrency(self):
+        callees = self._register("com.example.loaded.proc", 2, concurrency=1)
+
+        self._call("com.example.loaded.proc")
+        self._call("com.example.loaded.proc")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1])
+
+        # no callee has concurrency left
+        self._call("com.example.loaded.proc")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1])
+        error = self.caller.received.pop()
+        self.assertIsInstance(error, message.Error)
+        self.assertEqual(error.error, "crossbar.error.max_concurrency_reached")
+
+    def test_random_max_concurrency(self):
+        """
+        ``random`` skips callees which have their maximum concurrency reached.
+        """
+        callees = self._register("com.example.random", 3, invoke=message.Register.INVOKE_RANDOM, concurrency=1)
+
+        for _ in range(3):
+            self._call("com.example.random")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1, 1])
+
+        # no callee has concurrency left
+        self._call("com.example.random")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1, 1])
+        error = self.caller.received.pop()
+        self.assertIsInstance(error, message.Error)
+        self.assertEqual(error.error, "crossbar.error.max_concurrency_reached")
+
+        # an answered invocation frees the callee again
+        self._yield(callees[2], callees[2].received[0])
+        self._call("com.example.random")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1, 1])
+
+    def test_timeout_releases_concurrency(self):
+        callees = self._register("com.example.loaded.proc", 1, concurrency=1)
+        registration = self.dealer._registration_map.get_observation("com.example.loaded.proc")
+
+        self.request += 1
+        self.dealer.processCall(self.caller, message.Call(self.request, "com.example.loaded.proc", [], timeout=1))
+        self.assertEqual(registration.observers_extra[callees[0]].concurrency_current, 1)
+
+        self.clock.advance(2)
+        self.assertEqual(self.dealer._invocations, {})
+        self.assertEqual(registration.observers_extra[callees[0]].concurrency_current, 0)
+
+    def test_fastest(self):
+        callees = self._register("com.example.fast", 2)
+        registration = self.dealer._registration_map.get_observation("com.example.fast")
+        self.assertEqual(registration.extra.invoke, INVOKE_FASTEST)
+
+        # callees without round-trip times are tried first
+        self._call("com.example.fast")
+        self._call("com.example.fast")
+        self.assertEqual([len(callee.received) for callee in callees], [1, 1])
+
+        self.clock.advance(0.1)
+        self._yield(callees[0], callees[0].received[0])
+        self.clock.advance(0.9)
+        self._yield(callees[1], callees[1].received[0])
+
+        self.assertAlmostEqual(registration.observers_extra[callees[0]].rtt, 0.1)
+        self.assertAlmostEqual(registration.observers_extra[callees[1]].rtt, 1.0)
+
+        # the faster callee gets calls until its expected latency exceeds the slower one's
+        for _ in range(10):
+            self._call("com.example.fast")
+        self.assertEqual([len(callee.received) for callee in callees], [9, 1])
+
+    def test_fastest_new_callee(self):
+        callees = self._register("com.example.fast", 2)
+        for callee in callees:
+            self._call("com.example.fast")
+        self.clock.advance(0.5)
+        for callee in callees:
+            self._yield(callee, callee.received[0])
+
+        # a callee joining later has no round-trip times yet: it is assumed to be as fast as
+        # the others, and does not get every call
+        callee = _BenchSession(10, {"callee": role.RoleCalleeFeatures()})
+        self.dealer.attach(callee)
+        self.dealer.processRegister(
+            callee, message.Register(1, "com.example.fast", invoke=message.Register.INVOKE_ROUNDROBIN)
+        )
+        self.assertIsInstance(callee.received.pop(), message.Registered)
+        callees.append(callee)
+
+        for _ in range(9):
+            self._call("com.example.fast")
+        self.assertEqual([len(callee.received) for callee in callees], [3, 3, 3])
+
+    def test_list_callees_stats(self):
+        callees = self._register("com.example.fast", 2, concurrency=5)
+        registration = self.dealer._registration_map.get_observation("com.example.fast")
+
+        self._call("com.example.fast")
+        self._call("com.example.fast")
+        self.clock.advance(0.25)
+        self._yield(callees[0], callees[0].received[0])
+
+        service = RouterServiceAgent(ComponentConfig("realm1"), self.router)
+        self.assertEqual(service.registration_list_callees(registration.id), [1, 2])
+        self.assertEqual(
+            service.registration_list_callees(registration.id, include_stats=True),
+            [
+                {"session": 1, "concurrency": 5, "concurrency_current": 0, "calls": 1, "rtt_avg": 250.0},
+                {"session": 2, "concurrency": 5, "concurrency_current": 1, "calls": 0, "rtt_avg": None},
+            ],
+        )
+
+
+class TestDealerCallQueue(unittest.TestCase):
+    """
+    Calls queued in the realm store when the maximum concurrency of all callees is reached.
+    """
+
+    def setUp(self):
+        self.router_factory = RouterFactory("node1", "router1", None)
+        self.router_factory.start_realm(RouterRealm(None, "realm-001", {"name": "realm1"}))
+        self.router = self.router_factory.get("realm1")
+        self.router.authorize = lambda *args, **kwargs: defer.succeed({"allow": True, "disclose": False})
+        self.dealer = self.router._dealer
+        self.clock = Clock()
+        self.dealer._reactor = self.clock
+        self.dealer._cancel_timers = TimerWheel(self.clock)
+
+        self.store = RealmStoreMemory(
+            None,
+            self.router_factory,
+            {
+                "type": "memory",
+                "call-queue": [
+                    {
+                        "uri": "com.example.compute",
+                        "limit": 3,
+                        "max-age": 10,
+                        "priority": {"admin": 1},
+                    }
+                ],
+            },
+        )
+        self.store._reactor = self.clock
+        self.router._store = self.store
+        self.dealer._call_store = self.store
+
+        self.caller = _BenchSession(100, {"caller": role.RoleCallerFeatures()})
+        self.dealer.attach(self.caller)
+        self.request = 1000
+
+    def _register(self, procedure, session_id=1, concurrency=1):
+        callee = _BenchSession(session_id, {"callee": role.RoleCalleeFeatures()})
+        self.dealer.attach(callee)
+        self.dealer.processRegister(
+            callee, message.Register(1, procedure, invoke=message.Register.INVOKE_ROUNDROBIN, concurrency=concurrency)
+        )
+        self.assertIsInstance(callee.received.pop(0), message.Registered)
+        return callee
+
+    def _call(self, procedure, caller=None):
+        self.request += 1
+        self.dealer.processCall(caller or self.caller, message.Call(self.request, procedure, []))
+        return self.request
+
+    def _yield(self, callee):
+        invocation = callee.received.pop(0)
+        self.dealer.processYield(callee, message.Yield(invocation.request))
+        return invocation
+
+    def test_queue_drained_on_yield(self):
+        callee = self._register("com.example.compute")
+
+        requests = [self._call("com.example.compute") for _ in range(4)]
+        self.assertEqual(len(callee.received), 1)
+        self.assertEqual(self.store.stats()["calls"]["depth"], 3)
+
+        # the queue is full
+        self._call("com.example.compute")
+        self.assertEqual(self.caller.received[-1].error, "crossbar.error.max_concurrency_reached")
+        self.assertEqual(self.store.stats()["calls"]["rejected"], 1)
+
+        # queued calls are forwarded (in order) as the callee answers
+        for request in requests:
+            self._yield(callee)
+        results = [msg.request for msg in self.caller.received if isinstance(msg, message.Result)]
+        self.assertEqual(results, requests)
+        self.assertEqual(callee.received, [])
+        self.assertEqual(self.store.stats()["calls"]["depth"], 0)
+
+    def test_queue_drained_on_error(self):
+        callee = self._register("com.example.compute")
+        self._call("com.example.compute")
+        self._call("com.example.compute")
+
+        invocation = callee.received.pop(0)
+        self.dealer.processInvocationError(
+            callee, message.Error(message.Invocation.MESSAGE_TYPE, invocation.request, "com.example.error")
+        )
+        self.assertEqual(len(callee.received), 1)
+        self.assertEqual(self.store.stats()["calls"]["depth"], 0)
+
+    def test_not_configured(self):
+        callee = self._register("com.example.other")
+        self._call("com.example.other")
+        self._call("com.example.other")
+        self.assertEqual(len(callee.received), 1)
+        self.assertEqual(self.caller.received[-1].error, "crossbar.error.max_concurrency_reached")
+
+    def test_priority(self):
+        callee = self._register("com.example.compute")
+        admin = _BenchSession(101, {"caller": role.RoleCallerFeatures()})
+        admin._authrole = "admin"
+        self.dealer.attach(admin)
+
+        self._call("com.example.compute")
+        self._call("com.example.compute")
+        self._call("com.example.compute", caller=admin)
+
+        # the call of the admin is forwarded before the call queued earlier
+        self._yield(callee)
+        self.assertIs(self.dealer._invocations[callee.received[0].request].caller, admin)
+
+    def test_max_age(self):
+        callee = self._register("com.example.compute")
+        self._call("com.example.compute")
+        request = self._call("com.example.compute")
+
+        self.clock.advance(11)
+        error = self.caller.received[-1]
+        self.assertIsInstance(error, message.Error)
+        self.assertEqual(error.request, request)
+        self.assertEqual(error.error, "wamp.error.canceled")
+        self.assertEqual(self.store.stats()["calls"]["expired"], 1)
+
+        # the expired call is not forwarded anymore
+        self._yield(callee)
+        self.assertEqual(callee.received, [])
+
+    def test_drained_on_register(self):
+        first = self._register("com.example.compute", session_id=1)
+        self._call("com.example.compute")
+        self._call("com.example.compute")
+        self.assertEqual(len(first.received), 1)
+
+        second = self._register("com.example.compute", session_id=2)
+        self.assertEqual(len(second.received), 1)
+        self.assertEqual(self.store.stats()["calls"]["depth"], 0)
+
+    def test_dropped_on_delete(self):
+        callee = self._register("com.example.compute")
+        self._call("com.example.compute")
+        request = self._call("com.example.compute")
+
+        self.dealer.detach(callee)
+        self.assertIn(request, [msg.request for msg in self.caller.received if isinstance(msg, message.Error)])
+        self.assertEqual(self.store.stats()["calls"]["dropped"], 1)
+
+    def test_caller_detached(self):
+        callee = self._register("com.example.compute")
+        other = _BenchSession(101, {"caller": role.RoleCallerFeatures()})
+        self.dealer.attach(other)
+
+        self._call("com.example.compute", caller=other)
+        self._call("com.example.compute", caller=other)
+        self._call("com.example.compute")
+
+        # the in-flight invocation is cancelled, and the call queued by the detached caller skipped
+        self.dealer.detach(other)
+        invocation = callee.received[-1]
+        self.assertIsInstance(invocation, message.Invocation)
+        self.assertEqual(self.store.stats()["calls"]["depth"], 0)
+        self.dealer.processYield(callee, message.Yield(invocation.request))
+        self.assertIsInstance(self.caller.received[-1], message.Result)
@@ -0,0 +1,170 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import struct
+
+import mock
+from autobahn.exception import PayloadExceededError
+from autobahn.twisted.rawsocket import WampRawSocketServerProtocol
+from autobahn.twisted.websocket import WampWebSocketServerProtocol
+from autobahn.wamp import message
+from autobahn.wamp.exception import SerializationError
+from autobahn.wamp.serializer import CBORSerializer, JsonSerializer, MsgPackSerializer
+from twisted.internet.testing import StringTransport
+from twisted.trial import unittest
+
+from crossbar.router.fanout import EventFanout
+
+
+def _websocket_transport(serializer, auto_fragment_size=0):
+    transport = WampWebSocketServerProtocol()
+    transport.factory = mock.Mock(isServer=True)
+    transport._session = mock.Mock()
+    transport._serializer = serializer
+    transport.autoFragmentSize = auto_fragment_size
+    transport.sendPreparedMessage = mock.Mock()
+    transport.sendMessage = mock.Mock()
+    return transport
+
+
+def _rawsocket_transport(serializer, max_len_send=2**24):
+    transport = WampRawSocketServerProtocol()
+    transport._session = mock.Mock()
+    transport._serializer = serializer
+    transport._max_len_send = max_len_send
+    transport.transport = StringTransport()
+    return transport
+
+
+class TestEventFanout(unittest.TestCase):
+    def setUp(self):
+        self.msg = message.Event(1, 2, args=["hello", 23], kwargs={"foo": "bar"})
+
+    def test_websocket_serialize_once(self):
+        """
+        An event sent to many WebSocket receivers with the same serializer is framed only once.
+        """
+        fanout = EventFanout(self.msg)
+        transports = [_websocket_transport(JsonSerializer()) for _ in range(10)]
+        for transport in transports:
+            fanout.send(transport)
+
+        self.assertEqual(fanout.misses, 1)
+        self.assertEqual(fanout.hits, 9)
+        self.assertEqual(fanout.fallbacks, 0)
+
+        # every receiver got the very same prepared message
+        prepared = transports[0].sendPreparedMessage.call_args[0][0]
+        for transport in transports:
+            self.assertIs(transport.sendPreparedMessage.call_args[0][0], prepared)
+
+        # per-transport serializer statistics are still maintained
+        for transport in transports:
+            self.assertEqual(transport._serializer.stats(reset=False)["messages"], 1)
+
+    def test_mixed_serializers_and_framing(self):
+        """
+        The event is serialized and framed once per (framing, serializer) combination.
+        """
+        fanout = EventFanout(self.msg)
+        for serializer_class in [JsonSerializer, MsgPackSerializer, CBORSerializer]:
+            for _ in range(5):
+                fanout.send(_websocket_transport(serializer_class()))
+                fanout.send(_rawsocket_transport(serializer_class()))
+
+        self.assertEqual(fanout.misses, 6)
+        self.assertEqual(fanout.hits, 24)
+
+    def test_rawsocket_framing(self):
+        """
+        RawSocket receivers get the length-prefixed serialized event.
+        """
+        fanout = EventFanout(self.msg)
+        transports = [_rawsocket_transport(MsgPackSerializer()) for _ in range(3)]
+        for transport in transports:
+            fanout.send(transport)
+
+        payload, _ = MsgPackSerializer().serialize(message.Event(1, 2, args=["hello", 23], kwargs={"foo": "bar"}))
+        expected = struct.pack("!I", len(payload)) + payload
+        for transport in transports:
+            self.assertEqual(transport.transport.value(), expected)
+
+    def test_rawsocket_payload_exceeded(self):
+        """
+        The receiver's maximum message size is honored for pre-framed sends.
+        """
+        fanout = EventFanout(self.msg)
+        transport = _rawsocket_transport(JsonSerializer(), max_len_send=8)
+        self.assertRaises(PayloadExceededError, fanout.send, transport)
+        self.assertEqual(transport.transport.value(), b"")
+
+    def test_fallback(self):
+        """
+        Transports which cannot take pre-framed bytes use the regular send path.
+        """
+        fanout = EventFanout(self.msg)
+        transport = mock.Mock()
+        fanout.send(transport)
+        transport.send.assert_called_once_with(self.msg)
+        self.assertEqual(fanout.fallbacks, 1)
+
+    def test_stats_autoreset(self):
+        """
+        The auto-reset callback of the serializer statistics fires for pre-framed sends.
+        """
+        fanout = EventFanout(self.msg)
+        stats = []
+        transports = []
+        for _ in range(3):
+            serializer = JsonSerializer()
+            serializer.set_stats_autoreset(1, None, stats.append)
+            transports.append(_websocket_transport(serializer))
+        for transport in transports:
+            fanout.send(transport)
+
+        self.assertEqual(fanout.hits, 2)
+        self.assertEqual([s["messages"] for s in stats], [1, 1, 1])
+
+    def test_serialized_sizes(self):
+        """
+        The serialized sizes are recorded on the message for every receiver, as with regular sends.
+        """
+        fanout = EventFanout(self.msg)
+        transports = [_rawsocket_transport(CBORSerializer()) for _ in range(3)]
+        for transport in transports:
+            fanout.send(transport)
+
+        payload, _ = CBORSerializer().serialize(message.Event(1, 2, args=["hello", 23], kwargs={"foo": "bar"}))
+        self.assertEqual(len(self.msg._serialized), 3)
+        for transport in transports:
+            self.assertEqual(self.msg._serialized[transport._serializer._serializer], payload)
+
+    def test_websocket_fragmentation(self):
+        """
+        Messages larger than the receiver's auto-fragment size are fragmented by the transport.
+        """
+        fanout = EventFanout(self.msg)
+        small = _websocket_transport(JsonSerializer(), auto_fragment_size=1024)
+        large = _websocket_transport(JsonSerializer(), auto_fragment_size=8)
+        fanout.send(small)
+        fanout.send(large)
+
+        self.assertEqual(small.sendPreparedMessage.call_count, 1)
+        self.assertEqual(small.sendMessage.call_count, 0)
+        self.assertEqual(large.sendPreparedMessage.call_count, 0)
+        payload = small.sendPreparedMessage.call_args[0][0].payload
+        large.sendMessage.assert_called_once_with(payload, False)
+        self.assertEqual(fanout.fallbacks, 1)
+
+    def test_serialization_error(self):
+        """
+        Serializer failures are raised as serialization errors.
+        """
+        fanout = EventFanout(message.Event(1, 2, args=[object()]))
+        transport = _rawsocket_transport(JsonSerializer())
+        self.assertRaises(SerializationError, fanout.send, transport)
+        self.assertEqual(transport.transport.value(), b"")
@@ -5,12 +5,14 @@
 #
 #####################################################################################
 
+import random
 import unittest
 
 from autobahn.wamp.message import Subscribe
 
 from crossbar.router.observation import (
     ExactUriObservation,
+    OrderedSet,
     PrefixUriObservation,
     UriObservationMap,
     WildcardUriObservation,
@@ -53,6 +55,64 @@ class TestObservation(unittest.TestCase):
         self.assertEqual(obs1.observers, set())
 
 
+class TestOrderedSet(unittest.TestCase):
+    def test_order_and_positional_access(self):
+        """
+        Iteration and positional access follow insertion order, also after items were discarded.
+        """
+        rng = random.Random(23)
+        ordered = OrderedSet()
+        reference = []
+        for i in range(5000):
+            if reference and rng.random() < 0.45:
+                item = rng.choice(reference)
+                reference.remove(item)
+                ordered.discard(item)
+            else:
+                ordered.add(i)
+                reference.append(i)
+
+            self.assertEqual(len(ordered), len(reference))
+            if reference:
+                self.assertEqual(ordered[0], reference[0])
+                self.assertEqual(ordered[-1], reference[-1])
+                self.assertEqual(ordered[len(reference) - 1], reference[-1])
+                k = rng.randint(0, len(reference) - 1)
+                self.assertEqual(ordered[k], reference[k])
+            if i % 500 == 0:
+                self.assertEqual(list(ordered), reference)
+                self.assertEqual(list(reversed(ordered)), list(reversed(reference)))
+
+        self.assertEqual(list(ordered), reference)
+        self.assertEqual(set(ordered), set(reference))
+
+    def test_add_existing_and_discard_missing(self):
+        ordered = OrderedSet()
+        ordered.add("a")
+        ordered.add("b")
+        ordered.add("a")
+        ordered.discard("c")
+        self.assertEqual(list(ordered), ["a", "b"])
+        self.assertRaises(KeyError, ordered.remove, "c")
+        self.assertRaises(IndexError, ordered.__getitem__, 2)
+
+    def test_roundrobin_order(self):
+        """
+        Round-robin selection (counter modulo length) sees the same callees as with a plain list.
+        """
+        ordered = OrderedSet()
+        reference = []
+        for i in range(10):
+            ordered.add(i)
+            reference.append(i)
+        for item in [3, 0, 9]:
+            ordered.discard(item)
+            reference.remove(item)
+        self.assertEqual(
+            [ordered[k % len(ordered)] for k in range(20)], [reference[k % len(reference)] for k in range(20)]
+        )
+
+
 class TestUriObservationMap(unittest.TestCase):
     def test_match_observations_empty(self):
         """
@@ -312,3 +372,57 @@ class TestUriObservationMap(unittest.TestCase):
         observations = obs_map.match_observations("com.example.product.delete")
         self.assertEqual(observations, [observation2])
         self.assertEqual(observations[0].observers, set([obs1]))
+
+    def test_match_observations_cache_invalidation(self):
+        """
+        Cached match results are invalidated when matching observations are created or deleted.
+        """
+        obs_map = UriObservationMap()
+        obs1 = FakeObserver()
+        uri = "com.example.product.create"
+
+        observation1, _, _ = obs_map.add_observer(obs1, uri, match=Subscribe.MATCH_EXACT)
+        self.assertEqual(obs_map.match_observations(uri), [observation1])
+
+        # cached result is returned for repeated matches
+        self.assertIs(obs_map.match_observations(uri), obs_map.match_observations(uri))
+
+        observation2, _, _ = obs_map.add_observer(obs1, "com.example.", match=Subscribe.MATCH_PREFIX)
+        self.assertEqual(obs_map.match_observations(uri), [observation1, observation2])
+
+        observation3, _, _ = obs_map.add_observer(obs1, "com..product.", match=Subscribe.MATCH_WILDCARD)
+        self.assertEqual(obs_map.match_observations(uri), [observation1, observation2, observation3])
+
+        # a non-matching pattern does not invalidate the cached result
+        cached = obs_map.match_observations(uri)
+        obs_map.add_observer(obs1, "org.example.", match=Subscribe.MATCH_PREFIX)
+        obs_map.add_observer(obs1, "com..product", match=Subscribe.MATCH_WILDCARD)
+        self.assertIs(obs_map.match_observations(uri), cached)
+
+        for observation in [observation2, observation1, observation3]:
+            obs_map.drop_observer(obs1, observation)
+            obs_map.delete_observation(observation)
+            self.assertNotIn(observation, obs_map.match_observations(uri))
+        self.assertEqual(obs_map.match_observations(uri), [])
+
+    def test_match_observations_cache_bounded(self):
+        """
+        The match result cache does not grow beyond its configured size.
+        """
+        obs_map = UriObservationMap(match_cache_size=10)
+        obs1 = FakeObserver()
+        observation, _, _ = obs_map.add_observer(obs1, "com.example.", match=Subscribe.MATCH_PREFIX)
+        for i in range(100):
+            self.assertEqual(obs_map.match_observations("com.example.{}".format(i)), [observation])
+        self.assertEqual(len(obs_map._match_cache), 10)
+
+    def test_match_observations_uri_type(self):
+        """
+        Non-string URIs are rejected, whether or not a match result is cached.
+        """
+        obs_map = UriObservationMap()
+        obs_map.add_observer(FakeObserver(), "com.example.", match=Subscribe.MATCH_PREFIX)
+        obs_map.match_observations("com.example.uri")
+        for uri in [b"com.example.uri", ["com", "example", "uri"]]:
+            with self.assertRaisesRegex(Exception, "should be unicode"):
+                obs_map.match_observations(uri)
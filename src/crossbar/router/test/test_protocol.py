@@ -0,0 +1,175 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.wamp import message
+from autobahn.wamp.serializer import JsonSerializer
+from twisted.test import iosim
+from twisted.trial import unittest
+
+from crossbar.router.protocol import (
+    WampMuxChannel,
+    WampMuxRawSocketClientFactory,
+    WampMuxRawSocketServerProtocol,
+    WampRawMessageMixin,
+    WampRawSocketServerFactory,
+)
+
+
+class _Handler(object):
+    """
+    Transport handler recording everything it receives.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.messages = []
+        self.closed = None
+
+    def onOpen(self, transport):
+        self.transport = transport
+
+    def onMessage(self, msg):
+        self.messages.append(msg)
+
+    def onClose(self, wasClean):
+        self.closed = wasClean
+
+
+class _RawHandler(_Handler):
+    """
+    Transport handler taking over the messages it receives still serialized.
+    """
+
+    def onRawMessage(self, payload, is_binary):
+        self.messages.append((payload, is_binary))
+        return True
+
+
+class TestMultiplexedRawSocket(unittest.TestCase):
+    def setUp(self):
+        self.server_handlers = []
+
+        def session_factory():
+            handler = _Handler()
+            self.server_handlers.append(handler)
+            return handler
+
+        server_factory = WampRawSocketServerFactory(
+            session_factory, {"serializers": ["cbor"], "multiplex": True, "max_channels": 2}
+        )
+        self.assertEqual(server_factory.protocol, WampMuxRawSocketServerProtocol)
+        client_factory = WampMuxRawSocketClientFactory(None, {"serializer": "cbor"})
+
+        self.client, self.server, self.pump = iosim.connectedServerAndClient(
+            lambda: server_factory.buildProtocol(None), lambda: client_factory.buildProtocol(None)
+        )
+        self.pump.flush()
+        self.assertTrue(self.client.is_open.called)
+
+    def _open(self, channel_id):
+        handler = _Handler()
+        self.client.open_channel(WampMuxChannel(self.client, channel_id, handler))
+        self.pump.flush()
+        return handler
+
+    def test_routing(self):
+        client1, client2 = self._open(1), self._open(2)
+        self.assertEqual(len(self.server_handlers), 2)
+        server1, server2 = self.server_handlers
+
+        client1.transport.send(message.Publish(1, "com.example.topic1"))
+        client2.transport.send(message.Publish(2, "com.example.topic2"))
+        self.pump.flush()
+        self.assertEqual([msg.topic for msg in server1.messages], ["com.example.topic1"])
+        self.assertEqual([msg.topic for msg in server2.messages], ["com.example.topic2"])
+
+        server2.transport.send(message.Published(2, 1002))
+        self.pump.flush()
+        self.assertEqual(client1.messages, [])
+        self.assertEqual([msg.publication for msg in client2.messages], [1002])
+
+    def test_raw_messages(self):
+        self.server.factory._factory = _RawHandler
+        client = self._open(1)
+        client.transport.send(message.Publish(1, "com.example.topic1"))
+        self.pump.flush()
+
+        server = self.server._channels[1]._session
+        payload, is_binary = client.transport._serializer.serialize(message.Publish(1, "com.example.topic1"))
+        self.assertEqual(server.messages, [(payload, True)])
+
+    def test_close_channel(self):
+        client1, client2 = self._open(1), self._open(2)
+        server1, server2 = self.server_handlers
+
+        # closing one channel leaves the other sessions on the connection running
+        client1.transport.close()
+        self.pump.flush()
+        self.assertTrue(client1.closed)
+        self.assertTrue(server1.closed)
+        self.assertIsNone(server2.closed)
+        self.assertEqual(list(self.server._channels), [2])
+
+        # the router closing a channel is seen by the proxy
+        server2.transport.close()
+        self.pump.flush()
+        self.assertTrue(client2.closed)
+        self.assertEqual(self.client._channels, {})
+
+    def test_max_channels(self):
+        client1, client2, client3 = self._open(1), self._open(2), self._open(3)
+
+        # channels beyond the maximum are rejected, without affecting the others
+        self.assertEqual(len(self.server_handlers), 2)
+        self.assertTrue(client3.closed)
+        self.assertIsNone(client1.closed)
+        self.assertIsNone(client2.closed)
+        self.assertEqual(sorted(self.server._channels), [1, 2])
+        self.assertEqual(sorted(self.client._channels), [1, 2])
+
+        # .. until a channel is closed
+        client1.transport.close()
+        self.pump.flush()
+        self._open(4)
+        self.assertEqual(len(self.server_handlers), 3)
+        self.assertEqual(sorted(self.server._channels), [2, 4])
+
+    def test_connection_lost(self):
+        client1 = self._open(1)
+        (server1,) = self.server_handlers
+
+        self.client.transport.loseConnection()
+        self.pump.flush()
+        self.assertIsNotNone(client1.closed)
+        self.assertIsNotNone(server1.closed)
+        self.assertFalse(self.server.isOpen())
+
+
+class _RawMessageTransport(WampRawMessageMixin):
+    def __init__(self):
+        self._serializer = JsonSerializer()
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class TestRawMessageMixin(unittest.TestCase):
+    def test_send_raw_default(self):
+        """
+        Transports without a raw send of their own send the deserialized message.
+        """
+        transport = _RawMessageTransport()
+        payload, is_binary = JsonSerializer().serialize(message.Publish(1, "com.example.topic", args=[23]))
+        transport.send_raw(payload, is_binary)
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(transport.sent[0].topic, "com.example.topic")
+        self.assertEqual(transport.sent[0].args, [23])
@@ -0,0 +1,228 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.wamp import message
+from mock import Mock
+from twisted.trial import unittest
+
+from crossbar.router.observation import UriObservationMap
+from crossbar.router.realmstore import CallQueues, EventRing, MQTTSessions, RealmStoreMemory
+
+
+class TestRealmStoreMemory(unittest.TestCase):
+    def setUp(self):
+        config = {
+            "type": "memory",
+            "event-history": [{"uri": "com.example.history", "limit": 5}],
+        }
+        self.store = RealmStoreMemory(None, None, config)
+        subscription_map = UriObservationMap()
+        self.store.attach_subscription_map(subscription_map)
+        self.subscription_id = subscription_map.get_observation("com.example.history").id
+
+        session = Mock()
+        session._session_id = 1
+        session._realm = "realm1"
+        session._authid = "publisher"
+        session._authrole = "user"
+        for publication_id in range(1, 8):
+            publish = message.Publish(publication_id, "com.example.history", args=[publication_id])
+            self.store.store_event(session, publication_id, publish)
+            self.store.store_event_history(publication_id, self.subscription_id, session)
+
+    def _get_events(self, limit=None, before=None):
+        events = self.store.get_events(self.subscription_id, limit, before=before)
+        return [event["publication"] for event in events]
+
+    def test_get_events(self):
+        # only the last 5 events are kept, and returned newest first
+        self.assertEqual(self._get_events(), [7, 6, 5, 4, 3])
+        self.assertEqual(self._get_events(2), [7, 6])
+        self.assertEqual(self.store.get_events(self.subscription_id + 1), None)
+
+    def test_get_events_paging(self):
+        self.assertEqual(self._get_events(2, before=6), [5, 4])
+        self.assertEqual(self._get_events(2, before=4), [3])
+        self.assertEqual(self._get_events(2, before=3), [])
+
+        # the cursor event is no longer in the history
+        self.assertEqual(self._get_events(2, before=1), [])
+
+    def test_get_event_history(self):
+        events = self.store.get_events(self.subscription_id)
+        from_ts = events[3]["time_ns"]
+        until_ts = events[0]["time_ns"] + 1
+        history = self.store.get_event_history(self.subscription_id, from_ts, until_ts)
+        self.assertEqual([event["publication"] for event in history][-1], 7)
+        self.assertEqual(history[-1]["args"], [7])
+        self.assertEqual(history[-1]["authid"], "publisher")
+
+    def test_stats(self):
+        stats = self.store.stats()
+        self.assertEqual(stats["events"], 5)
+        subscription = stats["history"]["subscriptions"][self.subscription_id]
+        self.assertEqual(subscription["events"], 5)
+        self.assertEqual(stats["history"]["bytes"], subscription["bytes"])
+
+
+class TestRealmStoreMemoryBudget(unittest.TestCase):
+    def setUp(self):
+        config = {
+            "type": "memory",
+            "history-max-bytes": 4000,
+            "event-history": [
+                {"uri": "com.example.a", "limit": 100},
+                {"uri": "com.example.b", "limit": 100},
+                {"uri": "com.example.shared.", "match": "prefix", "limit": 100},
+                {"uri": "com.example.shared.", "match": "wildcard", "limit": 100},
+            ],
+        }
+        self.store = RealmStoreMemory(None, None, config)
+        self.subscription_map = UriObservationMap()
+        self.store.attach_subscription_map(self.subscription_map)
+        self.session = Mock()
+        self.session._session_id = 1
+        self.session._realm = "realm1"
+        self.session._authid = "publisher"
+        self.session._authrole = "user"
+        self.publication_id = 0
+
+    def _publish(self, topic, count):
+        for _ in range(count):
+            self.publication_id += 1
+            publish = message.Publish(self.publication_id, topic, args=["x" * 80])
+            self.store.store_event(self.session, self.publication_id, publish)
+
+    def _subscription_stats(self, topic):
+        subscription_id = self.subscription_map.get_observation(topic).id
+        return self.store.stats()["history"]["subscriptions"][subscription_id]
+
+    def test_budget(self):
+        self._publish("com.example.a", 5)
+        self._publish("com.example.b", 50)
+
+        stats = self.store.stats()["history"]
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+        self.assertGreater(stats["evicted"], 0)
+
+        # the least recently used subscription is evicted from first
+        self.assertEqual(self._subscription_stats("com.example.a")["events"], 0)
+        self.assertGreater(self._subscription_stats("com.example.b")["events"], 0)
+
+        # the newest events are kept
+        subscription_id = self.subscription_map.get_observation("com.example.b").id
+        events = self.store.get_events(subscription_id, 1)
+        self.assertEqual(events[0]["publication"], self.publication_id)
+
+    def test_bytes_held(self):
+        # only the events kept count against the budget, not the capacity of the histories
+        self.assertEqual(self.store.stats()["history"]["bytes"], 0)
+
+        # .. which is reported separately
+        self.assertEqual(self.store.stats()["history"]["fixed_bytes"], 4 * 100 * EventRing.SLOT_BYTES)
+        self.assertEqual(self._subscription_stats("com.example.a")["fixed_bytes"], 100 * EventRing.SLOT_BYTES)
+
+        self._publish("com.example.a", 1)
+        nbytes = self._subscription_stats("com.example.a")["bytes"]
+        self.assertEqual(self.store.stats()["history"]["bytes"], nbytes)
+
+        # an event recorded for two subscriptions shares the payload, which is counted once
+        self._publish("com.example.shared.x", 1)
+        stats = self.store.stats()["history"]
+        shared = [s["bytes"] for s in stats["subscriptions"].values() if s["uri"] == "com.example.shared."]
+        self.assertEqual(len(shared), 2)
+        self.assertEqual(stats["bytes"], nbytes + shared[0] + EventRing.SLOT_BYTES)
+
+        # .. until dropped from both (the shared histories are the least recently used, and evicted first)
+        self._publish("com.example.a", 50)
+        kept = 4000 // nbytes
+        self.assertEqual(self._subscription_stats("com.example.a")["events"], kept)
+        self.assertEqual(self.store.stats()["history"]["bytes"], kept * nbytes)
+        self.assertEqual(len(self.store._payload_refs), kept)
+
+
+class TestCallQueues(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.registration = Mock(id=1, uri="com.example.compute", match="exact")
+
+    def _session(self, authrole):
+        session = Mock()
+        session._authrole = authrole
+        return session
+
+    def test_queue_all(self):
+        queues = CallQueues({"limit": 2})
+        self.assertIsNotNone(queues.put(self._session("user"), Mock(), self.registration, None))
+        self.assertIsNotNone(queues.put(self._session("user"), Mock(), self.registration, None))
+        self.assertIsNone(queues.put(self._session("user"), Mock(), self.registration, None))
+        self.assertEqual(len(queues), 2)
+
+    def test_not_configured(self):
+        queues = CallQueues({"call-queue": [{"uri": "com.example.other"}]})
+        self.assertIsNone(queues.put(self._session("user"), Mock(), self.registration, None))
+        self.assertEqual(queues.stats()["depth"], 0)
+
+    def test_priority_and_expiry(self):
+        config = {"call-queue": [{"uri": "com.example.compute", "max-age": 5, "priority": {"admin": 1}}]}
+        queues = CallQueues(config, now=lambda: self.now)
+
+        first = queues.put(self._session("user"), Mock(), self.registration, None)
+        self.now = 3
+        second = queues.put(self._session("user"), Mock(), self.registration, None)
+        admin = queues.put(self._session("admin"), Mock(), self.registration, None)
+        self.assertEqual(admin.expires, 8)
+
+        self.assertIs(queues.head(self.registration), admin)
+        self.assertIs(queues.pop(self.registration), admin)
+
+        self.now = 6
+        self.assertEqual(queues.expire(self.registration), [first])
+        self.assertIs(queues.head(self.registration), second)
+
+        self.assertEqual(queues.drop(self.registration), [second])
+        self.assertIsNone(queues.pop(self.registration))
+        stats = queues.stats()
+        self.assertEqual(
+            (stats["enqueued"], stats["expired"], stats["dropped"], stats["depth"]),
+            (3, 1, 1, 0),
+        )
+
+
+class TestMQTTSessions(unittest.TestCase):
+    def _state(self, nbytes=0):
+        return {"authid": "device", "subscriptions": {"a/#": 1}, "messages": [], "bytes": nbytes}
+
+    def test_put_pop(self):
+        sessions = MQTTSessions({})
+        state = self._state()
+        sessions.put("client1", state)
+        self.assertIs(sessions.pop("client1"), state)
+        self.assertIsNone(sessions.pop("client1"))
+        stats = sessions.stats()
+        self.assertEqual((stats["sessions"], stats["stored"], stats["resumed"]), (0, 1, 1))
+
+    def test_limit(self):
+        sessions = MQTTSessions({"mqtt-session-limit": 2})
+        sessions.put("client1", self._state(1))
+        sessions.put("client2", self._state(2))
+        sessions.put("client1", self._state(3))
+        sessions.put("client3", self._state(4))
+        self.assertEqual(len(sessions), 2)
+        self.assertIsNone(sessions.pop("client2"))
+        stats = sessions.stats()
+        self.assertEqual((stats["bytes"], stats["evicted"]), (7, 1))
+
+    def test_store(self):
+        store = RealmStoreMemory(None, None, {"type": "memory"})
+        store.store_mqtt_session("client1", self._state())
+        self.assertEqual(store.stats()["mqtt_sessions"]["sessions"], 1)
+        self.assertEqual(store.pop_mqtt_session("client1")["subscriptions"], {"a/#": 1})
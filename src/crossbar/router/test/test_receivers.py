@@ -0,0 +1,134 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import random
+
+from autobahn.wamp import message
+from twisted.trial import unittest
+
+from crossbar.router.observation import UriObservationMap
+from crossbar.router.receivers import ReceiverIndex
+
+
+class FakeSession(object):
+    def __init__(self, session_id, authid, authrole):
+        self._session_id = session_id
+        self._authid = authid
+        self._authrole = authrole
+
+    def __repr__(self):
+        return "FakeSession({})".format(self._session_id)
+
+
+def _reference_filter(receivers, publish, sessions):
+    """
+    Set-based reference implementation of the publish receiver filtering.
+    """
+    by_id = {s._session_id: s for s in sessions}
+    by_authid = {}
+    by_authrole = {}
+    for s in sessions:
+        by_authid.setdefault(s._authid, set()).add(s)
+        by_authrole.setdefault(s._authrole, set()).add(s)
+
+    if publish.eligible:
+        receivers = receivers & set(by_id[i] for i in publish.eligible if i in by_id)
+    if publish.eligible_authid:
+        eligible = set()
+        for aid in publish.eligible_authid:
+            eligible.update(by_authid.get(aid, set()))
+        receivers = receivers & eligible
+    if publish.eligible_authrole:
+        eligible = set()
+        for ar in publish.eligible_authrole:
+            eligible.update(by_authrole.get(ar, set()))
+        receivers = receivers & eligible
+    if publish.exclude:
+        receivers = receivers - set(by_id[i] for i in publish.exclude if i in by_id)
+    for aid in publish.exclude_authid or []:
+        receivers = receivers - by_authid.get(aid, set())
+    for ar in publish.exclude_authrole or []:
+        receivers = receivers - by_authrole.get(ar, set())
+    return receivers
+
+
+class TestReceiverIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ReceiverIndex()
+        self.obs_map = UriObservationMap(index=self.index)
+        self.sessions = []
+        for i in range(200):
+            session = FakeSession(1000 + i, "user{}".format(i % 17), "role{}".format(i % 3))
+            self.index.add(session)
+            self.index.set_auth(session, session._authid, session._authrole)
+            self.sessions.append(session)
+
+    def test_slots_recycled(self):
+        session = self.sessions[5]
+        slot = self.index.slot(session)
+        self.index.remove(session)
+        self.assertIsNone(self.index.slot(session))
+
+        new_session = FakeSession(5000, "newuser", "role0")
+        self.assertEqual(self.index.add(new_session), slot)
+        self.assertEqual(self.index.session_ids_mask([5000]), 1 << slot)
+        self.assertEqual(self.index.session_ids_mask([session._session_id]), 0)
+        self.assertEqual(self.index.authids_mask([session._authid]) & (1 << slot), 0)
+
+    def test_observer_mask(self):
+        observation, _, _ = self.obs_map.add_observer(self.sessions[0], "com.example.topic")
+        self.obs_map.add_observer(self.sessions[3], "com.example.topic")
+        self.assertEqual(self.index.sessions(observation.observers_mask), {self.sessions[0], self.sessions[3]})
+
+        self.obs_map.drop_observer(self.sessions[0], observation)
+        self.assertEqual(self.index.sessions(observation.observers_mask), {self.sessions[3]})
+
+    def test_unindexed_observers(self):
+        """
+        Observers which are not sessions are kept unless a whitelist applies.
+        """
+        store = object()
+        observation, _, _ = self.obs_map.add_observer(store, "com.example.topic")
+        self.obs_map.add_observer(self.sessions[1], "com.example.topic")
+
+        publish = message.Publish(1, "com.example.topic", exclude=[self.sessions[1]._session_id])
+        self.assertEqual(self.index.filter(observation, publish), {store})
+
+        publish = message.Publish(1, "com.example.topic", eligible=[self.sessions[1]._session_id])
+        self.assertEqual(self.index.filter(observation, publish), {self.sessions[1]})
+
+    def test_filter_matches_reference(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            observers = rng.sample(self.sessions, rng.randint(0, len(self.sessions)))
+            obs_map = UriObservationMap(index=self.index)
+            observation = obs_map.create_observation("com.example.topic")
+            for session in observers:
+                obs_map.add_observer(session, "com.example.topic")
+
+            def ids(n):
+                return [1000 + rng.randint(0, 250) for _ in range(rng.randint(1, n))]
+
+            kwargs = {}
+            if rng.random() < 0.3:
+                kwargs["eligible"] = ids(150)
+            if rng.random() < 0.3:
+                kwargs["eligible_authid"] = ["user{}".format(rng.randint(0, 20)) for _ in range(rng.randint(1, 8))]
+            if rng.random() < 0.3:
+                kwargs["eligible_authrole"] = ["role{}".format(rng.randint(0, 4)) for _ in range(rng.randint(1, 2))]
+            if rng.random() < 0.3:
+                kwargs["exclude"] = ids(100)
+            if rng.random() < 0.3:
+                kwargs["exclude_authid"] = ["user{}".format(rng.randint(0, 20)) for _ in range(rng.randint(1, 8))]
+            if rng.random() < 0.3:
+                kwargs["exclude_authrole"] = ["role{}".format(rng.randint(0, 4))]
+            publish = message.Publish(1, "com.example.topic", **kwargs)
+
+            self.assertEqual(
+                self.index.filter(observation, publish),
+                _reference_filter(set(observers), publish, self.sessions),
+            )
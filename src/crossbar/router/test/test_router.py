@@ -283,3 +283,46 @@ class TestEmbeddedSessions(unittest.TestCase):
         self.session_factory.add(session, self.router)
 
         return d
+
+
+class TestAuthorizationCache(unittest.TestCase):
+    def setUp(self):
+        self.router_factory = RouterFactory("node1", "router1", None)
+        self.router_factory.start_realm(
+            RouterRealm(None, None, {"name": "realm1", "options": {"authorization_cache_size": 5}})
+        )
+        self.router = self.router_factory.get("realm1")
+        self.role = RouterRoleStaticAuth(
+            self.router,
+            "test_role",
+            default_permissions={"uri": "com.example.", "match": "prefix", "allow": {"call": True}, "cache": True},
+        )
+        self.router.add_role(self.role)
+        self.session = mock.Mock()
+        self.session._realm = "realm1"
+        self.session._authrole = "test_role"
+
+    def _authorize(self, uri):
+        results = []
+        self.router.authorize(self.session, uri, "call", {}).addCallback(results.append)
+        return results[0]
+
+    def test_bounded(self):
+        for i in range(20):
+            self.assertTrue(self._authorize("com.example.proc{}".format(i % 10))["allow"])
+
+        stats = self.router.stats()["authorization_cache"]
+        self.assertEqual(stats["size"], 5)
+        self.assertEqual(stats["maxsize"], 5)
+        self.assertEqual(stats["evictions"], 15)
+
+        self._authorize("com.example.proc9")
+        self.assertEqual(self.router.stats()["authorization_cache"]["hits"], 1)
+
+    def test_invalidated_on_role_change(self):
+        self._authorize("com.example.proc1")
+        self.assertEqual(len(self.router._authorization_cache), 1)
+
+        self.router.drop_role(self.role)
+        self.assertEqual(len(self.router._authorization_cache), 0)
+        self.assertFalse(self._authorize("com.example.proc1")["allow"])
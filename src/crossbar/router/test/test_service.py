@@ -0,0 +1,96 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import mock
+from autobahn.wamp import message, role
+from autobahn.wamp.types import ComponentConfig
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from crossbar.router.router import RouterFactory
+from crossbar.router.service import RouterServiceAgent
+from crossbar.worker.types import RouterRealm
+
+
+class _Session(object):
+    """
+    Lightweight session stand-in, recording the messages sent to it.
+    """
+
+    def __init__(self, session_id):
+        self._session_id = session_id
+        self._realm = "realm1"
+        self._authid = "authid{}".format(session_id)
+        self._authrole = "user"
+        self._authmethod = "anonymous"
+        self._authprovider = None
+        self._authextra = None
+        self._session_roles = {
+            "subscriber": role.RoleSubscriberFeatures(pattern_based_subscription=True),
+            "callee": role.RoleCalleeFeatures(pattern_based_registration=True),
+        }
+        self.authrole = self._authrole
+        self._transport = mock.Mock()
+        self._transport.send = self._on_message
+        self.received = []
+
+    def _on_message(self, msg):
+        self.received.append(msg)
+
+
+class TestRouterServiceListDetails(unittest.TestCase):
+    """
+    Subscriptions and registrations listed with ``include_details`` (as used to resync
+    router links) match the details returned by ``wamp.subscription.get`` and
+    ``wamp.registration.get``.
+    """
+
+    def setUp(self):
+        self.router_factory = RouterFactory("node1", "router1", None)
+        self.router_factory.start_realm(RouterRealm(None, "realm-001", {"name": "realm1"}))
+        self.router = self.router_factory.get("realm1")
+        self.router.authorize = lambda *args, **kwargs: defer.succeed({"allow": True, "disclose": False})
+        self.service = RouterServiceAgent(ComponentConfig("realm1"), self.router)
+
+        self.session = _Session(1)
+        self.other = _Session(2)
+        for session in [self.session, self.other]:
+            self.router.attach(session)
+
+        request = 1
+        for match, uri in [("exact", "com.example.a"), ("prefix", "com.example."), ("wildcard", "com..c")]:
+            self.router._broker.processSubscribe(self.session, message.Subscribe(request, uri, match=match))
+            self.router._dealer.processRegister(self.session, message.Register(request + 1, uri, match=match))
+            request += 2
+        self.router._broker.processSubscribe(self.other, message.Subscribe(request, "com.example.other"))
+        self.router._dealer.processRegister(self.other, message.Register(request + 1, "com.example.other"))
+
+    def _assert_details(self, listed, ids, get, count):
+        self.assertEqual(sorted(listed), ["exact", "prefix", "wildcard"])
+        self.assertEqual(sum(len(listed[match]) for match in listed), count)
+        for match in listed:
+            self.assertEqual([details["id"] for details in listed[match]], ids[match])
+            for details in listed[match]:
+                self.assertEqual(details["match"], match)
+                self.assertEqual(details, get(details["id"]))
+
+    def test_subscription_list(self):
+        listed = self.service.subscription_list(include_details=True)
+        self._assert_details(listed, self.service.subscription_list(), self.service.subscription_get, 4)
+
+    def test_subscription_list_session(self):
+        listed = self.service.subscription_list(1, include_details=True)
+        self._assert_details(listed, self.service.subscription_list(1), self.service.subscription_get, 3)
+
+    def test_registration_list(self):
+        listed = self.service.registration_list(include_details=True)
+        self._assert_details(listed, self.service.registration_list(), self.service.registration_get, 4)
+        self.assertEqual(listed["exact"][0]["invoke"], message.Register.INVOKE_SINGLE)
+
+    def test_registration_list_session(self):
+        listed = self.service.registration_list(1, include_details=True)
+        self._assert_details(listed, self.service.registration_list(1), self.service.registration_get, 3)
@@ -0,0 +1,82 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from crossbar.router.timerwheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(1000.5)
+        self.wheel = TimerWheel(self.clock)
+        self.fired = []
+
+    def test_fires_not_early(self):
+        self.wheel.call_later(2, self.fired.append, "a")
+        self.clock.advance(1.9)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.6)
+        self.assertEqual(self.fired, ["a"])
+        self.assertEqual(self.wheel.stats()["active"], 0)
+        self.assertEqual(self.wheel.stats()["expired"], 1)
+
+    def test_single_reactor_call(self):
+        """
+        Regardless of the number of timers, only one reactor call is pending.
+        """
+        for i in range(10000):
+            self.wheel.call_later(1 + i % 30, self.fired.append, i)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(self.wheel.stats()["active"], 10000)
+        self.assertEqual(self.wheel.stats()["buckets"], 30)
+
+        self.clock.pump([1] * 31)
+        self.assertEqual(sorted(self.fired), list(range(10000)))
+        self.assertEqual(len(self.clock.getDelayedCalls()), 0)
+
+    def test_cancel(self):
+        timers = [self.wheel.call_later(5, self.fired.append, i) for i in range(100)]
+        for timer in timers[::2]:
+            timer.cancel()
+            self.assertFalse(timer.active())
+        # cancelling twice is a no-op
+        timers[0].cancel()
+
+        self.assertEqual(self.wheel.stats()["active"], 50)
+        self.assertEqual(self.wheel.stats()["canceled"], 50)
+
+        self.clock.advance(6)
+        self.assertEqual(self.fired, list(range(1, 100, 2)))
+
+        # cancelling an expired timer is a no-op
+        timers[1].cancel()
+        self.assertEqual(self.wheel.stats()["canceled"], 50)
+
+    def test_cancel_from_callback(self):
+        timers = []
+
+        def on_timeout(i):
+            self.fired.append(i)
+            timers[1].cancel()
+
+        timers.append(self.wheel.call_later(3, on_timeout, 0))
+        timers.append(self.wheel.call_later(3, on_timeout, 1))
+        self.clock.advance(4)
+        self.assertEqual(self.fired, [0])
+        self.assertEqual(self.wheel.stats()["active"], 0)
+
+    def test_earlier_timer_reschedules(self):
+        self.wheel.call_later(10, self.fired.append, "late")
+        self.wheel.call_later(1, self.fired.append, "early")
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(2)
+        self.assertEqual(self.fired, ["early"])
+        self.clock.advance(10)
+        self.assertEqual(self.fired, ["early", "late"])
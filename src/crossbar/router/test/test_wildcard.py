@@ -85,3 +85,15 @@ class TestWildcardMatcher(AbstractTestMatcher, unittest.TestCase):
 
 class TestWildcardTrieMatcher(AbstractTestMatcher, unittest.TestCase):
     Matcher = WildcardTrieMatcher
+
+
+class TestWildcardTrieMatcherOrder(unittest.TestCase):
+    def test_deep_patterns(self):
+        """
+        Matching is not limited by recursion depth and visits exact components first.
+        """
+        matcher = WildcardTrieMatcher()
+        depth = 2000
+        matcher[".".join(["a"] * depth)] = "exact"
+        matcher[".".join([""] * depth)] = "wildcard"
+        self.assertEqual(list(matcher.iter_matches(".".join(["a"] * depth))), ["exact", "wildcard"])
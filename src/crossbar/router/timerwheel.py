@@ -0,0 +1,186 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import heapq
+import math
+
+from txaio import make_logger
+
+__all__ = ("TimerWheel",)
+
+
+class _WheelTimer(object):
+    """
+    A timer scheduled on a :class:`TimerWheel`, as returned from :meth:`TimerWheel.call_later`.
+    """
+
+    __slots__ = ("_wheel", "_tick", "_func", "_args", "_kwargs")
+
+    def __init__(self, wheel, tick, func, args, kwargs):
+        self._wheel = wheel
+        self._tick = tick
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def active(self):
+        """
+        :returns: ``True`` if the timer has neither fired nor been cancelled.
+        """
+        return self._wheel is not None
+
+    def cancel(self):
+        """
+        Cancel the timer. Cancelling a timer which already fired or was cancelled is a no-op.
+        """
+        if self._wheel is not None:
+            self._wheel._cancel(self)
+            self._wheel = None
+
+
+class TimerWheel(object):
+    """
+    Timer wheel for (large numbers of) timeouts with integer-second resolution,
+    eg WAMP call timeouts in the dealer.
+
+    Timers are kept in buckets keyed by their expiry tick (the absolute time
+    quantized to the wheel's resolution), with each bucket an insertion-ordered dict
+    so that both scheduling and cancelling a timer are O(1). Only a single
+    reactor delayed call - for the next tick which has timers - is pending at any
+    time, regardless of the number of timers.
+
+    Timers never fire early: a timer with a delay of ``d`` seconds fires at the
+    first tick at or after ``now + d``.
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor, resolution=1):
+        """
+
+        :param reactor: The reactor (``IReactorTime`` provider) to schedule ticks on.
+
+        :param resolution: Length of a tick (bucket) in seconds.
+        :type resolution: int
+        """
+        assert type(resolution) == int and resolution > 0
+
+        self._reactor = reactor
+        self._resolution = resolution
+
+        # map: tick -> dict of timers (used as an ordered set)
+        self._buckets = {}
+
+        # min-heap of ticks having a bucket
+        self._ticks = []
+
+        # the single reactor delayed call pending for the next tick, and its tick
+        self._delayed_call = None
+        self._delayed_tick = None
+
+        # statistics
+        self._active = 0
+        self._scheduled = 0
+        self._expired = 0
+        self._canceled = 0
+
+    def __len__(self):
+        return self._active
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Schedule a function to be called after a delay.
+
+        :param delay: Delay in seconds.
+        :type delay: int or float
+
+        :param func: The function to call when the timer fires (with ``args`` and ``kwargs``).
+
+        :returns: A timer handle with a ``cancel()`` method.
+        """
+        tick = int(math.ceil((self._reactor.seconds() + delay) / self._resolution))
+        timer = _WheelTimer(self, tick, func, args, kwargs)
+
+        bucket = self._buckets.get(tick, None)
+        if bucket is None:
+            bucket = {}
+            self._buckets[tick] = bucket
+            heapq.heappush(self._ticks, tick)
+        bucket[timer] = None
+
+        self._active += 1
+        self._scheduled += 1
+
+        if self._delayed_tick is None or tick < self._delayed_tick:
+            self._schedule(tick)
+
+        return timer
+
+    def _cancel(self, timer):
+        # the bucket is missing when the timer is cancelled from a callback of
+        # another timer firing in the same tick
+        bucket = self._buckets.get(timer._tick, None)
+        if bucket is not None:
+            del bucket[timer]
+            if not bucket:
+                # the tick stays in the heap, and is skipped when reached
+                del self._buckets[timer._tick]
+        self._active -= 1
+        self._canceled += 1
+
+    def _schedule(self, tick):
+        if self._delayed_call is not None and self._delayed_call.active():
+            self._delayed_call.cancel()
+        delay = max(0.0, tick * self._resolution - self._reactor.seconds())
+        self._delayed_tick = tick
+        self._delayed_call = self._reactor.callLater(delay, self._on_tick)
+
+    def _on_tick(self):
+        self._delayed_call = None
+        self._delayed_tick = None
+
+        now_tick = int(math.floor(self._reactor.seconds() / self._resolution))
+        ticks = self._ticks
+        while ticks and ticks[0] <= now_tick:
+            tick = heapq.heappop(ticks)
+            bucket = self._buckets.pop(tick, None)
+            if not bucket:
+                continue
+            for timer in list(bucket):
+                if timer._wheel is None:
+                    # cancelled by a callback of a timer fired before in this pass
+                    continue
+                timer._wheel = None
+                self._active -= 1
+                self._expired += 1
+                try:
+                    timer._func(*timer._args, **timer._kwargs)
+                except Exception:
+                    self.log.failure("timer callback failed")
+
+        # drop ticks of buckets which have been emptied by cancellations
+        while ticks and ticks[0] not in self._buckets:
+            heapq.heappop(ticks)
+
+        if ticks:
+            self._schedule(ticks[0])
+
+    def stats(self):
+        """
+        Get timer statistics.
+
+        :returns: Dict with the number of currently active timers and of (non-empty) buckets,
+            and the total number of timers scheduled, expired and cancelled.
+        :rtype: dict
+        """
+        return {
+            "active": self._active,
+            "buckets": len(self._buckets),
+            "scheduled": self._scheduled,
+            "expired": self._expired,
+            "canceled": self._canceled,
+        }
@@ -5,6 +5,8 @@
 #
 #####################################################################################
 
+import sys
+
 __all__ = ("WildcardMatcher", "WildcardTrieMatcher")
 
 
@@ -20,7 +22,9 @@ class WildcardTrieMatcher(object):
     def __setitem__(self, key, value):
         node = self._root
         for sym in key.split("."):
-            node = node.setdefault(sym, _Node())
+            # URI components are interned, since the same components are
+            # shared by many patterns (and looked up on every match)
+            node = node.setdefault(sys.intern(sym), _Node())
         node.value = value
         self._values.add(value)
 
@@ -68,24 +72,33 @@ class WildcardTrieMatcher(object):
             return default
 
     def iter_matches(self, key):
+        """
+        Iterate over the values of all patterns matching the given key.
+
+        The trie is walked depth-first using an explicit stack (exact
+        component matches before wildcard matches), rather than recursive
+        generators.
+        """
         key = key.split(".")
         key_len = len(key)
 
-        def rec(node, i):
+        matches = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, i = stack.pop()
             if i == key_len:
                 if hasattr(node, "value"):
-                    yield node.value
+                    matches.append(node.value)
             else:
-                nd = node.get(key[i])
+                # push the wildcard branch first, so that the exact branch is visited first
+                nd = node.get("")
                 if nd is not None:
-                    for e in rec(nd, i + 1):
-                        yield e
-                nd = node.get("")  # wildcard
+                    stack.append((nd, i + 1))
+                nd = node.get(key[i])
                 if nd is not None:
-                    for e in rec(nd, i + 1):
-                        yield e
+                    stack.append((nd, i + 1))
 
-        return rec(self._root, 0)
+        return iter(matches)
 
 
 class WildcardMatcher(object):
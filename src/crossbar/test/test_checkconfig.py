@@ -217,6 +217,26 @@ class CheckWebsocketTests(TestCase):
         self.assertTrue("'auto_ping_timeout' is in milliseconds" in str(ctx.exception))
 
 
+class CheckMQTTTests(TestCase):
+    def _check(self, **options):
+        transport = {"type": "mqtt", "options": dict(realm="realm1", **options)}
+        checkconfig.check_listening_transport_mqtt(None, transport, with_endpoint=False)
+
+    def test_zero_copy(self):
+        self._check(zero_copy=True)
+        self._check(parser="bytes", zero_copy=True)
+        self._check(parser="bitstring", zero_copy=False)
+
+    def test_zero_copy_bitstring(self):
+        with self.assertRaises(checkconfig.InvalidConfigException) as ctx:
+            self._check(parser="bitstring", zero_copy=True)
+        self.assertIn("zero_copy", str(ctx.exception))
+
+    def test_zero_copy_type(self):
+        with self.assertRaises(checkconfig.InvalidConfigException):
+            self._check(zero_copy="yes")
+
+
 class CheckRealmTests(TestCase):
     """
     Tests for check_router_realm, check_router_realm_role
@@ -27,6 +27,7 @@ from crossbar.common.process import NativeProcess
 from crossbar.common.profiler import PROFILERS
 from crossbar.common.reloader import TrackingModuleReloader
 from crossbar.interfaces import ISession
+from crossbar.router.auth.pending import authentication_cache_stats
 
 __all__ = ("WorkerController",)
 
@@ -334,6 +335,20 @@ class WorkerController(NativeProcess):
         self.log.debug("{klass}.get_pythonpath", klass=self.__class__.__name__)
         return sys.path
 
+    @wamp.register(None)
+    def get_authentication_cache_stats(self, details=None):
+        """
+        Get statistics of the authentication caches of dynamic authenticators in this worker
+        (only transport authentication methods with ``authenticator-cache-ttl`` configured have a cache).
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.get_authentication_cache_stats``.
+
+        :returns: List of cache statistics (authmethod, authenticator, ttl, size, hits, misses, ..).
+        :rtype: list[dict]
+        """
+        return authentication_cache_stats()
+
     @wamp.register(None)
     def add_pythonpath(self, paths, prepend=True, details=None):
         """
@@ -5,9 +5,12 @@
 #
 #####################################################################################
 
+import hashlib
 import os
+import re
+from bisect import bisect_left
 from pprint import pformat
-from typing import Any, Dict, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from autobahn import util, wamp
 from autobahn.twisted.component import Component, _create_transport_endpoint, _create_transport_factory
@@ -19,7 +22,7 @@ from autobahn.wamp.exception import ApplicationError, ProtocolError, TransportLo
 from autobahn.wamp.interfaces import IMessage, ITransportHandler
 from autobahn.wamp.role import RoleBrokerFeatures, RoleDealerFeatures
 from twisted.internet.base import ReactorBase
-from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue, succeed
 from twisted.internet.error import DNSLookupError
 from txaio import as_future, make_logger, time_ns
 
@@ -28,6 +31,13 @@ from crossbar.common.key import _read_node_key
 from crossbar.interfaces import IRealmContainer
 from crossbar.node import worker
 from crossbar.router.auth import AUTHMETHOD_MAP, PendingAuthScram, PendingAuthTicket, PendingAuthWampCra
+from crossbar.router.protocol import (
+    WampMuxChannel,
+    WampMuxRawSocketClientFactory,
+    WampMuxRawSocketClientProtocol,
+    WampRawSocketClientProtocol,
+    WampWebSocketClientProtocol,
+)
 from crossbar.router.session import RouterFactory, RouterSessionFactory
 from crossbar.worker.controller import WorkerController
 from crossbar.worker.transport import TransportController
@@ -43,16 +53,170 @@ __all__ = (
     "ProxyController",
     "ProxyConnection",
     "ProxyRoute",
+    "ProxyBackendPool",
 )
 
 log = make_logger()
 
+# WAMP messages which are never forwarded as is, but always processed by the proxy (session lifecycle)
+_NO_RAW_FORWARD = frozenset(
+    (
+        message.Hello.MESSAGE_TYPE,
+        message.Welcome.MESSAGE_TYPE,
+        message.Abort.MESSAGE_TYPE,
+        message.Challenge.MESSAGE_TYPE,
+        message.Authenticate.MESSAGE_TYPE,
+        message.Goodbye.MESSAGE_TYPE,
+    )
+)
+
+_JSON_HEADER = re.compile(rb"\s*\[\s*(\d+)(?:\s*,\s*(\d+)(?:\s*,\s*(\d+))?)?")
+
+
+def _cbor_head(payload: bytes, pos: int) -> Tuple[int, int, int]:
+    # major type, argument and position after the data item head
+    major, info = payload[pos] >> 5, payload[pos] & 0x1F
+    pos += 1
+    if info < 24:
+        return major, info, pos
+    if info == 31:
+        # indefinite length
+        return major, -1, pos
+    if info > 27:
+        raise ValueError("invalid CBOR data item")
+    size = 1 << (info - 24)
+    return major, int.from_bytes(payload[pos : pos + size], "big"), pos + size
+
+
+def _msgpack_uint(payload: bytes, pos: int) -> Tuple[int, int]:
+    # unsigned integer and position after it
+    tag = payload[pos]
+    if tag < 0x80:
+        return tag, pos + 1
+    if 0xCC <= tag <= 0xCF:
+        size = 1 << (tag - 0xCC)
+        return int.from_bytes(payload[pos + 1 : pos + 1 + size], "big"), pos + 1 + size
+    raise ValueError("not a MessagePack unsigned integer")
+
+
+def _parse_message_header(serializer_id: str, payload: bytes) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    Parse only the header of a serialized WAMP message: the message type, and the request ID
+    (or subscription/registration ID for EVENT/INVOCATION, session ID for WELCOME), which is
+    the second element of the message (the third for ERROR).
+
+    :param serializer_id: The WAMP serializer the message was serialized with.
+    :param payload: The serialized WAMP message.
+    :return: The message type and ID (``None`` for messages without one), or ``None`` when
+        the message or serializer cannot be parsed.
+    """
+    try:
+        if serializer_id == "json":
+            m = _JSON_HEADER.match(payload)
+            if m is None:
+                return None
+            values = [int(v) for v in m.groups() if v is not None]
+        elif serializer_id == "cbor":
+            major, length, pos = _cbor_head(payload, 0)
+            if major != 4 or length == 0:
+                return None
+            values = []
+            for _ in range(3 if length < 0 else min(length, 3)):
+                major, value, pos = _cbor_head(payload, pos)
+                if major != 0:
+                    break
+                values.append(value)
+        elif serializer_id == "msgpack":
+            tag = payload[0]
+            if 0x90 <= tag <= 0x9F:
+                length, pos = tag & 0x0F, 1
+            elif tag in (0xDC, 0xDD):
+                size = 2 if tag == 0xDC else 4
+                length, pos = int.from_bytes(payload[1 : 1 + size], "big"), 1 + size
+            else:
+                return None
+            values = []
+            for _ in range(min(length, 3)):
+                try:
+                    value, pos = _msgpack_uint(payload, pos)
+                except ValueError:
+                    break
+                values.append(value)
+        else:
+            # other serializers (and batched modes) are not supported
+            return None
+    except (IndexError, ValueError):
+        return None
+
+    if not values:
+        return None
+    msg_type = values[0]
+    if msg_type == message.Error.MESSAGE_TYPE:
+        return msg_type, values[2] if len(values) > 2 else None
+    return msg_type, values[1] if len(values) > 1 else None
+
+
+def _supports_raw_forwarding(frontend_transport, backend_transport) -> bool:
+    # messages can be forwarded as is when both transports speak the same (parsable) serialization
+    if not hasattr(frontend_transport, "send_raw") or not hasattr(backend_transport, "send_raw"):
+        return False
+    frontend_serializer = getattr(frontend_transport, "_serializer", None)
+    backend_serializer = getattr(backend_transport, "_serializer", None)
+    if frontend_serializer is None or backend_serializer is None:
+        return False
+    return frontend_serializer.SERIALIZER_ID == backend_serializer.SERIALIZER_ID and (
+        frontend_serializer.SERIALIZER_ID in ("json", "cbor", "msgpack")
+    )
+
 
 class ProxyWorkerProcess(worker.NativeWorkerProcess):
     TYPE = "proxy"
     LOGNAME = "Proxy"
 
 
+class TimingHistogram(object):
+    """
+    Histogram of durations (in ms), counted in buckets with fixed upper bounds.
+    """
+
+    __slots__ = ("_bounds", "_counts", "_count", "_sum", "_max")
+
+    BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self, bounds: Tuple[float, ...] = BOUNDS):
+        """
+
+        :param bounds: The (sorted) upper bounds of the buckets in ms.
+        """
+        self._bounds = bounds
+
+        # the last bucket counts the durations above the largest bound
+        self._counts = [0] * (len(bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def add(self, duration: float):
+        """
+        Count a duration.
+
+        :param duration: The duration in ms.
+        """
+        self._counts[bisect_left(self._bounds, duration)] += 1
+        self._count += 1
+        self._sum += duration
+        if duration > self._max:
+            self._max = duration
+
+    def marshal(self) -> Dict[str, Any]:
+        return {
+            "count": self._count,
+            "avg": self._sum / self._count if self._count else None,
+            "max": self._max,
+            "buckets": [[bound, count] for bound, count in zip(self._bounds + (None,), self._counts)],
+        }
+
+
 class ProxyFrontendSession(object):
     """
     A router-side proxy session that handles incoming client
@@ -88,6 +252,14 @@ class ProxyFrontendSession(object):
         ),
     }
 
+    # stages of a frontend session joining, timed from HELLO received to WELCOME sent:
+    #
+    # - "authenticate": HELLO received until the frontend session is accepted
+    # - "connect": accepted until connected to the backend
+    # - "join": connected until joined on the backend
+    # - "total": HELLO received until WELCOME sent
+    JOIN_STAGES = ("authenticate", "connect", "join", "total")
+
     log = make_logger()
 
     def __init__(self, router_factory):
@@ -118,6 +290,13 @@ class ProxyFrontendSession(object):
 
         self._custom_authextra = {}
 
+        # when HELLO was received and the session was accepted (Posix time in ns)
+        self._hello_received = None
+        self._accepted = None
+
+        # when set, messages are forwarded to the backend without deserializing them
+        self._raw_forwarding = False
+
     @property
     def realm(self):
         return self._realm
@@ -306,6 +485,53 @@ class ProxyFrontendSession(object):
                 else:
                     # if we have an active backend connection, forward the WAMP message
                     self._backend_session._transport.send(msg)
+                    if self._backend_session._proxy_connection is not None:
+                        self._backend_session._proxy_connection._messages_sent += 1
+
+    def onRawMessage(self, payload, is_binary):
+        """
+        Callback fired by the frontend transport with each WAMP message received, before
+        deserializing it. When the frontend and backend transports use the same serializer,
+        messages of the established session are forwarded to the backend as is.
+
+        :param payload: The serialized WAMP message received.
+        :type payload: bytes
+        :param is_binary: Whether the serialization is binary.
+        :type is_binary: bool
+        :return: ``True`` when the message was forwarded, and ``False`` when the message is
+            to be deserialized and processed by :meth:`onMessage`.
+        :rtype: bool
+        """
+        if not self._raw_forwarding or self._backend_session is None or self._backend_session._transport is None:
+            return False
+        header = _parse_message_header(self.transport._serializer.SERIALIZER_ID, payload)
+        if header is None or header[0] in _NO_RAW_FORWARD:
+            return False
+        self.log.trace(
+            "{func} forwarding message as is (message_type={message_type}, request={request})",
+            func=hltype(self.onRawMessage),
+            message_type=header[0],
+            request=header[1],
+        )
+        self._backend_session._transport.send_raw(payload, is_binary)
+        if self._backend_session._proxy_connection is not None:
+            self._backend_session._proxy_connection._messages_sent += 1
+        return True
+
+    def _enable_raw_forwarding(self):
+        # forward messages as is (both ways) after the session was established, if possible
+        backend = self._backend_session
+        if backend is None or not getattr(backend, "_passthrough", False):
+            return
+        if _supports_raw_forwarding(self.transport, backend._transport):
+            self._raw_forwarding = True
+            backend._raw_forwarding = True
+            self.log.debug(
+                "{func} forwarding messages as is for session {session_id} (serializer={serializer})",
+                func=hltype(self._enable_raw_forwarding),
+                session_id=hlid(self._session_id),
+                serializer=hlval(self.transport._serializer.SERIALIZER_ID),
+            )
 
     def frontend_accepted(self, accept):
         # we have done authentication with the client; now we can connect to
@@ -315,6 +541,8 @@ class ProxyFrontendSession(object):
         self.log.info(
             "{func} proxy frontend session accepted ({accept})", func=hltype(self.frontend_accepted), accept=accept
         )
+        self._accepted = time_ns()
+        self._controller.record_join_timing("authenticate", self._hello_received, self._accepted)
 
         if (
             hasattr(self.transport, "_cbtid")
@@ -338,14 +566,16 @@ class ProxyFrontendSession(object):
             try:
                 # first, wait for the WAMP-level transport to connect before starting to join
                 yield backend._on_connect
+                connected = time_ns()
+                self._controller.record_join_timing("connect", self._accepted, connected)
 
                 # while we were yielding, frontend session might have been closed (transport disconnected)
                 if self.transport is None:
                     backend.disconnect()
                     raise TransportLost("Proxy frontend session disconnected while connecting to backend")
 
-                # node private key
-                key = _read_node_key(self._controller._cbdir, private=False)
+                # node public key
+                key = self._controller.get_node_key()
 
                 # authid of the connecting backend (proxy service) session is this proxy node's ID
                 backend_authid = self._controller.node_id
@@ -404,6 +634,8 @@ class ProxyFrontendSession(object):
                         pending_session_id=self._pending_session_id,
                         func=hltype(backend_joined),
                     )
+                    self._controller.record_join_timing("join", connected)
+
                     # we're ready now! store and return the backend session
                     self._backend_session = session
 
@@ -480,6 +712,7 @@ class ProxyFrontendSession(object):
         self.log.debug(
             "{func} proxy frontend session processing HELLO (msg={msg})", func=hltype(self._process_Hello), msg=msg
         )
+        self._hello_received = time_ns()
         self._pending_session_id = util.id()
         self._goodbye_sent = False
 
@@ -732,6 +965,8 @@ class ProxyFrontendSession(object):
                             if self.transport:
                                 self._backend_session = session
                                 self.transport.send(msg)
+                                self._enable_raw_forwarding()
+                                self._controller.record_join_timing("total", self._hello_received)
                                 self.log.debug(
                                     "{func} proxy frontend session WELCOME: session_id={session_id}, session={session}, "
                                     'details="{details}"',
@@ -859,6 +1094,8 @@ class ProxyFrontendSession(object):
                                     if self.transport:
                                         self._backend_session = session
                                         self.transport.send(msg)
+                                        self._enable_raw_forwarding()
+                                        self._controller.record_join_timing("total", self._hello_received)
                                         self.log.debug(
                                             "{func} proxy frontend session WELCOME: session_id={session_id}, "
                                             "session={session}, msg={msg}",
@@ -918,9 +1155,9 @@ class ProxyBackendSession(Session):
     """
     This is a single WAMP session to the real backend service
 
-    There is one of these for every client connection. (In the future,
-    we could multiplex over a single backend connection -- for now,
-    there's a backend connection per frontend client).
+    There is one of these for every client connection. It runs either on a
+    backend connection of its own, or as a channel on a connection shared with
+    other backend sessions (see :class:`ProxyBackendPool`).
     """
 
     def onOpen(self, transport):
@@ -996,6 +1233,109 @@ class ProxyBackendSession(Session):
             # msg is a real WAMP message that our backend WAMP protocol has deserialized. so now we re-serialize it
             # for whatever the frontend is speaking and forward
             self._frontend._forward(msg)
+            if self._proxy_connection is not None:
+                self._proxy_connection._messages_received += 1
+
+    def onRawMessage(self, payload, is_binary):
+        """
+        Callback fired by the backend transport with each WAMP message received, before
+        deserializing it. When forwarding as is was enabled by the frontend session (see
+        :meth:`ProxyFrontendSession.onRawMessage`), messages are forwarded to the frontend
+        without deserializing and serializing them again.
+
+        :param payload: The serialized WAMP message received.
+        :type payload: bytes
+        :param is_binary: Whether the serialization is binary.
+        :type is_binary: bool
+        :return: ``True`` when the message was consumed.
+        :rtype: bool
+        """
+        if not self._raw_forwarding:
+            return False
+        header = _parse_message_header(self._transport._serializer.SERIALIZER_ID, payload)
+        if header is None or header[0] in _NO_RAW_FORWARD:
+            return False
+        if self._proxy_connection is not None:
+            self._proxy_connection._messages_received += 1
+        if self._frontend is not None and self._frontend.transport is not None:
+            self._frontend.transport.send_raw(payload, is_binary)
+        else:
+            self.log.debug(
+                "Trying to forward a message to the client, but no frontend transport! "
+                "(message_type={message_type}, request={request})",
+                message_type=header[0],
+                request=header[1],
+            )
+        return True
+
+
+def _create_backend_session(backend_config: Dict[str, Any], key: Dict[str, Any]) -> "ProxyBackendSession":
+    """
+    Create a (not yet connected) proxy backend session, with the authenticator to use
+    for the given backend connection configuration.
+
+    :param backend_config: Proxy backend connection.
+    :param key: This (the connecting) node's key.
+    :return: A new proxy backend session.
+    """
+    # this is our WAMP session to the backend
+    session = ProxyBackendSession()
+
+    # forward messages as is between frontend and backend when both use the same serializer
+    session._passthrough = backend_config.get("passthrough", True)
+    session._raw_forwarding = False
+
+    # the proxy connection the session was opened for (set when mapped to a frontend session)
+    session._proxy_connection = None
+
+    authextra = {}
+    log.debug(
+        "{func} connecting to backend with authextra={authextra}",
+        func=hltype(_create_backend_session),
+        authextra=authextra,
+    )
+
+    # if auth is configured and includes "cryptosign-proxy", always prefer
+    # that and connect to the backend node authenticating with WAMP-cryptosign
+    # using the connecting proxy node's key
+    #
+    # authentication via WAMP-cryptosign SHOULD always be possible with the backend node
+    #
+    if "auth" in backend_config and "cryptosign-proxy" in backend_config["auth"]:
+        session.add_authenticator(create_authenticator("cryptosign-proxy", privkey=key["hex"], authextra=authextra))
+        log.debug(
+            "{func} using cryptosign-proxy authenticator for backend connection, authextra={authextra}",
+            func=hltype(_create_backend_session),
+            authextra=authextra,
+        )
+
+    # if auth is not configured, or is configured and includes "anonymous-proxy",
+    # try to connect to the backend node authenticating with WAMP-anonymous
+    #
+    # authentication via WAMP-anonymous MAY be possible with the backend node if enabled
+    #
+    elif "auth" not in backend_config or "anonymous-proxy" in backend_config["auth"]:
+        # IMPORTANT: this is security sensitive! we only allow anonymous proxy
+        # locally on a host, that is, when the transport type is Unix domain socket
+        if backend_config["transport"]["endpoint"]["type"] == "unix":
+            session.add_authenticator(create_authenticator("anonymous-proxy", authextra=authextra))
+            log.debug(
+                "{func} using anonymous-proxy over UDS authenticator for backend connection, authextra={authextra}",
+                func=hltype(_create_backend_session),
+                authextra=authextra,
+            )
+        else:
+            raise RuntimeError(
+                'anonymous-proxy authenticator only allowed on Unix domain socket based transports, not type "{}"'.format(
+                    backend_config["transport"]["endpoint"]["type"]
+                )
+            )
+
+    # no valid authentication method found
+    else:
+        raise RuntimeError("could not determine valid authentication method to connect to the backend node")
+
+    return session
 
 
 def make_backend_connection(
@@ -1003,6 +1343,7 @@ def make_backend_connection(
     controller: "ProxyController",
     backend_config: Dict[str, Any],
     frontend_session: ApplicationSession,
+    pool: Optional["ProxyBackendPool"] = None,
 ) -> Deferred:
     """
     Create a connection to a router backend, wiring up the given proxy frontend session
@@ -1031,20 +1372,26 @@ def make_backend_connection(
 
     :param reactor: Twisted reactor to use.
     :param controller: The proxy controller the backend connection originates from.
-    :param cbdir: This node's directory.
     :param backend_config: Proxy backend connection.
     :param frontend_session: The proxy frontend session for which to create a mapped
         backend connection.
+    :param pool: When the backend connection is multiplexed, the pool of shared connections
+        to open the backend session on (rather than opening a connection of its own).
     :return: A deferred that resolves with a proxy backend session that is joined on the realm,
         under the authrole, as the proxy frontend session.
     """
-    log.info(
-        "{func} proxy connecting to backend with backend_config=\n{backend_config}",
+    log.debug(
+        "{func} proxy connecting to backend with backend_config={backend_config}",
         func=hltype(make_backend_connection),
-        backend_config=pformat(backend_config),
+        backend_config=backend_config,
     )
 
-    cbdir = controller.cbdir
+    # connecting node (this node) private key
+    key = controller.get_node_key(private=True)
+
+    # open the backend session as a channel on a shared (multiplexed) connection
+    if pool is not None:
+        return pool.open_session(_create_backend_session(backend_config, key), frontend_session)
 
     # fired when the component has connected, authenticated and joined a realm on the backend node
     ready = Deferred()
@@ -1052,63 +1399,9 @@ def make_backend_connection(
     # connected node transport
     backend = _create_transport(0, backend_config["transport"])
 
-    # connecting node (this node) private key
-    key = _read_node_key(cbdir, private=True)
-
     # factory for proxy->router backend connections, uses authentication (to router backend worker)
     def create_session():
-        # this is our WAMP session to the backend
-        session = ProxyBackendSession()
-
-        authextra = {}
-        log.debug(
-            "{func}::create_session() connecting to backend with authextra=\n{authextra}",
-            func=hltype(make_backend_connection),
-            authextra=pformat(authextra),
-        )
-
-        # if auth is configured and includes "cryptosign-proxy", always prefer
-        # that and connect to the backend node authenticating with WAMP-cryptosign
-        # using the connecting proxy node's key
-        #
-        # authentication via WAMP-cryptosign SHOULD always be possible with the backend node
-        #
-        if "auth" in backend_config and "cryptosign-proxy" in backend_config["auth"]:
-            session.add_authenticator(
-                create_authenticator("cryptosign-proxy", privkey=key["hex"], authextra=authextra)
-            )
-            log.debug(
-                "{func} using cryptosign-proxy authenticator for backend connection, authextra=\n{authextra}",
-                func=hltype(make_backend_connection),
-                authextra=pformat(authextra),
-            )
-
-        # if auth is not configured, or is configured and includes "anonymous-proxy",
-        # try to connect to the backend node authenticating with WAMP-anonymous
-        #
-        # authentication via WAMP-anonymous MAY be possible with the backend node if enabled
-        #
-        elif "auth" not in backend_config or "anonymous-proxy" in backend_config["auth"]:
-            # IMPORTANT: this is security sensitive! we only allow anonymous proxy
-            # locally on a host, that is, when the transport type is Unix domain socket
-            if backend_config["transport"]["endpoint"]["type"] == "unix":
-                session.add_authenticator(create_authenticator("anonymous-proxy", authextra=authextra))
-                log.debug(
-                    "{func} using anonymous-proxy over UDS authenticator for backend connection, "
-                    "authextra=\n{authextra}",
-                    func=hltype(make_backend_connection),
-                    authextra=pformat(authextra),
-                )
-            else:
-                raise RuntimeError(
-                    'anonymous-proxy authenticator only allowed on Unix domain socket based transports, not type "{}"'.format(
-                        backend_config["transport"]["endpoint"]["type"]
-                    )
-                )
-
-        # no valid authentication method found
-        else:
-            raise RuntimeError("could not determine valid authentication method to connect to the backend node")
+        session = _create_backend_session(backend_config, key)
 
         def connected(new_session, transport):
             ready.callback(new_session)
@@ -1118,6 +1411,11 @@ def make_backend_connection(
 
     # client transport factory to carry our session
     factory = _create_transport_factory(reactor, backend, create_session)
+    # use our client protocols, which can send and receive serialized messages as is
+    if backend_config["transport"]["type"] == "websocket":
+        factory.protocol = WampWebSocketClientProtocol
+    else:
+        factory.protocol = WampRawSocketClientProtocol
     # reduce noise from logs, otherwise for each connect/disconnect to the backend
     factory.noisy = False
     endpoint = _create_transport_endpoint(reactor, backend_config["transport"]["endpoint"])
@@ -1138,6 +1436,123 @@ def make_backend_connection(
     return ready
 
 
+class ProxyBackendPool(object):
+    """
+    Multiplexed connections from this proxy worker to a router backend.
+
+    Rather than opening a connection of its own for every proxy frontend session, the backend
+    sessions are opened as channels on at most ``multiplex.connections`` shared WAMP-RawSocket
+    connections. Each channel is routed on the wire by its ID (the pending session ID of
+    the proxy frontend session), so the number of backend connections is bounded per proxy
+    worker, regardless of the number of connected clients.
+
+    The router backend must listen on a RawSocket transport with ``"multiplex": true``.
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor: ReactorBase, backend_config: Dict[str, Any]):
+        """
+
+        :param reactor: Twisted reactor to use.
+        :param backend_config: Proxy backend connection.
+        """
+        self._reactor = reactor
+        self._config = backend_config
+        self._size = backend_config.get("multiplex", {}).get("connections", 1)
+        if type(self._size) != int or self._size < 1:
+            raise ValueError('invalid value {} for "connections" in multiplex configuration'.format(self._size))
+
+        # currently open (shared) connections to the backend
+        self._connections: List[WampMuxRawSocketClientProtocol] = []
+
+        # connection currently being established (if any), and sessions waiting for it
+        self._connecting: Optional[Deferred] = None
+        self._waiting: List[Deferred] = []
+
+    def marshal(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._connections),
+            "max_connections": self._size,
+            "channels": sum(len(proto._channels or {}) for proto in self._connections),
+        }
+
+    def _connect(self):
+        factory = WampMuxRawSocketClientFactory(None, self._config["transport"])
+        factory.noisy = False
+        endpoint = _create_transport_endpoint(self._reactor, self._config["transport"]["endpoint"])
+
+        self._connecting = endpoint.connect(factory)
+        self._connecting.addCallback(lambda proto: proto.is_open)
+        self._connecting.addCallbacks(self._connected, self._connect_failed)
+
+    def _connected(self, proto: WampMuxRawSocketClientProtocol):
+        self._connecting = None
+        self._connections.append(proto)
+        proto.is_closed.addCallback(self._connection_lost)
+        self.log.info(
+            "{func} multiplexed proxy backend connection {cnt}/{size} open",
+            func=hltype(self._connected),
+            cnt=len(self._connections),
+            size=self._size,
+        )
+
+        waiting, self._waiting = self._waiting, []
+        for d in waiting:
+            d.callback(proto)
+
+    def _connect_failed(self, fail):
+        self._connecting = None
+        waiting, self._waiting = self._waiting, []
+        for d in waiting:
+            d.errback(fail)
+
+    def _connection_lost(self, proto: WampMuxRawSocketClientProtocol):
+        if proto in self._connections:
+            self._connections.remove(proto)
+
+    def _get_connection(self) -> Deferred:
+        # grow the pool up to its size, while already sharing the connections open
+        if self._connecting is None and len(self._connections) < self._size:
+            self._connect()
+
+        if self._connections:
+            return succeed(min(self._connections, key=lambda proto: len(proto._channels)))
+
+        d = Deferred()
+        self._waiting.append(d)
+        return d
+
+    @inlineCallbacks
+    def open_session(self, session: "ProxyBackendSession", frontend_session: "ProxyFrontendSession"):
+        """
+        Open a proxy backend session as a channel on one of the shared backend connections.
+
+        :param session: The (not yet connected) proxy backend session.
+        :param frontend_session: The proxy frontend session the backend session forwards.
+        :return: The proxy backend session, connected (but not yet joined).
+        """
+        proto = yield self._get_connection()
+
+        channel_id = frontend_session._pending_session_id if frontend_session else None
+        while channel_id is None or channel_id in proto._channels:
+            channel_id = util.id()
+
+        channel = WampMuxChannel(proto, channel_id, session)
+        channel._proxy_other_side = frontend_session
+        proto.open_channel(channel)
+        returnValue(session)
+
+    def close(self):
+        """
+        Close all shared backend connections (and hence all sessions running on these).
+        """
+        if self._connecting is not None:
+            self._connecting.cancel()
+        for proto in list(self._connections):
+            proto.transport.loseConnection()
+
+
 class AuthenticatorSession(ApplicationSession):
     # when running over TLS, require TLS channel binding
     # CHANNEL_BINDING = 'tls-unique'
@@ -1196,7 +1611,12 @@ class AuthenticatorSession(ApplicationSession):
 
 
 def make_service_session(
-    reactor: ReactorBase, controller: "ProxyController", backend_config: Dict[str, Any], realm: str, authrole: str
+    reactor: ReactorBase,
+    controller: "ProxyController",
+    backend_config: Dict[str, Any],
+    realm: str,
+    authrole: str,
+    pool: Optional[ProxyBackendPool] = None,
 ) -> Deferred:
     """
     Create a connection to a router backend, creating a new service session.
@@ -1206,10 +1626,10 @@ def make_service_session(
     :param backend_config: Proxy backend connection.
     :param realm: The WAMP realm the service session is joined on.
     :param authrole: The WAMP authrole the service session is joined as.
+    :param pool: When the backend connection is multiplexed, the pool of shared connections
+        to open the service session on.
     :return: A service session joined on the given realm, under the given authrole.
     """
-    cbdir = controller.cbdir
-
     # authid of the proxy session forwarded to the backend: for service session that are
     # not forwarding incoming session (like make_backend_session), but represent an
     # independent session (exposed on the proxy), we synthesize an authid
@@ -1227,8 +1647,7 @@ def make_service_session(
     if "auth" in backend_config and "cryptosign-proxy" in backend_config["auth"]:
         # we will do cryptosign authentication to any backend node
 
-        # FIXME: get node private key from this proxy node
-        node_privkey = _read_node_key(cbdir, private=True)["hex"]
+        node_privkey = controller.get_node_key(private=True)["hex"]
 
         authentication = {
             "cryptosign-proxy": {
@@ -1274,6 +1693,26 @@ def make_service_session(
     else:
         raise RuntimeError("could not determine valid authentication method to connect to the backend node")
 
+    # open the service session as a channel on a shared (multiplexed) connection
+    if pool is not None:
+        session = Session(types.ComponentConfig(realm=realm))
+        for authmethod, auth_config in authentication.items():
+            session.add_authenticator(create_authenticator(authmethod, **auth_config))
+
+        ready = Deferred()
+
+        def session_joined(session, details):
+            ready.callback(session)
+
+        def session_disconnected(session, was_clean=False):
+            if not ready.called:
+                ready.errback(RuntimeError("backend session disconnected without ever having joined before"))
+
+        session.on("join", session_joined)
+        session.on("disconnect", session_disconnected)
+        pool.open_session(session, None).addErrback(ready.errback)
+        return ready
+
     # use Component API and create a component for the service session
     comp = Component(transports=[backend_config["transport"]], realm=realm, authentication=authentication)
 
@@ -1294,6 +1733,13 @@ def make_service_session(
     return ready
 
 
+BALANCE_ROUNDROBIN = "round-robin"
+BALANCE_LEAST_SESSIONS = "least-sessions"
+BALANCE_CONSISTENT_HASH = "consistent-hash"
+
+# strategies for selecting one of the proxy connections routed for a (realm, authrole)
+BALANCE_STRATEGIES = (BALANCE_ROUNDROBIN, BALANCE_LEAST_SESSIONS, BALANCE_CONSISTENT_HASH)
+
 STATE_CREATED = 1
 STATE_STARTING = 2
 STATE_STARTED = 3
@@ -1318,7 +1764,14 @@ class ProxyRoute(object):
 
     log = make_logger()
 
-    def __init__(self, controller: "ProxyController", realm_name: str, route_id: str, config: Dict[str, Any]):
+    def __init__(
+        self,
+        controller: "ProxyController",
+        realm_name: str,
+        route_id: str,
+        config: Dict[str, Any],
+        options: Optional[Dict[str, Any]] = None,
+    ):
         """
 
         :param controller: The (proxy) worker controller session the proxy connection is created from.
@@ -1329,11 +1782,15 @@ class ProxyRoute(object):
 
         :param config: The proxy route's configuration, which is a dictionary of role names
             and connection IDs as values.
+
+        :param options: The proxy route's options, e.g. the ``"strategy"`` to select one of the
+            connections routed for a role.
         """
         self._controller = controller
         self._realm_name = realm_name
         self._route_id = route_id
         self._config = config
+        self._options = options or {}
         self._started = None
         self._stopped = None
         self._state = STATE_CREATED
@@ -1343,6 +1800,7 @@ class ProxyRoute(object):
             "realm": self._realm_name,
             "id": self._route_id,
             "config": self._config,
+            "options": self._options,
             "started": self._started,
             "stopped": self._stopped,
             "state": self._state,
@@ -1396,6 +1854,14 @@ class ProxyRoute(object):
         """
         return self._config
 
+    @property
+    def strategy(self) -> Optional[str]:
+        """
+
+        :return: The strategy to select one of the connections routed for a role, if configured in this route.
+        """
+        return self._options.get("strategy", None)
+
     @property
     def started(self) -> Optional[int]:
         """
@@ -1537,13 +2003,38 @@ class ProxyConnection(object):
         self._stopped = None
         self._state = STATE_CREATED
 
+        # shared backend connections, when the proxy connection is multiplexed
+        self._pool: Optional[ProxyBackendPool] = None
+
+        # backend sessions currently mapped to frontend sessions (including sessions being
+        # opened), and backend sessions opened in total
+        self._sessions = 0
+        self._sessions_total = 0
+
+        # WAMP messages forwarded from frontend to backend sessions (sent), and from backend
+        # to frontend sessions (received)
+        self._messages_sent = 0
+        self._messages_received = 0
+
     def marshal(self):
-        return {
+        obj = {
             "id": self._connection_id,
             "config": self._config,
             "started": self._started,
             "stopped": self._stopped,
             "state": self._state,
+            "stats": self.marshal_stats(),
+        }
+        if self._pool is not None:
+            obj["multiplex"] = self._pool.marshal()
+        return obj
+
+    def marshal_stats(self) -> Dict[str, int]:
+        return {
+            "sessions": self._sessions,
+            "sessions_total": self._sessions_total,
+            "messages_sent": self._messages_sent,
+            "messages_received": self._messages_received,
         }
 
     def __str__(self):
@@ -1557,6 +2048,14 @@ class ProxyConnection(object):
         """
         return self._connection_id
 
+    @property
+    def sessions(self) -> int:
+        """
+
+        :return: Number of backend sessions currently mapped to frontend sessions over this connection.
+        """
+        return self._sessions
+
     @property
     def config(self) -> Dict[str, Any]:
         """
@@ -1589,6 +2088,14 @@ class ProxyConnection(object):
         """
         return self._state
 
+    @property
+    def pool(self) -> Optional[ProxyBackendPool]:
+        """
+
+        :return: The shared backend connections of this proxy backend connection, when multiplexed.
+        """
+        return self._pool
+
     @inlineCallbacks
     def start(self):
         """
@@ -1600,6 +2107,9 @@ class ProxyConnection(object):
         topic = "{}.on_proxy_connection_starting".format(self._controller._uri_prefix)
         yield self._controller.publish(topic, self.marshal(), options=types.PublishOptions(acknowledge=True))
 
+        if "multiplex" in self._config:
+            self._pool = ProxyBackendPool(self._controller._reactor, self._config)
+
         self._state = STATE_STARTED
         self._started = time_ns()
         self._stopped = None
@@ -1618,6 +2128,10 @@ class ProxyConnection(object):
         topic = "{}.on_proxy_connection_stopping".format(self._controller._uri_prefix)
         yield self._controller.publish(topic, self.marshal(), options=types.PublishOptions(acknowledge=True))
 
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
         self._state = STATE_STOPPED
         self._started = None
         self._stopped = time_ns()
@@ -1680,6 +2194,21 @@ class ProxyController(TransportController):
         # map: (realm, authrole) -> int
         self._roundrobin_idx = {}
 
+        # strategy to select one of the connections routed, when configured in a route (default is round-robin)
+        # map: (realm, authrole) -> str
+        self._strategies: Dict[Tuple[str, str], str] = {}
+
+        # backend connections resolved for routes, dropped whenever routes or connections are started or stopped
+        # map: (realm, authrole) -> List[ProxyConnection]
+        self._backend_connections: Dict[Tuple[str, str], List[ProxyConnection]] = {}
+
+        # this node's key (read from the node directory on first use)
+        # map: private -> node key
+        self._node_keys: Dict[bool, Dict[str, Any]] = {}
+
+        # timings of proxy frontend sessions joining, from HELLO received to WELCOME sent, by stage
+        self._join_timings = {stage: TimingHistogram() for stage in ProxyFrontendSession.JOIN_STAGES}
+
         # since we share some functionality with RouterController we
         # need to have a router_session_factory
         self._router_factory = RouterFactory(
@@ -1730,16 +2259,13 @@ class ProxyController(TransportController):
             # the route config is a map with role name as key
             result = any(authrole in route.config for route in realm_routes.values())
         else:
-            realm_routes = None
             result = False
         self.log.debug(
-            '{func}(realm="{realm}", authrole="{authrole}") -> {result} [routes={routes}, realm_routes={realm_routes}]',
+            '{func}(realm="{realm}", authrole="{authrole}") -> {result}',
             func=hltype(ProxyController.has_role),
             realm=hlid(realm),
             authrole=hlid(authrole),
             result=hlval(result),
-            realm_routes=hlval([route.config for route in realm_routes.values()] if realm_routes else []),
-            routes=sorted(self._routes.keys()),
         )
         return result
 
@@ -1791,13 +2317,13 @@ class ProxyController(TransportController):
             # .. check for (realm, authrole)
             if self._service_sessions[realm] is not None and authrole not in self._service_sessions[realm]:
                 if self.has_role(realm, authrole):
-                    # get backend connection configuration selected (round-robin or randomly) from all routes
+                    # get backend connection selected (round-robin or randomly) from all routes
                     # for the desired (realm, authrole)
-                    backend_config = self.get_backend_config(realm, authrole)
+                    connection = self.get_backend_connection(realm, authrole)
 
                     # create and store a new service session connected to the backend router worker
                     self._service_sessions[realm][authrole] = make_service_session(
-                        self._reactor, self, backend_config, realm, authrole
+                        self._reactor, self, connection.config, realm, authrole, pool=connection.pool
                     )
                 else:
                     # mark as non-existing!
@@ -1875,7 +2401,8 @@ class ProxyController(TransportController):
             self.log.info("{func} CACHE HIT {backend}", func=hltype(self.map_backend), backend=backend)
             return backend
 
-        backend_config = self.get_backend_config(realm, authrole)
+        connection = self.get_backend_connection(realm, authrole, authid=authid)
+        backend_config = connection.config
 
         # if auth uses cryptosign but has no privkey, we'd ideally
         # insert the node's private key
@@ -1886,30 +2413,41 @@ class ProxyController(TransportController):
 
         self.log.debug(
             '{func} CACHE MISS - opening new proxy backend connection for realm "{realm}", authrole "{authrole}" '
-            "using backend_config=\n{backend_config}",
+            "using backend_config={backend_config}",
             func=hltype(self.map_backend),
-            backend_config=pformat(backend_config),
+            backend_config=backend_config,
             realm=hlid(realm),
             authrole=hlid(authrole),
         )
 
+        # count the session on the connection right away, so that concurrently joining sessions are balanced
+        connection._sessions += 1
         try:
-            backend_proto = yield make_backend_connection(self._reactor, self, backend_config, frontend)
+            backend_proto = yield make_backend_connection(
+                self._reactor, self, backend_config, frontend, pool=connection.pool
+            )
         except DNSLookupError as e:
+            connection._sessions -= 1
             self.log.warn(
                 "{func} proxy worker could not connect to router backend: DNS resolution failed ({error})",
                 func=hltype(self.map_backend),
                 error=str(e),
             )
             raise e
+        except Exception:
+            connection._sessions -= 1
+            raise
 
+        connection._sessions_total += 1
         if frontend:
+            backend_proto._proxy_connection = connection
             self._backends_by_frontend[frontend] = backend_proto
+        else:
+            connection._sessions -= 1
 
         self.log.debug(
             '{func} proxy backend connection opened mapping frontend session to realm "{realm}", authrole "{authrole}"',
             func=hltype(self.map_backend),
-            backend_config=pformat(backend_config),
             realm=hlid(realm),
             authrole=hlid(authrole),
         )
@@ -1932,6 +2470,9 @@ class ProxyController(TransportController):
                 # session and delete it
                 backend.leave(reason=leave_reason, message=leave_message)
                 del self._backends_by_frontend[frontend]
+                if backend._proxy_connection is not None:
+                    backend._proxy_connection._sessions -= 1
+                    backend._proxy_connection = None
                 self.log.debug(
                     "{func} unmapped frontend session {frontend_session_id} from backend session {backend_session_id}",
                     func=hltype(self.unmap_backend),
@@ -1963,20 +2504,101 @@ class ProxyController(TransportController):
         :returns: a dict containing the connection configuration for the backend
             identified by the realm_name and role_name
         """
+        return self.get_backend_connection(realm_name, role_name).config
+
+    def get_backend_connection(self, realm_name, role_name, authid: Optional[str] = None) -> ProxyConnection:
+        """
+        Return the backend connection to use for the given backend realm and role, selected from
+        all connections routed for the realm and role using the strategy configured for the route:
+
+        * ``"round-robin"`` (default): cycle through the connections
+        * ``"least-sessions"``: the connection with the fewest backend sessions currently mapped
+        * ``"consistent-hash"``: the same connection for the same ``authid`` (while the routed
+          connections don't change, and only moving sessions of a removed connection otherwise)
+
+        :param realm_name: WAMP realm (the WAMP name, _not_ the run-time object ID).
+        :param role_name: WAMP authentication role (the WAMP URI, _not_ the run-time object ID).
+        :param authid: WAMP authentication ID of the session the connection is for (used with
+            strategy ``"consistent-hash"``).
+
+        :returns: the proxy backend connection for the backend identified by the realm_name and role_name
+        """
         assert self.has_role(realm_name, role_name), (
             "missing (realm_name={}, role_name={}) in ProxyController routes".format(realm_name, role_name)
         )
 
         key = realm_name, role_name
+        connections = self._backend_connections.get(key, None)
+        if connections is None:
+            connections = sorted(
+                (
+                    connection
+                    for connection in self._connections_by_auth.get(key, set())
+                    if connection.id in self._connections
+                ),
+                key=lambda connection: connection.id,
+            )
+            if not connections:
+                raise RuntimeError(
+                    'no proxy connection running for realm "{}" and role "{}"'.format(realm_name, role_name)
+                )
+            self._backend_connections[key] = connections
+
+        if len(connections) == 1:
+            return connections[0]
+
+        strategy = self._strategies.get(key, BALANCE_ROUNDROBIN)
+        if strategy == BALANCE_LEAST_SESSIONS:
+            return min(connections, key=lambda connection: connection.sessions)
+        elif strategy == BALANCE_CONSISTENT_HASH and authid is not None:
+            # rendezvous hashing: the connection with the highest hash of connection ID and authid
+            return max(
+                connections,
+                key=lambda connection: hashlib.sha256(
+                    "{}\x00{}".format(connection.id, authid).encode("utf8")
+                ).digest(),
+            )
+
         if key not in self._roundrobin_idx:
             self._roundrobin_idx[key] = 0
         else:
             self._roundrobin_idx[key] += 1
 
-        idx = self._roundrobin_idx[key] % len(self._connections_by_auth[key])
-        connection = list(self._connections_by_auth[key])[idx]
+        return connections[self._roundrobin_idx[key] % len(connections)]
 
-        return connection.config
+    def get_node_key(self, private: bool = False) -> Dict[str, Any]:
+        """
+        Get this node's key. The key is read from the node directory once, and then held in memory.
+
+        :param private: If ``True``, return the private key, otherwise the public key.
+        :returns: The node key.
+        """
+        if private not in self._node_keys:
+            self._node_keys[private] = _read_node_key(self._cbdir, private=private)
+        return self._node_keys[private]
+
+    def record_join_timing(self, stage: str, started: int, ended: Optional[int] = None):
+        """
+        Record the duration of a stage of a proxy frontend session joining.
+
+        :param stage: The stage, one of :attr:`ProxyFrontendSession.JOIN_STAGES`.
+        :param started: When the stage started (Posix time in ns).
+        :param ended: When the stage ended (Posix time in ns), default now.
+        """
+        if started is not None:
+            self._join_timings[stage].add(((ended or time_ns()) - started) / 1000000.0)
+
+    def _invalidate_backend_connections(self):
+        self._backend_connections = {}
+
+    def _update_strategies(self, realm_name: str, role_names):
+        # the strategy for a (realm, role) is the one configured in any running route for it
+        for role_name in role_names:
+            key = (realm_name, role_name)
+            self._strategies.pop(key, None)
+            for route in self._routes.get(realm_name, {}).values():
+                if route.has_role(role_name) and route.strategy is not None:
+                    self._strategies[key] = route.strategy
 
     @inlineCallbacks
     def onJoin(self, details):
@@ -2201,7 +2823,7 @@ class ProxyController(TransportController):
 
     @inlineCallbacks
     @wamp.register(None)
-    def start_proxy_realm_route(self, realm_name, config, details=None):
+    def start_proxy_realm_route(self, realm_name, config, options=None, details=None):
         """
         Start a new proxy route for the given realm. A proxy route maps authroles
         on the given realm to proxy backend connection IDs.
@@ -2219,8 +2841,19 @@ class ProxyController(TransportController):
         In this example, the two specified connections ``"conn1"`` and ``"conn2"``
         must be running already.
 
+        When multiple routes map an authrole to different connections, one of the connections
+        is selected for each session using a strategy (see :meth:`get_backend_connection`),
+        which can be set in the route options:
+
+        .. code-block:: json
+
+            {
+                "strategy": "least-sessions"
+            }
+
         :param realm_name: The realm this route should apply for.
         :param config: The route configuration.
+        :param options: The route options.
         :param details: WAMP call details.
         :return: Proxy route run-time information.
         """
@@ -2245,6 +2878,25 @@ class ProxyController(TransportController):
             else:
                 connection_ids.add(connection_id)
 
+        # check the strategy to select from the connections for a role, which must agree between routes
+        strategy = (options or {}).get("strategy", None)
+        if strategy is not None:
+            if strategy not in BALANCE_STRATEGIES:
+                raise ApplicationError(
+                    "crossbar.error.invalid_configuration",
+                    'invalid strategy "{}" in proxy route options (must be one of {})'.format(
+                        strategy, ", ".join(BALANCE_STRATEGIES)
+                    ),
+                )
+            for role_name in config.keys():
+                other_strategy = self._strategies.get((realm_name, role_name), strategy)
+                if other_strategy != strategy:
+                    raise ApplicationError(
+                        "crossbar.error.invalid_configuration",
+                        'strategy "{}" for realm "{}" and role "{}" conflicts with strategy "{}" of running '
+                        "proxy routes".format(strategy, realm_name, role_name, other_strategy),
+                    )
+
         # remember connections mapped from proxy routes by (realm, authrole)
         for role_name in config.keys():
             connection_id = config[role_name]
@@ -2260,11 +2912,13 @@ class ProxyController(TransportController):
         route_id = "route{:03d}".format(self._next_route_id)
         self._next_route_id += 1
 
-        route = ProxyRoute(self, realm_name, route_id, config)
+        route = ProxyRoute(self, realm_name, route_id, config, options)
         yield route.start()
 
         # remember route by route ID
         self._routes[realm_name][route_id] = route
+        self._update_strategies(realm_name, config.keys())
+        self._invalidate_backend_connections()
 
         # remember route by connections
         for connection_id in connection_ids:
@@ -2305,6 +2959,20 @@ class ProxyController(TransportController):
         yield route.stop()
         del self._routes[realm_name][route_id]
 
+        # forget connections mapped from the route, unless still mapped from another route
+        for role_name, connection_id in route.config.items():
+            key = (realm_name, role_name)
+            if key in self._connections_by_auth and not any(
+                other.config.get(role_name, None) == connection_id for other in self._routes[realm_name].values()
+            ):
+                self._connections_by_auth[key] = {
+                    connection for connection in self._connections_by_auth[key] if connection.id != connection_id
+                }
+                if not self._connections_by_auth[key]:
+                    del self._connections_by_auth[key]
+        self._update_strategies(realm_name, route.config.keys())
+        self._invalidate_backend_connections()
+
         # If all routes are stopped, clear the realm from routes map
         # Relevant discussion: https://github.com/crossbario/crossbar/pull/1968
         if len(self._routes[realm_name]) == 0:
@@ -2313,19 +2981,41 @@ class ProxyController(TransportController):
         returnValue(route.marshal())
 
     @wamp.register(None)
-    def get_proxy_connections(self, details=None):
+    def get_proxy_join_timings(self, details=None):
         """
-        Get currently running proxy connections.
+        Get timing histograms of proxy frontend sessions joining, from HELLO received to WELCOME sent.
 
         :param details: WAMP call details.
-        :return: List of run-time IDs of currently running connection.s
+        :return: Map of join stage to histogram of durations in ms (see :attr:`ProxyFrontendSession.JOIN_STAGES`).
         """
         self.log.debug(
             '{func}(caller_authid="{caller_authid}")',
+            func=hltype(self.get_proxy_join_timings),
+            caller_authid=hlval(details.caller_authid),
+        )
+        return {stage: histogram.marshal() for stage, histogram in self._join_timings.items()}
+
+    @wamp.register(None)
+    def get_proxy_connections(self, include_stats=False, details=None):
+        """
+        Get currently running proxy connections.
+
+        :param include_stats: If ``True``, return the session and traffic counters of each connection.
+        :param details: WAMP call details.
+        :return: List of run-time IDs of currently running connections, or when ``include_stats`` is
+            set, a map of run-time ID to counters of currently running connections.
+        """
+        self.log.debug(
+            '{func}(include_stats={include_stats}, caller_authid="{caller_authid}")',
             func=hltype(self.get_proxy_connections),
+            include_stats=include_stats,
             caller_authid=hlval(details.caller_authid),
         )
 
+        if include_stats:
+            return {
+                connection_id: connection.marshal_stats() for connection_id, connection in self._connections.items()
+            }
         return sorted(self._connections.keys())
 
     @wamp.register(None)
@@ -2381,6 +3071,7 @@ class ProxyController(TransportController):
 
         connection = ProxyConnection(self, connection_id, config)
         self._connections[connection_id] = connection
+        self._invalidate_backend_connections()
         yield connection.start()
 
         returnValue(connection.marshal())
@@ -2409,6 +3100,7 @@ class ProxyController(TransportController):
         connection = self._connections[connection_id]
         yield connection.stop()
         del self._connections[connection_id]
+        self._invalidate_backend_connections()
 
         returnValue(connection.marshal())
 
@@ -7,14 +7,16 @@
 
 import copy
 import pprint
+from collections import deque
 from collections.abc import Mapping, Sequence
-from typing import Dict
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from autobahn import util
 from autobahn.twisted.wamp import ApplicationRunner, ApplicationSession
 from autobahn.util import hl, hlid, hltype, hluserid, hlval
-from autobahn.wamp.exception import ApplicationError, TransportLost
+from autobahn.wamp.exception import ApplicationError, SerializationError, TransportLost
 from autobahn.wamp.message import Event, Invocation
+from autobahn.wamp.request import Subscription
 from autobahn.wamp.types import (
     CallOptions,
     ComponentConfig,
@@ -23,32 +25,562 @@ from autobahn.wamp.types import (
     SessionIdent,
     SubscribeOptions,
 )
-from twisted.internet.defer import Deferred, inlineCallbacks
+from autobahn.websocket.protocol import WebSocketProtocol
+from twisted.internet.defer import Deferred, DeferredList, DeferredSemaphore, inlineCallbacks
 from txaio import make_logger, time_ns
 
-from crossbar.common.checkconfig import check_connecting_transport, check_dict_args, check_realm_name
+from crossbar.common.checkconfig import (
+    InvalidConfigException,
+    check_connecting_transport,
+    check_dict_args,
+    check_realm_name,
+)
 from crossbar.common.twisted.endpoint import create_connecting_endpoint_from_config
 
 __all__ = (
     "RLink",
     "RLinkConfig",
+    "RLinkEventForwarder",
+    "RLinkInterest",
     "RLinkManager",
 )
 
 
+# maximum number of requests (e.g. subscribe or register) outstanding at a time while (re-)syncing a router link
+RESYNC_PIPELINE_DEPTH = 1000
+
+
+def _wildcard_matches(pattern: str, uri: str) -> bool:
+    # empty components of a wildcard pattern match any (non-empty) URI component
+    pattern_components = pattern.split(".")
+    uri_components = uri.split(".")
+    return len(pattern_components) == len(uri_components) and all(
+        not p or p == u for p, u in zip(pattern_components, uri_components)
+    )
+
+
+class RLinkInterest(object):
+    """
+    Interest in the events of the subscriptions on a router, aggregated into a minimal set
+    of subscriptions covering them, which are made on the other router of a router link:
+
+    * subscriptions to the same URI (and match policy) are subscribed once
+    * subscriptions covered by a prefix or wildcard subscription are not subscribed, since
+      their events are forwarded to the router via the covering subscription
+    * exact subscriptions under one of the configured aggregated prefixes are subscribed as
+      one prefix subscription, once there are at least ``threshold`` of them (and as exact
+      subscriptions again, when falling below half the threshold). Events received via such
+      a subscription are filtered for the topics subscribed (see :meth:`accepts`).
+
+    Prefix and wildcard subscriptions may overlap without one covering the other (say
+    ``a.b`` as prefix and ``a..c`` as wildcard), and while the covering set changes, the old
+    and the new covering subscriptions are both made for a moment. An event matching more
+    than one of these is received once per subscription, all with the same publication ID,
+    and is forwarded only once (see :meth:`first_delivery`).
+
+    The covering set is maintained incrementally: adding and removing subscriptions returns
+    the subscriptions to make and to remove on the other router.
+    """
+
+    RECENT_PUBLICATIONS = 1000
+    """
+    Number of publications most recently forwarded remembered to skip duplicate events.
+    """
+
+    def __init__(self, prefixes: Optional[List[str]] = None, threshold: int = 100):
+        """
+
+        :param prefixes: URI prefixes to aggregate exact subscriptions under.
+        :param threshold: Number of exact subscriptions under an aggregated prefix from which
+            these are subscribed as one prefix subscription.
+        """
+        self._prefixes = list(prefixes or [])
+        self._threshold = threshold
+
+        # map: subscription ID -> (uri, match)
+        self._subscriptions: Dict[int, Tuple[str, str]] = {}
+
+        # map: (uri, match) -> number of subscriptions
+        self._interest: Dict[Tuple[str, str], int] = {}
+
+        # prefix and wildcard subscriptions among the above
+        self._patterns: Set[Tuple[str, str]] = set()
+
+        # map: aggregated prefix -> exact URIs subscribed under the prefix (and not otherwise covered)
+        self._aggregated: Dict[str, Set[str]] = {prefix: set() for prefix in self._prefixes}
+
+        # aggregated prefixes currently subscribed as prefix subscriptions
+        self._promoted: Set[str] = set()
+
+        # the covering set of subscriptions (uri, match) to make on the other router
+        self.covering: Set[Tuple[str, str]] = set()
+
+        # events received via an aggregated prefix subscription, but not for a topic subscribed
+        self.filtered = 0
+
+        # IDs of the publications most recently forwarded (the broker of the other router
+        # dispatches the events of a publication together, so a short window suffices)
+        self._recent = deque(maxlen=self.RECENT_PUBLICATIONS)
+        self._recent_set: Set[int] = set()
+
+        # events received again via another (overlapping) subscription, and not forwarded
+        self.duplicates = 0
+
+    def marshal(self) -> Dict[str, Any]:
+        return {
+            "subscriptions": len(self._subscriptions),
+            "covering": len(self.covering),
+            "promoted": sorted(self._promoted),
+            "filtered": self.filtered,
+            "duplicates": self.duplicates,
+        }
+
+    def __contains__(self, subscription_id: int) -> bool:
+        return subscription_id in self._subscriptions
+
+    def add(self, subscription_id: int, uri: str, match: str = "exact"):
+        """
+        Add a subscription on the router.
+
+        :param subscription_id: The ID of the subscription on the router.
+        :param uri: The URI (or pattern) subscribed to.
+        :param match: The match policy of the subscription.
+        :return: Subscriptions (uri, match) to make and to remove on the other router.
+        """
+        key = (uri, match)
+        self._subscriptions[subscription_id] = key
+        count = self._interest.get(key, 0)
+        self._interest[key] = count + 1
+        if count:
+            return [], []
+
+        if match != "exact":
+            self._patterns.add(key)
+            return self._recompute()
+
+        if self._covered(key):
+            return [], []
+
+        prefix = self._aggregated_prefix(uri)
+        if prefix is None:
+            return self._update(add={key})
+
+        uris = self._aggregated[prefix]
+        uris.add(uri)
+        if prefix in self._promoted:
+            return [], []
+        if len(uris) >= self._threshold:
+            self._promoted.add(prefix)
+            return self._update(add={(prefix, "prefix")}, remove={(u, "exact") for u in uris})
+        return self._update(add={key})
+
+    def add_many(self, subscriptions):
+        """
+        Add many subscriptions on the router at once (e.g. when starting or resyncing a router link).
+
+        :param subscriptions: Subscriptions on the router, each ``(subscription_id, uri, match)``.
+        :return: Subscriptions (uri, match) to make and to remove on the other router.
+        """
+        for subscription_id, uri, match in subscriptions:
+            if subscription_id in self._subscriptions:
+                continue
+            key = (uri, match)
+            self._subscriptions[subscription_id] = key
+            self._interest[key] = self._interest.get(key, 0) + 1
+            if match != "exact":
+                self._patterns.add(key)
+        return self._recompute()
+
+    def remove(self, subscription_id: int):
+        """
+        Remove a subscription on the router.
+
+        :param subscription_id: The ID of the subscription on the router.
+        :return: Subscriptions (uri, match) to make and to remove on the other router.
+        """
+        key = self._subscriptions.pop(subscription_id, None)
+        if key is None:
+            return [], []
+        self._interest[key] -= 1
+        if self._interest[key]:
+            return [], []
+        del self._interest[key]
+
+        uri, match = key
+        if match != "exact":
+            self._patterns.discard(key)
+            return self._recompute()
+
+        if self._covered(key):
+            return [], []
+
+        prefix = self._aggregated_prefix(uri)
+        if prefix is None:
+            return self._update(remove={key})
+
+        uris = self._aggregated[prefix]
+        uris.discard(uri)
+        if prefix not in self._promoted:
+            return self._update(remove={key})
+        if len(uris) < max(self._threshold // 2, 1):
+            self._promoted.discard(prefix)
+            return self._update(add={(u, "exact") for u in uris}, remove={(prefix, "prefix")})
+        return [], []
+
+    def clear(self):
+        """
+        Forget all subscriptions, e.g. when the other router has gone.
+        """
+        self._subscriptions = {}
+        self._interest = {}
+        self._patterns = set()
+        self._aggregated = {prefix: set() for prefix in self._prefixes}
+        self._promoted = set()
+        self.covering = set()
+        self._recent.clear()
+        self._recent_set = set()
+
+    def is_aggregated(self, uri: str, match: str) -> bool:
+        """
+        Check if a subscription on the other router is for an aggregated prefix, with events to filter.
+
+        :param uri: The URI (or pattern) subscribed to on the other router.
+        :param match: The match policy of the subscription on the other router.
+        :return: ``True`` if events received via the subscription need filtering.
+        """
+        return match == "prefix" and uri in self._promoted and (uri, match) not in self._interest
+
+    def accepts(self, topic: str) -> bool:
+        """
+        Check if an event received via an aggregated prefix subscription is for a topic subscribed.
+
+        :param topic: The topic of the event.
+        :return: ``True`` if the event is to be forwarded.
+        """
+        prefix = self._aggregated_prefix(topic)
+        if prefix is not None and topic in self._aggregated[prefix]:
+            return True
+        self.filtered += 1
+        return False
+
+    def first_delivery(self, publication_id: int) -> bool:
+        """
+        Check if an event received from the other router is the first one for its publication.
+
+        :param publication_id: The ID of the publication on the other router.
+        :return: ``True`` if the event is to be forwarded, ``False`` if already forwarded.
+        """
+        if publication_id in self._recent_set:
+            self.duplicates += 1
+            return False
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(publication_id)
+        self._recent_set.add(publication_id)
+        return True
+
+    def _aggregated_prefix(self, uri: str) -> Optional[str]:
+        for prefix in self._prefixes:
+            if uri.startswith(prefix):
+                return prefix
+        return None
+
+    def _covered(self, key: Tuple[str, str]) -> bool:
+        # check if the subscription is covered by one of the (other) prefix or wildcard subscriptions
+        uri, match = key
+        for pattern in self._patterns:
+            if pattern == key:
+                continue
+            pattern_uri, pattern_match = pattern
+            if pattern_match == "prefix":
+                if uri.startswith(pattern_uri) and (match != "prefix" or len(uri) > len(pattern_uri)):
+                    return True
+            elif match != "prefix" and _wildcard_matches(pattern_uri, uri):
+                # (a wildcard pattern covering another one has empty components at least where the other has)
+                return True
+        return False
+
+    def _recompute(self):
+        # compute the covering set anew (when prefix or wildcard subscriptions change)
+        covering = set()
+        aggregated = {prefix: set() for prefix in self._prefixes}
+        for key in self._interest:
+            if self._covered(key):
+                continue
+            uri, match = key
+            prefix = self._aggregated_prefix(uri) if match == "exact" else None
+            if prefix is None:
+                covering.add(key)
+            else:
+                aggregated[prefix].add(uri)
+
+        for prefix, uris in aggregated.items():
+            promoted = prefix in self._promoted and len(uris) >= max(self._threshold // 2, 1)
+            if promoted or len(uris) >= self._threshold:
+                self._promoted.add(prefix)
+                covering.add((prefix, "prefix"))
+            else:
+                self._promoted.discard(prefix)
+                covering.update((uri, "exact") for uri in uris)
+
+        self._aggregated = aggregated
+        return self._update(add=covering - self.covering, remove=self.covering - covering)
+
+    def _update(self, add=None, remove=None):
+        # only subscriptions not made yet are to make, and only subscriptions made are to remove
+        add = (add or set()) - self.covering
+        remove = (remove or set()) & self.covering
+        self.covering.difference_update(remove)
+        self.covering.update(add)
+        return sorted(add), sorted(remove)
+
+
+class _PublishBatch(object):
+    """
+    Transport of a session for the time publications are batched: the WAMP messages sent by
+    the session are serialized with the serializer of the session's transport, and collected
+    to be sent on that transport as one WebSocket message.
+    """
+
+    def __init__(self, transport: WebSocketProtocol):
+        self.transport = transport
+        self.payloads: List[bytes] = []
+        self.is_binary = False
+
+    def isOpen(self) -> bool:
+        return self.transport.isOpen()
+
+    def send(self, msg):
+        if not self.transport.isOpen():
+            raise TransportLost()
+        try:
+            payload, self.is_binary = self.transport._serializer.serialize(msg)
+        except Exception as e:
+            raise SerializationError("unable to serialize WAMP application payload ({0})".format(e))
+        self.payloads.append(payload)
+
+    def flush(self):
+        """
+        Send the messages collected on the transport, as one WebSocket message.
+        """
+        if self.payloads and self.transport.isOpen():
+            self.transport.sendMessage(b"".join(self.payloads), self.is_binary)
+            self.payloads = []
+
+
+class RLinkEventForwarder(object):
+    """
+    Re-publishes events forwarded over a router link on the router of a bridge session.
+
+    With acknowledge mode ``"each"``, every event is published with acknowledgement, and
+    forwarding the event completes when the publication was acknowledged. With modes
+    ``"window"`` and ``"none"``, events are pipelined instead: events received are queued
+    and published at the end of the current reactor iteration, either acknowledged with at
+    most ``window`` publications awaiting acknowledgement (``"window"``), or unacknowledged
+    (``"none"``). Events are dropped when more than ``max_queued`` events are waiting.
+
+    Publications pipelined in one reactor iteration are written to the transport together.
+    On a WebSocket transport with a batched serializer (e.g. ``"wamp.2.cbor.batched"``),
+    these are also sent as one WebSocket message carrying all events.
+    """
+
+    ACK_EACH = "each"
+    ACK_WINDOW = "window"
+    ACK_NONE = "none"
+
+    ACK_MODES = (ACK_EACH, ACK_WINDOW, ACK_NONE)
+
+    log = make_logger()
+
+    def __init__(
+        self,
+        session: ApplicationSession,
+        acknowledge: str = ACK_EACH,
+        window: int = 100,
+        max_queued: int = 10000,
+        reactor=None,
+    ):
+        """
+
+        :param session: The bridge session to publish events on.
+        :param acknowledge: Acknowledge mode, one of :attr:`ACK_MODES`.
+        :param window: Maximum number of publications awaiting acknowledgement (mode ``"window"``).
+        :param max_queued: Maximum number of events waiting to be published.
+        :param reactor: Twisted reactor to use.
+        """
+        assert acknowledge in self.ACK_MODES
+        if reactor is None:
+            from twisted.internet import reactor
+        self._session = session
+        self._acknowledge = acknowledge
+        self._window = window
+        self._max_queued = max_queued
+        self._reactor = reactor
+
+        # events waiting to be published: (uri, args, kwargs, options)
+        self._queue = deque()
+        self._flush_call = None
+
+        # set after the first failure to publish was logged
+        self._failure_logged = False
+
+        # events published (and acknowledged, if acknowledging), publications awaiting
+        # acknowledgement, events dropped, and WebSocket messages carrying more than one event
+        self.forwarded = 0
+        self.in_flight = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def marshal(self) -> Dict[str, Any]:
+        return {
+            "acknowledge": self._acknowledge,
+            "forwarded": self.forwarded,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+
+    def forward(self, uri: str, args, kwargs, options: PublishOptions) -> Optional[Deferred]:
+        """
+        Forward an event, re-publishing it on the router of the bridge session.
+
+        :param uri: The topic to publish to.
+        :param args: Positional event payload.
+        :param kwargs: Keyword event payload.
+        :param options: Options to publish with (``acknowledge`` is set according to the acknowledge mode).
+        :return: When acknowledging each event, a deferred that fires when the event was acknowledged
+            (or dropped), otherwise ``None``.
+        """
+        if self._acknowledge == self.ACK_EACH:
+            options.acknowledge = True
+            self.in_flight += 1
+            try:
+                d = self._session.publish(uri, *args, options=options, **kwargs)
+            except Exception as e:
+                self.in_flight -= 1
+                self._dropped(e)
+                return None
+            return d.addCallbacks(self._acknowledged, self._not_acknowledged)
+
+        if len(self._queue) >= self._max_queued:
+            self.dropped += 1
+            return None
+
+        options.acknowledge = self._acknowledge == self.ACK_WINDOW
+        self._queue.append((uri, args, kwargs, options))
+        self._schedule_flush()
+        return None
+
+    def clear(self):
+        """
+        Drop all events waiting to be published, e.g. when the bridge session has left.
+        """
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        self.dropped += len(self._queue)
+        self._queue.clear()
+
+    def _schedule_flush(self):
+        if self._flush_call is None and self._queue:
+            self._flush_call = self._reactor.callLater(0, self._flush)
+
+    def _flush(self):
+        self._flush_call = None
+
+        if self._acknowledge == self.ACK_WINDOW:
+            count = min(len(self._queue), self._window - self.in_flight)
+        else:
+            count = len(self._queue)
+        if count <= 0:
+            return
+
+        transport = self._session._transport
+        if transport is None:
+            self.clear()
+            return
+
+        # on WebSocket with a batched serializer, collect the publications into one message
+        batch = None
+        if isinstance(transport, WebSocketProtocol) and getattr(transport._serializer._serializer, "_batched", False):
+            batch = _PublishBatch(transport)
+            self._session._transport = batch
+        try:
+            for _ in range(count):
+                uri, args, kwargs, options = self._queue.popleft()
+                if options.acknowledge:
+                    self.in_flight += 1
+                try:
+                    d = self._session.publish(uri, *args, options=options, **kwargs)
+                except Exception as e:
+                    if options.acknowledge:
+                        self.in_flight -= 1
+                    self._dropped(e)
+                    if isinstance(e, TransportLost):
+                        self.clear()
+                        break
+                else:
+                    if d is not None:
+                        d.addCallbacks(self._acknowledged, self._not_acknowledged)
+                    else:
+                        self.forwarded += 1
+        finally:
+            if batch is not None:
+                if self._session._transport is batch:
+                    self._session._transport = transport
+                if len(batch.payloads) > 1:
+                    self.batches += 1
+                batch.flush()
+
+    def _acknowledged(self, _):
+        self.in_flight -= 1
+        self.forwarded += 1
+        # the window has room again for events waiting
+        self._schedule_flush()
+
+    def _not_acknowledged(self, fail):
+        self.in_flight -= 1
+        self._dropped(fail.value)
+        self._schedule_flush()
+
+    def _dropped(self, error):
+        self.dropped += 1
+        if isinstance(error, TransportLost):
+            return
+        if isinstance(error, ApplicationError) and error.error in ["wamp.close.normal"]:
+            return
+        if not self._failure_logged:
+            self.log.warn("FAILED TO PUBLISH: {} {}".format(type(error), str(error)))
+            self._failure_logged = True
+
+
 class BridgeSession(ApplicationSession):
     log = make_logger()
 
     def __init__(self, config):
         ApplicationSession.__init__(self, config)
 
+        # subscriptions on this router (forwarded to the other router), by subscription ID
         self._subs = {}
+        # subscriptions made on the other router (covering the above), by (uri, match)
+        self._forwarding_subs: Dict[Tuple[str, str], Any] = {}
         # registration-id's of remote registrations from an rlink
         self._regs = {}
 
         self._exclude_authid = None
         self._exclude_authrole = None
 
+        # re-publishes events forwarded from the other router (when forwarding events)
+        self._event_forwarder: Optional[RLinkEventForwarder] = None
+
+        # subscriptions on this router aggregated into those made on the other router (when forwarding events)
+        self._interest: Optional[RLinkInterest] = None
+
+        # last (re-)sync of subscriptions and registrations to the other router
+        # map: "subscriptions" | "registrations" -> resync information
+        self._resync: Dict[str, Dict[str, Any]] = {}
+
     def onMessage(self, msg):
         if msg._router_internal is not None:
             if isinstance(msg, Event):
@@ -57,6 +589,64 @@ class BridgeSession(ApplicationSession):
                 msg.caller, msg.caller_authid, msg.caller_authrole = msg._router_internal
         return super(BridgeSession, self).onMessage(msg)
 
+    def onLeave(self, details):
+        if self._event_forwarder is not None:
+            self._event_forwarder.clear()
+        return super(BridgeSession, self).onLeave(details)
+
+    @inlineCallbacks
+    def _list_current(self, kind: str):
+        """
+        Get the details of all current subscriptions or registrations on this router, listed in bulk
+        with one call of the meta API (or, with routers not supporting that, listing the IDs and
+        getting the details of each with pipelined calls).
+
+        :param kind: Either ``"subscription"`` or ``"registration"``.
+        :return: List of subscription or registration details.
+        """
+        try:
+            listing = yield self.call("wamp.{}.list".format(kind), include_details=True)
+        except ApplicationError:
+            listing = yield self.call("wamp.{}.list".format(kind))
+
+        current = []
+        ids = []
+        for match in ["exact", "prefix", "wildcard"]:
+            for obj in listing.get(match, []):
+                if isinstance(obj, Mapping):
+                    current.append(obj)
+                else:
+                    ids.append(obj)
+
+        if ids:
+            semaphore = DeferredSemaphore(RESYNC_PIPELINE_DEPTH)
+            results = yield DeferredList(
+                [semaphore.run(self.call, "wamp.{}.get".format(kind), obj_id) for obj_id in ids], consumeErrors=True
+            )
+            # (objects removed in the meantime are skipped)
+            current.extend(result for success, result in results if success)
+
+        return current
+
+    @inlineCallbacks
+    def _pipelined(self, func, items):
+        """
+        Run a function returning a deferred for every item, with a bounded number of these
+        outstanding at a time, and log failures.
+
+        :param func: The function to run.
+        :param items: The items to run the function for.
+        :return: Number of items for which the function failed.
+        """
+        semaphore = DeferredSemaphore(RESYNC_PIPELINE_DEPTH)
+        results = yield DeferredList([semaphore.run(func, item) for item in items], consumeErrors=True)
+        failed = 0
+        for success, result in results:
+            if not success:
+                failed += 1
+                self.log.warn("{func} failed: {error}", func=hltype(func), error=result.getErrorMessage())
+        return failed
+
     @inlineCallbacks
     def _setup_event_forwarding(self, other):
         self.log.debug(
@@ -67,50 +657,30 @@ class BridgeSession(ApplicationSession):
             other=other,
         )
 
-        @inlineCallbacks
-        def on_subscription_create(sub_session, sub_details, details=None):
-            """
-            Event handler fired when a new subscription was created on this router.
-
-            The handler will then also subscribe on the other router, and when receiving
-            events, re-publish those on this router.
-
-            :param sub_session:
-            :param sub_details:
-            :param details:
-            :return:
-            """
-            if sub_details["uri"].startswith("wamp."):
-                return
-
-            sub_id = sub_details["id"]
-
-            if sub_id in self._subs and self._subs[sub_id]["sub"]:
-                # This will happen if, partway through the subscription process, the RLink disconnects
-                self.log.error(
-                    "on_subscription_create: sub ID {sub_id} already in map {method}",
-                    sub_id=sub_id,
-                    method=hltype(BridgeSession._setup_event_forwarding),
-                )
-                return
-
-            sub_details_local = copy.deepcopy(sub_details)
-            if sub_id not in self._subs:
-                sub_details_local["sub"] = None
-                self._subs[sub_id] = sub_details_local
+        self._event_forwarder = RLinkEventForwarder(
+            self,
+            acknowledge=self.config.extra.get("forward_events_acknowledge", RLinkEventForwarder.ACK_EACH),
+            window=self.config.extra.get("forward_events_window", 100),
+            max_queued=self.config.extra.get("forward_events_queue", 10000),
+        )
 
-            uri = sub_details["uri"]
-            ERR_MSG = [None]
+        self._interest = RLinkInterest(
+            prefixes=self.config.extra.get("aggregate_prefixes", []),
+            threshold=self.config.extra.get("aggregate_threshold", 100),
+        )
 
-            @inlineCallbacks
+        def make_on_event(uri, match):
             def on_event(*args, **kwargs):
                 assert "details" in kwargs
                 details = kwargs.pop("details")
                 options = kwargs.pop("options", None)
 
+                # with prefix and wildcard subscriptions, the event carries the actual topic
+                topic = details.topic or uri
+
                 self.log.debug(
                     "Received event on uri={uri}, options={options} (publisher={publisher}, publisher_authid={publisher_authid}, publisher_authrole={publisher_authrole}, forward_for={forward_for})",
-                    uri=uri,
+                    uri=topic,
                     options=options,
                     publisher=details.publisher,
                     publisher_authid=details.publisher_authid,
@@ -118,6 +688,14 @@ class BridgeSession(ApplicationSession):
                     forward_for=details.forward_for,
                 )
 
+                # events received via an aggregated prefix subscription are only forwarded for topics subscribed
+                if self._interest.is_aggregated(uri, match) and not self._interest.accepts(topic):
+                    return
+
+                # events received via more than one (overlapping) subscription are forwarded once
+                if not self._interest.first_delivery(details.publication):
+                    return
+
                 assert details.publisher is not None
                 this_forward = {
                     "session": details.publisher,
@@ -131,62 +709,123 @@ class BridgeSession(ApplicationSession):
                         self.log.debug("SKIP! already forwarded")
                         return
 
-                    forward_for = copy.deepcopy(details.forward_for)
-                    forward_for.append(this_forward)
+                    forward_for = details.forward_for + [this_forward]
                 else:
                     forward_for = [this_forward]
 
                 options = PublishOptions(
-                    acknowledge=True,
                     exclude_me=True,
                     exclude_authid=self._exclude_authid,
                     exclude_authrole=self._exclude_authrole,
                     forward_for=forward_for,
                 )
 
+                # the acknowledge mode of the forwarder determines whether to wait for the publication
+                return self._event_forwarder.forward(topic, args, kwargs, options)
+
+            return on_event
+
+        @inlineCallbacks
+        def update_forwarding_subscriptions(subscribe, unsubscribe):
+            """
+            Make and remove subscriptions on the other router, as the covering set of
+            subscriptions on this router changed.
+
+            :param subscribe: Subscriptions (uri, match) to make on the other router.
+            :param unsubscribe: Subscriptions (uri, match) to remove from the other router.
+            """
+            # (subscriptions already made on the other router, or removed from there already, are skipped)
+            unsubscribe = [key for key in unsubscribe if key in self._forwarding_subs]
+            subscribe = [key for key in subscribe if key not in self._forwarding_subs]
+
+            @inlineCallbacks
+            def unsubscribe_one(key):
+                # (the subscription might have become part of the covering set again meanwhile)
+                if key in self._interest.covering:
+                    return
+                sub = self._forwarding_subs.pop(key, None)
+                # (while still subscribing, the pending subscription is removed once made, see below)
+                if isinstance(sub, Subscription) and sub.active:
+                    yield sub.unsubscribe()
+                self.log.debug("{other} unsubscribed from {uri}", other=other, uri=key[0])
+
+            @inlineCallbacks
+            def subscribe_one(key):
+                uri, match = key
+                pending = object()
+                self._forwarding_subs[key] = pending
                 try:
-                    yield self.publish(uri, *args, options=options, **kwargs)
+                    sub = yield other.subscribe(
+                        make_on_event(uri, match), uri, options=SubscribeOptions(match=match, details=True)
+                    )
                 except TransportLost:
-                    return
-                except ApplicationError as e:
-                    if e.error not in ["wamp.close.normal"]:
-                        self.log.warn("FAILED TO PUBLISH 1: {} {}".format(type(e), str(e)))
-                    return
-                except Exception as e:
-                    if not ERR_MSG[0]:
-                        self.log.warn("FAILED TO PUBLISH 2: {} {}".format(type(e), str(e)))
-                        ERR_MSG[0] = True
+                    self.log.debug(
+                        "on_subscription_create: could not forward-subscription '{}' as RLink is not connected".format(
+                            uri
+                        )
+                    )
+                    if self._forwarding_subs.get(key, None) is pending:
+                        del self._forwarding_subs[key]
                     return
 
-                self.log.debug(
-                    "RLink forward-published event {dir} (options={options})",
-                    dir=self.DIR,
-                    options=options,
-                )
+                # the subscription might have been removed (or made anew) while subscribing on the other router
+                if self._forwarding_subs.get(key, None) is not pending:
+                    self.log.info("subscription already gone: {uri}", uri=uri)
+                    yield sub.unsubscribe()
+                else:
+                    self._forwarding_subs[key] = sub
 
-            try:
-                sub = yield other.subscribe(on_event, uri, options=SubscribeOptions(details=True))
-            except TransportLost:
                 self.log.debug(
-                    "on_subscription_create: could not forward-subscription '{}' as RLink is not connected".format(uri)
+                    "created forwarding subscription: me={me} other={other} uri={uri} match={match}",
+                    me=self._session_id,
+                    other=other,
+                    uri=uri,
+                    match=match,
                 )
+
+            # subscribe to the new covering subscriptions first, and only once these are made,
+            # unsubscribe from the stale ones: no event is lost while the covering set changes
+            # (events received via both meanwhile are forwarded once, see RLinkInterest)
+            if len(subscribe) == 1:
+                yield subscribe_one(subscribe[0])
+            elif subscribe:
+                yield self._pipelined(subscribe_one, subscribe)
+            if len(unsubscribe) == 1:
+                yield unsubscribe_one(unsubscribe[0])
+            elif unsubscribe:
+                yield self._pipelined(unsubscribe_one, unsubscribe)
+
+        @inlineCallbacks
+        def on_subscription_create(sub_session, sub_details, details=None):
+            """
+            Event handler fired when a new subscription was created on this router.
+
+            The handler will then also subscribe on the other router (unless already covered
+            by the subscriptions made there, see :class:`RLinkInterest`), and when receiving
+            events, re-publish those on this router.
+
+            :param sub_session:
+            :param sub_details:
+            :param details:
+            :return:
+            """
+            if sub_details["uri"].startswith("wamp."):
                 return
 
-            if sub_id not in self._subs:
-                self.log.info("subscription already gone: {uri}", uri=sub_details["uri"])
-                yield sub.unsubscribe()
-            else:
-                self._subs[sub_id]["sub"] = sub
+            sub_id = sub_details["id"]
 
-            self.log.debug(
-                "created forwarding subscription: me={me} other={other} sub_id={sub_id} sub_details={sub_details} details={details} sub_session={sub_session}",
-                me=self._session_id,
-                other=other,
-                sub_id=sub_id,
-                sub_details=sub_details,
-                details=details,
-                sub_session=sub_session,
-            )
+            if sub_id in self._subs:
+                # This will happen if, partway through the subscription process, the RLink disconnects
+                self.log.error(
+                    "on_subscription_create: sub ID {sub_id} already in map {method}",
+                    sub_id=sub_id,
+                    method=hltype(BridgeSession._setup_event_forwarding),
+                )
+                return
+
+            self._subs[sub_id] = sub_details
+            subscribe, unsubscribe = self._interest.add(sub_id, sub_details["uri"], sub_details.get("match", "exact"))
+            yield update_forwarding_subscriptions(subscribe, unsubscribe)
 
         # listen to when a subscription is removed from the router
         #
@@ -200,33 +839,45 @@ class BridgeSession(ApplicationSession):
                 details=details,
             )
 
-            sub_details = self._subs.get(sub_id, None)
-            if not sub_details:
+            if sub_id not in self._subs:
                 self.log.debug("subscription not tracked - huh??")
                 return
 
-            uri = sub_details["uri"]
-
-            sub = self._subs[sub_id]["sub"]
-            if sub is None:
-                # see above; we might have un-subscribed here before
-                # we got an answer from the other router
-                self.log.info("subscription has no 'sub'")
-            else:
-                yield sub.unsubscribe()
-
             del self._subs[sub_id]
-
-            self.log.debug("{other} unsubscribed from {uri}".format(other=other, uri=uri))
+            subscribe, unsubscribe = self._interest.remove(sub_id)
+            yield update_forwarding_subscriptions(subscribe, unsubscribe)
 
         @inlineCallbacks
         def forward_current_subs():
-            # get current subscriptions on the router
-            subs = yield self.call("wamp.subscription.list")
-            for sub_id in subs["exact"]:
-                sub = yield self.call("wamp.subscription.get", sub_id)
-                assert sub["id"] == sub_id, "Logic error, subscription IDs don't match"
-                yield on_subscription_create(self._session_id, sub)
+            # get current subscriptions on the router in bulk, and add those not yet tracked (subscriptions
+            # created meanwhile are tracked already, while subscriptions deleted meanwhile are untracked
+            # by on_subscription_delete)
+            started = time_ns()
+            subs = yield self._list_current("subscription")
+            subs = [sub for sub in subs if not sub["uri"].startswith("wamp.") and sub["id"] not in self._subs]
+            for sub in subs:
+                self._subs[sub["id"]] = sub
+            subscribe, unsubscribe = self._interest.add_many(
+                (sub["id"], sub["uri"], sub.get("match", "exact")) for sub in subs
+            )
+
+            # .. and apply the changes of the covering subscriptions to the other router
+            yield update_forwarding_subscriptions(subscribe, unsubscribe)
+
+            self._resync["subscriptions"] = {
+                "started": started,
+                "duration": (time_ns() - started) / 1000000.0,
+                "listed": len(subs),
+                "subscribed": len(subscribe),
+                "unsubscribed": len(unsubscribe),
+            }
+            self.log.info(
+                "{me}: forwarded {cnt} current subscriptions with {subscribed} subscriptions in {duration} ms",
+                me=self._session_id,
+                cnt=len(subs),
+                subscribed=len(subscribe),
+                duration=round(self._resync["subscriptions"]["duration"], 1),
+            )
 
         @inlineCallbacks
         def on_remote_join(_session, _details):
@@ -239,6 +890,8 @@ class BridgeSession(ApplicationSession):
             # on reestablishment of remote session.
             # See: https://github.com/crossbario/crossbar/issues/1909
             self._subs = {}
+            self._forwarding_subs = {}
+            self._interest.clear()
 
         if self.IS_REMOTE_LEG:
             yield forward_current_subs()
@@ -297,7 +950,7 @@ class BridgeSession(ApplicationSession):
                 )
                 return
 
-            reg_details_local = copy.deepcopy(reg_details)
+            reg_details_local = dict(reg_details)
             if reg_id not in self._regs:
                 reg_details_local["reg"] = None
                 self._regs[reg_id] = reg_details_local
@@ -443,12 +1096,24 @@ class BridgeSession(ApplicationSession):
 
         @inlineCallbacks
         def register_current():
-            # get current registrations on the router
-            regs = yield self.call("wamp.registration.list")
-            for reg_id in regs["exact"]:
-                reg = yield self.call("wamp.registration.get", reg_id)
-                assert reg["id"] == reg_id, "Logic error, registration IDs don't match"
-                yield on_registration_create(self._session_id, reg)
+            # get current registrations on the router in bulk, and register those pipelined on the other router
+            started = time_ns()
+            regs = yield self._list_current("registration")
+            regs = [reg for reg in regs if reg.get("match", "exact") == "exact"]
+            failed = yield self._pipelined(lambda reg: on_registration_create(self._session_id, reg), regs)
+
+            self._resync["registrations"] = {
+                "started": started,
+                "duration": (time_ns() - started) / 1000000.0,
+                "listed": len(regs),
+                "failed": failed,
+            }
+            self.log.info(
+                "{me}: forwarded {cnt} current registrations in {duration} ms",
+                me=self._session_id,
+                cnt=len(regs),
+                duration=round(self._resync["registrations"]["duration"], 1),
+            )
 
         @inlineCallbacks
         def on_remote_join(_session, _details):
@@ -710,10 +1375,13 @@ class RLinkRemoteSession(BridgeSession):
         # all events that are subscribed on the local-leg.
         # This avoids duplicate events that would otherwise arrive
         # See: https://github.com/crossbario/crossbar/issues/1916
-        for k, v in self._subs.items():
-            if v["sub"].active:
-                yield v["sub"].unsubscribe()
+        for sub in self._forwarding_subs.values():
+            if isinstance(sub, Subscription) and sub.active:
+                yield sub.unsubscribe()
+        self._forwarding_subs = {}
         self._subs = {}
+        if self._interest is not None:
+            self._interest.clear()
 
         for (
             k,
@@ -779,6 +1447,27 @@ class RLink(object):
             "started_by": self.started_by.marshal() if self.started_by else None,
             "connected": self.connected,
         }
+
+        # counters of events forwarded (re-published) to the local and to the remote router, and
+        # of the subscriptions on the local and the remote router forwarded to the other router
+        # (and of the last resync of subscriptions and registrations forwarded from each router)
+        forwarded_events = {}
+        forwarded_subscriptions = {}
+        resync = {}
+        for leg, session in [("local", self.local), ("remote", self.remote)]:
+            if session is not None and session._event_forwarder is not None:
+                forwarded_events[leg] = session._event_forwarder.marshal()
+            if session is not None and session._interest is not None:
+                forwarded_subscriptions[leg] = session._interest.marshal()
+            if session is not None and session._resync:
+                resync[leg] = dict(session._resync)
+        if forwarded_events:
+            obj["forwarded_events"] = forwarded_events
+        if forwarded_subscriptions:
+            obj["forwarded_subscriptions"] = forwarded_subscriptions
+        if resync:
+            obj["resync"] = resync
+
         return obj
 
 
@@ -793,6 +1482,11 @@ class RLinkConfig(object):
         forward_remote_events,
         forward_local_invocations,
         forward_remote_invocations,
+        forward_events_acknowledge=RLinkEventForwarder.ACK_EACH,
+        forward_events_window=100,
+        forward_events_queue=10000,
+        aggregate_prefixes=None,
+        aggregate_threshold=100,
     ):
         """
 
@@ -801,6 +1495,25 @@ class RLinkConfig(object):
 
         :param transport: The transport for connecting to the remote router.
         :type transport:
+
+        :param forward_events_acknowledge: Acknowledge mode for forwarding events, one of
+            :attr:`RLinkEventForwarder.ACK_MODES`.
+        :type forward_events_acknowledge: str
+
+        :param forward_events_window: Maximum number of forwarded events awaiting acknowledgement
+            (with acknowledge mode ``"window"``).
+        :type forward_events_window: int
+
+        :param forward_events_queue: Maximum number of events waiting to be forwarded.
+        :type forward_events_queue: int
+
+        :param aggregate_prefixes: URI prefixes under which to aggregate exact subscriptions forwarded
+            into one prefix subscription (see :class:`RLinkInterest`).
+        :type aggregate_prefixes: list[str]
+
+        :param aggregate_threshold: Number of exact subscriptions under an aggregated prefix from which
+            these are forwarded as one prefix subscription.
+        :type aggregate_threshold: int
         """
         self.realm = realm
         self.transport = transport
@@ -810,6 +1523,11 @@ class RLinkConfig(object):
         self.forward_remote_events = forward_remote_events
         self.forward_local_invocations = forward_local_invocations
         self.forward_remote_invocations = forward_remote_invocations
+        self.forward_events_acknowledge = forward_events_acknowledge
+        self.forward_events_window = forward_events_window
+        self.forward_events_queue = forward_events_queue
+        self.aggregate_prefixes = aggregate_prefixes or []
+        self.aggregate_threshold = aggregate_threshold
 
     def __str__(self):
         return pprint.pformat(self.marshal())
@@ -824,6 +1542,11 @@ class RLinkConfig(object):
             "forward_remote_events": self.forward_remote_events,
             "forward_local_invocations": self.forward_local_invocations,
             "forward_remote_invocations": self.forward_remote_invocations,
+            "forward_events_acknowledge": self.forward_events_acknowledge,
+            "forward_events_window": self.forward_events_window,
+            "forward_events_queue": self.forward_events_queue,
+            "aggregate_prefixes": self.aggregate_prefixes,
+            "aggregate_threshold": self.aggregate_threshold,
         }
         return obj
 
@@ -857,6 +1580,11 @@ class RLinkConfig(object):
                 "forward_remote_events": (False, [bool]),
                 "forward_local_invocations": (False, [bool]),
                 "forward_remote_invocations": (False, [bool]),
+                "forward_events_acknowledge": (False, [str]),
+                "forward_events_window": (False, [int]),
+                "forward_events_queue": (False, [int]),
+                "aggregate_prefixes": (False, [Sequence]),
+                "aggregate_threshold": (False, [int]),
             },
             obj,
             "router link configuration",
@@ -871,6 +1599,30 @@ class RLinkConfig(object):
         forward_remote_events = obj.get("forward_remote_events", True)
         forward_local_invocations = obj.get("forward_local_invocations", True)
         forward_remote_invocations = obj.get("forward_remote_invocations", True)
+        forward_events_acknowledge = obj.get("forward_events_acknowledge", RLinkEventForwarder.ACK_EACH)
+        if forward_events_acknowledge not in RLinkEventForwarder.ACK_MODES:
+            raise InvalidConfigException(
+                "invalid value '{}' for 'forward_events_acknowledge' in router link configuration "
+                "(must be one of {})".format(forward_events_acknowledge, ", ".join(RLinkEventForwarder.ACK_MODES))
+            )
+        forward_events_window = obj.get("forward_events_window", 100)
+        forward_events_queue = obj.get("forward_events_queue", 10000)
+        aggregate_prefixes = obj.get("aggregate_prefixes", [])
+        for prefix in aggregate_prefixes:
+            if not isinstance(prefix, str) or not prefix:
+                raise InvalidConfigException(
+                    "invalid prefix {} in 'aggregate_prefixes' in router link configuration".format(prefix)
+                )
+        aggregate_threshold = obj.get("aggregate_threshold", 100)
+        for name, value in [
+            ("forward_events_window", forward_events_window),
+            ("forward_events_queue", forward_events_queue),
+            ("aggregate_threshold", aggregate_threshold),
+        ]:
+            if value < 1:
+                raise InvalidConfigException(
+                    "invalid value {} for '{}' in router link configuration (must be positive)".format(value, name)
+                )
         transport = obj["transport"]
 
         check_realm_name(realm)
@@ -885,6 +1637,11 @@ class RLinkConfig(object):
             forward_remote_events=forward_remote_events,
             forward_local_invocations=forward_local_invocations,
             forward_remote_invocations=forward_remote_invocations,
+            forward_events_acknowledge=forward_events_acknowledge,
+            forward_events_window=forward_events_window,
+            forward_events_queue=forward_events_queue,
+            aggregate_prefixes=aggregate_prefixes,
+            aggregate_threshold=aggregate_threshold,
         )
 
         return config
@@ -959,6 +1716,11 @@ class RLinkManager(object):
             "rlink": link_id,
             "forward_events": link_config.forward_local_events,
             "forward_invocations": link_config.forward_local_invocations,
+            "forward_events_acknowledge": link_config.forward_events_acknowledge,
+            "forward_events_window": link_config.forward_events_window,
+            "forward_events_queue": link_config.forward_events_queue,
+            "aggregate_prefixes": link_config.aggregate_prefixes,
+            "aggregate_threshold": link_config.aggregate_threshold,
         }
         local_realm = self._realm.config["name"]
 
@@ -977,6 +1739,11 @@ class RLinkManager(object):
             "exclude_authid": link_config.exclude_authid,
             "forward_events": link_config.forward_remote_events,
             "forward_invocations": link_config.forward_remote_invocations,
+            "forward_events_acknowledge": link_config.forward_events_acknowledge,
+            "forward_events_window": link_config.forward_events_window,
+            "forward_events_queue": link_config.forward_events_queue,
+            "aggregate_prefixes": link_config.aggregate_prefixes,
+            "aggregate_threshold": link_config.aggregate_threshold,
         }
         remote_realm = link_config.realm
         remote_config = ComponentConfig(remote_realm, remote_extra)
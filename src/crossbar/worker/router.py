@@ -446,6 +446,10 @@ class RouterController(TransportController):
 
         detached_sessions = self._router_factory.stop_realm(realm_name)
 
+        # stop the realm store (a database-backed store commits all writes still queued)
+        if rlm.router._store and rlm.router._store.is_running():
+            yield rlm.router._store.stop()
+
         del self.realms[realm_id]
         del self.realm_to_id[realm_name]
 
@@ -0,0 +1,192 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.wamp import message
+from autobahn.wamp.exception import ApplicationError
+from autobahn.wamp.serializer import CBORSerializer, JsonSerializer, MsgPackSerializer
+from autobahn.wamp.types import ComponentConfig
+from mock import Mock
+from twisted.internet import defer, reactor
+from twisted.trial import unittest
+
+from crossbar.personality import Personality
+from crossbar.worker import proxy
+from crossbar.worker.proxy import ProxyController, ProxyFrontendSession, TimingHistogram
+
+
+class _Extra(dict):
+    __getattr__ = dict.__getitem__
+
+
+class TestTimingHistogram(unittest.TestCase):
+    def test_add(self):
+        histogram = TimingHistogram(bounds=(1, 10, 100))
+        for duration in [0.5, 1, 5, 50, 500]:
+            histogram.add(duration)
+
+        timings = histogram.marshal()
+        self.assertEqual(timings["count"], 5)
+        self.assertEqual(timings["max"], 500)
+        self.assertEqual(timings["buckets"], [[1, 2], [10, 1], [100, 1], [None, 1]])
+
+
+class TestMessageHeader(unittest.TestCase):
+    MESSAGES = [
+        (message.Call(2**53 - 1, "com.example.add2", args=[1, 2]), (message.Call.MESSAGE_TYPE, 2**53 - 1)),
+        (message.Result(23, args=["hello"]), (message.Result.MESSAGE_TYPE, 23)),
+        (message.Publish(1, "com.example.topic", args=[list(range(100))]), (message.Publish.MESSAGE_TYPE, 1)),
+        (
+            message.Error(message.Call.MESSAGE_TYPE, 300, "com.example.error"),
+            (message.Error.MESSAGE_TYPE, 300),
+        ),
+        (message.Goodbye(), (message.Goodbye.MESSAGE_TYPE, None)),
+    ]
+
+    def test_serializers(self):
+        for serializer in [JsonSerializer(), CBORSerializer(), MsgPackSerializer()]:
+            for msg, header in self.MESSAGES:
+                payload, _ = serializer.serialize(msg)
+                self.assertEqual(proxy._parse_message_header(serializer.SERIALIZER_ID, payload), header)
+
+    def test_unsupported(self):
+        self.assertIsNone(proxy._parse_message_header("ubjson", b"[i\x30"))
+        self.assertIsNone(proxy._parse_message_header("json", b'{"foo": 1}'))
+        self.assertIsNone(proxy._parse_message_header("cbor", b""))
+        self.assertIsNone(proxy._parse_message_header("msgpack", b"\x92"))
+
+
+class TestRawForwarding(unittest.TestCase):
+    def setUp(self):
+        router_factory = Mock()
+        router_factory.worker = Mock()
+        self.frontend = ProxyFrontendSession(router_factory)
+        self.frontend.transport = Mock()
+        self.frontend.transport._serializer = CBORSerializer()
+        self.backend = Mock(_passthrough=True, _raw_forwarding=False, _proxy_connection=None)
+        self.backend._transport._serializer = CBORSerializer()
+        self.frontend._backend_session = self.backend
+
+    def test_forward(self):
+        self.frontend._enable_raw_forwarding()
+        self.assertTrue(self.backend._raw_forwarding)
+
+        payload, is_binary = CBORSerializer().serialize(message.Call(1, "com.example.add2", args=[1, 2]))
+        self.assertTrue(self.frontend.onRawMessage(payload, is_binary))
+        self.backend._transport.send_raw.assert_called_once_with(payload, is_binary)
+
+        # session lifecycle messages are always processed by the proxy
+        payload, is_binary = CBORSerializer().serialize(message.Goodbye())
+        self.assertFalse(self.frontend.onRawMessage(payload, is_binary))
+
+    def test_serializer_mismatch(self):
+        self.backend._transport._serializer = JsonSerializer()
+        self.frontend._enable_raw_forwarding()
+        self.assertFalse(self.backend._raw_forwarding)
+
+        payload, is_binary = CBORSerializer().serialize(message.Call(1, "com.example.add2"))
+        self.assertFalse(self.frontend.onRawMessage(payload, is_binary))
+
+    def test_disabled(self):
+        self.backend._passthrough = False
+        self.frontend._enable_raw_forwarding()
+        self.assertFalse(self.frontend._raw_forwarding)
+
+
+class TestProxyController(unittest.TestCase):
+    def setUp(self):
+        extra = _Extra(worker="worker1", node="node1", cbdir=self.mktemp())
+        self.controller = ProxyController(
+            config=ComponentConfig("crossbar", extra=extra), reactor=reactor, personality=Personality
+        )
+        self.controller.publish = Mock(return_value=defer.succeed(None))
+        self.details = Mock(caller_authid="node1")
+
+    @defer.inlineCallbacks
+    def _start(self):
+        for connection_id in ["conn1", "conn2"]:
+            yield self.controller.start_proxy_connection(connection_id, {}, details=self.details)
+        yield self.controller.start_proxy_realm_route("realm1", {"user": "conn1"}, details=self.details)
+        yield self.controller.start_proxy_realm_route("realm1", {"user": "conn2"}, details=self.details)
+
+    def _connection_ids(self, count=4):
+        return [self.controller.get_backend_connection("realm1", "user").id for _ in range(count)]
+
+    @defer.inlineCallbacks
+    def test_backend_connections(self):
+        yield self._start()
+        self.assertEqual(self._connection_ids(), ["conn1", "conn2", "conn1", "conn2"])
+
+        # connections resolved for routes are dropped when routes are stopped
+        yield self.controller.stop_proxy_realm_route("realm1", "route000", details=self.details)
+        self.assertEqual(self._connection_ids(), ["conn2", "conn2", "conn2", "conn2"])
+
+    @defer.inlineCallbacks
+    def test_least_sessions(self):
+        yield self._start()
+        yield self.controller.start_proxy_realm_route(
+            "realm1", {"user": "conn1"}, {"strategy": "least-sessions"}, details=self.details
+        )
+        self.controller._connections["conn1"]._sessions = 3
+        self.controller._connections["conn2"]._sessions = 1
+        self.assertEqual(self._connection_ids(), ["conn2", "conn2", "conn2", "conn2"])
+
+        stats = yield self.controller.get_proxy_connections(include_stats=True, details=self.details)
+        self.assertEqual(stats["conn1"]["sessions"], 3)
+
+    @defer.inlineCallbacks
+    def test_consistent_hash(self):
+        yield self._start()
+        yield self.controller.start_proxy_realm_route(
+            "realm1", {"user": "conn1"}, {"strategy": "consistent-hash"}, details=self.details
+        )
+        selected = {
+            authid: self.controller.get_backend_connection("realm1", "user", authid=authid).id
+            for authid in ["alice", "bob", "carol", "dave", "eve", "frank"]
+        }
+        for authid, connection_id in selected.items():
+            self.assertEqual(self.controller.get_backend_connection("realm1", "user", authid=authid).id, connection_id)
+        self.assertEqual(set(selected.values()), {"conn1", "conn2"})
+
+    @defer.inlineCallbacks
+    def test_strategy_conflict(self):
+        yield self._start()
+        yield self.controller.start_proxy_realm_route(
+            "realm1", {"user": "conn1"}, {"strategy": "least-sessions"}, details=self.details
+        )
+        for options in [{"strategy": "consistent-hash"}, {"strategy": "random"}]:
+            with self.assertRaises(ApplicationError):
+                yield self.controller.start_proxy_realm_route(
+                    "realm1", {"user": "conn2"}, options, details=self.details
+                )
+
+    @defer.inlineCallbacks
+    def test_stop_multiplexed(self):
+        yield self.controller.start_proxy_connection("conn1", {"multiplex": {"connections": 2}}, details=self.details)
+        yield self.controller.start_proxy_realm_route("realm1", {"user": "conn1"}, details=self.details)
+        connection = self.controller._connections["conn1"]
+        pool = connection.pool
+        pool.close = Mock()
+
+        # the pool is owned by the connection, stopping a route using it leaves it open
+        yield self.controller.stop_proxy_realm_route("realm1", "route000", details=self.details)
+        self.assertFalse(pool.close.called)
+
+        yield self.controller.stop_proxy_connection("conn1", details=self.details)
+        self.assertEqual(pool.close.call_count, 1)
+        self.assertIsNone(connection.pool)
+
+    def test_node_key(self):
+        read_node_key = Mock(return_value={"hex": "00" * 32})
+        self.patch(proxy, "_read_node_key", read_node_key)
+
+        for _ in range(3):
+            self.assertEqual(self.controller.get_node_key(private=True)["hex"], "00" * 32)
+        self.assertEqual(read_node_key.call_count, 1)
@@ -0,0 +1,290 @@
+#####################################################################################
+#
+#  Copyright (c) typedef int GmbH
+#  SPDX-License-Identifier: EUPL-1.2
+#
+#####################################################################################
+
+import txaio
+
+txaio.use_twisted()  # noqa
+
+from autobahn.twisted.wamp import ApplicationSession
+from autobahn.wamp.exception import ApplicationError, TransportLost
+from autobahn.wamp.request import Subscription
+from autobahn.wamp.serializer import CBORSerializer
+from autobahn.wamp.types import ComponentConfig, EventDetails, PublishOptions
+from autobahn.websocket.protocol import WebSocketProtocol
+from mock import Mock
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from crossbar.worker.rlink import BridgeSession, RLinkEventForwarder, RLinkInterest
+
+
+class _BatchedTransport(WebSocketProtocol):
+    def __init__(self):
+        self._serializer = CBORSerializer(batched=True)
+        self.messages = []
+
+    def isOpen(self):
+        return True
+
+    def send(self, msg):
+        payload, is_binary = self._serializer.serialize(msg)
+        self.sendMessage(payload, is_binary)
+
+    def sendMessage(self, payload, isBinary=False, **kwargs):
+        self.messages.append(payload)
+
+
+class TestRLinkEventForwarder(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.session = Mock()
+        self.acks = []
+
+        def publish(uri, *args, **kwargs):
+            if kwargs["options"].acknowledge:
+                d = defer.Deferred()
+                self.acks.append(d)
+                return d
+
+        self.session.publish = Mock(side_effect=publish)
+
+    def _forwarder(self, acknowledge, **kwargs):
+        return RLinkEventForwarder(self.session, acknowledge=acknowledge, reactor=self.clock, **kwargs)
+
+    def _forward(self, forwarder, count):
+        return [forwarder.forward("com.example.topic", [i], {}, PublishOptions()) for i in range(count)]
+
+    def test_each(self):
+        forwarder = self._forwarder(RLinkEventForwarder.ACK_EACH)
+        results = self._forward(forwarder, 2)
+        self.assertEqual(forwarder.in_flight, 2)
+
+        self.acks[0].callback(None)
+        self.acks[1].errback(TransportLost())
+        self.assertEqual([r.called for r in results], [True, True])
+        self.assertEqual((forwarder.forwarded, forwarder.in_flight, forwarder.dropped), (1, 0, 1))
+
+    def test_window(self):
+        forwarder = self._forwarder(RLinkEventForwarder.ACK_WINDOW, window=2)
+        self.assertEqual(self._forward(forwarder, 5), [None] * 5)
+        self.assertEqual(self.session.publish.call_count, 0)
+
+        self.clock.advance(0)
+        self.assertEqual((self.session.publish.call_count, forwarder.in_flight), (2, 2))
+        self.assertEqual(forwarder.marshal()["queued"], 3)
+
+        # acknowledgements open the window for events waiting
+        self.acks[0].callback(None)
+        self.clock.advance(0)
+        self.assertEqual((self.session.publish.call_count, forwarder.in_flight, forwarder.forwarded), (3, 2, 1))
+
+    def test_none(self):
+        forwarder = self._forwarder(RLinkEventForwarder.ACK_NONE, max_queued=3)
+        self._forward(forwarder, 5)
+        self.clock.advance(0)
+        self.assertEqual((forwarder.forwarded, forwarder.in_flight, forwarder.dropped), (3, 0, 2))
+
+    def test_batch(self):
+        transport = _BatchedTransport()
+        self.session = ApplicationSession(ComponentConfig("realm1"))
+        self.session._transport = transport
+
+        forwarder = self._forwarder(RLinkEventForwarder.ACK_NONE)
+        self._forward(forwarder, 3)
+        self.clock.advance(0)
+        self.assertEqual(len(transport.messages), 1)
+        self.assertEqual(forwarder.batches, 1)
+        self.assertIs(self.session._transport, transport)
+
+        published = transport._serializer.unserialize(transport.messages[0])
+        self.assertEqual([msg.args for msg in published], [[0], [1], [2]])
+
+        # the session sends messages on the transport itself again after the batch
+        self.session.publish("com.example.topic", 3)
+        self.assertEqual(transport._serializer.unserialize(transport.messages[-1])[0].args, [3])
+
+
+class TestRLinkInterest(unittest.TestCase):
+    def test_shared(self):
+        interest = RLinkInterest()
+        self.assertEqual(interest.add(1, "com.example.a"), ([("com.example.a", "exact")], []))
+        self.assertEqual(interest.add(2, "com.example.a"), ([], []))
+        self.assertEqual(interest.remove(1), ([], []))
+        self.assertEqual(interest.remove(2), ([], [("com.example.a", "exact")]))
+        self.assertEqual(interest.covering, set())
+
+    def test_covered(self):
+        interest = RLinkInterest()
+        interest.add(1, "com.example.a")
+        interest.add(2, "com..b", "wildcard")
+        interest.add(3, "com.example.b")
+
+        # a prefix subscription covers both the exact and the wildcard subscriptions
+        self.assertEqual(
+            interest.add(4, "com.", "prefix"),
+            ([("com.", "prefix")], [("com..b", "wildcard"), ("com.example.a", "exact")]),
+        )
+        self.assertEqual(interest.add(5, "com.example.c"), ([], []))
+
+        self.assertEqual(
+            interest.remove(4),
+            ([("com..b", "wildcard"), ("com.example.a", "exact"), ("com.example.c", "exact")], [("com.", "prefix")]),
+        )
+        self.assertEqual(
+            interest.covering, {("com..b", "wildcard"), ("com.example.a", "exact"), ("com.example.c", "exact")}
+        )
+
+    def test_aggregated(self):
+        interest = RLinkInterest(prefixes=["com.example.device."], threshold=4)
+        for i in range(3):
+            interest.add(i, "com.example.device.{}".format(i))
+        self.assertEqual(len(interest.covering), 3)
+
+        subscribe, unsubscribe = interest.add(3, "com.example.device.3")
+        self.assertEqual(subscribe, [("com.example.device.", "prefix")])
+        self.assertEqual(len(unsubscribe), 3)
+        self.assertEqual(interest.covering, {("com.example.device.", "prefix")})
+
+        # events via the aggregated subscription are filtered for the topics subscribed
+        self.assertTrue(interest.is_aggregated("com.example.device.", "prefix"))
+        self.assertTrue(interest.accepts("com.example.device.2"))
+        self.assertFalse(interest.accepts("com.example.device.99"))
+        self.assertEqual(interest.filtered, 1)
+
+        # back to exact subscriptions below half the threshold
+        self.assertEqual(interest.remove(0), ([], []))
+        self.assertEqual(interest.remove(1), ([], []))
+        self.assertEqual(
+            interest.remove(2), ([("com.example.device.3", "exact")], [("com.example.device.", "prefix")])
+        )
+
+    def test_add_many(self):
+        interest = RLinkInterest(prefixes=["com.example.device."], threshold=3)
+        interest.add(1, "com.example.a")
+        subscribe, unsubscribe = interest.add_many(
+            [(1, "com.example.a", "exact"), (2, "com.example.b", "exact")]
+            + [(10 + i, "com.example.device.{}".format(i), "exact") for i in range(5)]
+        )
+        self.assertEqual(subscribe, [("com.example.b", "exact"), ("com.example.device.", "prefix")])
+        self.assertEqual(unsubscribe, [])
+        self.assertEqual(interest.marshal()["subscriptions"], 7)
+
+    def test_overlapping(self):
+        # a prefix and a wildcard subscription overlapping, but neither covering the other
+        interest = RLinkInterest()
+        interest.add(1, "a.b", "prefix")
+        interest.add(2, "a..c", "wildcard")
+        self.assertEqual(interest.covering, {("a.b", "prefix"), ("a..c", "wildcard")})
+
+        # an event for "a.b.c" is received via both, and forwarded once
+        self.assertTrue(interest.first_delivery(7))
+        self.assertFalse(interest.first_delivery(7))
+        self.assertTrue(interest.first_delivery(8))
+        self.assertEqual(interest.marshal()["duplicates"], 1)
+
+        # only the publications most recently forwarded are remembered
+        for publication_id in range(100, 100 + RLinkInterest.RECENT_PUBLICATIONS):
+            interest.first_delivery(publication_id)
+        self.assertTrue(interest.first_delivery(7))
+
+
+class TestBridgeSession(unittest.TestCase):
+    def setUp(self):
+        self.session = BridgeSession(ComponentConfig("realm1", {}))
+        self.details = {
+            1: {"id": 1, "uri": "com.example.a", "match": "exact"},
+            2: {"id": 2, "uri": "com.example.", "match": "prefix"},
+        }
+
+    @defer.inlineCallbacks
+    def _setup_event_forwarding(self):
+        # the handlers of the meta events on this router, and the subscriptions made on the other router
+        handlers = {}
+        self.session.subscribe = Mock(
+            side_effect=lambda handler, topic, options=None: handlers.__setitem__(topic, handler)
+        )
+        self.session.IS_REMOTE_LEG = True
+        self.session._list_current = Mock(return_value=defer.succeed([]))
+
+        other = Mock()
+        other.made = {}
+
+        def subscribe(handler, uri, options=None):
+            sub = Mock(spec=Subscription)
+            sub.active = True
+            sub.unsubscribe = Mock(return_value=defer.succeed(None))
+            other.made[uri] = (handler, sub, defer.Deferred())
+            return other.made[uri][2]
+
+        other.subscribe = Mock(side_effect=subscribe)
+        yield self.session._setup_event_forwarding(other)
+        self.session._event_forwarder.forward = Mock()
+        return handlers, other
+
+    @defer.inlineCallbacks
+    def test_forwarding_subscribe_first(self):
+        handlers, other = yield self._setup_event_forwarding()
+        on_create = handlers["wamp.subscription.on_create"]
+
+        d = on_create(1, self.details[1])
+        handler, sub_a, subscribed = other.made["com.example.a"]
+        subscribed.callback(sub_a)
+        yield d
+
+        # the prefix subscription covers the exact one, which is only removed once the prefix one is made
+        d = on_create(1, self.details[2])
+        handler, sub_prefix, subscribed = other.made["com.example."]
+        self.assertEqual(sub_a.unsubscribe.call_count, 0)
+        subscribed.callback(sub_prefix)
+        yield d
+        self.assertEqual(sub_a.unsubscribe.call_count, 1)
+        self.assertEqual(list(self.session._forwarding_subs), [("com.example.", "prefix")])
+
+    @defer.inlineCallbacks
+    def test_forwarding_overlapping(self):
+        handlers, other = yield self._setup_event_forwarding()
+        on_create = handlers["wamp.subscription.on_create"]
+        on_create(1, {"id": 1, "uri": "a.b", "match": "prefix"})
+        on_create(1, {"id": 2, "uri": "a..c", "match": "wildcard"})
+        self.assertEqual(sorted(other.made), ["a..c", "a.b"])
+
+        # an event matching both subscriptions on the other router is re-published once
+        for uri in ["a.b", "a..c"]:
+            handler, sub, _ = other.made[uri]
+            details = EventDetails(
+                sub, 7, publisher=3, publisher_authid="client", publisher_authrole="user", topic="a.b.c"
+            )
+            handler(details=details)
+        self.assertEqual(self.session._event_forwarder.forward.call_count, 1)
+        self.assertEqual(self.session._interest.duplicates, 1)
+
+    @defer.inlineCallbacks
+    def test_list_current(self):
+        def call(procedure, *args, **kwargs):
+            self.assertEqual(kwargs, {"include_details": True})
+            return defer.succeed({"exact": [self.details[1]], "prefix": [self.details[2]], "wildcard": []})
+
+        self.session.call = Mock(side_effect=call)
+        current = yield self.session._list_current("subscription")
+        self.assertEqual(current, [self.details[1], self.details[2]])
+        self.assertEqual(self.session.call.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_list_current_fallback(self):
+        # routers not supporting bulk listing: list IDs, and get each (skipping those gone meanwhile)
+        def call(procedure, *args, **kwargs):
+            if procedure == "wamp.subscription.list":
+                if kwargs:
+                    return defer.fail(ApplicationError("wamp.error.invalid_argument"))
+                return defer.succeed({"exact": [1, 3], "prefix": [2], "wildcard": []})
+            if args[0] in self.details:
+                return defer.succeed(self.details[args[0]])
+            return defer.fail(ApplicationError(ApplicationError.NO_SUCH_SUBSCRIPTION))
+
+        self.session.call = Mock(side_effect=call)
+        current = yield self.session._list_current("subscription")
+        self.assertEqual(current, [self.details[1], self.details[2]])
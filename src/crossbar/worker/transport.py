@@ -19,6 +19,7 @@ from crossbar._util import hlid, hltype, hlval
 from crossbar.bridge.mqtt.wamp import WampMQTTServerFactory
 from crossbar.common.twisted.endpoint import create_listening_port_from_config
 from crossbar.common.twisted.web import Site
+from crossbar.router.auth.pending import release_authentication_caches
 from crossbar.router.protocol import WampRawSocketServerFactory, WampWebSocketServerFactory
 from crossbar.router.unisocket import UniSocketServerFactory
 from crossbar.webservice.flashpolicy import FlashPolicyFactory
@@ -350,10 +351,12 @@ class RouterTransport(object):
         def ok(_):
             self._state = RouterTransport.STATE_STOPPED
             self._port = None
+            release_authentication_caches(self._config)
 
         def fail(err):
             self._state = RouterTransport.STATE_FAILED
             self._port = None
+            release_authentication_caches(self._config)
             raise err
 
         d.addCallbacks(ok, fail)